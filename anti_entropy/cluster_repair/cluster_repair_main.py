@@ -14,6 +14,7 @@ from threading import Event
 import zmq
 
 from tools.standard_logging import initialize_logging
+from tools.sampling_profiler import install_sampling_profiler
 from tools.event_push_client import EventPushClient, unhandled_exception_topic
 from tools.sized_pickle import store_sized_pickle, retrieve_sized_pickle
 from tools.data_definitions import min_node_count, block_generator, \
@@ -197,6 +198,7 @@ def main():
     return 0 for success (exit code)
     """
     initialize_logging(_log_path)
+    install_sampling_profiler()
     log = logging.getLogger("main")
     log.info("program starts")
 
@@ -11,6 +11,7 @@ import sys
 import zmq
 
 from tools.standard_logging import initialize_logging
+from tools.sampling_profiler import install_sampling_profiler
 from tools.database_connection import get_node_local_connection
 from tools.event_push_client import EventPushClient, unhandled_exception_topic
 from tools.data_definitions import compute_expected_slice_count, \
@@ -277,6 +278,7 @@ def main():
     global _max_value_file_time
 
     initialize_logging(_log_path)
+    install_sampling_profiler()
     log = logging.getLogger("main")
 
     try:
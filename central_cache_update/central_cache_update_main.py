@@ -3,29 +3,29 @@
 """
 Ticket #47 Update/Invalidate memcache records when central DB changes
 """
-import base64
 import logging
 import os
-import pickle
 import sys
 from threading import Event
 import time
-import zlib
 
 import memcache
 
 import zmq
 
 from tools.standard_logging import initialize_logging
+from tools.sampling_profiler import install_sampling_profiler
 from tools.zeromq_util import is_interrupted_system_call, \
         prepare_ipc_path
 from tools.process_util import set_signal_handler
-from tools.data_definitions import memcached_central_key_template
+from tools.data_definitions import memcached_central_key_template, \
+        central_cache_update_channel, \
+        parse_central_cache_update_data
 
 _log_path = "{0}/nimbusio_central_cache_update.log".format(
     os.environ["NIMBUSIO_LOG_DIR"]) 
 _skeeter_pub_socket_uri = os.environ["NIMBUSIO_CENTRAL_SKEETER_URI"]
-_cache_update_channel = "nimbusio_central_cache_update"
+_cache_update_channel = central_cache_update_channel
 _memcached_host = os.environ.get("NIMBUSIO_MEMCACHED_HOST", "localhost")
 _memcached_port = int(os.environ.get("NIMBUSIO_MEMCACHED_PORT", "11211"))
 _memcached_nodes = ["{0}:{1}".format(_memcached_host, _memcached_port), ]
@@ -126,13 +126,10 @@ def _process_one_event(memcached_client, expected_sequence, topic, meta, data):
         log.error(message)
         expected_sequence[topic] = None
 
-    table_name, uuid, raw_data = data.split("\n", 2)
     try:
-        event_data = \
-            pickle.loads(zlib.decompress(base64.b64decode(raw_data)))
+        _table_name, event_data = parse_central_cache_update_data(data)
     except Exception:
-        log.exception("unable to parse {0} data '{1}'".format(
-            table_name, raw_data))
+        log.exception("unable to parse data '{0}'".format(data))
         return 
 
     if "table_name" not in event_data or \
@@ -148,6 +145,7 @@ def main():
     """
     return_value = 0
     initialize_logging(_log_path)
+    install_sampling_profiler()
     log = logging.getLogger("main")
     log.info("program starts")
 
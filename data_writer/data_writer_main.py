@@ -10,6 +10,7 @@ import os
 import queue
 import sys
 from threading import Event
+import time
 
 import zmq
 
@@ -17,26 +18,93 @@ from tools.zeromq_pollster import ZeroMQPollster
 from tools.resilient_server import ResilientServer
 from tools.rep_server import REPServer
 from tools.standard_logging import initialize_logging
+from tools.sampling_profiler import install_sampling_profiler, \
+        profiler_control_topic
 from tools.sub_client import SUBClient
 from tools.push_client import PUSHClient
 from tools.event_push_client import EventPushClient
-from tools.database_connection import get_central_connection
+from tools.database_connection import get_central_connection, \
+        get_node_local_connection
+from tools.file_space import load_file_space_info, available_volume_space
 from tools.process_util import set_signal_handler
+from tools.fair_queue import FairQueue
 
 from web_public_reader.central_database_util import get_cluster_row, \
         get_node_rows
 
 from data_writer.reply_pull_server import ReplyPULLServer
 from data_writer.writer_thread import WriterThread
-from data_writer.sync_thread import SyncThread
 
-class AppendQueue(queue.Queue):
+_message_overhead = 4096
+_journal_space_check_interval = 10.0
+
+def _message_collection_id(message_tuple):
+    message, _ = message_tuple
+    return message.get("collection-id")
+
+def _message_cost(message_tuple):
+    _, data = message_tuple
+    if data is None:
+        return _message_overhead
+    return _message_overhead + len(data)
+
+class FairAppendQueue(queue.Queue):
     """
-    adapter to give a Queue an 'append' member.
+    a Queue that serves the messages of each collection in weighted fair
+    order, by bytes (see tools/fair_queue.py), with an 'append' member.
+    Messages without a collection-id share one flow.
     """
+    def _init(self, _maxsize):
+        self.queue = FairQueue(_message_collection_id, _message_cost)
+
+    def _qsize(self):
+        return len(self.queue)
+
+    def _put(self, item):
+        self.queue.append(item)
+
+    def _get(self):
+        return self.queue.popleft()
+
     def append(self, item):
         self.put(item)
 
+    def pop_wait_stats(self):
+        with self.mutex:
+            return self.queue.pop_wait_stats()
+
+    @property
+    def last_wait_time(self):
+        """
+        how long the last message we got waited: we have one consumer
+        """
+        return self.queue.last_wait_time
+
+class AckStatus(object):
+    """
+    the load of this data writer, added to every ack, so that the web
+    writers can place hinted handoffs on the least loaded nodes:
+    the depth of the message queue and the free space on the journal
+    volumes (checked every _journal_space_check_interval seconds)
+    """
+    def __init__(self, message_queue, file_space_info):
+        self._message_queue = message_queue
+        self._file_space_info = file_space_info
+        self._journal_free_bytes = None
+        self._next_check_time = 0.0
+
+    def __call__(self):
+        current_time = time.time()
+        if current_time >= self._next_check_time:
+            self._journal_free_bytes = \
+                available_volume_space("journal", self._file_space_info)
+            self._next_check_time = \
+                current_time + _journal_space_check_interval
+        return {
+            "queue-depth"           : self._message_queue.qsize(),
+            "journal-free-bytes"    : self._journal_free_bytes,
+        }
+
 _local_node_name = os.environ["NIMBUSIO_NODE_NAME"]
 _log_path = "{0}/nimbusio_data_writer_{1}.log".format(
     os.environ["NIMBUSIO_LOG_DIR"], _local_node_name,
@@ -58,12 +126,13 @@ def _create_state():
         "anti-entropy-server"   : None,
         "sub-client"            : None,
         "event-push-client"     : None,
-        "message-queue"         : AppendQueue(),
+        "message-queue"         : FairAppendQueue(),
         "cluster-row"           : None,
         "node-rows"             : None,
         "node-id-dict"          : None,
+        "writer-event-push-client" : None,
         "writer-thread"         : None,
-        "sync-thread"           : None,
+        "profiler"              : None,
     }
 
 def _setup(state):
@@ -76,11 +145,16 @@ def _setup(state):
         "data_writer"
     )
 
+    node_local_connection = get_node_local_connection()
+    file_space_info = load_file_space_info(node_local_connection)
+    node_local_connection.close()
+
     log.info("binding resilient-server to {0}".format(_data_writer_address))
     state["resilient-server"] = ResilientServer(
         state["zmq-context"],
         _data_writer_address,
-        state["message-queue"]
+        state["message-queue"],
+        AckStatus(state["message-queue"], file_space_info)
     )
     state["resilient-server"].register(state["pollster"])
 
@@ -102,7 +176,7 @@ def _setup(state):
     )
     state["anti-entropy-server"].register(state["pollster"])
 
-    topics = ["web-writer-start", ]
+    topics = ["web-writer-start", profiler_control_topic, ]
     log.info("connecting sub-client to {0} subscribing to {1}".format(
         _event_aggregator_pub_address,
         topics))
@@ -131,31 +205,33 @@ def _setup(state):
     state["reply-push-client"] = PUSHClient(state["zmq-context"],
                                             _writer_thread_reply_address)
 
+    # the writer thread gets its own socket for reporting sync histograms
+    state["writer-event-push-client"] = EventPushClient(
+        state["zmq-context"],
+        "data_writer"
+    )
+
     state["writer-thread"] = WriterThread(state["halt-event"],
                                           state["node-id-dict"],
                                           state["message-queue"],
-                                          state["reply-push-client"])
+                                          state["reply-push-client"],
+                                          state["writer-event-push-client"],
+                                          state["profiler"])
     state["writer-thread"].start()
 
-    state["sync-thread"] = SyncThread(state["halt-event"],
-                                      state["message-queue"])
-    state["sync-thread"].start()
-
 def _tear_down(state):
     log = logging.getLogger("_tear_down")
 
     log.debug("joining writer thread")
     state["writer-thread"].join(timeout=3.0)
 
-    log.debug("joining sync thread")
-    state["sync-thread"].join(timeout=3.0)
-
     log.debug("stopping resilient server")
     state["resilient-server"].close()
     state["reply-pull-server"].close()
     state["anti-entropy-server"].close()
     state["sub-client"].close()
     state["event-push-client"].close()
+    state["writer-event-push-client"].close()
     state["reply-push-client"].close()
 
     state["zmq-context"].term()
@@ -169,9 +245,11 @@ def main():
     returncode = 0
     
     initialize_logging(_log_path)
+    profiler = install_sampling_profiler()
 
     log = logging.getLogger("main")
     state = _create_state()
+    state["profiler"] = profiler
     set_signal_handler(state["halt-event"])
 
     try:
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+journal_volumes.py
+
+class JournalVolumes
+
+choose the journal volume for each new segment the data writer stores.
+
+We take the volume with the fewest unsynced bytes (the shortest fsync
+queue), round robin when they are equal. A volume with less than
+_min_free_bytes available is skipped, so that a nearly full disk stops
+receiving segments before writes to it fail. Free space is checked with
+statvfs every _free_space_check_interval seconds; in between we subtract
+what we write. If every volume is short of space, we use the one with the
+most space.
+
+This module must run under both python 2 and python 3 (the data writer).
+"""
+import logging
+import os
+import time
+
+from tools.file_space import find_volume_space_ids, available_space
+
+_min_free_bytes = int(os.environ.get(
+    "NIMBUSIO_DATA_WRITER_MIN_JOURNAL_FREE_BYTES", str(1024 ** 3))
+)
+_free_space_check_interval = float(os.environ.get(
+    "NIMBUSIO_DATA_WRITER_FREE_SPACE_CHECK_INTERVAL", "10.0")
+)
+
+class JournalVolumes(object):
+    """
+    the journal volumes of one data writer, with the unsynced bytes and
+    available space of each
+    """
+    def __init__(self,
+                 file_space_info,
+                 min_free_bytes=_min_free_bytes,
+                 check_interval=_free_space_check_interval,
+                 available_space_function=available_space):
+        self._log = logging.getLogger("JournalVolumes")
+        self._space_ids = find_volume_space_ids("journal", file_space_info)
+        self._paths = dict([(row.space_id, row.path, ) \
+                            for row in file_space_info["journal"]])
+        self._min_free_bytes = min_free_bytes
+        self._check_interval = check_interval
+        self._available_space_function = available_space_function
+        self._unsynced_bytes = dict.fromkeys(self._space_ids, 0)
+        self._available_bytes = dict()
+        self._short_space_ids = set()
+        self._next_check_time = 0.0
+        self._next_space_index = 0
+
+    @property
+    def space_ids(self):
+        """
+        return one journal space_id for each volume
+        """
+        return self._space_ids
+
+    @property
+    def unsynced_bytes(self):
+        """
+        return the number of bytes written since the last sync
+        """
+        return sum(self._unsynced_bytes.values())
+
+    def written(self, space_id, byte_count):
+        """
+        count bytes written to a volume
+        """
+        self._unsynced_bytes[space_id] += byte_count
+        if space_id in self._available_bytes:
+            self._available_bytes[space_id] -= byte_count
+
+    def synced(self):
+        """
+        note that every volume has been synced
+        """
+        self._unsynced_bytes = dict.fromkeys(self._space_ids, 0)
+
+    def _check_available_space(self, current_time):
+        if current_time < self._next_check_time:
+            return
+        self._next_check_time = current_time + self._check_interval
+
+        for space_id in self._space_ids:
+            self._available_bytes[space_id] = \
+                self._available_space_function(self._paths[space_id])
+
+        short_space_ids = set([space_id for space_id in self._space_ids \
+            if self._available_bytes[space_id] < self._min_free_bytes])
+        for space_id in short_space_ids - self._short_space_ids:
+            self._log.warn("journal space {0} has {1} bytes available; "
+                           "skipping it".format(
+                           space_id, self._available_bytes[space_id]))
+        for space_id in self._short_space_ids - short_space_ids:
+            self._log.info("journal space {0} has {1} bytes available; "
+                           "using it again".format(
+                           space_id, self._available_bytes[space_id]))
+        self._short_space_ids = short_space_ids
+
+    def choose_space_id(self, current_time=None):
+        """
+        return the journal space_id for a new segment
+        """
+        if current_time is None:
+            current_time = time.time()
+        self._check_available_space(current_time)
+
+        space_count = len(self._space_ids)
+        chosen_space_id = None
+        for index in range(space_count):
+            space_id = \
+                self._space_ids[(self._next_space_index + index) % space_count]
+            if self._available_bytes[space_id] < self._min_free_bytes:
+                continue
+            if chosen_space_id is None or \
+                self._unsynced_bytes[space_id] < \
+                self._unsynced_bytes[chosen_space_id]:
+                chosen_space_id = space_id
+
+        if chosen_space_id is None:
+            chosen_space_id = max(self._space_ids,
+                                  key=lambda s: self._available_bytes[s])
+
+        self._next_space_index = \
+            (self._space_ids.index(chosen_space_id) + 1) % space_count
+        return chosen_space_id
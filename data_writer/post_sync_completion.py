@@ -5,11 +5,11 @@ post_sync_completion.py
 Actions to be taken to complete an archive after the last value file
 is fsync'd
 """
-from base64 import b64decode
 import logging
 import psycopg2
 
 from tools.data_definitions import parse_timestamp_repr, \
+        parse_digest, \
         meta_row_template, \
         segment_status_final, \
         nimbus_meta_prefix
@@ -89,6 +89,10 @@ class PostSyncCompletion(object):
         self._archive_message = archive_message
         self._reply_message = reply_message
 
+    @property
+    def user_request_id(self):
+        return self._archive_message["user-request-id"]
+
     def pre_commit_process(self):
         """
         finalize the segment row
@@ -101,7 +105,7 @@ class PostSyncCompletion(object):
             self._archive_message["segment-num"],
             self._archive_message["file-size"],
             self._archive_message["file-adler32"],
-            b64decode(self._archive_message["file-hash"].encode("utf-8")),
+            parse_digest(self._archive_message["file-hash"]),
             _extract_meta(self._archive_message),
         )
 
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+sync_scheduler.py
+
+class SyncScheduler
+
+decide when the writer thread should sync the output value file and send
+the replies that wait for the sync (group commit).
+
+While messages keep arriving we let the completions accumulate, and sync
+when there are too many of them, when too many bytes are unsynced, or when
+the oldest completion has waited for the latency budget.
+
+When the writer goes idle we sync, so a small PUT does not wait for a
+timer, but not sooner than the idle interval after the last sync. A writer
+that empties its queue between messages is idle after every message, so a
+fixed idle interval would sync once per message, up to 1/min_sync_interval
+times a second. Instead the idle interval grows with the rate at which
+completions arrive: rate / idle_sync_rate ** 2 seconds, between
+min_sync_interval and latency_budget. That keeps idle syncs below about
+idle_sync_rate a second at any arrival rate, while an occasional
+completion is still synced at once. From an arrival rate of
+idle_sync_rate ** 2 * latency_budget up, we sync no more often than a
+fixed timer of latency_budget, unless a threshold is reached.
+"""
+import os
+
+from tools.latency_histogram import LatencyHistogram
+
+_latency_budget = float(
+    os.environ.get("NIMBUSIO_DATA_WRITER_SYNC_LATENCY_BUDGET", "1.0"))
+# idle syncs are no closer together than this
+_min_sync_interval = float(
+    os.environ.get("NIMBUSIO_DATA_WRITER_MIN_SYNC_INTERVAL", "0.02"))
+# about the most idle syncs per second, whatever the arrival rate
+_idle_sync_rate = float(
+    os.environ.get("NIMBUSIO_DATA_WRITER_IDLE_SYNC_RATE", "2.0"))
+_max_completions = int(
+    os.environ.get("NIMBUSIO_DATA_WRITER_SYNC_MAX_COMPLETIONS", "256"))
+_max_unsynced_bytes = int(
+    os.environ.get("NIMBUSIO_DATA_WRITER_SYNC_MAX_BYTES",
+                   str(64 * 1024 * 1024)))
+
+# weight of the newest gap in the smoothed gap between completions
+_arrival_gap_weight = 0.2
+
+# 1, 2, 4 ... 4096 completions per sync
+_batch_size_bucket_limits = [2 ** i for i in range(13)]
+
+class SyncScheduler(object):
+    """
+    event_push_client
+        if not None, the sync latency and batch size histograms are
+        reported periodically
+    """
+    def __init__(self,
+                 event_push_client=None,
+                 latency_budget=_latency_budget,
+                 min_sync_interval=_min_sync_interval,
+                 idle_sync_rate=_idle_sync_rate,
+                 max_completions=_max_completions,
+                 max_unsynced_bytes=_max_unsynced_bytes):
+        self._latency_budget = latency_budget
+        self._min_sync_interval = min_sync_interval
+        self._idle_sync_rate = idle_sync_rate
+        self._max_completions = max_completions
+        self._max_unsynced_bytes = max_unsynced_bytes
+
+        # when we first saw a completion waiting for the next sync
+        self._first_pending_time = None
+        self._last_sync_time = 0.0
+
+        # the completions we have counted since the last sync, when the
+        # last of them arrived, and the smoothed gap between completions
+        self._counted_completions = 0
+        self._last_arrival_time = None
+        self._arrival_gap = None
+
+        self._sync_latency_histogram = LatencyHistogram(
+            "data-writer-sync", event_push_client
+        )
+        self._batch_size_histogram = LatencyHistogram(
+            "data-writer-sync-batch-size",
+            event_push_client,
+            bucket_limits=_batch_size_bucket_limits
+        )
+
+    @property
+    def sync_latency_histogram(self):
+        return self._sync_latency_histogram
+
+    @property
+    def batch_size_histogram(self):
+        return self._batch_size_histogram
+
+    def sync_due(self,
+                 completion_count,
+                 unsynced_bytes,
+                 idle,
+                 current_time):
+        """
+        return True if the writer should sync now
+
+        idle
+            True if there are no messages waiting for the writer
+        """
+        self._count_arrivals(completion_count, current_time)
+
+        if unsynced_bytes >= self._max_unsynced_bytes:
+            return True
+
+        if completion_count == 0:
+            self._first_pending_time = None
+            return False
+
+        if self._first_pending_time is None:
+            self._first_pending_time = current_time
+
+        if completion_count >= self._max_completions:
+            return True
+
+        if current_time - self._first_pending_time >= self._latency_budget:
+            return True
+
+        return idle and \
+            current_time - self._last_sync_time >= self.idle_interval
+
+    def wait_time(self, current_time, default_wait_time):
+        """
+        return how long the writer may wait for a message before it must
+        check sync_due again
+        """
+        if self._first_pending_time is None:
+            return default_wait_time
+
+        # while we wait, we are idle
+        sync_time = min(self._first_pending_time + self._latency_budget,
+                        self._last_sync_time + self.idle_interval)
+        return min(max(sync_time - current_time, 0.0), default_wait_time)
+
+    @property
+    def idle_interval(self):
+        """
+        the least time from the last sync to an idle sync
+        """
+        if not self._arrival_gap:
+            return self._min_sync_interval
+        arrival_rate = 1.0 / self._arrival_gap
+        idle_interval = arrival_rate / self._idle_sync_rate ** 2
+        return min(max(idle_interval, self._min_sync_interval),
+                   self._latency_budget)
+
+    def _count_arrivals(self, completion_count, current_time):
+        if completion_count <= self._counted_completions:
+            self._counted_completions = completion_count
+            return
+
+        arrival_count = completion_count - self._counted_completions
+        self._counted_completions = completion_count
+        if self._last_arrival_time is not None:
+            gap = (current_time - self._last_arrival_time) / arrival_count
+            if self._arrival_gap is None:
+                self._arrival_gap = gap
+            else:
+                self._arrival_gap += \
+                    _arrival_gap_weight * (gap - self._arrival_gap)
+        self._last_arrival_time = current_time
+
+    def record_sync(self, completion_count, start_time, end_time):
+        """
+        the writer has synced, and sent the replies for completion_count
+        completions
+        """
+        self._sync_latency_histogram.record(end_time - start_time)
+        if completion_count > 0:
+            self._batch_size_histogram.record(completion_count)
+        self._first_pending_time = None
+        self._last_sync_time = end_time
+        self._counted_completions = 0
@@ -3,21 +3,33 @@
 writer.py
 
 Manage writing segment values to disk
+
+We keep an output value file open on each journal volume, and stripe new
+segments across them, so that ingest is not limited to one disk at a time.
+See journal_volumes.py for how a volume is chosen.
 """
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import os
+import time
+
 import psycopg2
 
 from tools.data_definitions import segment_sequence_template, \
         parse_timestamp_repr, \
         segment_status_active, \
         segment_status_tombstone
-from tools.file_space import find_least_volume_space_id
+from tools.standard_logging import LazyFormat, sampled_logger
 from data_writer.output_value_file import OutputValueFile
+from data_writer.journal_volumes import JournalVolumes
 
 _max_value_file_size = int(os.environ.get(
     "NIMBUS_IO_MAX_VALUE_FILE_SIZE", str(1024 * 1024 * 1024))
 )
+_throughput_report_interval = float(os.environ.get(
+    "NIMBUSIO_DATA_WRITER_THROUGHPUT_REPORT_INTERVAL", "60.0")
+)
+journal_volume_throughput_topic = "journal-volume-throughput"
 
 def _insert_conjoined_row(connection, conjoined_dict):
     connection.execute("""
@@ -266,36 +278,99 @@ class Writer(object):
                  file_space_info, 
                  repository_path, 
                  active_segments, 
-                 completions
+                 completions,
+                 event_push_client=None,
+                 tracer=None
     ):
         self._log = logging.getLogger("Writer")
+        # one line for every sequence: see tools/standard_logging.py
+        self._sequence_log = sampled_logger("Writer.store_sequence")
         self._connection = connection
         self._file_space_info = file_space_info
         self._repository_path = repository_path
         self._active_segments = active_segments
         self._completions = completions
+        self._event_push_client = event_push_client
+        self._tracer = tracer
         
-        space_id = find_least_volume_space_id("journal", self._file_space_info)
-
-        # open a new value file at startup
-        self._value_file = OutputValueFile(self._connection, 
-                                           space_id, 
-                                           self._repository_path)
+        self._journal_volumes = JournalVolumes(self._file_space_info)
+        self._space_ids = self._journal_volumes.space_ids
+        self._log.info("journal spaces {0}".format(self._space_ids))
+
+        # open a new value file on each volume at startup
+        self._value_files = dict()
+        for space_id in self._space_ids:
+            self._value_files[space_id] = \
+                OutputValueFile(self._connection, 
+                                space_id, 
+                                self._repository_path)
+
+        # os.fsync releases the GIL, so we can sync the volumes in parallel
+        self._sync_executor = None
+        if len(self._space_ids) > 1:
+            self._sync_executor = \
+                ThreadPoolExecutor(max_workers=len(self._space_ids))
+
+        self._bytes_written = dict.fromkeys(self._space_ids, 0)
+        self._report_start_time = time.time()
 
     @property
-    def value_file_hash(self):
+    def unsynced_bytes(self):
         """
-        return the hash of the currently open value file
+        return the number of bytes written since the last sync
         """
-        assert self._value_file is not None
-        return hash(self._value_file)
+        return self._journal_volumes.unsynced_bytes
+
+    def _choose_space_id(self):
+        """
+        return the journal space for a new segment
+        """
+        return self._journal_volumes.choose_space_id()
+
+    def _report_throughput(self):
+        current_time = time.time()
+        elapsed_time = current_time - self._report_start_time
+        if elapsed_time < _throughput_report_interval:
+            return
+
+        volumes = list()
+        for space_id in self._space_ids:
+            bytes_written = self._bytes_written[space_id]
+            volumes.append({"space-id"          : space_id,
+                            "bytes-written"     : bytes_written,
+                            "bytes-per-second"  : bytes_written / elapsed_time})
+            self._log.info("space {0}: {1} bytes {2:.0f} bytes/sec".format(
+                space_id, bytes_written, bytes_written / elapsed_time))
+        if self._event_push_client is not None:
+            self._event_push_client.info(
+                journal_volume_throughput_topic,
+                "journal volume throughput",
+                **{"elapsed-time" : elapsed_time, "volumes" : volumes}
+            )
+
+        self._bytes_written = dict.fromkeys(self._space_ids, 0)
+        self._report_start_time = current_time
 
     def sync_value_file(self):
         """
-        sync the current value file
+        sync the open value files
         """
-        assert self._value_file is not None
-        self._value_file.sync()
+        assert self._value_files is not None
+        sync_start_time = time.time()
+        unsynced_value_files = [value_file \
+                                for value_file in self._value_files.values() \
+                                if not value_file.is_synced]
+        if self._sync_executor is None or len(unsynced_value_files) < 2:
+            for value_file in unsynced_value_files:
+                value_file.sync()
+        else:
+            futures = [self._sync_executor.submit(value_file.sync) \
+                       for value_file in unsynced_value_files]
+            for future in futures:
+                future.result()
+        self._journal_volumes.synced()
+        sync_end_time = time.time()
+        self._report_throughput()
 
         # Ticket #70 Data writer causes "already a transaction in progress" 
         # warning in the PostgreSQL log
@@ -313,22 +388,36 @@ class Writer(object):
             self._connection.rollback()
             raise
         self._connection.commit()
+        commit_end_time = time.time()
 
         for completion in self._completions:
             completion.post_commit_process()
+            if self._tracer is not None:
+                self._tracer.record(completion.user_request_id,
+                                    "data-writer-fsync",
+                                    sync_start_time,
+                                    sync_end_time)
+                self._tracer.record(completion.user_request_id,
+                                    "data-writer-db-commit",
+                                    sync_end_time,
+                                    commit_end_time)
 
         self._completions[:] = []
 
     @property
     def value_file_is_synced(self):
-        assert self._value_file is not None
-        return self._value_file.is_synced 
+        assert self._value_files is not None
+        return all([value_file.is_synced \
+                    for value_file in self._value_files.values()])
 
     def close(self):
-        assert self._value_file is not None
+        assert self._value_files is not None
         self.sync_value_file()
-        self._value_file.close()
-        self._value_file = None
+        for value_file in self._value_files.values():
+            value_file.close()
+        self._value_files = None
+        if self._sync_executor is not None:
+            self._sync_executor.shutdown()
 
     def start_new_segment(
         self, 
@@ -371,6 +460,8 @@ class Writer(object):
                                                    segment_num,
                                                    source_node_id,
                                                    handoff_node_id),
+            # all sequences of a segment go to the same volume
+            "space-id"   : self._choose_space_id(),
         }
 
     def store_sequence(
@@ -393,8 +484,8 @@ class Writer(object):
         store one piece (sequence) of segment data
         """
         segment_key = (unified_id, conjoined_part, segment_num, )
-        self._log.info("request {0}: " \
-                       "store_sequence {1} {2} {3} {4} {5}: {6} ({7})".format(
+        self._sequence_log.info(LazyFormat("request {0}: " \
+                       "store_sequence {1} {2} {3} {4} {5}: {6} ({7})",
                        user_request_id,
                        collection_id, 
                        key, 
@@ -404,32 +495,35 @@ class Writer(object):
                        sequence_num,
                        segment_size))
         segment_entry = self._active_segments[segment_key]
+        space_id = segment_entry["space-id"]
+        value_file = self._value_files[space_id]
 
         # if this write would put us over the max size,
-        # start a new output value file
-        if self._value_file.size + segment_size > _max_value_file_size:
-            self._value_file.close()
-            space_id = find_least_volume_space_id("journal",
-                                                  self._file_space_info)
-            self._value_file = OutputValueFile(self._connection, 
-                                               space_id,
-                                               self._repository_path)
+        # start a new output value file on the same volume
+        if value_file.size + segment_size > _max_value_file_size:
+            value_file.close()
+            value_file = OutputValueFile(self._connection, 
+                                         space_id,
+                                         self._repository_path)
+            self._value_files[space_id] = value_file
 
         segment_sequence_row = segment_sequence_template(
             collection_id=collection_id,
             segment_id=segment_entry["segment-id"],
             zfec_padding_size=zfec_padding_size,
-            value_file_id=self._value_file.value_file_id,
+            value_file_id=value_file.value_file_id,
             sequence_num=sequence_num,
-            value_file_offset=self._value_file.size,
+            value_file_offset=value_file.size,
             size=segment_size,
             hash=psycopg2.Binary(segment_md5_digest),
             adler32=segment_adler32,
         )
 
-        self._value_file.write_data_for_one_sequence(
+        value_file.write_data_for_one_sequence(
             collection_id, segment_entry["segment-id"], data
         )
+        self._journal_volumes.written(space_id, len(data))
+        self._bytes_written[space_id] += len(data)
 
         _insert_segment_sequence_row(self._connection, segment_sequence_row)
 
@@ -12,30 +12,42 @@ sends message to the database server to record key as stored.
 ACK back to to requestor includes size (from the database server)
 of any previous key this key supersedes (for space accounting.)
 """
-from base64 import b64decode
 import hashlib
 import logging
 import os
 import queue
 from threading import Thread
 import sys
+import time
 
 from tools.file_space import load_file_space_info, file_space_sanity_check
 from tools.database_connection import get_node_local_connection
-from tools.data_definitions import parse_timestamp_repr
+from tools.data_definitions import parse_timestamp_repr, parse_digest
+from tools.fair_queue import report_wait_stats
+from tools.standard_logging import LazyFormat, sampled_logger
+from tools.request_tracer import RequestTracer
+from tools.sampling_profiler import profiler_control_topic
 
 from data_writer.output_value_file import mark_value_files_as_closed
 from data_writer.writer import Writer
 from data_writer.post_sync_completion import PostSyncCompletion
+from data_writer.sync_scheduler import SyncScheduler
 
 _repository_path = os.environ["NIMBUSIO_REPOSITORY_PATH"]
 _queue_timeout = 1.0
+_reporting_interval = 60.0
 
 class WriterThread(Thread):
     """
     manage writes to filesystem
     """
-    def __init__(self, halt_event, node_id_dict, message_queue, push_client):
+    def __init__(self, 
+                 halt_event, 
+                 node_id_dict, 
+                 message_queue, 
+                 push_client,
+                 event_push_client=None,
+                 profiler=None):
         Thread.__init__(self, name="WriterThread")
         self._halt_event = halt_event
         self._node_id_dict = node_id_dict
@@ -45,6 +57,10 @@ class WriterThread(Thread):
         self._completions = list()
         self._writer = None
         self._reply_pusher = push_client
+        self._event_push_client = event_push_client
+        self._sync_scheduler = SyncScheduler(event_push_client)
+        self._tracer = RequestTracer(event_push_client)
+        self._profiler = profiler
 
 
         self._dispatch_table = {
@@ -58,7 +74,7 @@ class WriterThread(Thread):
             "abort-conjoined-archive"   : self._handle_abort_conjoined_archive,
             "finish-conjoined-archive"  : self._handle_finish_conjoined_archive,
             "web-writer-start"          : self._handle_web_writer_start,
-            "sync-value-file"           : self._handle_sync_value_file,
+            profiler_control_topic      : self._handle_profiler_control,
         }
 
     def run(self):
@@ -88,17 +104,38 @@ class WriterThread(Thread):
                              file_space_info,
                              _repository_path,
                              self._active_segments,
-                             self._completions)
+                             self._completions,
+                             self._event_push_client,
+                             self._tracer)
+
+        next_report_time = time.time() + _reporting_interval
 
         log.debug("start halt_event loop")
         while not self._halt_event.is_set():
+            timeout = self._sync_scheduler.wait_time(time.time(), 
+                                                     _queue_timeout)
             try:
                 message, data = self._message_queue.get(block=True,
-                                                        timeout=_queue_timeout)
+                                                        timeout=timeout)
             except queue.Empty:
                 pass
             else:
-                self._dispatch_table[message["message-type"]](message, data)
+                self._dispatch(message, data)
+
+            if self._sync_scheduler.sync_due(len(self._completions),
+                                             self._writer.unsynced_bytes,
+                                             self._message_queue.empty(),
+                                             time.time()):
+                self._sync_value_file()
+
+            self._tracer.flush_if_due()
+
+            if time.time() >= next_report_time:
+                report_wait_stats(self._event_push_client,
+                                  log,
+                                  "collection_queue_wait",
+                                  self._message_queue.pop_wait_stats())
+                next_report_time = time.time() + _reporting_interval
         log.debug("end halt_event loop")
 
         # 2012-03-27 dougfort -- we stop the data writer first because it is
@@ -118,6 +155,19 @@ class WriterThread(Thread):
                 len(self._active_segments)))
 
 
+    def _dispatch(self, message, data):
+        user_request_id = message.get("user-request-id")
+        start_time = time.time()
+        self._tracer.record(user_request_id,
+                            "data-writer-queue-wait",
+                            start_time - self._message_queue.last_wait_time,
+                            start_time)
+        # includes the reply push, except for the final sequence,
+        # which is replied to after the fsync
+        with self._tracer.span(user_request_id,
+                               "data-writer-" + message["message-type"]):
+            self._dispatch_table[message["message-type"]](message, data)
+
     def _handle_archive_key_entire(self, message, data):
         log = logging.getLogger("_handle_archive_key_entire")
         log.info("request {0}: {1} {2} {3} {4}".format(
@@ -162,8 +212,8 @@ class WriterThread(Thread):
             self._reply_pusher.send(reply)
             return
 
-        expected_segment_md5_digest = b64decode(
-            message["segment-md5-digest"].encode("utf-8"))
+        expected_segment_md5_digest = parse_digest(
+            message["segment-md5-digest"])
         segment_md5 = hashlib.md5()
         segment_md5.update(segment_data)
         if segment_md5.digest() != expected_segment_md5_digest:
@@ -266,8 +316,8 @@ class WriterThread(Thread):
             self._reply_pusher.send(reply)
             return
 
-        expected_segment_md5_digest = b64decode(
-            message["segment-md5-digest"].encode("utf-8"))
+        expected_segment_md5_digest = parse_digest(
+            message["segment-md5-digest"])
         segment_md5 = hashlib.md5()
         segment_md5.update(segment_data)
         if segment_md5.digest() != expected_segment_md5_digest:
@@ -321,8 +371,9 @@ class WriterThread(Thread):
         self._reply_pusher.send(reply)
 
     def _handle_archive_key_next(self, message, data):
-        log = logging.getLogger("_handle_archive_key_next")
-        log.info("request {0}: {1} {2} {3} {4}".format(
+        # one for every slice: see tools/standard_logging.py
+        log = sampled_logger("_handle_archive_key_next")
+        log.info(LazyFormat("request {0}: {1} {2} {3} {4}",
             message["user-request-id"],
             message["collection-id"],
             message["key"],
@@ -363,8 +414,8 @@ class WriterThread(Thread):
             self._reply_pusher.send(reply)
             return
 
-        expected_segment_md5_digest = b64decode(
-            message["segment-md5-digest"].encode("utf-8"))
+        expected_segment_md5_digest = parse_digest(
+            message["segment-md5-digest"])
         segment_md5 = hashlib.md5()
         segment_md5.update(segment_data)
         if segment_md5.digest() != expected_segment_md5_digest:
@@ -443,8 +494,8 @@ class WriterThread(Thread):
             self._reply_pusher.send(reply)
             return
 
-        expected_segment_md5_digest = b64decode(
-            message["segment-md5-digest"].encode("utf-8"))
+        expected_segment_md5_digest = parse_digest(
+            message["segment-md5-digest"])
         segment_md5 = hashlib.md5()
         segment_md5.update(segment_data)
         if segment_md5.digest() != expected_segment_md5_digest:
@@ -662,5 +713,17 @@ class WriterThread(Thread):
             source_node_id, timestamp
         )
 
-    def _handle_sync_value_file(self, _message, _data):
+    def _handle_profiler_control(self, message, _data):
+        log = logging.getLogger("_handle_profiler_control")
+        log.info("{0} from {1}".format(message["action"],
+                                       message.get("node-name")))
+        if self._profiler is not None:
+            self._profiler.handle_control_message(message)
+
+    def _sync_value_file(self):
+        completion_count = len(self._completions)
+        start_time = time.time()
         self._writer.sync_value_file()
+        self._sync_scheduler.record_sync(completion_count, 
+                                         start_time, 
+                                         time.time())
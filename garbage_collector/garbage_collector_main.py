@@ -12,6 +12,7 @@ import sys
 import zmq
 
 from tools.standard_logging import initialize_logging
+from tools.sampling_profiler import install_sampling_profiler
 from tools.database_connection import get_node_local_connection
 from tools.event_push_client import EventPushClient
 from tools.data_definitions import segment_status_active, \
@@ -133,6 +134,7 @@ def main():
     return 0 for success (exit code)
     """
     initialize_logging(_log_path)
+    install_sampling_profiler()
     log = logging.getLogger("main")
     log.info("program starts")
 
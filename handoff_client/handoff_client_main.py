@@ -12,6 +12,7 @@ from threading import Event
 import zmq
 
 from tools.standard_logging import initialize_logging
+from tools.sampling_profiler import install_sampling_profiler
 from tools.event_push_client import EventPushClient, unhandled_exception_topic
 from tools.process_util import set_signal_handler
 
@@ -31,6 +32,7 @@ def main():
     return 0 for success (exit code)
     """
     initialize_logging(_log_path)
+    install_sampling_profiler()
     log = logging.getLogger("main")
     log.info("program starts")
 
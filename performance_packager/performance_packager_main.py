@@ -16,6 +16,11 @@ from tools.zeromq_pollster import ZeroMQPollster
 from tools.sub_client import SUBClient
 from tools.deque_dispatcher import DequeDispatcher
 from tools import time_queue_driven_process
+from tools.latency_histogram import latency_histogram_topic, \
+        compute_percentile
+from tools.request_tracer import trace_spans_topic
+
+from performance_packager.trace_collector import TraceCollector
 
 _local_node_name = os.environ["NIMBUSIO_NODE_NAME"]
 _log_path = u"%s/nimbusio_performance_packager_%s.log" % (
@@ -23,8 +28,13 @@ _log_path = u"%s/nimbusio_performance_packager_%s.log" % (
 )
 _event_aggregator_pub_address = \
         os.environ["NIMBUSIO_EVENT_AGGREGATOR_PUB_ADDRESS"]
-_sub_topics = ["archive-stats", "retrieve-stats", ]
+_sub_topics = ["archive-stats", 
+               "retrieve-stats", 
+               latency_histogram_topic, 
+               trace_spans_topic, ]
 _report_template = "%s %-8s %8.02f min %6d bytes/sec"
+_latency_report_template = \
+    "%s %-8s %-24s %8d count %8.04f p50 %8.04f p90 %8.04f p99 %8.04f max"
 
 def _handle_archive_stats(_state, message, _data):
     log = logging.getLogger("stats")
@@ -56,9 +66,33 @@ def _handle_retrieve_stats(_state, message, _data):
         bytes_per_second
     ))
 
+def _handle_latency_histogram(_state, message, _data):
+    log = logging.getLogger("stats")
+    percentiles = [compute_percentile(message["bucket-limits"],
+                                      message["bucket-counts"],
+                                      message["max"],
+                                      fraction) \
+                   for fraction in [0.5, 0.9, 0.99, ]]
+
+    log.info(_latency_report_template % tuple(
+        [message.get("node-name", message["source"]), 
+         "latency",
+         message["histogram-name"],
+         message["count"], ] + percentiles + [message["max"], ]
+    ))
+
+def _handle_trace_spans(state, message, _data):
+    state["trace-collector"].add_spans(
+        message.get("node-name", message["source"]),
+        message["spans"],
+        message["dropped"]
+    )
+
 _dispatch_table = {
-    "archive-stats"     : _handle_archive_stats,
-    "retrieve-stats"    : _handle_retrieve_stats,
+    "archive-stats"         : _handle_archive_stats,
+    "retrieve-stats"        : _handle_retrieve_stats,
+    latency_histogram_topic : _handle_latency_histogram,
+    trace_spans_topic       : _handle_trace_spans,
 }
 
 def _create_state():
@@ -68,6 +102,7 @@ def _create_state():
         "sub-client"            : None,
         "receive-queue"         : deque(),
         "queue-dispatcher"      : None,
+        "trace-collector"       : TraceCollector(),
     }
 
 def _setup(_halt_event, state):
@@ -92,6 +127,7 @@ def _setup(_halt_event, state):
     return [
         (state["pollster"].run, time.time(), ), 
         (state["queue-dispatcher"].run, time.time(), ), 
+        (state["trace-collector"].run, time.time(), ), 
     ] 
 
 def _tear_down(_state):
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+trace_collector.py
+
+class TraceCollector
+
+collect the spans that RequestTracers send as "trace-spans" events.
+
+We gather the spans of each request, from every node and process, and when
+no span has arrived for a request in quiet_interval seconds, we log its
+waterfall: each stage with its offset from the start of the request and its
+duration. We also keep a LatencyHistogram for each stage and log their
+percentiles every report_interval seconds.
+"""
+import logging
+import time
+
+from tools.latency_histogram import LatencyHistogram
+
+_quiet_interval = 30.0
+_report_interval = 60.0
+_check_interval = 5.0
+_max_requests = 10000
+_waterfall_template = "    +%8.04f %8.04f %-16s %s"
+_stage_report_template = \
+    "%-8s %-36s %8d count %8.04f p50 %8.04f p90 %8.04f p99 %8.04f max"
+
+class TraceCollector(object):
+    """
+    reconstruct per request waterfalls and per stage histograms
+    """
+    def __init__(self,
+                 quiet_interval=_quiet_interval,
+                 report_interval=_report_interval,
+                 max_requests=_max_requests):
+        self._log = logging.getLogger("TraceCollector")
+        self._quiet_interval = quiet_interval
+        self._report_interval = report_interval
+        self._max_requests = max_requests
+        # user-request-id : [last arrival time, [(start, duration, node,
+        #                                         stage), ...]]
+        self._requests = dict()
+        self._stage_histograms = dict()
+        self._dropped_count = 0
+        self._next_report_time = time.time() + report_interval
+
+    def add_spans(self, node_name, spans, dropped_count=0, current_time=None):
+        """
+        add the spans from one "trace-spans" event
+        """
+        if current_time is None:
+            current_time = time.time()
+        self._dropped_count += dropped_count
+        for user_request_id, stage, start_time, duration in spans:
+            try:
+                request_entry = self._requests[user_request_id]
+            except KeyError:
+                if len(self._requests) >= self._max_requests:
+                    self._dropped_count += 1
+                    continue
+                request_entry = [current_time, list()]
+                self._requests[user_request_id] = request_entry
+            request_entry[0] = current_time
+            request_entry[1].append((start_time, duration, node_name, stage, ))
+
+            try:
+                histogram = self._stage_histograms[stage]
+            except KeyError:
+                histogram = LatencyHistogram(stage)
+                self._stage_histograms[stage] = histogram
+            histogram.record(duration)
+
+    def pop_quiet_requests(self, current_time):
+        """
+        remove and return a list of (user-request-id, spans sorted by start)
+        for the requests that have been quiet for quiet_interval
+        """
+        quiet_requests = list()
+        for user_request_id, (last_time, spans, ) in self._requests.items():
+            if current_time - last_time >= self._quiet_interval:
+                quiet_requests.append((user_request_id, sorted(spans), ))
+        for user_request_id, _ in quiet_requests:
+            del self._requests[user_request_id]
+        return quiet_requests
+
+    def _log_waterfall(self, user_request_id, spans):
+        request_start = spans[0][0]
+        request_end = max(start + duration \
+                          for start, duration, _, _ in spans)
+        self._log.info("request %s %8.04f seconds %d spans" % (
+            user_request_id, request_end - request_start, len(spans),
+        ))
+        for start_time, duration, node_name, stage in spans:
+            self._log.info(_waterfall_template % (
+                start_time - request_start, duration, node_name, stage,
+            ))
+
+    def _log_stage_histograms(self):
+        for stage in sorted(self._stage_histograms.keys()):
+            histogram = self._stage_histograms[stage]
+            if histogram.count == 0:
+                continue
+            snapshot = histogram.snapshot()
+            self._log.info(_stage_report_template % tuple(
+                ["stage", stage, histogram.count, ] + \
+                [histogram.percentile(fraction) \
+                 for fraction in [0.5, 0.9, 0.99, ]] + \
+                [snapshot["max"], ]
+            ))
+            histogram.reset()
+        if self._dropped_count > 0:
+            self._log.warn("%d spans dropped" % (self._dropped_count, ))
+            self._dropped_count = 0
+
+    def run(self, halt_event):
+        """
+        time queue task: log the waterfalls of finished requests
+        and, periodically, the stage histograms
+        """
+        if halt_event.is_set():
+            return
+
+        current_time = time.time()
+        for user_request_id, spans in self.pop_quiet_requests(current_time):
+            self._log_waterfall(user_request_id, spans)
+
+        if current_time >= self._next_report_time:
+            self._log_stage_histograms()
+            self._next_report_time = current_time + self._report_interval
+
+        return [(self.run, current_time + _check_interval, ), ]
@@ -5,7 +5,9 @@
 flush_stats_from_redis_main.py
 See Ticket #65 Collect and Flush Stats from Redis on Storage Nodes to Central DB
 """
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+import io
 import logging
 import os
 import sys
@@ -14,6 +16,7 @@ from threading import Event
 import zmq
 
 from tools.standard_logging import initialize_logging
+from tools.sampling_profiler import install_sampling_profiler
 from tools.event_push_client import EventPushClient, unhandled_exception_topic
 from tools.process_util import set_signal_handler
 from tools.database_connection import get_central_connection
@@ -26,54 +29,130 @@ _local_node_name = os.environ["NIMBUSIO_NODE_NAME"]
 _log_path = "{0}/nimbusio_redis_stats_collector_{1}.log".format(
     os.environ["NIMBUSIO_LOG_DIR"], _local_node_name)
 
-_collection_ops_accounting_insert = """
-    insert into nimbusio_central.collection_ops_accounting( 
-            collection_id,
-            node_id,
-            timestamp,
-            duration,
-            retrieve_request,
-            retrieve_success,
-            retrieve_error,
-            archive_request,
-            archive_success,
-            archive_error,
-            listmatch_request,
-            listmatch_success,
-            listmatch_error,
-            delete_request,
-            delete_success,
-            delete_error,
-            socket_bytes_in,
-            socket_bytes_out,
-            success_bytes_in,
-            success_bytes_out,
-            error_bytes_in,
-            error_bytes_out)
-   values (
-            %(collection_id)s,
-            %(node_id)s,
-            %(timestamp)s,
-            %(duration)s,
-            %(retrieve_request)s,
-            %(retrieve_success)s,
-            %(retrieve_error)s,
-            %(archive_request)s,
-            %(archive_success)s,
-            %(archive_error)s,
-            %(listmatch_request)s,
-            %(listmatch_success)s,
-            %(listmatch_error)s,
-            %(delete_request)s,
-            %(delete_success)s,
-            %(delete_error)s,
-            %(socket_bytes_in)s,
-            %(socket_bytes_out)s,
-            %(success_bytes_in)s,
-            %(success_bytes_out)s,
-            %(error_bytes_in)s,
-            %(error_bytes_out)s
-          );"""
+_scan_count = int(os.environ.get("NIMBUSIO_REDIS_STATS_SCAN_COUNT", "1000"))
+_pipeline_batch_size = \
+    int(os.environ.get("NIMBUSIO_REDIS_STATS_PIPELINE_BATCH_SIZE", "1000"))
+
+_collection_ops_accounting_columns = [
+    "collection_id",
+    "node_id",
+    "timestamp",
+    "duration",
+    "retrieve_request",
+    "retrieve_success",
+    "retrieve_error",
+    "archive_request",
+    "archive_success",
+    "archive_error",
+    "listmatch_request",
+    "listmatch_success",
+    "listmatch_error",
+    "delete_request",
+    "delete_success",
+    "delete_error",
+    "socket_bytes_in",
+    "socket_bytes_out",
+    "success_bytes_in",
+    "success_bytes_out",
+    "error_bytes_in",
+    "error_bytes_out", ]
+_collection_ops_accounting_key_columns = \
+    ["collection_id", "node_id", "timestamp", ]
+_collection_ops_accounting_count_columns = \
+    _collection_ops_accounting_columns[4:]
+
+_dedupe_columns = ["node_id", "redis_key", "timestamp", ]
+
+_accounting_staging_table = "collection_ops_accounting_staging"
+_dedupe_staging_table = "collection_ops_accounting_flush_dedupe_staging"
+
+_create_staging_tables = """
+    create temp table {0} 
+        (like nimbusio_central.collection_ops_accounting) on commit drop;
+    create temp table {1} 
+        (like nimbusio_central.collection_ops_accounting_flush_dedupe) 
+        on commit drop;
+""".format(_accounting_staging_table, _dedupe_staging_table)
+
+# rows for a (collection, node, minute) that is already in the table
+# (from an earlier partial flush) are added to the existing counts,
+# the rest are inserted
+_merge_accounting_rows = """
+    update nimbusio_central.collection_ops_accounting coa
+    set {set_list}
+    from {staging} s
+    where coa.collection_id = s.collection_id
+    and coa.node_id = s.node_id
+    and coa.timestamp = s.timestamp;
+
+    insert into nimbusio_central.collection_ops_accounting ({column_list})
+    select {column_list} from {staging} s
+    where not exists (
+        select 1 from nimbusio_central.collection_ops_accounting coa
+        where coa.collection_id = s.collection_id
+        and coa.node_id = s.node_id
+        and coa.timestamp = s.timestamp);
+""".format(
+    set_list=",\n        ".join(["{0} = coa.{0} + s.{0}".format(c) \
+                                  for c in \
+                                  _collection_ops_accounting_count_columns]),
+    column_list=", ".join(_collection_ops_accounting_columns),
+    staging=_accounting_staging_table)
+
+# the API reads per collection totals from rollup tables, which we keep
+# current in the same transaction, so they always agree with
+# collection_ops_accounting
+_rollup_tables = [("hour", "nimbusio_central.collection_ops_accounting_hourly"),
+                  ("day", "nimbusio_central.collection_ops_accounting_daily"), ]
+
+_merge_rollup_rows_template = """
+    create temp table {rollup_staging} on commit drop as
+    select collection_id, 
+           date_trunc('{resolution}', timestamp) as timestamp,
+           {sum_list}
+    from {staging}
+    group by collection_id, date_trunc('{resolution}', timestamp);
+
+    update {rollup_table} r
+    set {set_list}
+    from {rollup_staging} s
+    where r.collection_id = s.collection_id
+    and r.timestamp = s.timestamp;
+
+    insert into {rollup_table} ({column_list})
+    select {column_list} from {rollup_staging} s
+    where not exists (
+        select 1 from {rollup_table} r
+        where r.collection_id = s.collection_id
+        and r.timestamp = s.timestamp);
+"""
+
+_merge_rollup_rows = "".join([
+    _merge_rollup_rows_template.format(
+        resolution=resolution,
+        rollup_table=rollup_table,
+        rollup_staging="{0}_{1}".format(_accounting_staging_table, 
+                                        resolution),
+        sum_list=",\n           ".join(
+            ["sum({0}) as {0}".format(c) \
+             for c in _collection_ops_accounting_count_columns]),
+        set_list=",\n        ".join(
+            ["{0} = r.{0} + s.{0}".format(c) \
+             for c in _collection_ops_accounting_count_columns]),
+        column_list=", ".join(["collection_id", "timestamp", ] + \
+                              _collection_ops_accounting_count_columns),
+        staging=_accounting_staging_table) \
+    for resolution, rollup_table in _rollup_tables])
+
+_merge_dedupe_rows = """
+    insert into nimbusio_central.collection_ops_accounting_flush_dedupe 
+        ({column_list})
+    select {column_list} from {staging} s
+    where not exists (
+        select 1 from nimbusio_central.collection_ops_accounting_flush_dedupe d
+        where d.node_id = s.node_id and d.redis_key = s.redis_key);
+""".format(column_list=", ".join(_dedupe_columns),
+           staging=_dedupe_staging_table)
 
 def _collection_ops_accounting_row(node_id, collection_id, timestamp):
     """
@@ -109,83 +188,142 @@ def _retrieve_node_dict(central_db_connection):
                             where name = %s)""", [_local_node_name, ])
     return dict(rows)
 
-def _retrieve_dedupe_set(central_db_connection, node_id):
+def _retrieve_dedupe_sets(central_db_connection, node_ids):
+    """
+    return a dict of node_id : set of previously flushed redis keys
+    """
+    dedupe_sets = dict([(node_id, set(), ) for node_id in node_ids])
     rows = central_db_connection.fetch_all_rows("""
-        select redis_key
+        select node_id, redis_key
         from nimbusio_central.collection_ops_accounting_flush_dedupe
-        where node_id = %s""", [node_id, ])
-    return set([redis_key for (redis_key, ) in rows])
+        where node_id = any(%s)""", [list(node_ids), ])
+    for node_id, redis_key in rows:
+        dedupe_sets[node_id].add(redis_key)
+    return dedupe_sets
+
+def _batches(items, batch_size):
+    for start in range(0, len(items), batch_size):
+        yield items[start:start+batch_size]
 
 def _process_one_node(node_name,
                       node_id,
                       timestamp_cutoff,
-                      dedupe_set,
-                      collection_ops_accounting_rows,
-                      new_dedupes,
-                      node_keys_processed):
+                      dedupe_set):
+    """
+    return (collection_ops_accounting_rows, new_dedupes, keys_processed)
+    for one node
+
+    Keys are found with SCAN, so redis is never blocked by a KEYS over 
+    the whole keyspace, and are read with pipelined HGETALL.
+    """
     log = logging.getLogger("_process_one_node")
     redis_connection = create_redis_connection(host=node_name)
     search_key = compute_search_key(node_name)
-    keys = redis_connection.keys(search_key)
-    log.debug("found {0} keys from {1}".format(len(keys), search_key))
-    
-    value_dict = dict()
 
-    for key_bytes in keys:
+    collection_ops_accounting_rows = list()
+    new_dedupes = list()
+    keys_processed = list()
+
+    keys_to_read = list()
+    for key_bytes in redis_connection.scan_iter(match=search_key, 
+                                                count=_scan_count):
         key = key_bytes.decode("utf-8")
 
-        node_name, timestamp, partial_key = parse_key(key)
+        _, timestamp, partial_key = parse_key(key)
 
         if timestamp > timestamp_cutoff:
             log.debug("ignoring recent key {0}".format(key))
             continue
 
-        node_keys_processed.append(key)
+        keys_processed.append(key)
         if key in dedupe_set:
             log.debug("ignoring duplicate key {0}".format(key))
             continue
 
-        log.info("node = {0}, key = {1}".format(node_name, key))
-
-        hash_dict = redis_connection.hgetall(key)
-        for collection_id_bytes, count_bytes in hash_dict.items():
-            collection_id = int(collection_id_bytes)
-            count = int(count_bytes)
+        keys_to_read.append((key, timestamp, partial_key, ))
 
-            log.info("    collection_id = {0}, count = {1}".format(
-                collection_id, count))
+    log.info("node = {0}, {1} keys to read {2} processed".format(
+        node_name, len(keys_to_read), len(keys_processed)))
+    
+    value_dict = dict()
 
-            value_key = (timestamp, collection_id, )
-            if not value_key in value_dict:
-                value_dict[value_key] = \
-                    _collection_ops_accounting_row(node_id, 
-                                                   collection_id, 
-                                                   timestamp)
-            
-            value_dict[value_key][partial_key] += count
-        new_dedupes.append((node_id, key, ))
+    for batch in _batches(keys_to_read, _pipeline_batch_size):
+        pipeline = redis_connection.pipeline(transaction=False)
+        for key, _, _ in batch:
+            pipeline.hgetall(key)
+        hash_dicts = pipeline.execute()
+
+        for (key, timestamp, partial_key, ), hash_dict in \
+            zip(batch, hash_dicts):
+            for collection_id_bytes, count_bytes in hash_dict.items():
+                collection_id = int(collection_id_bytes)
+                count = int(count_bytes)
+
+                value_key = (timestamp, collection_id, )
+                if not value_key in value_dict:
+                    value_dict[value_key] = \
+                        _collection_ops_accounting_row(node_id, 
+                                                       collection_id, 
+                                                       timestamp)
+                
+                value_dict[value_key][partial_key] += count
+            new_dedupes.append((node_id, key, ))
 
     collection_ops_accounting_rows.extend(value_dict.values())
 
-def _insert_accounting_rows(central_db_connection, 
-                            collection_ops_accounting_rows):
-    for row in collection_ops_accounting_rows:
-        central_db_connection.execute(_collection_ops_accounting_insert,
-                                      row)
+    return collection_ops_accounting_rows, new_dedupes, keys_processed
 
-def _insert_dedupe_rows(central_db_connection, timestamp_cutoff, new_dedupes):
-    for node_id, redis_key in new_dedupes:
-        central_db_connection.execute("""
-            insert into nimbusio_central.collection_ops_accounting_flush_dedupe
-                   (node_id, redis_key, timestamp)
-            values (%s, %s, %s)""", [node_id, redis_key, timestamp_cutoff, ])
+def _copy_value(value):
+    """
+    format a value for the COPY text format
+    """
+    return str(value).replace("\\", "\\\\").replace(
+        "\t", "\\t").replace("\n", "\\n")
+
+def _copy_rows(central_db_connection, table_name, columns, rows):
+    """
+    bulk load a list of row tuples into a table with COPY
+    """
+    copy_file = io.StringIO()
+    for row in rows:
+        copy_file.write("\t".join([_copy_value(v) for v in row]))
+        copy_file.write("\n")
+    copy_file.seek(0)
+    central_db_connection.copy_from(copy_file, table_name, columns)
+
+def _merge_rows(central_db_connection, 
+                timestamp_cutoff, 
+                collection_ops_accounting_rows,
+                new_dedupes):
+    """
+    COPY the collected rows into staging tables and merge them 
+    into the real tables with set based statements.
+    We expect to be called inside a transaction.
+    """
+    central_db_connection.execute(_create_staging_tables)
+
+    _copy_rows(central_db_connection,
+               _accounting_staging_table,
+               _collection_ops_accounting_columns,
+               [[row[c] for c in _collection_ops_accounting_columns] \
+                for row in collection_ops_accounting_rows])
+    _copy_rows(central_db_connection,
+               _dedupe_staging_table,
+               _dedupe_columns,
+               [(node_id, redis_key, timestamp_cutoff, ) \
+                for node_id, redis_key in new_dedupes])
+
+    central_db_connection.execute(_merge_accounting_rows)
+    central_db_connection.execute(_merge_rollup_rows)
+    central_db_connection.execute(_merge_dedupe_rows)
 
 def _remove_processed_keys(node_name, keys_processed):
     log = logging.getLogger("_remove_processed_keys")
     redis_connection = create_redis_connection(host=node_name)
-    for key in keys_processed:
-        log.info("removing {0}".format(key))
-        redis_connection.delete(key)
+    log.info("removing {0} keys from {1}".format(len(keys_processed),
+                                                 node_name))
+    for batch in _batches(keys_processed, _pipeline_batch_size):
+        redis_connection.delete(*batch)
 
 def main():
     """
@@ -193,6 +331,7 @@ def main():
     return 0 for success (exit code)
     """
     initialize_logging(_log_path)
+    install_sampling_profiler()
     log = logging.getLogger("main")
     log.info("program starts")
 
@@ -217,8 +356,8 @@ def main():
     # values to be added to the dedupe table
     new_dedupes = list()
 
-    # keys to be deleted (a list for each node
-    node_keys_processed = [list() for _ in _node_names]
+    # keys to be deleted (a list for each node)
+    node_keys_processed = list()
 
     try:
         central_db_connection = get_central_connection()
@@ -232,51 +371,53 @@ def main():
 
         with advisory_lock(central_db_connection, "redis_stats_collector"):
             node_dict = _retrieve_node_dict(central_db_connection)
-            for node_name, keys_processed in \
-                zip(_node_names, node_keys_processed):
-                node_id = node_dict[node_name]
-                log.debug("processing node {0} node_id={1}".format(node_name,
-                                                                  node_id))
-
-                # The program then selects into memory all recently collected 
-                # keys from the central database table 
-                # collection_ops_accounting_flush_dedupe and stores them in a 
-                # dedupe set. This set allows runs of the collection/flush 
-                # program to be idempotent across some time period (
-                # but we won't keep the list of old keys forever.) 
-
-                dedupe_set = _retrieve_dedupe_set(central_db_connection, 
-                                                  node_id)
-
-                # The program then visits the Redis instance on every storage 
-                # node in the local data center, collecting the data from all 
-                # past stats keys -- aggregating it into the program's memory.  
-                # The aggregation should involve buckets for each 
-                # storage_node_id and redis key, corresponding to the columns 
-                # in the database.
-                _process_one_node(node_name,
-                                  node_dict[node_name],
-                                  timestamp_cutoff,
-                                  dedupe_set,
-                                  collection_ops_accounting_rows,
-                                  new_dedupes,
-                                  keys_processed)
+            node_ids = [node_dict[node_name] for node_name in _node_names]
+
+            # The program then selects into memory all recently collected 
+            # keys from the central database table 
+            # collection_ops_accounting_flush_dedupe and stores them in a 
+            # dedupe set. This set allows runs of the collection/flush 
+            # program to be idempotent across some time period (
+            # but we won't keep the list of old keys forever.) 
+            dedupe_sets = _retrieve_dedupe_sets(central_db_connection, 
+                                                node_ids)
+
+            # The program then visits the Redis instance on every storage 
+            # node in the local data center, collecting the data from all 
+            # past stats keys -- aggregating it into the program's memory.  
+            # The aggregation should involve buckets for each 
+            # storage_node_id and redis key, corresponding to the columns 
+            # in the database.
+            # The nodes are visited concurrently.
+            with ThreadPoolExecutor(max_workers=len(_node_names)) as executor:
+                futures = [executor.submit(_process_one_node,
+                                           node_name,
+                                           node_id,
+                                           timestamp_cutoff,
+                                           dedupe_sets[node_id]) \
+                           for node_name, node_id in zip(_node_names, 
+                                                         node_ids)]
+                for future in futures:
+                    rows, dedupes, keys_processed = future.result()
+                    collection_ops_accounting_rows.extend(rows)
+                    new_dedupes.extend(dedupes)
+                    node_keys_processed.append(keys_processed)
 
             # After collecting past keys from every storage node, 
             # inside a central database transaction:
-            # 1. Insert the collected stats into the central database 
-            #    collection_ops_accounting
+            # 1. Merge the collected stats into the central database 
+            #    collection_ops_accounting, and add them to the hourly
+            #    and daily rollups
             # 2. Insert collected keys into recently collected keys 
             #    collection_ops_accounting_flush_dedupe.
             # 3. commit transaction
             log.debug("updating central database")
             central_db_connection.begin_transaction()
             try:
-                _insert_accounting_rows(central_db_connection,
-                                        collection_ops_accounting_rows)
-                _insert_dedupe_rows(central_db_connection, 
-                                    timestamp_cutoff, 
-                                    new_dedupes)
+                _merge_rows(central_db_connection,
+                            timestamp_cutoff,
+                            collection_ops_accounting_rows,
+                            new_dedupes)
             except Exception:
                 central_db_connection.rollback()
                 raise
@@ -286,9 +427,14 @@ def main():
             # Then revisit the Redis nodes, and delete the keys we flushed 
             # into the database, and any keys we skipped because they were 
             # found in the dedupe set.
-            for node_name, keys_processed in zip(_node_names, 
-                                                 node_keys_processed):
-                _remove_processed_keys(node_name, keys_processed)
+            with ThreadPoolExecutor(max_workers=len(_node_names)) as executor:
+                futures = [executor.submit(_remove_processed_keys,
+                                           node_name,
+                                           keys_processed) \
+                           for node_name, keys_processed in \
+                           zip(_node_names, node_keys_processed)]
+                for future in futures:
+                    future.result()
 
     except Exception as instance:
         log.exception("Uhandled exception {0}".format(instance))
@@ -38,6 +38,8 @@ _resources_tuple = namedtuple("Resources",
                                "router_socket",
                                "event_push_client",
                                "active_retrieves",
+                               "cancelled_retrieves",
+                               "cancel_stats",
                                "pending_work_queue",
                                "available_ident_queue",])
 
@@ -54,6 +56,12 @@ _log_path_template = "{0}/nimbusio_rs_db_pool_controller_{1}.log"
 _worker_count = int(os.environ.get("NIMBUSIO_RETRIEVE_DB_POOL_COUNT", "2"))
 _poll_timeout = 3000 # milliseconds
 _reporting_interval = 60.0
+# a client that has not asked for the next sequence in this long
+# is not going to
+_retrieve_state_timeout = float(
+    os.environ.get("NIMBUSIO_RETRIEVE_STATE_TIMEOUT", str(10 * 60.0)))
+# long enough for a database worker to finish a lookup
+_cancelled_retrieve_timeout = 60.0
 
 def _launch_database_pool_worker(worker_number):
     log = logging.getLogger("launch_database_pool_worker")
@@ -79,9 +87,19 @@ def _send_pending_work_to_available_workers(resources):
         resources.router_socket.send_pyobj(message, zmq.SNDMORE)
         resources.router_socket.send_pyobj(control)
 
+def _remaining_sequence_size(retrieve_state):
+    """
+    the number of bytes we would still read for this retrieve
+    """
+    return sum(sequence_row["size"] for sequence_row in \
+        retrieve_state.sequence_rows[retrieve_state.sequence_index:
+                                     retrieve_state.sequence_end])
+
 def _handle_retrieve_key_start(resources, message, control):
     log = logging.getLogger("_handle_retrieve_key_start")
     retrieve_id = message["retrieve-id"]
+    # a client can cancel a retrieve and later start it again
+    resources.cancelled_retrieves.pop(retrieve_id, None)
     if retrieve_id in resources.active_retrieves:
         log.error("user_request_id = {0}, " \
                   "duplicate retrieve-id {1} in retrieve-key-start".format(
@@ -101,6 +119,11 @@ def _handle_retrieve_key_next(resources, message, control):
         log.error("user_request_id = {0}, " \
                   "unknown retrieve-id {1} in retrieve-key-next".format(
                   message["user-request-id"], retrieve_id))
+        # don't leave the client waiting for a reply
+        control["result"] = "unknown-retrieve-id"
+        control["error-message"] = "unknown retrieve-id {0}".format(
+            retrieve_id)
+        _send_error_reply(resources, message, control)
         return
 
     retrieve_state = resources.active_retrieves.pop(retrieve_id)
@@ -108,8 +131,45 @@ def _handle_retrieve_key_next(resources, message, control):
               message["user-request-id"]))
     _send_request_to_io_controller(resources, message, control, retrieve_state)
 
+def _handle_retrieve_key_cancel(resources, message, control):
+    """
+    the client has moved on without us: drop the work we have for this
+    retrieve here, and have the io controller drop the reads it has queued
+    """
+    log = logging.getLogger("_handle_retrieve_key_cancel")
+    retrieve_id = message["retrieve-id"]
+
+    pending_work = [(pending_message, pending_control, ) \
+        for pending_message, pending_control in resources.pending_work_queue \
+        if pending_message["retrieve-id"] != retrieve_id]
+    pending_work_count = len(resources.pending_work_queue) - len(pending_work)
+    resources.pending_work_queue.clear()
+    resources.pending_work_queue.extend(pending_work)
+
+    bytes_avoided = 0
+    retrieve_state = resources.active_retrieves.pop(retrieve_id, None)
+    if retrieve_state is not None:
+        bytes_avoided = _remaining_sequence_size(retrieve_state)
+
+    # the start may be with a database worker now
+    resources.cancelled_retrieves[retrieve_id] = time.time()
+
+    log.debug("user_request_id = {0}, {1} cancelled: " \
+              "{2} pending, {3} bytes avoided".format(
+              message["user-request-id"],
+              retrieve_id,
+              pending_work_count,
+              bytes_avoided))
+    resources.cancel_stats["cancels"] += 1
+    resources.cancel_stats["bytes-avoided"] += bytes_avoided
+
+    resources.io_controller_push_socket.send_pyobj(message, zmq.SNDMORE)
+    resources.io_controller_push_socket.send_pyobj(control, zmq.SNDMORE)
+    resources.io_controller_push_socket.send_pyobj(None)
+
 _dispatch_table = { "retrieve-key-start" : _handle_retrieve_key_start,
-                    "retrieve-key-next"  : _handle_retrieve_key_next, }
+                    "retrieve-key-next"  : _handle_retrieve_key_next, 
+                    "retrieve-key-cancel": _handle_retrieve_key_cancel, }
 
 def _read_pull_socket(resources):
     """
@@ -174,7 +234,7 @@ def _analyze_slice_offsets(sequence_rows, block_offset, total_block_count):
     log.debug("rows={0}, block_offset={1}, total_block_count={2}".format(
               len(sequence_rows), block_offset, total_block_count))
 
-    while pre_block_count < block_offset:
+    while pre_block_count < block_offset and index < len(sequence_rows):
         sequence_row = sequence_rows[index]
         blocks_in_sequence = _compute_blocks_in_sequence(sequence_row["size"])
         pre_block_count += blocks_in_sequence
@@ -186,7 +246,12 @@ def _analyze_slice_offsets(sequence_rows, block_offset, total_block_count):
             skip_count += 1
             skip_block_count = pre_block_count
 
-    if block_offset > 0: 
+    # the caller asked for a block past the end: there is nothing to keep
+    if skip_count == len(sequence_rows):
+        log.debug("block_offset={0} is past the end".format(block_offset))
+        return (skip_count, 0, 0, 0)
+
+    if block_offset > 0:
         if skip_count == 0:
             left_offset = block_offset
         else:
@@ -282,10 +347,30 @@ def _read_router_socket(resources):
     assert  message["message-type"] == "retrieve-key-start", message
     assert sequence_rows is not None
 
+    if message["retrieve-id"] in resources.cancelled_retrieves:
+        log.debug("user_request_id = {0}, {1} cancelled".format(
+                  message["user-request-id"], message["retrieve-id"]))
+        resources.cancel_stats["bytes-avoided"] += \
+            sum(sequence_row["size"] for sequence_row in sequence_rows)
+        return
+
     row_skip_count, row_keep_count, left_offset, right_offset = \
         _analyze_slice_offsets(sequence_rows, 
                                message["block-offset"],
                                message["block-count"])
+
+    # a block offset past the end of the object leaves nothing to send
+    if row_keep_count == 0:
+        control["result"] = "block_offset_out_of_range"
+        control["error-message"] = \
+            "block offset {0} is past the end of {1} sequence rows".format(
+                message["block-offset"], len(sequence_rows))
+        log.error("user_request_id = {0}, {1} {2}".format(
+                  message["user-request-id"],
+                  message["retrieve-id"],
+                  control["error-message"]))
+        _send_error_reply(resources, message, control)
+        return
     log.debug("user_request_id = {0}, " \
               "{1} {2} rows; skip={3}, keep={4}, " \
               "left_offset={5}, right_offset={6} ".format(
@@ -336,12 +421,54 @@ def _send_request_to_io_controller(resources,
     else:
         control["right-offset"] = 0
         resources.active_retrieves[message["retrieve-id"]] = \
-            retrieve_state._replace(sequence_index=next_sequence_index)
+            retrieve_state._replace(sequence_index=next_sequence_index,
+                                    timestamp=time.time())
 
     resources.io_controller_push_socket.send_pyobj(message, zmq.SNDMORE)
     resources.io_controller_push_socket.send_pyobj(control, zmq.SNDMORE)
     resources.io_controller_push_socket.send_pyobj(sequence_row)
 
+def _expire_retrieves(resources, current_time):
+    """
+    forget retrieves whose client has stopped asking for sequences, and
+    cancellations that no database worker can still be working on
+    """
+    log = logging.getLogger("_expire_retrieves")
+    expired_retrieve_ids = [
+        retrieve_id \
+        for retrieve_id, retrieve_state in resources.active_retrieves.items() \
+        if current_time - retrieve_state.timestamp >= _retrieve_state_timeout
+    ]
+    for retrieve_id in expired_retrieve_ids:
+        retrieve_state = resources.active_retrieves.pop(retrieve_id)
+        resources.cancel_stats["bytes-avoided"] += \
+            _remaining_sequence_size(retrieve_state)
+    if len(expired_retrieve_ids) > 0:
+        log.warn("expired {0} active_retrieves".format(
+                 len(expired_retrieve_ids)))
+
+    expired_retrieve_ids = [
+        retrieve_id \
+        for retrieve_id, cancel_time in resources.cancelled_retrieves.items() \
+        if current_time - cancel_time >= _cancelled_retrieve_timeout
+    ]
+    for retrieve_id in expired_retrieve_ids:
+        del resources.cancelled_retrieves[retrieve_id]
+
+def _report_cancel_stats(resources):
+    log = logging.getLogger("_report_cancel_stats")
+    report_message = "{0:,} retrieve cancels, {1:,} bytes avoided".format(
+        resources.cancel_stats["cancels"], 
+        resources.cancel_stats["bytes-avoided"])
+    log.info(report_message)
+    resources.event_push_client.info(
+        "retrieve_cancels",
+        report_message,
+        cancels=resources.cancel_stats["cancels"],
+        bytes_avoided=resources.cancel_stats["bytes-avoided"])
+    resources.cancel_stats["cancels"] = 0
+    resources.cancel_stats["bytes-avoided"] = 0
+
 def main():
     """
     main entry point
@@ -372,6 +499,8 @@ def main():
                             EventPushClient(zeromq_context, 
                                             "rs_db_pool_controller"),
                          active_retrieves=dict(),
+                         cancelled_retrieves=dict(),
+                         cancel_stats={"cancels" : 0, "bytes-avoided" : 0},
                          pending_work_queue=deque(),
                          available_ident_queue=deque())
 
@@ -430,6 +559,9 @@ def main():
                     pending_work_queue=len(resources.pending_work_queue),
                     available_ident_queue=len(resources.available_ident_queue))
 
+                _expire_retrieves(resources, current_time)
+                _report_cancel_stats(resources)
+
                 last_report_time = current_time
 
     except zmq.ZMQError as zmq_error:
@@ -9,6 +9,7 @@ import os
 import os.path
 import sys
 from threading import Event
+import time
 
 import psycopg2
 import zmq
@@ -20,11 +21,13 @@ from tools.process_util import set_signal_handler
 from tools.event_push_client import EventPushClient, unhandled_exception_topic
 from tools.database_connection import get_node_local_connection
 from tools.data_definitions import segment_sequence_template
+from tools.request_tracer import RequestTracer
 
 from retrieve_source.internal_sockets import db_controller_router_socket_uri
 
 _local_node_name = os.environ["NIMBUSIO_NODE_NAME"]
 _log_path_template = "{0}/nimbusio_rs_db_pool_worker_{1}_{2}.log"
+_poll_timeout = 1000 # milliseconds
 _all_sequence_rows_for_segment_query = """
 select {0} 
 from nimbusio_node.segment_sequence seq 
@@ -76,7 +79,8 @@ def _define_seq_val_fields():
 
 def _process_one_transaction(dealer_socket, 
                              database_connection, 
-                             event_push_client):
+                             event_push_client,
+                             tracer):
     """
     Wait for a reply to our last message from the controller.
     This will be a query request.
@@ -86,6 +90,10 @@ def _process_one_transaction(dealer_socket,
     log = logging.getLogger("_process_one_transaction")
     log.debug("waiting work request")
     try:
+        # wake up now and then to send the trace spans we hold
+        if dealer_socket.poll(_poll_timeout) == 0:
+            tracer.flush_if_due()
+            return
         request = dealer_socket.recv_pyobj()
     except zmq.ZMQError as zmq_error:
         if is_interrupted_system_call(zmq_error):
@@ -102,6 +110,7 @@ def _process_one_transaction(dealer_socket,
 
     control["result"] = "success"
     control["error-message"] = ""
+    query_start_time = time.time()
     try:
         result = database_connection.fetch_all_rows(query, request)    
     except psycopg2.OperationalError as instance:
@@ -113,6 +122,9 @@ def _process_one_transaction(dealer_socket,
         if len(result) == 0:
             control["result"] = "no_sequence_rows_found"
             control["error-message"] = "no sequence rows found"
+    tracer.record(request["user-request-id"], 
+                  "rs-db-lookup", 
+                  query_start_time)
 
     if control["result"] != "success":
         log.error("user_request_id = {0}, " \
@@ -164,6 +176,7 @@ def main():
 
     event_source_name = "rs_dbpool_worker_{0}".format(worker_number)
     event_push_client = EventPushClient(zeromq_context, event_source_name)
+    tracer = RequestTracer(event_push_client)
 
     dealer_socket = zeromq_context.socket(zmq.DEALER)
     dealer_socket.setsockopt(zmq.LINGER, 1000)
@@ -178,7 +191,8 @@ def main():
         while not halt_event.is_set():
             _process_one_transaction(dealer_socket, 
                                      database_connection,
-                                     event_push_client)
+                                     event_push_client,
+                                     tracer)
     except InterruptedSystemCall:
         if halt_event.is_set():
             log.info("program teminates normally with interrupted system call")
@@ -3,6 +3,10 @@
 io_controller.py
 
 Manage a pool of IO workers
+
+Each volume's pending reads are served in weighted fair order by collection
+(tools/fair_queue.py), with cost in bytes, so one collection reading many
+large objects does not make everyone else wait behind it.
 """
 from collections import defaultdict, deque, namedtuple
 import logging
@@ -23,6 +27,8 @@ from tools.process_util import identify_program_dir, \
         terminate_subprocess
 from tools.event_push_client import EventPushClient, unhandled_exception_topic
 from tools.file_space import load_file_space_info, file_space_sanity_check
+from tools.fair_queue import FairQueue, report_wait_stats
+from tools.request_tracer import RequestTracer
 from tools.zeromq_util import PollError, \
         is_interrupted_system_call
 
@@ -36,7 +42,9 @@ _resources_tuple = namedtuple("Resources",
                                "router_socket",
                                "event_push_client",
                                "pending_work_by_volume",
-                               "available_ident_by_volume",])
+                               "available_ident_by_volume",
+                               "cancel_stats",
+                               "tracer",])
 
 _local_node_name = os.environ["NIMBUSIO_NODE_NAME"]
 _log_path_template = "{0}/nimbusio_rs_io_controller_{1}.log"
@@ -45,6 +53,17 @@ _worker_count = int(os.environ.get("NIMBUSIO_RETRIEVE_IO_WORKER_COUNT", "2"))
 _poll_timeout = 3000 # milliseconds
 _reporting_interval = 60.0
 
+def _work_collection_id(work_entry):
+    message, _, _ = work_entry
+    return message["collection-id"]
+
+def _work_size(work_entry):
+    _, _, sequence_row = work_entry
+    return sequence_row["size"]
+
+def _create_pending_work_queue():
+    return FairQueue(_work_collection_id, _work_size)
+
 def _launch_io_worker(volume_name, worker_number):
     log = logging.getLogger("launch_io_worker")
     module_dir = identify_program_dir("retrieve_source")
@@ -67,14 +86,37 @@ def _send_pending_work_to_available_workers(resources):
         log.debug("work_count {0} for volume {1}".format(work_count, 
                                                          volume_name))
         for _ in range(work_count):
-            message, control, sequence_row = \
-                resources.pending_work_by_volume[volume_name].popleft()
+            volume_queue = resources.pending_work_by_volume[volume_name]
+            message, control, sequence_row = volume_queue.popleft()
+            current_time = time.time()
+            resources.tracer.record(message["user-request-id"],
+                                    "rs-io-queue-wait",
+                                    current_time - volume_queue.last_wait_time,
+                                    current_time)
             ident = resources.available_ident_by_volume[volume_name].popleft()
             resources.router_socket.send(ident, zmq.SNDMORE)
             resources.router_socket.send_pyobj(message, zmq.SNDMORE)
             resources.router_socket.send_pyobj(control, zmq.SNDMORE)
             resources.router_socket.send_pyobj(sequence_row)
 
+def _cancel_pending_work(resources, message):
+    """
+    drop the reads we have queued for a cancelled retrieve
+    """
+    log = logging.getLogger("_cancel_pending_work")
+    retrieve_id = message["retrieve-id"]
+    cancelled_count = 0
+    for volume_queue in resources.pending_work_by_volume.values():
+        cancelled_work = volume_queue.remove_if(
+            lambda work_entry: work_entry[0]["retrieve-id"] == retrieve_id)
+        cancelled_count += len(cancelled_work)
+        resources.cancel_stats["bytes-avoided"] += \
+            sum(_work_size(work_entry) for work_entry in cancelled_work)
+
+    log.debug("user_request_id = {0}, {1} cancelled {2} reads".format(
+              message["user-request-id"], retrieve_id, cancelled_count))
+    resources.cancel_stats["cancelled-reads"] += cancelled_count
+
 def _read_pull_socket(resources):
     """
     read messages from the PULL socket until we would block
@@ -95,6 +137,10 @@ def _read_pull_socket(resources):
         assert resources.pull_socket.rcvmore
         sequence_row = resources.pull_socket.recv_pyobj()
 
+        if message["message-type"] == "retrieve-key-cancel":
+            _cancel_pending_work(resources, message)
+            continue
+
         space_id = sequence_row["space_id"]
         try:
             volume_name = resources.volume_by_space_id[space_id]
@@ -181,17 +227,20 @@ def main():
 
 
     zeromq_context = zmq.Context()
+    event_push_client = EventPushClient(zeromq_context, "rs_io_controller")
 
     resources = \
         _resources_tuple(halt_event=Event(),
                          volume_by_space_id=_volume_name_by_space_id(),
                          pull_socket=zeromq_context.socket(zmq.PULL),
                          router_socket=zeromq_context.socket(zmq.ROUTER),
-                         event_push_client=\
-                            EventPushClient(zeromq_context, 
-                                            "rs_io_controller"),
-                         pending_work_by_volume=defaultdict(deque),
-                         available_ident_by_volume=defaultdict(deque))
+                         event_push_client=event_push_client,
+                         pending_work_by_volume=\
+                            defaultdict(_create_pending_work_queue),
+                         available_ident_by_volume=defaultdict(deque),
+                         cancel_stats={"cancelled-reads" : 0, 
+                                       "bytes-avoided"   : 0},
+                         tracer=RequestTracer(event_push_client))
 
     log.debug("binding to {0}".format(io_controller_pull_socket_uri))
     resources.pull_socket.bind(io_controller_pull_socket_uri)
@@ -230,6 +279,8 @@ def main():
                     log.error("unknown socket {0}".format(active_socket))
 
             current_time = time.time()
+            resources.tracer.flush_if_due(current_time)
+
             elapsed_time = current_time - last_report_time
             if elapsed_time > _reporting_interval:
                 pending_work = 0
@@ -243,6 +294,34 @@ def main():
                     report_message,
                     pending_work=pending_work)
 
+                report_message = \
+                    "{0:,} cancelled reads, {1:,} bytes avoided".format(
+                    resources.cancel_stats["cancelled-reads"],
+                    resources.cancel_stats["bytes-avoided"])
+                log.info(report_message)
+                resources.event_push_client.info(
+                    "retrieve_cancels",
+                    report_message,
+                    cancelled_reads=resources.cancel_stats["cancelled-reads"],
+                    bytes_avoided=resources.cancel_stats["bytes-avoided"])
+                resources.cancel_stats["cancelled-reads"] = 0
+                resources.cancel_stats["bytes-avoided"] = 0
+
+                wait_stats = dict()
+                for volume_queue in resources.pending_work_by_volume.values():
+                    for collection_id, (count, total_wait, max_wait, ) in \
+                        volume_queue.pop_wait_stats().items():
+                        wait_entry = \
+                            wait_stats.get(collection_id, (0, 0.0, 0.0, ))
+                        wait_stats[collection_id] = \
+                            (wait_entry[0] + count,
+                             wait_entry[1] + total_wait,
+                             max(wait_entry[2], max_wait), )
+                report_wait_stats(resources.event_push_client,
+                                  log,
+                                  "collection_queue_wait",
+                                  wait_stats)
+
                 last_report_time = current_time
 
     except zmq.ZMQError as zmq_error:
@@ -26,6 +26,7 @@ from tools.zeromq_util import is_interrupted_system_call, \
         InterruptedSystemCall
 from tools.process_util import set_signal_handler
 from tools.event_push_client import EventPushClient, unhandled_exception_topic
+from tools.request_tracer import RequestTracer
 
 from retrieve_source.internal_sockets import io_controller_router_socket_uri
 
@@ -34,6 +35,7 @@ _log_path_template = "{0}/nimbusio_rs_io_worker_{1}_{2}_{3}.log"
 _repository_path = os.environ["NIMBUSIO_REPOSITORY_PATH"]
 _max_file_cache_size = 1000
 _unused_file_close_interval = 120.0
+_poll_timeout = 1000 # milliseconds
 
 _resources_tuple = namedtuple("Resources", 
                               ["halt_event",
@@ -41,7 +43,8 @@ _resources_tuple = namedtuple("Resources",
                                "reply_push_sockets",
                                "dealer_socket",
                                "event_push_client",
-                               "file_cache", ])
+                               "file_cache", 
+                               "tracer", ])
 
 def _send_work_request(resources, volume_name):
     """
@@ -88,6 +91,11 @@ def _process_request(resources):
     log = logging.getLogger("_process_one_transaction")
     log.debug("waiting work request")
     try:
+        # wake up now and then to send the trace spans we hold
+        while resources.dealer_socket.poll(_poll_timeout) == 0:
+            resources.tracer.flush_if_due()
+            if resources.halt_event.is_set():
+                return
         request = resources.dealer_socket.recv_pyobj()
     except zmq.ZMQError as zmq_error:
         if is_interrupted_system_call(zmq_error):
@@ -103,6 +111,12 @@ def _process_request(resources):
     assert resources.dealer_socket.rcvmore
     sequence_row = resources.dealer_socket.recv_pyobj()
 
+    # the read, checksums and reply
+    with resources.tracer.span(request["user-request-id"], "rs-io-read"):
+        _read_and_reply(resources, request, control, sequence_row)
+
+def _read_and_reply(resources, request, control, sequence_row):
+    log = logging.getLogger("_read_and_reply")
     value_file_path = compute_value_file_path(_repository_path, 
                                               sequence_row["space_id"], 
                                               sequence_row["value_file_id"]) 
@@ -259,14 +273,15 @@ def main():
 
     event_source_name = "rs_io_worker_{0}_{1}".format(volume_name, 
                                                       worker_number)
+    event_push_client = EventPushClient(zeromq_context, event_source_name)
     resources = \
         _resources_tuple(halt_event=halt_event,
                          zeromq_context=zeromq_context,
                          reply_push_sockets=dict(),
-                         event_push_client=EventPushClient(zeromq_context, 
-                                                           event_source_name),
+                         event_push_client=event_push_client,
                          dealer_socket=zeromq_context.socket(zmq.DEALER),
-                         file_cache=LRUCache(_max_file_cache_size))
+                         file_cache=LRUCache(_max_file_cache_size),
+                         tracer=RequestTracer(event_push_client))
 
     resources.dealer_socket.setsockopt(zmq.LINGER, 1000)
     log.debug("connecting to {0}".format(io_controller_router_socket_uri))
@@ -15,6 +15,7 @@ import time
 import zmq
 
 from tools.standard_logging import initialize_logging
+from tools.sampling_profiler import install_sampling_profiler
 from tools.zeromq_util import PollError, \
         is_interrupted_system_call, \
         prepare_ipc_path
@@ -143,6 +144,7 @@ def main():
     log_path = _log_path_template.format(os.environ["NIMBUSIO_LOG_DIR"], 
                                          _local_node_name)
     initialize_logging(log_path)
+    install_sampling_profiler()
     log = logging.getLogger("main")
     log.info("program starts")
 
@@ -174,10 +176,19 @@ def main():
             poll_subprocess(database_pool_controller)
             poll_subprocess(io_controller)
 
+            try:
+                poll_result = poller.poll(_poll_timeout)
+            except zmq.ZMQError as zmq_error:
+                # some other signal, such as the sampling profiler's
+                if halt_event.is_set() or \
+                   not is_interrupted_system_call(zmq_error):
+                    raise
+                poll_result = list()
+
             # we've only registered one socket, so we could use an 'if' here,
             # but this 'for' works ok and it has the same form as the other
             # places where we use poller
-            for active_socket, event_flags in poller.poll(_poll_timeout):
+            for active_socket, event_flags in poll_result:
                 if event_flags & zmq.POLLERR:
                     error_message = \
                         "error flags from zmq {0}".format(active_socket)
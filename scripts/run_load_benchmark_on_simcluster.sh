@@ -0,0 +1,26 @@
+#!/bin/bash
+
+# run the load benchmark against a running cluster sim.
+
+# pass basedir of cluster sim as $1, any other arguments go to the benchmark
+# e.g. run_load_benchmark_on_simcluster.sh $BASEDIR \
+#           --workload=small_mix --output=/tmp/small_mix.json
+
+set -x
+set -e
+
+BASEDIR=$1
+shift
+
+if [ ! -d $BASEDIR ]; then
+    echo "basedir of simulated cluster '$BASEDIR' does not exist"
+    exit 1
+fi
+
+# pull in environment settings from the simulated cluster 
+source $BASEDIR/config/central_config.sh
+source $BASEDIR/config/client_config.sh
+
+PYTHON="python2.7"
+
+${PYTHON} test/load_benchmark/load_benchmark_main.py "$@"
@@ -18,6 +18,7 @@ from threading import Event
 import zmq
 
 from tools.standard_logging import initialize_logging
+from tools.sampling_profiler import install_sampling_profiler
 from tools.zeromq_util import is_interrupted_system_call, \
         prepare_ipc_path, \
         ipc_socket_uri
@@ -180,6 +181,7 @@ def main():
     log_path = _log_path_template.format(os.environ["NIMBUSIO_LOG_DIR"], 
                                          _local_node_name)
     initialize_logging(log_path)
+    install_sampling_profiler()
     log = logging.getLogger("main")
     log.info("program starts")
 
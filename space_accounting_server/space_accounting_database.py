@@ -19,16 +19,54 @@ INSERT INTO nimbusio_central.space_accounting
 VALUES(%s, '%s'::timestamp, %s, %s, %s);
 """.strip()
 
+# the running totals include every row ever stored for the collection,
+# so a space usage request is a primary key lookup
+_add_to_total_command = """
+UPDATE nimbusio_central.space_accounting_total
+SET bytes_added = bytes_added + %s,
+bytes_removed = bytes_removed + %s,
+bytes_retrieved = bytes_retrieved + %s
+WHERE collection_id = %s
+""".strip()
+
+_insert_total_command = """
+INSERT INTO nimbusio_central.space_accounting_total
+(collection_id, bytes_added, bytes_removed, bytes_retrieved)
+VALUES(%s, %s, %s, %s);
+""".strip()
+
 _collection_query = """
-SELECT COALESCE(SUM(bytes_added), 0), 
-COALESCE(SUM(bytes_removed), 0), 
-COALESCE(SUM(bytes_retrieved), 0)
-FROM nimbusio_central.space_accounting 
+SELECT bytes_added, bytes_removed, bytes_retrieved
+FROM nimbusio_central.space_accounting_total
 WHERE collection_id = %s
 """.strip()
 
+# fold the hourly rows of each day older than the cutoff into one row
+# for the day. The totals are unchanged, only the resolution of old history.
+_compact_command = """
+WITH folded AS (
+    DELETE FROM nimbusio_central.space_accounting sa
+    WHERE sa.timestamp < '%s'::timestamp
+    AND EXISTS (
+        SELECT 1 FROM nimbusio_central.space_accounting o
+        WHERE o.collection_id = sa.collection_id
+        AND o.timestamp >= date_trunc('day', sa.timestamp)
+        AND o.timestamp < date_trunc('day', sa.timestamp) + '1 day'::interval
+        AND o.timestamp <> sa.timestamp)
+    RETURNING *
+)
+INSERT INTO nimbusio_central.space_accounting
+(collection_id, timestamp, bytes_added, bytes_removed, bytes_retrieved)
+SELECT collection_id, date_trunc('day', timestamp), 
+SUM(bytes_added), SUM(bytes_removed), SUM(bytes_retrieved)
+FROM folded
+GROUP BY collection_id, date_trunc('day', timestamp)
+""".strip()
+
 _clear_command = """
 DELETE FROM nimbusio_central.space_accounting 
+WHERE collection_id = %s;
+DELETE FROM nimbusio_central.space_accounting_total
 WHERE collection_id = %s
 """.strip()
 
@@ -65,19 +103,43 @@ class SpaceAccountingDatabase(object):
             bytes_retrieved,
         )
         self._connection.execute(command)
+
+        command = _add_to_total_command % (
+            bytes_added,
+            bytes_removed,
+            bytes_retrieved,
+            collection_id,
+        )
+        if self._connection.execute(command) == 0:
+            command = _insert_total_command % (
+                collection_id,
+                bytes_added,
+                bytes_removed,
+                bytes_retrieved,
+            )
+            self._connection.execute(command)
     
     def retrieve_collection_stats(self, collection_id):
         """get the consolidated stats for an collection"""
         query = _collection_query % (collection_id, )
         result = self._connection.fetch_one_row(query)
         if result is None:
-            raise SpaceAccountingDatabasecollectionNotFound(str(collection_id))
+            # nothing has been stored for this collection yet
+            return 0, 0, 0, 
         [bytes_added, bytes_removed, bytes_retrieved, ] = result
         return bytes_added, bytes_removed, bytes_retrieved, 
 
+    def compact_collection_stats(self, cutoff):
+        """
+        fold the hourly rows older than cutoff into daily rows
+        return the number of daily rows written
+        """
+        command = _compact_command % (cutoff, )
+        return self._connection.execute(command)
+
     def clear_collection_stats(self, collection_id):
         """clear all stats for an collection *** for use in testing ***"""
-        command = _clear_command % (collection_id, )
+        command = _clear_command % (collection_id, collection_id, )
         self._connection.execute(command)
 
 if __name__ == "__main__":
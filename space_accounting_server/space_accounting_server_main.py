@@ -7,6 +7,8 @@ Receives space accounting messages.
 Accumulates diffs for each collection in memory.
 Diffs are grouped by hour. I.e added = [hournumber][collection_id] = bytes added. 
 Similar for bytes retrieved and bytes removed.
+The diffs not yet stored are also summed by collection, and added to the
+running totals in the database to answer a space usage request.
 5 minutes into the next hour, the lowest numbered node dumps stats to the 
 database, and announces to other nodes that it has done so.
 Other nodes clear their memory of an hour's data when notified of a successful
@@ -34,7 +36,7 @@ from tools import time_queue_driven_process
 from tools.data_definitions import parse_timestamp_repr
 
 from space_accounting_server.space_accounting_database import \
-        SpaceAccountingDatabase, SpaceAccountingDatabaseCollectionNotFound
+        SpaceAccountingDatabase
 from space_accounting_server.state_cleaner import StateCleaner
 from space_accounting_server.util import floor_hour
 
@@ -53,6 +55,16 @@ _space_accounting_pipeline_address = os.environ.get(
     "tcp://127.0.0.1:8550"
 )
 
+def _add_to_state(state, hour, collection_id, event, value):
+    hour_entry = state["data"].setdefault(hour, dict())
+    collection_entry = hour_entry.setdefault(collection_id, dict())
+    collection_entry[event] = collection_entry.setdefault(event, 0) + value
+
+    # the same values summed over all hours, so a space usage request
+    # does not have to visit every hour
+    pending_entry = state["pending"].setdefault(collection_id, dict())
+    pending_entry[event] = pending_entry.setdefault(event, 0) + value
+
 def _handle_space_accounting_detail(state, message, _data):
     log = logging.getLogger("_handle_space_accounting_detail")
     message_datetime = parse_timestamp_repr(message["timestamp-repr"])
@@ -61,10 +73,25 @@ def _handle_space_accounting_detail(state, message, _data):
         message_hour, message["collection-id"], message["event"], message["value"]
     ))
 
-    hour_entry = state["data"].setdefault(message_hour, dict())
-    collection_entry = hour_entry.setdefault(message["collection-id"], dict())
-    collection_entry[message["event"]] = \
-        collection_entry.setdefault(message["event"], 0) + message["value"]
+    _add_to_state(state, 
+                  message_hour, 
+                  message["collection-id"], 
+                  message["event"], 
+                  message["value"])
+
+def _handle_space_accounting_batch(state, message, _data):
+    """
+    values summed by a web server's SpaceAccountingClient
+    hour-entries is a dict of hour repr : [[collection_id, event, value]...]
+    """
+    log = logging.getLogger("_handle_space_accounting_batch")
+    entry_count = 0
+    for hour_repr, entries in message["hour-entries"].iteritems():
+        message_hour = floor_hour(parse_timestamp_repr(hour_repr))
+        for collection_id, event, value in entries:
+            _add_to_state(state, message_hour, collection_id, event, value)
+        entry_count += len(entries)
+    log.debug("%s entries" % (entry_count, ))
 
 def _handle_space_usage_request(state, message, _data):
     log = logging.getLogger("_handle_space_usage_request")
@@ -78,31 +105,22 @@ def _handle_space_usage_request(state, message, _data):
         "result"        : None,
     }
 
-    # get sums of stats from the database
+    # get the running totals from the database
     space_accounting_database = SpaceAccountingDatabase(transaction=False)
     try:
         stats = space_accounting_database.retrieve_collection_stats(
             message["collection-id"]
         )
-    except SpaceAccountingDatabasecollectionNotFound, instance:
-        error_message = "collection not found %s" % (instance, )
-        log.warn(error_message)
-        reply["result"] = "unknown-collection"
-        reply["error-message"] = error_message
-        state["router-server"].queue_message_for_send(reply)
-        return
     finally:
         space_accounting_database.close()
 
     bytes_added, bytes_removed, bytes_retrieved = stats
 
-    # increment sums with data from state
-    for key in state["data"].keys():
-        if message["collection-id"] in state["data"][key]:
-            events = state["data"][key][message["collection-id"]]
-            bytes_added += events.get("bytes_added", 0)
-            bytes_removed += events.get("bytes_removed", 0)
-            bytes_retrieved += events.get("bytes_retrieved", 0)
+    # increment sums with data we have not stored yet
+    events = state["pending"].get(message["collection-id"], dict())
+    bytes_added += events.get("bytes_added", 0)
+    bytes_removed += events.get("bytes_removed", 0)
+    bytes_retrieved += events.get("bytes_retrieved", 0)
         
     reply["result"] = "success"
     reply["bytes-added"] = long(bytes_added)
@@ -112,6 +130,7 @@ def _handle_space_usage_request(state, message, _data):
 
 _dispatch_table = {
     "space-accounting-detail"   : _handle_space_accounting_detail,
+    "space-accounting-batch"    : _handle_space_accounting_batch,
     "space-usage-request"       : _handle_space_usage_request,
 }
 
@@ -126,6 +145,7 @@ def _create_state():
         "receive-queue"         : deque(),
         "queue-dispatcher"      : None,
         "data"                  : dict(),
+        "pending"               : dict(),
     }
 
 def _setup(_halt_event, state):
@@ -6,6 +6,7 @@ A time queue action to periodically clean out the state
 """
 import datetime
 import logging
+import os
 import time
 
 from tools.data_definitions import create_timestamp
@@ -13,6 +14,11 @@ from space_accounting_server.space_accounting_database import \
         SpaceAccountingDatabase
 from space_accounting_server.util import floor_hour
 
+# hourly rows older than this are folded into daily rows, once a day
+_compact_after_days = int(
+    os.environ.get("NIMBUSIO_SPACE_ACCOUNTING_COMPACT_AFTER_DAYS", "30"))
+_compact_hour = 3
+
 class StateCleaner(object):
     """A time queue action to periodically clean out the state"""
     def __init__(self, state):
@@ -48,6 +54,9 @@ class StateCleaner(object):
 
         self._flush_to_database(prev_hour)
 
+        if current_hour.hour == _compact_hour:
+            self._compact_database(current_hour)
+
         return [(self.run, self.next_run(), )]
 
     def _flush_to_database(self, hour):
@@ -68,5 +77,29 @@ class StateCleaner(object):
             )
         space_accounting_database.commit()
 
+        # the hour is now in the running totals
+        for collection_id, events in self._state["data"][hour].items():
+            pending_entry = self._state["pending"][collection_id]
+            for event, value in events.items():
+                pending_entry[event] -= value
+            if not any(pending_entry.values()):
+                del self._state["pending"][collection_id]
+
         del self._state["data"][hour]
 
+    def _compact_database(self, current_hour):
+        cutoff = current_hour - datetime.timedelta(days=_compact_after_days)
+        self._log.info("compacting data before %s" % (cutoff, ))
+        space_accounting_database = SpaceAccountingDatabase()
+        try:
+            row_count = \
+                space_accounting_database.compact_collection_stats(cutoff)
+        except Exception:
+            # the totals don't depend on compaction, so we keep running
+            # and try again tomorrow
+            self._log.exception("compaction failed")
+            space_accounting_database.close()
+            return
+        space_accounting_database.commit()
+        self._log.info("compacted into %s daily rows" % (row_count, ))
+
@@ -1,4 +1,7 @@
 delete from nimbusio_central.space_accounting;
+delete from nimbusio_central.space_accounting_total;
+delete from nimbusio_central.collection_ops_accounting_hourly;
+delete from nimbusio_central.collection_ops_accounting_daily;
 delete from nimbusio_central.collection;
 delete from nimbusio_central.customer_key;
 delete from nimbusio_central.customer;
@@ -0,0 +1,120 @@
+/****
+ * add the hourly and daily rollups of collection_ops_accounting to an
+ * existing central database, and backfill them from the history tables.
+ *
+ * The history tables are locked in share mode, so a concurrent flush from
+ * redis_stats_collector waits for the backfill to commit, and is then added
+ * to the rollups incrementally: nothing is counted twice or missed.
+ ****/
+
+begin;
+
+set search_path to nimbusio_central, public;
+
+lock table collection_ops_accounting, collection_ops_accounting_old
+    in share mode;
+
+create table collection_ops_accounting_hourly (
+   collection_id int4 not null references nimbusio_central.collection(id),
+   timestamp timestamp not null,
+   retrieve_request int8 not null default 0,
+   retrieve_success int8 not null default 0,
+   retrieve_error int8 not null default 0,
+   archive_request int8 not null default 0,
+   archive_success int8 not null default 0,
+   archive_error int8 not null default 0,
+   listmatch_request int8 not null default 0,
+   listmatch_success int8 not null default 0,
+   listmatch_error int8 not null default 0,
+   delete_request int8 not null default 0,
+   delete_success int8 not null default 0,
+   delete_error int8 not null default 0,
+   socket_bytes_in int8 not null default 0,
+   socket_bytes_out int8 not null default 0,
+   success_bytes_in int8 not null default 0,
+   success_bytes_out int8 not null default 0,
+   error_bytes_in int8 not null default 0,
+   error_bytes_out int8 not null default 0
+);
+create unique index collection_ops_accounting_hourly_idx 
+    on collection_ops_accounting_hourly ("collection_id", "timestamp");
+
+create table collection_ops_accounting_daily (
+   collection_id int4 not null references nimbusio_central.collection(id),
+   timestamp timestamp not null,
+   retrieve_request int8 not null default 0,
+   retrieve_success int8 not null default 0,
+   retrieve_error int8 not null default 0,
+   archive_request int8 not null default 0,
+   archive_success int8 not null default 0,
+   archive_error int8 not null default 0,
+   listmatch_request int8 not null default 0,
+   listmatch_success int8 not null default 0,
+   listmatch_error int8 not null default 0,
+   delete_request int8 not null default 0,
+   delete_success int8 not null default 0,
+   delete_error int8 not null default 0,
+   socket_bytes_in int8 not null default 0,
+   socket_bytes_out int8 not null default 0,
+   success_bytes_in int8 not null default 0,
+   success_bytes_out int8 not null default 0,
+   error_bytes_in int8 not null default 0,
+   error_bytes_out int8 not null default 0
+);
+create unique index collection_ops_accounting_daily_idx 
+    on collection_ops_accounting_daily ("collection_id", "timestamp");
+
+INSERT INTO collection_ops_accounting_hourly
+SELECT collection_id,
+       date_trunc('hour', timestamp) AS timestamp,
+       sum(retrieve_request),
+       sum(retrieve_success),
+       sum(retrieve_error),
+       sum(archive_request),
+       sum(archive_success),
+       sum(archive_error),
+       sum(listmatch_request),
+       sum(listmatch_success),
+       sum(listmatch_error),
+       sum(delete_request),
+       sum(delete_success),
+       sum(delete_error),
+       sum(socket_bytes_in),
+       sum(socket_bytes_out),
+       sum(success_bytes_in),
+       sum(success_bytes_out),
+       sum(error_bytes_in),
+       sum(error_bytes_out)
+  FROM (SELECT * FROM collection_ops_accounting
+        UNION ALL
+        SELECT * FROM collection_ops_accounting_old) combined
+ GROUP BY collection_id, date_trunc('hour', timestamp);
+
+INSERT INTO collection_ops_accounting_daily
+SELECT collection_id,
+       date_trunc('day', timestamp) AS timestamp,
+       sum(retrieve_request),
+       sum(retrieve_success),
+       sum(retrieve_error),
+       sum(archive_request),
+       sum(archive_success),
+       sum(archive_error),
+       sum(listmatch_request),
+       sum(listmatch_success),
+       sum(listmatch_error),
+       sum(delete_request),
+       sum(delete_success),
+       sum(delete_error),
+       sum(socket_bytes_in),
+       sum(socket_bytes_out),
+       sum(success_bytes_in),
+       sum(success_bytes_out),
+       sum(error_bytes_in),
+       sum(error_bytes_out)
+  FROM (SELECT * FROM collection_ops_accounting
+        UNION ALL
+        SELECT * FROM collection_ops_accounting_old) combined
+ GROUP BY collection_id, date_trunc('day', timestamp);
+
+/* rollback; */
+commit;
@@ -79,6 +79,23 @@ create table space_accounting(
    bytes_removed int8 not null default 0,
    bytes_retrieved int8 not null default 0
 );
+create index space_accounting_collection_id_timestamp_idx 
+    on space_accounting ("collection_id", "timestamp");
+
+create table space_accounting_total(
+   collection_id int4 primary key references nimbusio_central.collection(id),
+   bytes_added int8 not null default 0,
+   bytes_removed int8 not null default 0,
+   bytes_retrieved int8 not null default 0
+);
+
+COMMENT ON TABLE space_accounting_total IS
+'The sums of space_accounting for each collection.  space_accounting_server
+adds to this table in the same transaction in which it inserts its hourly
+rows into space_accounting, and reads it to answer space usage requests.
+
+sql/space_accounting_total.sql creates this table in an existing database
+and backfills it from space_accounting.';
 
 create table collection_ops_accounting (
    collection_id int4 not null references nimbusio_central.collection(id),
@@ -211,5 +228,71 @@ records moved into this table.
 
 Look at the maintenance script for details.';
 
+create table collection_ops_accounting_hourly (
+   collection_id int4 not null references nimbusio_central.collection(id),
+   timestamp timestamp not null,
+   retrieve_request int8 not null default 0,
+   retrieve_success int8 not null default 0,
+   retrieve_error int8 not null default 0,
+   archive_request int8 not null default 0,
+   archive_success int8 not null default 0,
+   archive_error int8 not null default 0,
+   listmatch_request int8 not null default 0,
+   listmatch_success int8 not null default 0,
+   listmatch_error int8 not null default 0,
+   delete_request int8 not null default 0,
+   delete_success int8 not null default 0,
+   delete_error int8 not null default 0,
+   socket_bytes_in int8 not null default 0,
+   socket_bytes_out int8 not null default 0,
+   success_bytes_in int8 not null default 0,
+   success_bytes_out int8 not null default 0,
+   error_bytes_in int8 not null default 0,
+   error_bytes_out int8 not null default 0
+);
+create unique index collection_ops_accounting_hourly_idx 
+    on collection_ops_accounting_hourly ("collection_id", "timestamp");
+
+COMMENT ON TABLE collection_ops_accounting_hourly IS
+'Totals from collection_ops_accounting for each collection, across all
+nodes, by hour.
+
+redis_stats_collector adds to this table in the same transaction in which it
+adds rows to collection_ops_accounting, so the two always agree.  Rows are not
+moved out of this table when collection_ops_accounting is summerized into
+collection_ops_accounting_old.
+
+sql/collection_ops_accounting_rollups.sql creates this table in an existing
+database and backfills it from the history tables.';
+
+create table collection_ops_accounting_daily (
+   collection_id int4 not null references nimbusio_central.collection(id),
+   timestamp timestamp not null,
+   retrieve_request int8 not null default 0,
+   retrieve_success int8 not null default 0,
+   retrieve_error int8 not null default 0,
+   archive_request int8 not null default 0,
+   archive_success int8 not null default 0,
+   archive_error int8 not null default 0,
+   listmatch_request int8 not null default 0,
+   listmatch_success int8 not null default 0,
+   listmatch_error int8 not null default 0,
+   delete_request int8 not null default 0,
+   delete_success int8 not null default 0,
+   delete_error int8 not null default 0,
+   socket_bytes_in int8 not null default 0,
+   socket_bytes_out int8 not null default 0,
+   success_bytes_in int8 not null default 0,
+   success_bytes_out int8 not null default 0,
+   error_bytes_in int8 not null default 0,
+   error_bytes_out int8 not null default 0
+);
+create unique index collection_ops_accounting_daily_idx 
+    on collection_ops_accounting_daily ("collection_id", "timestamp");
+
+COMMENT ON TABLE collection_ops_accounting_daily IS
+'Like collection_ops_accounting_hourly, but by day.  This is what the API
+reads to report operational stats for a collection.';
+
 /* rollback; */
 commit;
@@ -0,0 +1,35 @@
+/****
+ * add the running totals of space_accounting to an existing central
+ * database, and backfill them from the hourly rows.
+ *
+ * space_accounting is locked in share mode, so an hourly flush from
+ * space_accounting_server waits for the backfill to commit, and is then
+ * added to the totals incrementally.
+ ****/
+
+begin;
+
+set search_path to nimbusio_central, public;
+
+lock table space_accounting in share mode;
+
+create index space_accounting_collection_id_timestamp_idx 
+    on space_accounting ("collection_id", "timestamp");
+
+create table space_accounting_total(
+   collection_id int4 primary key references nimbusio_central.collection(id),
+   bytes_added int8 not null default 0,
+   bytes_removed int8 not null default 0,
+   bytes_retrieved int8 not null default 0
+);
+
+INSERT INTO space_accounting_total
+SELECT collection_id,
+       sum(bytes_added),
+       sum(bytes_removed),
+       sum(bytes_retrieved)
+  FROM space_accounting
+ GROUP BY collection_id;
+
+/* rollback; */
+commit;
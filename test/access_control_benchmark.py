@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+access_control_benchmark.py
+
+compare checks/sec of check_access_control, which parses the access_control
+JSON on every request, against the cached CompiledAccessControl
+arguments [<check-count>]
+"""
+from collections import namedtuple
+import json
+import sys
+import time
+
+from tools.collection_access_control import version, \
+    check_access_control, \
+    CompiledAccessControlCache, \
+    read_access, \
+    allow_unauth_read, \
+    ipv4_whitelist, \
+    unauth_referrer_whitelist, \
+    locations
+
+_default_check_count = 100000
+_collection_id = 1
+
+# represents a WebOb request
+_mock_request = namedtuple("MockRequest",
+                           ["method", "url", "headers", "remote_addr"])
+
+_request = _mock_request(
+    method="GET",
+    url="http://example.com/public/images/logo.png",
+    headers={"Referer" : "http://example.com/myapp/index.html"},
+    remote_addr="192.168.17.200")
+
+_access_control_cases = [
+    ("public read",
+     {version : "1.0",
+      allow_unauth_read : True}),
+    ("ipv4 whitelist",
+     {version : "1.0",
+      allow_unauth_read : True,
+      ipv4_whitelist : ["10.{0}.0.0/16".format(n) for n in range(32)] + \
+                       ["192.168.{0}.0/24".format(n) for n in range(32)]}),
+    ("referrer whitelist",
+     {version : "1.0",
+      allow_unauth_read : True,
+      unauth_referrer_whitelist : ["example.com/app{0}".format(n) \
+                                   for n in range(32)] + \
+                                  ["example.com/myapp"]}),
+    ("locations",
+     {version : "1.0",
+      allow_unauth_read : False,
+      ipv4_whitelist : ["192.168.0.0/16"],
+      locations : [{"prefix" : "private{0}".format(n),
+                    allow_unauth_read : False} for n in range(8)] + \
+                  [{"regexp" : "^public/.*$",
+                    allow_unauth_read : True}]}),
+]
+
+def _checks_per_second(check_function, check_count):
+    start_time = time.time()
+    for _ in xrange(check_count):
+        check_function()
+    elapsed_time = time.time() - start_time
+    return check_count / elapsed_time
+
+def main():
+    """
+    main entry point
+    """
+    if len(sys.argv) > 1:
+        check_count = int(sys.argv[1])
+    else:
+        check_count = _default_check_count
+
+    cache = CompiledAccessControlCache()
+
+    print "{0:<20} {1:>14} {2:>14} {3:>8}".format(
+        "case", "uncached/sec", "compiled/sec", "speedup")
+    for name, access_control in _access_control_cases:
+        access_control_json = json.dumps(access_control)
+
+        uncached_result = check_access_control(read_access,
+                                               _request,
+                                               access_control_json)
+        compiled_result = cache.check_access_control(_collection_id,
+                                                     read_access,
+                                                     _request,
+                                                     access_control_json)
+        assert compiled_result == uncached_result, (name,
+                                                    uncached_result,
+                                                    compiled_result, )
+
+        uncached_rate = _checks_per_second(
+            lambda: check_access_control(read_access,
+                                         _request,
+                                         access_control_json),
+            check_count)
+        compiled_rate = _checks_per_second(
+            lambda: cache.check_access_control(_collection_id,
+                                               read_access,
+                                               _request,
+                                               access_control_json),
+            check_count)
+
+        print "{0:<20} {1:>14.0f} {2:>14.0f} {3:>7.1f}x".format(
+            name, uncached_rate, compiled_rate, compiled_rate / uncached_rate)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+load_benchmark_main.py
+
+run workloads against a simulated cluster, recording throughput and latency
+percentiles for each operation and the CPU and memory of each service.
+Write the results as JSON, optionally comparing them with a baseline run.
+
+expects the environment from the cluster's central_config.sh and
+client_config.sh (see scripts/run_load_benchmark_on_simcluster.sh)
+
+returns 1 if the comparison found a regression
+"""
+import logging
+import os
+import os.path
+import random
+import sys
+import threading
+
+from tools.standard_logging import initialize_logging
+from tools.database_connection import get_central_connection
+from tools.collection import compute_default_collection_name
+from tools.customer import create_customer, \
+    add_key_to_customer, \
+    list_customer_keys
+from test.load_benchmark.options import parse_cmdline
+from test.load_benchmark.signed_http_client import SignedHTTPClient, \
+    parse_address
+from test.load_benchmark.operation_stats import OperationStats
+from test.load_benchmark.service_stats import ServiceMonitor
+from test.load_benchmark.workloads import workloads
+from test.load_benchmark import results
+
+_log_dir = os.environ["NIMBUSIO_LOG_DIR"]
+_log_path = "{0}/nimbusio_load_benchmark.log".format(_log_dir)
+_service_domain = os.environ["NIMBUS_IO_SERVICE_DOMAIN"]
+_default_address = "{0}:{1}".format(os.environ["NIMBUS_IO_SERVICE_HOST"],
+                                    os.environ["NIMBUS_IO_SERVICE_PORT"])
+_source_path = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def _customer_key(username):
+    """
+    return (key_id, key), creating the customer if needed
+    """
+    connection = get_central_connection()
+    connection.begin_transaction()
+    try:
+        keys = list_customer_keys(connection, username)
+        if len(keys) == 0:
+            create_customer(connection, username, False)
+            add_key_to_customer(connection, username)
+            keys = list_customer_keys(connection, username)
+    except Exception:
+        connection.rollback()
+        raise
+    else:
+        connection.commit()
+    finally:
+        connection.close()
+
+    return keys[0]
+
+def _run_workload(workload, client, collection_name, monitor, options):
+    log = logging.getLogger("_run_workload")
+
+    log.info("setup {0}".format(workload.name))
+    workload.setup(client, collection_name, options)
+
+    log.info("run {0}: {1} workers {2} operations".format(workload.name,
+                                                          options.workers,
+                                                          options.operations))
+    stats = OperationStats()
+    threads = list()
+    for worker_index in range(options.workers):
+        rng = random.Random(options.seed + worker_index)
+        threads.append(threading.Thread(target=workload.run,
+                                        name="worker-{0}".format(worker_index),
+                                        args=(client,
+                                              collection_name,
+                                              rng,
+                                              worker_index,
+                                              stats,
+                                              options, )))
+
+    monitor.start()
+    stats.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats.finish()
+    service_stats = monitor.stop()
+
+    return {"operations" : stats.summary(), "services" : service_stats}
+
+def _print_workload(workload_name, workload_result):
+    print workload_name
+    for operation_name, summary in sorted(
+        workload_result["operations"].items()):
+        print "    {0:18} {1:6} ops {2:4} errors {3:9.1f} ops/s " \
+              "{4:8.2f} MB/s p50 {5} p90 {6} p99 {7}".format(
+                  operation_name,
+                  summary["count"],
+                  summary["errors"],
+                  summary["ops_per_second"],
+                  summary["mb_per_second"],
+                  _format_seconds(summary["p50"]),
+                  _format_seconds(summary["p90"]),
+                  _format_seconds(summary["p99"]))
+    for service_name, service in sorted(workload_result["services"].items()):
+        print "    {0:48} cpu {1:8.2f}s rss {2:8.1f}MB".format(
+            service_name,
+            service["cpu_seconds"],
+            service["peak_rss"] / (1024.0 * 1024.0))
+
+def _format_seconds(value):
+    if value is None:
+        return "-"
+    return "{0:.3f}s".format(value)
+
+def main():
+    """
+    main entry point
+    """
+    initialize_logging(_log_path)
+    log = logging.getLogger("main")
+    options = parse_cmdline()
+
+    writer_address = parse_address(options.writer_address or _default_address)
+    reader_address = parse_address(options.reader_address or _default_address)
+
+    key_id, key = _customer_key(options.username)
+    client = SignedHTTPClient(writer_address,
+                              reader_address,
+                              _service_domain,
+                              options.username,
+                              key_id,
+                              key)
+    collection_name = compute_default_collection_name(options.username)
+    monitor = ServiceMonitor(_log_dir)
+
+    workload_results = dict()
+    for workload_name in options.workloads:
+        workload = workloads[workload_name]()
+        workload_results[workload_name] = _run_workload(workload,
+                                                        client,
+                                                        collection_name,
+                                                        monitor,
+                                                        options)
+        _print_workload(workload_name, workload_results[workload_name])
+
+    run_results = results.build_results(_source_path,
+                                        options,
+                                        workload_results)
+    if options.output is not None:
+        results.write_results(options.output, run_results)
+        log.info("results written to {0}".format(options.output))
+
+    if options.compare is not None:
+        baseline = results.load_results(options.compare)
+        if results.compare(baseline,
+                           run_results,
+                           options.regression_threshold,
+                           sys.stdout):
+            log.warn("regression against {0}".format(options.compare))
+            return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+operation_stats.py
+
+class OperationStats
+
+record the latency, size and outcome of each operation a workload performs,
+and summarize them per operation: throughput and latency percentiles.
+One OperationStats is shared by all the workers of a workload.
+"""
+import logging
+import threading
+import time
+
+_percentiles = [("p50", 0.50, ), ("p90", 0.90, ), ("p99", 0.99, ), ]
+
+def nearest_rank(sorted_values, fraction):
+    """
+    return the value at the given fraction (0.0 - 1.0) of a sorted list
+    """
+    if len(sorted_values) == 0:
+        return None
+    index = int(fraction * len(sorted_values) + 0.5) - 1
+    return sorted_values[min(max(index, 0), len(sorted_values) - 1)]
+
+class OperationStats(object):
+    """
+    thread safe record of operations
+    """
+    def __init__(self):
+        self._log = logging.getLogger("OperationStats")
+        self._lock = threading.Lock()
+        # operation name : [latencies, bytes, error count]
+        self._operations = dict()
+        self._start_time = None
+        self._end_time = None
+
+    def start(self):
+        self._start_time = time.time()
+
+    def finish(self):
+        self._end_time = time.time()
+
+    def record(self, operation_name, elapsed_seconds, byte_count, success):
+        with self._lock:
+            try:
+                entry = self._operations[operation_name]
+            except KeyError:
+                entry = [list(), 0, 0]
+                self._operations[operation_name] = entry
+            if success:
+                entry[0].append(elapsed_seconds)
+                entry[1] += byte_count
+            else:
+                entry[2] += 1
+
+    def timed(self, operation_name, function, *args, **kwargs):
+        """
+        call function and record it as one operation. byte_count is the
+        length of the result, or kwargs["byte_count"] if it is given.
+        Errors are counted and logged, not raised: a benchmark run keeps
+        going.
+        """
+        byte_count = kwargs.pop("byte_count", None)
+        start_time = time.time()
+        try:
+            result = function(*args, **kwargs)
+        except Exception:
+            self.record(operation_name, time.time() - start_time, 0, False)
+            self._log.exception(operation_name)
+            return None
+        if byte_count is None:
+            byte_count = len(result) if result is not None else 0
+        self.record(operation_name, time.time() - start_time, byte_count, True)
+        return result
+
+    def summary(self):
+        """
+        return a dict of operation name : summary dict
+        """
+        elapsed_seconds = self._end_time - self._start_time
+        summary = dict()
+        for operation_name, (latencies, byte_count, error_count) in \
+            self._operations.items():
+            latencies = sorted(latencies)
+            operation_summary = {
+                "count"             : len(latencies),
+                "errors"            : error_count,
+                "bytes"             : byte_count,
+                "seconds"           : elapsed_seconds,
+                "ops_per_second"    : len(latencies) / elapsed_seconds,
+                "mb_per_second"     : \
+                    byte_count / elapsed_seconds / (1024.0 * 1024.0),
+                "max"               : latencies[-1] if latencies else None,
+            }
+            for name, fraction in _percentiles:
+                operation_summary[name] = nearest_rank(latencies, fraction)
+            summary[operation_name] = operation_summary
+        return summary
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+commandline options for the load benchmark
+"""
+import argparse
+
+from test.load_benchmark.workloads import workloads
+
+def parse_cmdline():
+    """
+    """
+
+    parser = argparse.ArgumentParser(
+        description='Run a load benchmark against a simulated cluster')
+
+    parser.add_argument("--writer-address", dest="writer_address",
+        action="store", default=None,
+        help="host:port of the web writer "
+            "(default: NIMBUS_IO_SERVICE_HOST:NIMBUS_IO_SERVICE_PORT)")
+
+    parser.add_argument("--reader-address", dest="reader_address",
+        action="store", default=None,
+        help="host:port of the web reader "
+            "(default: NIMBUS_IO_SERVICE_HOST:NIMBUS_IO_SERVICE_PORT)")
+
+    parser.add_argument("--username", dest="username", action="store",
+        default="load-benchmark",
+        help="customer to run the benchmark as (created if needed)")
+
+    parser.add_argument("--workload", dest="workloads", action="append",
+        choices=sorted(workloads.keys()), default=None,
+        help="workload to run, may be repeated (default: all)")
+
+    parser.add_argument("--workers", dest="workers", action="store",
+        default=4, type=int,
+        help="number of concurrent clients per workload")
+
+    parser.add_argument("--operations", dest="operations", action="store",
+        default=100, type=int,
+        help="operations per worker per workload")
+
+    parser.add_argument("--seed", dest="seed", action="store",
+        default=0, type=int,
+        help="random seed: the same seed sends the same requests")
+
+    parser.add_argument("--put-fraction", dest="put_fraction",
+        action="store", default=0.5, type=float,
+        help="fraction of PUTs in the small object mix")
+
+    parser.add_argument("--small-size", dest="small_size", action="store",
+        default=4 * 1024, type=int,
+        help="size of small objects")
+
+    parser.add_argument("--large-size", dest="large_size", action="store",
+        default=64 * 1024 * 1024, type=int,
+        help="size of the object for range reads")
+
+    parser.add_argument("--part-size", dest="part_size", action="store",
+        default=10 * 1024 * 1024, type=int,
+        help="size of each part of a conjoined upload")
+
+    parser.add_argument("--part-count", dest="part_count", action="store",
+        default=4, type=int,
+        help="number of parts in a conjoined upload")
+
+    parser.add_argument("--list-key-count", dest="list_key_count",
+        action="store", default=10000, type=int,
+        help="number of keys under the listmatch prefix")
+
+    parser.add_argument("--list-max-keys", dest="list_max_keys",
+        action="store", default=1000, type=int,
+        help="max_keys for each listmatch")
+
+    parser.add_argument("--output", dest="output", action="store",
+        default=None,
+        help="write JSON results to this file")
+
+    parser.add_argument("--compare", dest="compare", action="store",
+        default=None,
+        help="JSON results of a baseline run to compare with")
+
+    parser.add_argument("--regression-threshold",
+        dest="regression_threshold", action="store", default=0.1, type=float,
+        help="fractional change counted as a regression (default: 0.1)")
+
+    args = parser.parse_args()
+    if args.workloads is None:
+        args.workloads = sorted(workloads.keys())
+
+    return args
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+results.py
+
+write the results of a benchmark run as JSON, and compare a run with a
+baseline run, so a regression between two commits shows up.
+"""
+import json
+import subprocess
+import time
+
+def git_commit(source_path):
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"],
+                                       cwd=source_path).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def build_results(source_path, options, workload_results):
+    """
+    return a dict of the whole run
+
+    workload_results
+        dict of workload name : {"operations" : ..., "services" : ...}
+    """
+    return {
+        "commit"        : git_commit(source_path),
+        "timestamp"     : time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "options"       : dict(vars(options)),
+        "workloads"     : workload_results,
+    }
+
+def write_results(path, results):
+    with open(path, "w") as output_file:
+        json.dump(results, output_file, indent=4, sort_keys=True)
+
+def load_results(path):
+    with open(path) as input_file:
+        return json.load(input_file)
+
+def _change(baseline_value, current_value):
+    if not baseline_value or current_value is None:
+        return None
+    return (current_value - baseline_value) / float(baseline_value)
+
+def _format_change(change):
+    if change is None:
+        return "    -"
+    return "{0:+6.1%}".format(change)
+
+def compare(baseline, current, threshold, output_file):
+    """
+    print throughput and p99 latency changes for each operation the two
+    runs have in common.
+
+    return True if any operation is slower than the baseline by more
+    than threshold (a fraction)
+    """
+    output_file.write("baseline {0} {1}\n".format(baseline["commit"],
+                                                 baseline["timestamp"]))
+    output_file.write("current  {0} {1}\n".format(current["commit"],
+                                                 current["timestamp"]))
+
+    regression = False
+    for workload_name in sorted(current["workloads"]):
+        if workload_name not in baseline["workloads"]:
+            continue
+        baseline_operations = \
+            baseline["workloads"][workload_name]["operations"]
+        current_operations = current["workloads"][workload_name]["operations"]
+        for operation_name in sorted(current_operations):
+            if operation_name not in baseline_operations:
+                continue
+            baseline_summary = baseline_operations[operation_name]
+            current_summary = current_operations[operation_name]
+            throughput_change = _change(baseline_summary["ops_per_second"],
+                                        current_summary["ops_per_second"])
+            p99_change = _change(baseline_summary["p99"],
+                                 current_summary["p99"])
+            regressed = \
+                (throughput_change is not None and \
+                 throughput_change < -threshold) or \
+                (p99_change is not None and p99_change > threshold)
+            output_file.write(
+                "{0:14} {1:18} ops/s {2} p99 {3}{4}\n".format(
+                    workload_name,
+                    operation_name,
+                    _format_change(throughput_change),
+                    _format_change(p99_change),
+                    " REGRESSION" if regressed else ""))
+            regression = regression or regressed
+
+    return regression
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+service_stats.py
+
+class ServiceMonitor
+
+measure the CPU time and memory of each service in a simulated cluster
+while a workload runs. We find the services in /proc: python processes
+whose NIMBUSIO_LOG_DIR is the cluster's log dir. A service is named
+<node name>/<program>, e.g. "multi-node-01/data_writer_main".
+
+A thread samples every sample_interval seconds, for the peak RSS and
+to see processes that start (or restart) during the run.
+"""
+import logging
+import os
+import os.path
+import resource
+import threading
+
+_sample_interval = 1.0
+_clock_ticks = os.sysconf(os.sysconf_names["SC_CLK_TCK"])
+_page_size = resource.getpagesize()
+
+def _read_file(path):
+    with open(path, "rb") as input_file:
+        return input_file.read()
+
+def _process_environment(pid):
+    environ_data = _read_file("/proc/{0}/environ".format(pid))
+    return dict([entry.split("=", 1) \
+                 for entry in environ_data.split("\0") if "=" in entry])
+
+def _program_name(pid):
+    """
+    return the name of the first .py file in the command line, or None
+    """
+    for arg in _read_file("/proc/{0}/cmdline".format(pid)).split("\0"):
+        if arg.endswith(".py"):
+            return os.path.splitext(os.path.basename(arg))[0]
+    return None
+
+def _cpu_seconds(pid):
+    # the command may contain spaces: the fields we want come after ')'
+    stat_fields = _read_file("/proc/{0}/stat".format(pid)).rsplit(")", 1)[1]
+    stat_fields = stat_fields.split()
+    # utime and stime are fields 14 and 15 of the whole line
+    return (int(stat_fields[11]) + int(stat_fields[12])) / float(_clock_ticks)
+
+def _rss_bytes(pid):
+    return int(_read_file("/proc/{0}/statm".format(pid)).split()[1]) * \
+        _page_size
+
+def find_services(log_dir):
+    """
+    return a dict of pid : service name for the cluster's processes
+    """
+    services = dict()
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        pid = int(entry)
+        try:
+            environment = _process_environment(pid)
+            if environment.get("NIMBUSIO_LOG_DIR") != log_dir:
+                continue
+            program_name = _program_name(pid)
+        except (IOError, OSError):
+            # gone, or not ours
+            continue
+        if program_name is None:
+            continue
+        services[pid] = "/".join([environment.get("NIMBUSIO_NODE_NAME", "-"),
+                                  program_name])
+    return services
+
+class ServiceMonitor(object):
+    """
+    measure CPU seconds and peak RSS per service between start and stop
+    """
+    def __init__(self, log_dir, sample_interval=_sample_interval):
+        self._log = logging.getLogger("ServiceMonitor")
+        self._log_dir = log_dir
+        self._sample_interval = sample_interval
+        self._halt_event = threading.Event()
+        self._thread = None
+        # pid : [service name, start cpu, last cpu, peak rss]
+        self._processes = dict()
+
+    def start(self):
+        self._halt_event.clear()
+        self._processes.clear()
+        self._sample(initial=True)
+        self._thread = threading.Thread(target=self._run,
+                                        name="ServiceMonitor")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        stop sampling, return a dict of service name : stats dict
+        """
+        self._halt_event.set()
+        self._thread.join()
+        self._sample()
+
+        stats = dict()
+        for service_name, start_cpu, last_cpu, peak_rss in \
+            self._processes.values():
+            # a service restarted during the run has more than one pid
+            entry = stats.setdefault(service_name, {"cpu_seconds"   : 0.0,
+                                                    "peak_rss"      : 0,
+                                                    "processes"     : 0, })
+            entry["cpu_seconds"] += last_cpu - start_cpu
+            entry["peak_rss"] = max(entry["peak_rss"], peak_rss)
+            entry["processes"] += 1
+        return stats
+
+    def _run(self):
+        while not self._halt_event.wait(self._sample_interval):
+            self._sample()
+
+    def _sample(self, initial=False):
+        for pid, service_name in find_services(self._log_dir).items():
+            try:
+                cpu_seconds = _cpu_seconds(pid)
+                rss_bytes = _rss_bytes(pid)
+            except (IOError, OSError):
+                continue
+            try:
+                entry = self._processes[pid]
+            except KeyError:
+                # a process that starts during the run is charged all its CPU
+                start_cpu = cpu_seconds if initial else 0.0
+                self._processes[pid] = \
+                    [service_name, start_cpu, cpu_seconds, rss_bytes]
+            else:
+                entry[2] = cpu_seconds
+                entry[3] = max(entry[3], rss_bytes)
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+signed_http_client.py
+
+class SignedHTTPClient
+
+make nimbus.io requests, signed as InteractionPoolAuthenticator expects,
+to a web writer and a web reader. Every request carries a fresh
+x-nimbus-io-user-request-id, so a traced request can be found in the logs.
+"""
+import hashlib
+import hmac
+import httplib
+import json
+import time
+import urllib
+import uuid
+
+_timeout = 360.0
+
+class HTTPRequestError(Exception):
+    """
+    a request returned a status we did not expect
+    """
+    def __init__(self, method, path, status, body):
+        Exception.__init__(self, "{0} {1} {2} {3}".format(method,
+                                                          path,
+                                                          status,
+                                                          body[:200]))
+        self.status = status
+
+def parse_address(address):
+    """
+    return (host, port) from host:port
+    """
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+class SignedHTTPClient(object):
+    """
+    writer_address, reader_address
+        (host, port) of a web writer and a web reader
+
+    service_domain
+        requests go to <collection-name>.<service_domain>
+    """
+    def __init__(self,
+                 writer_address,
+                 reader_address,
+                 service_domain,
+                 username,
+                 key_id,
+                 key):
+        self._writer_address = writer_address
+        self._reader_address = reader_address
+        self._service_domain = service_domain
+        self._username = username
+        self._key_id = key_id
+        self._key = key
+
+    def _headers(self, method, host, path):
+        timestamp = str(int(time.time()))
+        string_to_sign = "\n".join((self._username,
+                                    method,
+                                    timestamp,
+                                    urllib.unquote_plus(path), ))
+        signature = hmac.new(self._key,
+                             string_to_sign,
+                             hashlib.sha256).hexdigest()
+        return {
+            "Host"                          : host,
+            "Authorization"                 : "NIMBUS.IO {0}:{1}".format(
+                                                self._key_id, signature),
+            "x-nimbus-io-timestamp"         : timestamp,
+            "x-nimbus-io-user-request-id"   : str(uuid.uuid4()),
+        }
+
+    def request(self,
+                method,
+                collection_name,
+                path,
+                body=None,
+                headers=None,
+                expected_statuses=(httplib.OK, httplib.PARTIAL_CONTENT, )):
+        """
+        send one request, return the response body
+        raise HTTPRequestError for a status we don't expect
+        """
+        if method in ["GET", "HEAD", ]:
+            address = self._reader_address
+        else:
+            address = self._writer_address
+
+        host = "{0}.{1}:{2}".format(collection_name,
+                                    self._service_domain,
+                                    address[1])
+        request_headers = self._headers(method, host, path)
+        if headers is not None:
+            request_headers.update(headers)
+        if body is not None:
+            request_headers["Content-Length"] = str(len(body))
+
+        # the servers often close the connection, so we don't try to
+        # keep it
+        connection = httplib.HTTPConnection(address[0],
+                                            address[1],
+                                            timeout=_timeout)
+        try:
+            connection.request(method, path, body, request_headers)
+            response = connection.getresponse()
+            response_body = response.read()
+        finally:
+            connection.close()
+
+        if response.status not in expected_statuses:
+            raise HTTPRequestError(method, path, response.status,
+                                   response_body)
+        return response_body
+
+    def archive(self, collection_name, key, data, query_args=None):
+        path = "/data/{0}".format(urllib.quote(key))
+        if query_args is not None:
+            path = "?".join([path, urllib.urlencode(query_args)])
+        return self.request("POST", collection_name, path, data)
+
+    def retrieve(self, collection_name, key, byte_range=None):
+        headers = None
+        if byte_range is not None:
+            headers = {"Range" : "bytes={0}-{1}".format(*byte_range)}
+        return self.request("GET",
+                            collection_name,
+                            "/data/{0}".format(urllib.quote(key)),
+                            headers=headers)
+
+    def delete(self, collection_name, key):
+        return self.request("DELETE",
+                            collection_name,
+                            "/data/{0}".format(urllib.quote(key)))
+
+    def list_keys(self, collection_name, prefix, max_keys):
+        query = urllib.urlencode([("prefix", prefix),
+                                  ("max_keys", max_keys), ])
+        return self.request("GET", collection_name, "/data/?{0}".format(query))
+
+    def start_conjoined(self, collection_name, key):
+        path = "/conjoined/{0}?action=start".format(urllib.quote(key))
+        result = json.loads(self.request("POST", collection_name, path))
+        return result["conjoined_identifier"]
+
+    def finish_conjoined(self, collection_name, key, conjoined_identifier):
+        path = "/conjoined/{0}?action=finish&conjoined_identifier={1}".format(
+            urllib.quote(key), conjoined_identifier)
+        return self.request("POST", collection_name, path)
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+workloads.py
+
+the workloads a load benchmark can run. Each workload has
+
+setup(client, collection_name, options)
+    create whatever the workload needs: not measured
+
+run(client, collection_name, rng, worker_index, stats, options)
+    perform options.operations operations for one worker, recording each
+    one in stats
+
+Keys and data depend only on the workload, the worker index and the seed,
+so two runs with the same options send the same requests.
+"""
+import logging
+import random
+
+_range_read_size = 64 * 1024
+_payload_chunk_size = 64 * 1024
+
+def _payload(rng, size):
+    """
+    return size bytes of random data from rng: we can't benefit from
+    compression anywhere, and the same seed gives the same data
+    """
+    chunks = list()
+    remaining_size = size
+    while remaining_size > 0:
+        chunk_size = min(remaining_size, _payload_chunk_size)
+        chunks.append("{0:0{1}x}".format(rng.getrandbits(chunk_size * 8),
+                                         chunk_size * 2).decode("hex"))
+        remaining_size -= chunk_size
+    return "".join(chunks)
+
+def _setup_rng(options):
+    return random.Random(options.seed)
+
+def _key(workload_name, worker_index, index):
+    return "load-benchmark/{0}/{1:04d}/{2:08d}".format(workload_name,
+                                                      worker_index,
+                                                      index)
+
+class SmallObjectMix(object):
+    """
+    a mix of PUTs and GETs of small objects. Each worker reads back only
+    keys it has already written.
+    """
+    name = "small_mix"
+
+    def setup(self, client, collection_name, options):
+        pass
+
+    def run(self, client, collection_name, rng, worker_index, stats, options):
+        data = _payload(rng, options.small_size)
+        written_keys = list()
+        for index in range(options.operations):
+            if len(written_keys) == 0 or rng.random() < options.put_fraction:
+                key = _key(self.name, worker_index, index)
+                if stats.timed("put",
+                               client.archive,
+                               collection_name,
+                               key,
+                               data,
+                               byte_count=len(data)) is not None:
+                    written_keys.append(key)
+            else:
+                stats.timed("get",
+                            client.retrieve,
+                            collection_name,
+                            rng.choice(written_keys))
+
+class ConjoinedUpload(object):
+    """
+    large uploads as conjoined archives: start, upload the parts, finish
+    """
+    name = "conjoined"
+
+    def setup(self, client, collection_name, options):
+        pass
+
+    def run(self, client, collection_name, rng, worker_index, stats, options):
+        data = _payload(rng, options.part_size)
+        for index in range(options.operations):
+            key = _key(self.name, worker_index, index)
+            conjoined_identifier = stats.timed("conjoined-start",
+                                               client.start_conjoined,
+                                               collection_name,
+                                               key,
+                                               byte_count=0)
+            if conjoined_identifier is None:
+                continue
+            for part in range(1, options.part_count + 1):
+                query_args = [("conjoined_identifier", conjoined_identifier),
+                              ("conjoined_part", part), ]
+                stats.timed("conjoined-part",
+                            client.archive,
+                            collection_name,
+                            key,
+                            data,
+                            query_args,
+                            byte_count=len(data))
+            stats.timed("conjoined-finish",
+                        client.finish_conjoined,
+                        collection_name,
+                        key,
+                        conjoined_identifier,
+                        byte_count=0)
+
+class RangeRead(object):
+    """
+    random range reads from one large object
+    """
+    name = "range_read"
+
+    def __init__(self):
+        self._key = _key(self.name, 0, 0)
+
+    def setup(self, client, collection_name, options):
+        client.archive(collection_name,
+                       self._key,
+                       _payload(_setup_rng(options), options.large_size))
+
+    def run(self, client, collection_name, rng, worker_index, stats, options):
+        read_size = min(_range_read_size, options.large_size)
+        for _ in range(options.operations):
+            offset = rng.randint(0, options.large_size - read_size)
+            stats.timed("range-get",
+                        client.retrieve,
+                        collection_name,
+                        self._key,
+                        (offset, offset + read_size - 1, ))
+
+class ListMatch(object):
+    """
+    listmatch on a prefix holding many keys
+    """
+    name = "listmatch"
+
+    def setup(self, client, collection_name, options):
+        log = logging.getLogger("ListMatch")
+        log.info("archiving {0} keys".format(options.list_key_count))
+        data = _payload(_setup_rng(options), options.small_size)
+        for index in range(options.list_key_count):
+            client.archive(collection_name, _key(self.name, 0, index), data)
+
+    def run(self, client, collection_name, rng, worker_index, stats, options):
+        prefix = "load-benchmark/{0}/".format(self.name)
+        for _ in range(options.operations):
+            stats.timed("listmatch",
+                        client.list_keys,
+                        collection_name,
+                        prefix,
+                        options.list_max_keys)
+
+class DeleteStorm(object):
+    """
+    delete as fast as we can the keys archived in setup
+    """
+    name = "delete_storm"
+
+    def setup(self, client, collection_name, options):
+        data = _payload(_setup_rng(options), options.small_size)
+        for worker_index in range(options.workers):
+            for index in range(options.operations):
+                client.archive(collection_name,
+                               _key(self.name, worker_index, index),
+                               data)
+
+    def run(self, client, collection_name, rng, worker_index, stats, options):
+        for index in range(options.operations):
+            stats.timed("delete",
+                        client.delete,
+                        collection_name,
+                        _key(self.name, worker_index, index),
+                        byte_count=0)
+
+workloads = dict([(workload.name, workload, ) for workload in [
+    SmallObjectMix, ConjoinedUpload, RangeRead, ListMatch, DeleteStorm, ]])
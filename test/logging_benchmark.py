@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+logging_benchmark.py
+
+measure the CPU that logging costs per GB ingested and per GB served,
+at INFO, with the log calls our hot paths make:
+
+ingest
+    for each slice, an INFO line from WriterThread._handle_archive_key_next
+    and one from Writer.store_sequence
+
+serve
+    for each block, a DEBUG line from web_public_reader's retriever and
+    one from web_internal_reader's retriever (not emitted at INFO)
+
+for the way we used to log (str.format before the call, written by a
+RotatingFileHandler in the caller), with LazyFormat, with the level checked
+once per request (as the retrievers do for their per block DEBUG lines),
+with LazyFormat and 1 in 10 sampling, and with LazyFormat and the
+AsyncHandler.
+
+CPU is user + system for the whole process, so it includes the
+AsyncHandler thread. The caller column is the wall time of the logging
+calls themselves: what the hot path waits for.
+
+arguments [<gigabytes>]
+"""
+import logging
+import logging.handlers
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+from tools.data_definitions import incoming_slice_size, block_size
+from tools.standard_logging import _log_format_template, LazyFormat, \
+        SamplingFilter, AsyncHandler
+
+_default_gigabytes = 1
+_gigabyte = 1024 ** 3
+_sample_interval = 10
+_max_log_size = 16 * 1024 * 1024
+_max_log_backup_files = 1000
+
+_archive_key_next_log = logging.getLogger("_handle_archive_key_next")
+_store_sequence_log = logging.getLogger("Writer.store_sequence")
+_public_retriever_log = logging.getLogger("web_public_reader.Retriever")
+_internal_retriever_log = logging.getLogger("web_internal_reader.Retriever")
+
+_message = {
+    "user-request-id"   : str(uuid.uuid4()),
+    "collection-id"     : 1001,
+    "key"               : "test/key/0000001234",
+    "timestamp-repr"    : "datetime.datetime(2013, 1, 2, 3, 4, 5, 678901)",
+    "segment-num"       : 3,
+    "unified-id"        : 4294967296123,
+    "segment-size"      : incoming_slice_size // 8,
+}
+
+def _ingest_eager(sequence_num):
+    _archive_key_next_log.info("request {0}: {1} {2} {3} {4}".format(
+        _message["user-request-id"],
+        _message["collection-id"],
+        _message["key"],
+        _message["timestamp-repr"],
+        _message["segment-num"]))
+    _store_sequence_log.info("request {0}: " \
+                   "store_sequence {1} {2} {3} {4} {5}: {6} ({7})".format(
+                   _message["user-request-id"],
+                   _message["collection-id"],
+                   _message["key"],
+                   _message["unified-id"],
+                   _message["timestamp-repr"],
+                   _message["segment-num"],
+                   sequence_num,
+                   _message["segment-size"]))
+
+def _ingest_lazy(sequence_num):
+    _archive_key_next_log.info(LazyFormat("request {0}: {1} {2} {3} {4}",
+        _message["user-request-id"],
+        _message["collection-id"],
+        _message["key"],
+        _message["timestamp-repr"],
+        _message["segment-num"]))
+    _store_sequence_log.info(LazyFormat("request {0}: " \
+                   "store_sequence {1} {2} {3} {4} {5}: {6} ({7})",
+                   _message["user-request-id"],
+                   _message["collection-id"],
+                   _message["key"],
+                   _message["unified-id"],
+                   _message["timestamp-repr"],
+                   _message["segment-num"],
+                   sequence_num,
+                   _message["segment-size"]))
+
+def _serve_checked(block_num, debug_enabled):
+    if debug_enabled:
+        _serve_lazy(block_num)
+
+def _serve_eager(block_num):
+    _public_retriever_log.debug("{0} retrieved {1} bytes from internal".format(
+                                _message["user-request-id"], block_size))
+    _internal_retriever_log.debug(
+        "request {0} ({1}) {2} {3} task successful".format(
+        _message["user-request-id"],
+        block_num,
+        _message["segment-num"],
+        _message["key"]))
+
+def _serve_lazy(block_num):
+    _public_retriever_log.debug(LazyFormat(
+        "{0} retrieved {1} bytes from internal",
+        _message["user-request-id"], block_size))
+    _internal_retriever_log.debug(LazyFormat(
+        "request {0} ({1}) {2} {3} task successful",
+        _message["user-request-id"],
+        block_num,
+        _message["segment-num"],
+        _message["key"]))
+
+def _file_handler(log_path):
+    return logging.handlers.RotatingFileHandler(
+        log_path,
+        mode="a",
+        maxBytes=_max_log_size,
+        backupCount=_max_log_backup_files,
+        encoding="utf-8"
+    )
+
+def _cpu_seconds():
+    times = os.times()
+    return times[0] + times[1]
+
+def _run(log_path, log_function, call_count, async_handler, sampled):
+    """
+    return the CPU seconds and caller seconds for call_count calls
+    """
+    handler = _file_handler(log_path)
+    if async_handler:
+        handler = AsyncHandler(handler)
+    handler.setFormatter(logging.Formatter(_log_format_template))
+    logging.root.addHandler(handler)
+    logging.root.setLevel(logging.INFO)
+    sampled_loggers = [_archive_key_next_log, _store_sequence_log, ]
+    sampling_filters = list()
+    if sampled:
+        for log in sampled_loggers:
+            sampling_filters.append(SamplingFilter(_sample_interval))
+            log.addFilter(sampling_filters[-1])
+
+    start_cpu = _cpu_seconds()
+    start_time = time.time()
+    for index in range(call_count):
+        log_function(index)
+    caller_seconds = time.time() - start_time
+
+    # the records still queued are part of the cost
+    logging.root.removeHandler(handler)
+    handler.close()
+    cpu_seconds = _cpu_seconds() - start_cpu
+
+    for log, sampling_filter in zip(sampled_loggers, sampling_filters):
+        log.removeFilter(sampling_filter)
+
+    return cpu_seconds, caller_seconds
+
+def _check_level_once(log_function, log):
+    """
+    check the level once, as a retriever does at the start of a request
+    """
+    def _checked_function(index):
+        return log_function(index, enabled)
+    enabled = log.isEnabledFor(logging.DEBUG)
+    return _checked_function
+
+_modes = [
+    ("format, sync (before)", "eager", False, False, ),
+    ("lazy, sync", "lazy", False, False, ),
+    ("level checked once", "checked", False, False, ),
+    ("lazy, sampled 1/10", "lazy", False, True, ),
+    ("lazy, async", "lazy", True, False, ),
+]
+
+def main():
+    gigabytes = _default_gigabytes
+    if len(sys.argv) > 1:
+        gigabytes = float(sys.argv[1])
+    logging.root.setLevel(logging.INFO)
+
+    work = [
+        ("ingest", int(gigabytes * _gigabyte / incoming_slice_size),
+         {"eager"   : _ingest_eager,
+          "lazy"    : _ingest_lazy,
+          # the ingest lines are INFO: there is nothing to check
+          "checked" : _ingest_lazy}, ),
+        ("serve", int(gigabytes * _gigabyte / block_size),
+         {"eager"   : _serve_eager,
+          "lazy"    : _serve_lazy,
+          "checked" : _check_level_once(_serve_checked,
+                                        _public_retriever_log)}, ),
+    ]
+
+    log_dir = tempfile.mkdtemp()
+    try:
+        print "{0} GB, {1:,} byte slices, {2:,} byte blocks, at INFO".format(
+            gigabytes, incoming_slice_size, block_size)
+        print "{0:<8} {1:<22} {2:>10} {3:>12} {4:>12}".format(
+            "path", "logging", "calls", "cpu ms/GB", "caller ms/GB")
+        for work_name, call_count, log_functions in work:
+            for mode_name, function_name, async_handler, sampled in _modes:
+                log_path = os.path.join(log_dir, "benchmark.log")
+                cpu_seconds, caller_seconds = \
+                    _run(log_path,
+                         log_functions[function_name],
+                         call_count,
+                         async_handler,
+                         sampled)
+                os.unlink(log_path)
+                print "{0:<8} {1:<22} {2:>10,} {3:>12.2f} {4:>12.2f}".format(
+                    work_name,
+                    mode_name,
+                    call_count,
+                    1000.0 * cpu_seconds / gigabytes,
+                    1000.0 * caller_seconds / gigabytes)
+    finally:
+        shutil.rmtree(log_dir)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+message_codec_benchmark.py
+
+measure the cost of encoding and decoding the control frames of typical
+messages with each message codec, and with pickle (send_pyobj), which
+retrieve_source uses between its own processes.
+
+Decoding includes turning the timestamp and digests back into datetime and
+bytes, because under JSON the receiver parses a repr and base64.
+
+arguments [<iterations>]
+"""
+from datetime import datetime
+import hashlib
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+import sys
+import time
+import uuid
+
+from tools.data_definitions import create_timestamp, parse_timestamp_repr, \
+        parse_digest
+from tools.message_codec import json_codec_name, compact_codec_name, \
+        encode, decode
+
+_default_iterations = 20000
+
+def _handshake():
+    return {
+        "message-type"      : "resilient-server-handshake",
+        "message-id"        : uuid.uuid1().hex,
+        "client-tag"        : "web-writer-multi-node-01-multi-node-02",
+        "client-address"    : "tcp://127.0.0.1:8100",
+        "codecs"            : [compact_codec_name, json_codec_name, ],
+    }
+
+def _ack():
+    return {
+        "message-type"  : "resilient-server-ack",
+        "message-id"    : uuid.uuid1().hex,
+        "incoming-type" : "archive-key-entire",
+        "accepted"      : True,
+    }
+
+def _archive_key_entire():
+    return {
+        "message-type"          : "archive-key-entire",
+        "priority"              : int(time.time()),
+        "user-request-id"       : str(uuid.uuid4()),
+        "collection-id"         : 1001,
+        "key"                   : "test/key/0000001234",
+        "unified-id"            : 4294967296123,
+        "timestamp-repr"        : create_timestamp(),
+        "conjoined-part"        : 0,
+        "segment-num"           : 3,
+        "segment-size"          : 1024 * 1024,
+        "zfec-padding-size"     : 2,
+        "segment-md5-digest"    : bytearray(hashlib.md5(b"segment").digest()),
+        "segment-adler32"       : 1234567890,
+        "file-size"             : 8 * 1024 * 1024,
+        "file-adler32"          : -123456789,
+        "file-hash"             : bytearray(hashlib.md5(b"file").digest()),
+        "source-node-name"      : "multi-node-01",
+        "handoff-node-name"     : None,
+        "client-tag"            : "web-writer-multi-node-01-multi-node-02",
+        "client-address"        : "tcp://127.0.0.1:8100",
+        "message-id"            : uuid.uuid1().hex,
+    }
+
+def _archive_key_final_reply():
+    return {
+        "message-type"      : "archive-key-final-reply",
+        "client-tag"        : "web-writer-multi-node-01-multi-node-02",
+        "client-address"    : "tcp://127.0.0.1:8100",
+        "user-request-id"   : str(uuid.uuid4()),
+        "message-id"        : uuid.uuid1().hex,
+        "result"            : "success",
+        "error-message"     : None,
+    }
+
+def _retrieve_key_start():
+    return {
+        "message-type"              : "retrieve-key-start",
+        "user-request-id"           : str(uuid.uuid4()),
+        "retrieve-id"               : uuid.uuid1().hex,
+        "retrieve-sequence"         : 0,
+        "collection-id"             : 1001,
+        "key"                       : "test/key/0000001234",
+        "segment-unified-id"        : 4294967296123,
+        "segment-conjoined-part"    : 0,
+        "segment-num"               : 3,
+        "handoff-node-id"           : None,
+        "block-offset"              : 0,
+        "block-count"               : None,
+    }
+
+def _space_accounting_batch():
+    hour = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    return {
+        "message-type"  : "space-accounting-batch",
+        "hour-entries"  : {
+            repr(hour) : [[collection_id, "bytes_added", 1024 * collection_id]
+                          for collection_id in range(100)]
+        },
+    }
+
+_message_types = [
+    ("handshake", _handshake, ),
+    ("ack", _ack, ),
+    ("archive-key-entire", _archive_key_entire, ),
+    ("archive-key-final-reply", _archive_key_final_reply, ),
+    ("retrieve-key-start", _retrieve_key_start, ),
+    ("space-accounting-batch", _space_accounting_batch, ),
+]
+
+def _parse_fields(control):
+    if "timestamp-repr" in control:
+        parse_timestamp_repr(control["timestamp-repr"])
+    if "segment-md5-digest" in control:
+        parse_digest(control["segment-md5-digest"])
+    if "file-hash" in control:
+        parse_digest(control["file-hash"])
+
+def _pickle_encode(control):
+    return pickle.dumps(control, pickle.HIGHEST_PROTOCOL)
+
+_encoders = [
+    (json_codec_name, lambda control: encode(control, json_codec_name),
+     decode, ),
+    (compact_codec_name, lambda control: encode(control, compact_codec_name),
+     decode, ),
+    ("pickle", _pickle_encode, pickle.loads, ),
+]
+
+def _time_per_call(function, argument, iterations):
+    start_time = time.time()
+    for _ in range(iterations):
+        function(argument)
+    return (time.time() - start_time) / iterations
+
+def main():
+    iterations = _default_iterations
+    if len(sys.argv) > 1:
+        iterations = int(sys.argv[1])
+
+    print "{0:,} iterations".format(iterations)
+    print "{0:<24} {1:<10} {2:>6} {3:>10} {4:>10}".format(
+        "message", "codec", "bytes", "encode us", "decode us")
+    for message_name, message_function in _message_types:
+        control = message_function()
+        for codec_name, encode_function, decode_function in _encoders:
+            frame = encode_function(control)
+
+            def _decode_and_parse(frame):
+                _parse_fields(decode_function(frame))
+
+            encode_time = _time_per_call(encode_function, control, iterations)
+            decode_time = _time_per_call(_decode_and_parse, frame, iterations)
+            print "{0:<24} {1:<10} {2:>6} {3:>10.2f} {4:>10.2f}".format(
+                message_name,
+                codec_name,
+                len(frame),
+                1000000.0 * encode_time,
+                1000000.0 * decode_time)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+cases.py
+
+the storage node hot paths we benchmark. Every case runs in this process,
+in a temporary directory, with a StubConnection for the database and
+zeromq inproc sockets for messaging: no other service is needed.
+
+A case is constructed with the work directory. See harness.py for the
+rest of the interface.
+"""
+from collections import deque
+import os
+import os.path
+import shutil
+from threading import Event
+import uuid
+
+import zmq
+
+from tools.data_definitions import incoming_slice_size, \
+        min_node_count, \
+        compute_value_file_path, \
+        encoded_block_generator, \
+        create_timestamp, \
+        parse_timestamp_repr
+from tools.LRUCache import LRUCache
+from tools.message_codec import recv_control
+from tools.request_tracer import RequestTracer
+from tools.resilient_client import ResilientClient
+from tools.resilient_server import ResilientServer
+from tools.zeromq_pollster import ZeroMQPollster
+from segment_visibility import sql_factory
+from data_writer.output_value_file import OutputValueFile
+
+from test.micro_benchmark.stub_connection import StubConnection
+
+# what one data writer receives for one incoming slice
+_segment_size = incoming_slice_size // min_node_count
+_space_id = 1
+_collection_id = 1001
+_poll_timeout = 1.0
+
+class _Case(object):
+    bytes_per_call = None
+
+    def __init__(self, work_dir):
+        self._work_dir = work_dir
+
+    def setup(self):
+        pass
+
+    def teardown(self):
+        pass
+
+class WriteDataForOneSequence(_Case):
+    """
+    OutputValueFile.write_data_for_one_sequence of one segment: the write
+    to the page cache and the md5
+    """
+    name = "output_value_file_write"
+    bytes_per_call = _segment_size
+
+    def __init__(self, work_dir):
+        _Case.__init__(self, work_dir)
+        self._data = os.urandom(_segment_size)
+        self._repository_path = os.path.join(work_dir, "write")
+        self._value_file = None
+        self._segment_id = 0
+
+    def setup(self):
+        # a new value file for each repeat, so the disk doesn't fill
+        os.makedirs(self._repository_path)
+        self._value_file = OutputValueFile(StubConnection(),
+                                           _space_id,
+                                           self._repository_path)
+
+    def __call__(self):
+        self._segment_id += 1
+        self._value_file.write_data_for_one_sequence(_collection_id,
+                                                     self._segment_id,
+                                                     self._data)
+
+    def teardown(self):
+        self._value_file.close()
+        self._value_file = None
+        shutil.rmtree(self._repository_path)
+
+class EncodedBlockGenerator(_Case):
+    """
+    slicing a segment into encoded blocks, as the io_worker does before
+    it sends them
+    """
+    name = "encoded_block_generator"
+    bytes_per_call = _segment_size
+
+    def __init__(self, work_dir):
+        _Case.__init__(self, work_dir)
+        self._data = os.urandom(_segment_size)
+
+    def __call__(self):
+        list(encoded_block_generator(self._data))
+
+class ParseTimestampRepr(_Case):
+    """
+    parse_timestamp_repr of a timestamp sent by the JSON codec
+    """
+    name = "parse_timestamp_repr"
+
+    def __init__(self, work_dir):
+        _Case.__init__(self, work_dir)
+        self._timestamp_repr = repr(create_timestamp())
+
+    def __call__(self):
+        parse_timestamp_repr(self._timestamp_repr)
+
+class SQLListKeys(_Case):
+    """
+    sql_factory generating the listmatch query
+    """
+    name = "sql_factory_list_keys"
+
+    def __call__(self):
+        sql_factory.list_keys(_collection_id,
+                              versioned=False,
+                              prefix="test/prefix/",
+                              key_marker="test/prefix/key-00001000",
+                              limit=1001)
+
+class SQLVersionForKey(_Case):
+    """
+    sql_factory generating the query for the rows of a key, as every
+    retrieve does
+    """
+    name = "sql_factory_version_for_key"
+
+    def __call__(self):
+        sql_factory.version_for_key(_collection_id,
+                                    versioned=False,
+                                    key="test/prefix/key-00001000")
+
+class IOWorkerRequest(_Case):
+    """
+    io_worker._process_request for a whole segment: receive the request
+    from the controller, read the value file, compute the checksums and
+    push the blocks to the reply socket
+    """
+    name = "io_worker_process_request"
+    bytes_per_call = _segment_size
+
+    def __init__(self, work_dir):
+        _Case.__init__(self, work_dir)
+        # the io_worker takes its repository path from the environment
+        # when it is imported
+        os.environ["NIMBUSIO_REPOSITORY_PATH"] = work_dir
+        os.environ.setdefault("NIMBUSIO_NODE_NAME", "micro-benchmark")
+        os.environ.setdefault("NIMBUSIO_SOCKET_DIR", work_dir)
+        from retrieve_source import io_worker
+        self._io_worker = io_worker
+
+        value_file_id = 1
+        value_file_path = compute_value_file_path(work_dir,
+                                                  _space_id,
+                                                  value_file_id)
+        os.makedirs(os.path.dirname(value_file_path))
+        with open(value_file_path, "wb") as output_file:
+            output_file.write(os.urandom(_segment_size))
+
+        self._request = {
+            "user-request-id"       : str(uuid.uuid4()),
+            "client-tag"            : "micro-benchmark",
+            "client-address"        : "inproc://micro-benchmark-io-reply",
+            "message-id"            : uuid.uuid1().hex,
+            "retrieve-id"           : uuid.uuid1().hex,
+            "segment-unified-id"    : 1,
+            "segment-num"           : 1,
+        }
+        self._control = {
+            "left-offset"   : 0,
+            "right-offset"  : 0,
+            "completed"     : True,
+        }
+        self._sequence_row = {
+            "space_id"          : _space_id,
+            "value_file_id"     : value_file_id,
+            "value_file_offset" : 0,
+            "size"              : _segment_size,
+            "zfec_padding_size" : 0,
+        }
+
+        self._context = None
+        self._router_socket = None
+        self._reply_socket = None
+        self._resources = None
+
+    def setup(self):
+        self._context = zmq.Context()
+        self._router_socket = self._context.socket(zmq.ROUTER)
+        self._router_socket.bind("inproc://micro-benchmark-io-controller")
+        self._reply_socket = self._context.socket(zmq.PULL)
+        self._reply_socket.bind(self._request["client-address"])
+
+        dealer_socket = self._context.socket(zmq.DEALER)
+        dealer_socket.setsockopt(zmq.IDENTITY, b"micro-benchmark-io-worker")
+        dealer_socket.connect("inproc://micro-benchmark-io-controller")
+        self._resources = self._io_worker._resources_tuple(
+            halt_event=Event(),
+            zeromq_context=self._context,
+            reply_push_sockets=dict(),
+            dealer_socket=dealer_socket,
+            event_push_client=None,
+            file_cache=LRUCache(self._io_worker._max_file_cache_size),
+            tracer=RequestTracer(sample_rate=0.0))
+
+    def __call__(self):
+        # what the io_controller sends
+        self._router_socket.send(b"micro-benchmark-io-worker", zmq.SNDMORE)
+        self._router_socket.send_pyobj(self._request, zmq.SNDMORE)
+        self._router_socket.send_pyobj(dict(self._control), zmq.SNDMORE)
+        self._router_socket.send_pyobj(self._sequence_row)
+
+        self._io_worker._process_request(self._resources)
+        self._reply_socket.recv_multipart()
+
+    def teardown(self):
+        self._resources.dealer_socket.close()
+        for push_socket in self._resources.reply_push_sockets.values():
+            push_socket.close()
+        for value_file, _ in self._resources.file_cache.itervalues():
+            value_file.close()
+        self._resources = None
+        self._router_socket.close()
+        self._reply_socket.close()
+        self._context.term()
+
+class ResilientRoundTrip(_Case):
+    """
+    one message from a ResilientClient to a ResilientServer and the reply
+    back to the client's PULL socket, over inproc sockets: the framing,
+    codec and ack overhead of every message between services
+    """
+    name = "resilient_round_trip"
+    bytes_per_call = 64 * 1024
+
+    def __init__(self, work_dir):
+        _Case.__init__(self, work_dir)
+        self._data = os.urandom(self.bytes_per_call)
+        self._halt_event = Event()
+        self._context = None
+        self._pollster = None
+        self._pull_socket = None
+        self._server = None
+        self._client = None
+        self._receive_queue = deque()
+        self._reply_count = 0
+
+    def setup(self):
+        server_address = "inproc://micro-benchmark-resilient-server"
+        client_address = "inproc://micro-benchmark-resilient-client"
+
+        self._context = zmq.Context()
+        self._pollster = ZeroMQPollster()
+        self._pull_socket = self._context.socket(zmq.PULL)
+        self._pull_socket.bind(client_address)
+        self._pollster.register_read(self._pull_socket, self._pull_callback)
+        self._server = ResilientServer(self._context,
+                                       server_address,
+                                       self._receive_queue)
+        self._server.register(self._pollster)
+        self._client = ResilientClient(self._context,
+                                       self._pollster,
+                                       "micro-benchmark-server",
+                                       server_address,
+                                       "micro-benchmark-client",
+                                       client_address)
+        # the first run sends the handshake
+        self._client.run(self._halt_event)
+        while not self._client.connected:
+            self._pollster.poll(self._halt_event, _poll_timeout)
+
+    def _pull_callback(self, _active_socket, readable, writable):
+        recv_control(self._pull_socket)
+        while self._pull_socket.rcvmore:
+            self._pull_socket.recv()
+        self._reply_count += 1
+
+    def __call__(self):
+        reply_count = self._reply_count + 1
+        self._client.queue_message_for_send({"message-type" : "echo-request"},
+                                            self._data)
+        while self._reply_count < reply_count:
+            self._pollster.poll(self._halt_event, _poll_timeout)
+            while len(self._receive_queue) > 0:
+                message, data = self._receive_queue.popleft()
+                message["message-type"] = "echo-reply"
+                self._server.send_reply(message, data)
+
+    def teardown(self):
+        self._client.close()
+        self._server.close()
+        self._pull_socket.close()
+        self._context.term()
+
+cases = [
+    WriteDataForOneSequence,
+    EncodedBlockGenerator,
+    ParseTimestampRepr,
+    SQLListKeys,
+    SQLVersionForKey,
+    IOWorkerRequest,
+    ResilientRoundTrip,
+]
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+harness.py
+
+time a benchmark case the way timeit does, and summarize the repeats.
+
+A case has
+
+name
+    the name in the results
+
+bytes_per_call
+    bytes processed by one call, or None
+
+setup()
+    called before each repeat: not timed
+
+__call__()
+    one operation: timed
+
+teardown()
+    called after each repeat: not timed
+
+We call the case once to warm up, then find a number of calls that takes
+at least min_time seconds, then time repeat runs of that many calls with
+the garbage collector off. Each repeat gives one per call time; we report
+the min, median, mean and a 95% confidence interval of the mean.
+"""
+import gc
+import math
+import timeit
+
+# two sided 95% t values, by degrees of freedom
+_t_values = [
+    None, 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262,
+    2.228, 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093,
+    2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045,
+    2.042,
+]
+_normal_value = 1.96
+_max_number = 10 ** 7
+
+def _t_value(degrees_of_freedom):
+    if degrees_of_freedom < len(_t_values):
+        return _t_values[degrees_of_freedom]
+    return _normal_value
+
+def _time_calls(case, number):
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start_time = timeit.default_timer()
+        for _ in range(number):
+            case()
+        return timeit.default_timer() - start_time
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+def _calibrate(case, min_time):
+    """
+    return the number of calls (1, 2, 5, 10, 20, 50, ...) that takes at
+    least min_time seconds
+    """
+    number = 1
+    while number < _max_number:
+        for multiplier in [1, 2, 5, ]:
+            case.setup()
+            try:
+                elapsed_time = _time_calls(case, number * multiplier)
+            finally:
+                case.teardown()
+            if elapsed_time >= min_time:
+                return number * multiplier
+        number *= 10
+    return _max_number
+
+def summarize(per_call_times):
+    """
+    return a dict of statistics for a list of per call times (seconds)
+    """
+    count = len(per_call_times)
+    sorted_times = sorted(per_call_times)
+    mean = sum(sorted_times) / count
+    if count % 2 == 1:
+        median = sorted_times[count // 2]
+    else:
+        median = (sorted_times[count // 2 - 1] + sorted_times[count // 2]) / 2.0
+    if count > 1:
+        stdev = math.sqrt(
+            sum((value - mean) ** 2 for value in sorted_times) / (count - 1))
+        ci_half_width = _t_value(count - 1) * stdev / math.sqrt(count)
+    else:
+        stdev = 0.0
+        ci_half_width = 0.0
+    return {
+        "min"       : sorted_times[0],
+        "max"       : sorted_times[-1],
+        "median"    : median,
+        "mean"      : mean,
+        "stdev"     : stdev,
+        "ci_low"    : mean - ci_half_width,
+        "ci_high"   : mean + ci_half_width,
+    }
+
+def measure(case, repeat, min_time):
+    """
+    time case, return a dict of statistics
+    """
+    case.setup()
+    try:
+        case()
+    finally:
+        case.teardown()
+
+    number = _calibrate(case, min_time)
+
+    per_call_times = list()
+    for _ in range(repeat):
+        case.setup()
+        try:
+            per_call_times.append(_time_calls(case, number) / number)
+        finally:
+            case.teardown()
+
+    result = summarize(per_call_times)
+    result["number"] = number
+    result["repeat"] = repeat
+    result["calls_per_second"] = 1.0 / result["median"]
+    if case.bytes_per_call is not None:
+        result["mb_per_second"] = \
+            case.bytes_per_call / result["median"] / (1024.0 * 1024.0)
+    return result
+
+def is_regression(baseline, current, threshold):
+    """
+    return True if the current median is slower than the baseline median
+    by more than threshold (a fraction), and the confidence intervals
+    do not overlap, so the difference is not noise
+    """
+    return current["median"] > baseline["median"] * (1.0 + threshold) and \
+        current["ci_low"] > baseline["ci_high"]
+
+def compare(baseline, current, threshold, output_file):
+    """
+    print the change of each case the two runs have in common
+
+    return True if any case regressed
+    """
+    output_file.write("baseline {0} {1}\n".format(baseline["commit"],
+                                                 baseline["timestamp"]))
+    output_file.write("current  {0} {1}\n".format(current["commit"],
+                                                 current["timestamp"]))
+    regression = False
+    for case_name in sorted(current["cases"]):
+        if case_name not in baseline["cases"]:
+            continue
+        baseline_case = baseline["cases"][case_name]
+        current_case = current["cases"][case_name]
+        change = (current_case["median"] - baseline_case["median"]) / \
+            baseline_case["median"]
+        regressed = is_regression(baseline_case, current_case, threshold)
+        output_file.write("{0:36} {1:12.2f}us {2:12.2f}us {3:+7.1%}{4}\n".format(
+            case_name,
+            1000000.0 * baseline_case["median"],
+            1000000.0 * current_case["median"],
+            change,
+            " REGRESSION" if regressed else ""))
+        regression = regression or regressed
+    return regression
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+micro_benchmark_main.py
+
+time the storage node hot paths in isolation (see cases.py), without a
+database or any other service. Write the results as JSON, optionally
+comparing them with a baseline run.
+
+returns 1 if the comparison found a regression
+"""
+import argparse
+import logging
+import os
+import os.path
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from test.micro_benchmark.cases import cases
+from test.micro_benchmark import harness
+from test.load_benchmark.results import git_commit, \
+    write_results, \
+    load_results
+
+_source_path = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def _parse_cmdline():
+    case_names = [case.name for case in cases]
+
+    parser = argparse.ArgumentParser(
+        description='Time storage node hot paths')
+
+    parser.add_argument("--case", dest="cases", action="append",
+        choices=case_names, default=None,
+        help="case to run, may be repeated (default: all)")
+
+    parser.add_argument("--repeat", dest="repeat", action="store",
+        default=10, type=int,
+        help="number of timed repeats of each case")
+
+    parser.add_argument("--min-time", dest="min_time", action="store",
+        default=0.2, type=float,
+        help="minimum seconds for one repeat")
+
+    parser.add_argument("--output", dest="output", action="store",
+        default=None,
+        help="write JSON results to this file")
+
+    parser.add_argument("--compare", dest="compare", action="store",
+        default=None,
+        help="JSON results of a baseline run to compare with")
+
+    parser.add_argument("--regression-threshold",
+        dest="regression_threshold", action="store", default=0.1, type=float,
+        help="fractional slow down counted as a regression (default: 0.1)")
+
+    args = parser.parse_args()
+    if args.cases is None:
+        args.cases = case_names
+
+    return args
+
+def main():
+    """
+    main entry point
+    """
+    # the code we time logs; we don't want to time the logging
+    logging.basicConfig(level=logging.WARN)
+    options = _parse_cmdline()
+
+    print "{0:36} {1:>12} {2:>12} {3:>12} {4:>10}".format(
+        "case", "median us", "min us", "95% ci +/-", "MB/s")
+    case_results = dict()
+    work_dir = tempfile.mkdtemp(prefix="micro_benchmark_")
+    try:
+        for case_class in cases:
+            if case_class.name not in options.cases:
+                continue
+            case_dir = os.path.join(work_dir, case_class.name)
+            os.mkdir(case_dir)
+            result = harness.measure(case_class(case_dir),
+                                     options.repeat,
+                                     options.min_time)
+            case_results[case_class.name] = result
+            print "{0:36} {1:12.2f} {2:12.2f} {3:12.2f} {4:>10}".format(
+                case_class.name,
+                1000000.0 * result["median"],
+                1000000.0 * result["min"],
+                1000000.0 * (result["ci_high"] - result["mean"]),
+                "{0:.1f}".format(result["mb_per_second"]) \
+                    if "mb_per_second" in result else "-")
+    finally:
+        shutil.rmtree(work_dir)
+
+    run_results = {
+        "commit"        : git_commit(_source_path),
+        "timestamp"     : time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python"        : platform.python_version(),
+        "options"       : dict(vars(options)),
+        "cases"         : case_results,
+    }
+    if options.output is not None:
+        write_results(options.output, run_results)
+
+    if options.compare is not None:
+        if harness.compare(load_results(options.compare),
+                           run_results,
+                           options.regression_threshold,
+                           sys.stdout):
+            return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
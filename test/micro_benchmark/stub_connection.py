@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+stub_connection.py
+
+class StubConnection
+
+stands in for tools.database_connection.DatabaseConnection, so we can
+benchmark code that talks to the database without a database. It counts
+the statements it is given, and returns ids from a counter.
+"""
+import itertools
+
+class StubConnection(object):
+    """
+    rows
+        returned by fetch_one_row and fetch_all_rows
+    """
+    def __init__(self, rows=None):
+        self._rows = rows or []
+        self._ids = itertools.count(1)
+        self.statement_count = 0
+
+    def fetch_one_row(self, query, *args):
+        self.statement_count += 1
+        return self._rows[0] if self._rows else None
+
+    def fetch_all_rows(self, query, *args):
+        self.statement_count += 1
+        return list(self._rows)
+
+    def execute(self, query, *args):
+        self.statement_count += 1
+
+    def execute_and_return_id(self, query, *args):
+        self.statement_count += 1
+        return next(self._ids)
+
+    def begin_transaction(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+range_read_benchmark.py
+
+simulate a client reading an object in sequential ranges, and compare
+whole block retrieves, trimmed by web_public_reader, against retrieves
+trimmed by web_internal_reader with the boundary block cache.
+
+reports blocks decoded, bytes sent over the internal network, and MB/s
+(zfec decoding included, data readers excluded)
+arguments [<object-megabytes> [<range-kilobytes> [<start-offset>]]]
+"""
+import os
+import sys
+import time
+
+from tools.LRUCache import LRUCache
+from tools.data_definitions import block_size
+from tools.zfec_segmenter import ZfecSegmenter
+
+_default_object_megabytes = 1024
+_default_range_kilobytes = 64
+# video style clients rarely start on a block boundary
+_default_start_offset = 1000
+_boundary_block_cache_size = 1024
+_min_segments = 8
+_num_segments = 10
+
+class _BlockSource(object):
+    """
+    decode blocks as web_internal_reader would. every block has the
+    same content, since we only care about the cost
+    """
+    def __init__(self):
+        self._segmenter = ZfecSegmenter(_min_segments, _num_segments)
+        self._segments = self._segmenter.encode([os.urandom(block_size), ])
+        # include a parity segment, so that we measure a real decode
+        self._segment_numbers = range(2, _num_segments)
+        self._decode_segments = \
+            [self._segments[n-1] for n in self._segment_numbers]
+        self.decoded_count = 0
+
+    def decode(self, _block_index):
+        self.decoded_count += 1
+        return self._segmenter.decode(self._decode_segments,
+                                      self._segment_numbers,
+                                      0)[0]
+
+def _untrimmed_range(source, _cache, first_byte, size):
+    """
+    decode whole blocks and send them all; the public reader trims them
+    return the number of bytes sent over the internal network
+    """
+    block_offset = first_byte // block_size
+    end_block = (first_byte + size + block_size - 1) // block_size
+    sent = 0
+    for block_index in range(block_offset, end_block):
+        sent += len(source.decode(block_index))
+    return sent
+
+def _trimmed_range(source, cache, first_byte, size):
+    """
+    reuse cached boundary blocks, and trim before sending
+    return the number of bytes sent over the internal network
+    """
+    block_offset, offset_into_first_block = divmod(first_byte, block_size)
+    end_block = (first_byte + size + block_size - 1) // block_size
+    blocks = list()
+    for block_index in range(block_offset, end_block):
+        data = cache.get(block_index)
+        if data is None:
+            data = source.decode(block_index)
+            if block_index in [block_offset, end_block-1, ]:
+                cache[block_index] = data
+        blocks.append(data)
+    data = "".join(blocks)[offset_into_first_block:]
+    return len(data[:size])
+
+def main():
+    """
+    main entry point
+    """
+    object_size = _default_object_megabytes * 1024 * 1024
+    range_size = _default_range_kilobytes * 1024
+    start_offset = _default_start_offset
+    if len(sys.argv) > 1:
+        object_size = int(sys.argv[1]) * 1024 * 1024
+    if len(sys.argv) > 2:
+        range_size = int(sys.argv[2]) * 1024
+    if len(sys.argv) > 3:
+        start_offset = int(sys.argv[3])
+
+    print "{0} byte ranges of a {1} byte object from offset {2}".format(
+        range_size, object_size, start_offset)
+    print "{0:<24} {1:>14} {2:>16} {3:>10}".format(
+        "", "blocks decoded", "internal bytes", "MB/s")
+
+    for name, function in [("untrimmed", _untrimmed_range),
+                           ("trimmed + boundary cache", _trimmed_range)]:
+        source = _BlockSource()
+        cache = LRUCache(_boundary_block_cache_size)
+        internal_bytes = 0
+        client_bytes = 0
+        start_time = time.time()
+        for first_byte in xrange(start_offset, object_size, range_size):
+            size = min(range_size, object_size - first_byte)
+            internal_bytes += function(source, cache, first_byte, size)
+            client_bytes += size
+        elapsed_time = time.time() - start_time
+
+        print "{0:<24} {1:>14,} {2:>16,} {3:>10.2f}".format(
+            name, 
+            source.decoded_count, 
+            internal_bytes, 
+            client_bytes / elapsed_time / (1024 * 1024))
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+reactor_latency_benchmark.py
+
+measure request/reply round trip latency on localhost through a time queue
+driven process, with the polling loop (NIMBUSIO_EVENT_REACTOR=0) and with
+the event reactor.
+
+The server is this script run with --server: an echo service built like
+space_accounting_server, from a RouterServer, a DequeDispatcher and a
+ZeroMQPollster. Also reports the CPU the server uses while idle.
+
+arguments [<request-count> [<max-gap-milliseconds>]]
+"""
+from collections import deque
+import os
+import random
+import subprocess
+import sys
+import time
+
+import zmq
+
+_default_request_count = 200
+_default_max_gap_milliseconds = 20
+_server_address = "tcp://127.0.0.1:8700"
+_idle_seconds = 5.0
+
+def _process_cpu_seconds(pid):
+    """
+    return user + system CPU seconds used by a process (Linux)
+    """
+    with open("/proc/{0}/stat".format(pid)) as input_file:
+        fields = input_file.read().rsplit(")", 1)[1].split()
+    # utime and stime are fields 14 and 15 of stat, 12 and 13 after the name
+    return (int(fields[11]) + int(fields[12])) / \
+        float(os.sysconf("SC_CLK_TCK"))
+
+def _run_server():
+    from tools import time_queue_driven_process
+    from tools.zeromq_pollster import ZeroMQPollster
+    from tools.router_server import RouterServer
+    from tools.deque_dispatcher import DequeDispatcher
+
+    def _handle_ping(state, message, _data):
+        reply = {
+            "message-type"  : "ping-reply",
+            "router-ident"  : message["router-ident"],
+            "message-id"    : message["message-id"],
+        }
+        state["router-server"].queue_message_for_send(reply)
+
+    def _setup(_halt_event, state):
+        state["router-server"] = RouterServer(state["zmq-context"],
+                                              _server_address,
+                                              state["receive-queue"])
+        state["router-server"].register(state["pollster"])
+        state["queue-dispatcher"] = DequeDispatcher(state,
+                                                    state["receive-queue"],
+                                                    {"ping" : _handle_ping})
+        return [
+            (state["pollster"].run, time.time(), ),
+            (state["queue-dispatcher"].run, time.time(), ),
+        ]
+
+    def _tear_down(state):
+        state["router-server"].close()
+        state["zmq-context"].term()
+
+    state = {
+        "zmq-context"       : zmq.Context(),
+        "pollster"          : ZeroMQPollster(),
+        "receive-queue"     : deque(),
+        "router-server"     : None,
+        "queue-dispatcher"  : None,
+    }
+    return time_queue_driven_process.main(
+        os.path.join(os.environ.get("NIMBUSIO_LOG_DIR", "/tmp"),
+                     "reactor_latency_benchmark_server.log"),
+        state,
+        pre_loop_actions=[_setup, ],
+        post_loop_actions=[_tear_down, ]
+    )
+
+def _percentile(sorted_values, fraction):
+    index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+def _run_client(title, event_reactor, request_count, max_gap_milliseconds):
+    environment = dict(os.environ)
+    environment["NIMBUSIO_EVENT_REACTOR"] = event_reactor
+    server_process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--server", ],
+        env=environment
+    )
+    context = zmq.Context()
+    dealer_socket = context.socket(zmq.DEALER)
+    dealer_socket.setsockopt(zmq.LINGER, 0)
+    dealer_socket.connect(_server_address)
+    try:
+        # make sure the server is up before we time anything
+        dealer_socket.send_json({"message-type" : "ping", "message-id" : -1})
+        dealer_socket.recv_json()
+
+        start_cpu_seconds = _process_cpu_seconds(server_process.pid)
+        time.sleep(_idle_seconds)
+        idle_cpu_seconds = \
+            _process_cpu_seconds(server_process.pid) - start_cpu_seconds
+
+        round_trip_times = list()
+        for message_id in range(request_count):
+            time.sleep(random.uniform(0, max_gap_milliseconds) / 1000.0)
+            start_time = time.time()
+            dealer_socket.send_json({"message-type" : "ping",
+                                     "message-id"   : message_id})
+            reply = dealer_socket.recv_json()
+            round_trip_times.append(time.time() - start_time)
+            assert reply["message-id"] == message_id, reply
+    finally:
+        dealer_socket.close()
+        context.term()
+        server_process.terminate()
+        server_process.wait()
+
+    round_trip_times.sort()
+    print title
+    print "    round trip ms: median {0:.3f} p99 {1:.3f} max {2:.3f}".format(
+        1000.0 * _percentile(round_trip_times, 0.5),
+        1000.0 * _percentile(round_trip_times, 0.99),
+        1000.0 * round_trip_times[-1])
+    print "    idle server CPU {0:.1f}%".format(
+        100.0 * idle_cpu_seconds / _idle_seconds)
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--server":
+        return _run_server()
+
+    request_count = _default_request_count
+    max_gap_milliseconds = _default_max_gap_milliseconds
+    if len(sys.argv) > 1:
+        request_count = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        max_gap_milliseconds = int(sys.argv[2])
+
+    print "{0} requests, up to {1}ms apart".format(request_count,
+                                                   max_gap_milliseconds)
+    _run_client("polling loop", "0", request_count, max_gap_milliseconds)
+    _run_client("event reactor", "1", request_count, max_gap_milliseconds)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+space_accounting_load_test.py
+
+start a space accounting server and push the space accounting events of
+simulated web requests at it: first as one space-accounting-detail message
+per request (the old SpaceAccountingClient), then summed by
+SpaceAccountingClient into space-accounting-batch messages.
+
+reports messages/sec sent to the server, and the CPU time the server spent
+to absorb them. Space usage requests are not sent, so no database is needed.
+
+arguments [<requests-per-second> [<seconds> [<collection-count>]]]
+"""
+import os
+import random
+import sys
+import time
+
+import gevent
+import zmq.green as zmq
+
+from tools.data_definitions import create_timestamp
+from tools.greenlet_push_client import GreenletPUSHClient
+from web_public_reader.space_accounting_client import SpaceAccountingClient
+
+from unit_tests.util import start_space_accounting_server, \
+    terminate_process
+
+_default_requests_per_second = 20000
+_default_seconds = 10
+_default_collection_count = 100
+_batch_flush_interval = 5.0
+_node_name = "load-test"
+_server_address = "tcp://127.0.0.1:8600"
+_pipeline_address = "tcp://127.0.0.1:8650"
+_event_publisher_pull_address = "tcp://127.0.0.1:8651"
+# yield to the flush greenlet this often
+_requests_per_tick = 100
+_events = ["bytes_added", "bytes_retrieved", "bytes_removed", ]
+
+def _process_cpu_seconds(pid):
+    """
+    return user + system CPU seconds used by a process (Linux)
+    """
+    with open("/proc/{0}/stat".format(pid)) as input_file:
+        fields = input_file.read().rsplit(")", 1)[1].split()
+    # utime and stime are fields 14 and 15 of stat, 12 and 13 after the name
+    return (int(fields[11]) + int(fields[12])) / \
+        float(os.sysconf("SC_CLK_TCK"))
+
+def _wait_for_idle(pid):
+    """
+    wait until the server stops using CPU, so that we count the time it
+    takes to drain its queue
+    """
+    cpu_seconds = _process_cpu_seconds(pid)
+    while True:
+        time.sleep(1.0)
+        next_cpu_seconds = _process_cpu_seconds(pid)
+        if next_cpu_seconds - cpu_seconds < 0.02:
+            return next_cpu_seconds
+        cpu_seconds = next_cpu_seconds
+
+class _DetailClient(object):
+    """
+    send one message per event, as SpaceAccountingClient used to
+    """
+    def __init__(self, push_client):
+        self._push_client = push_client
+        self.message_count = 0
+
+    def start(self):
+        pass
+
+    def close(self):
+        pass
+
+    def add(self, collection_id, timestamp, event, value):
+        self._push_client.send({
+            "message-type"  : "space-accounting-detail",
+            "collection-id" : collection_id,
+            "timestamp-repr": repr(timestamp),
+            "event"         : event,
+            "value"         : value,
+        })
+        self.message_count += 1
+
+class _CountingPUSHClient(object):
+    """
+    count the batches sent by SpaceAccountingClient; the real PUSH client
+    is closed by main
+    """
+    def __init__(self, push_client):
+        self._push_client = push_client
+        self.message_count = 0
+
+    def send(self, message):
+        self._push_client.send(message)
+        self.message_count += 1
+
+    def close(self):
+        pass
+
+class _BatchClient(object):
+    """
+    sum events in SpaceAccountingClient
+    """
+    def __init__(self, push_client):
+        self._counting_push_client = _CountingPUSHClient(push_client)
+        self._client = SpaceAccountingClient(_node_name,
+                                             None,
+                                             self._counting_push_client,
+                                             _batch_flush_interval)
+
+    @property
+    def message_count(self):
+        return self._counting_push_client.message_count
+
+    def start(self):
+        self._client.start()
+
+    def close(self):
+        self._client.close()
+
+    def add(self, collection_id, timestamp, event, value):
+        getattr(self._client, event[len("bytes_"):])(collection_id,
+                                                     timestamp,
+                                                     value)
+
+def _run(title, client, pid, requests_per_second, seconds, collection_count):
+    start_cpu_seconds = _process_cpu_seconds(pid)
+    client.start()
+
+    request_count = requests_per_second * seconds
+    tick_interval = float(_requests_per_tick) / requests_per_second
+    start_time = time.time()
+    for request_index in xrange(request_count):
+        client.add(random.randint(1, collection_count),
+                   create_timestamp(),
+                   random.choice(_events),
+                   random.randint(1, 1024 * 1024))
+        if request_index % _requests_per_tick == 0:
+            # pace the requests, and let the flush greenlet run
+            delay = start_time + \
+                (request_index // _requests_per_tick) * tick_interval - \
+                time.time()
+            gevent.sleep(max(delay, 0.0))
+    client.close()
+    elapsed_time = time.time() - start_time
+
+    # give the PUSH socket time to deliver, then wait for the server
+    gevent.sleep(1.0)
+    cpu_seconds = _wait_for_idle(pid) - start_cpu_seconds
+
+    print title
+    print "    {0:,} requests in {1:.1f}s".format(request_count, elapsed_time)
+    print "    {0:,} messages {1:,.0f} messages/sec".format(
+        client.message_count, client.message_count / elapsed_time)
+    print "    server CPU {0:.2f}s {1:.1f}% {2:.2f}us/request".format(
+        cpu_seconds,
+        100.0 * cpu_seconds / elapsed_time,
+        1000000.0 * cpu_seconds / request_count)
+
+def main():
+    requests_per_second = _default_requests_per_second
+    seconds = _default_seconds
+    collection_count = _default_collection_count
+    if len(sys.argv) > 1:
+        requests_per_second = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        seconds = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        collection_count = int(sys.argv[3])
+
+    environment = {
+        "PYTHONPATH"        : os.environ.get("PYTHONPATH", "."),
+        "NIMBUSIO_LOG_DIR"  : os.environ.get("NIMBUSIO_LOG_DIR", "/tmp"),
+        "NIMBUSIO_NODE_NAME": _node_name,
+        "NIMBUSIO_SPACE_ACCOUNTING_SERVER_ADDRESS" : _server_address,
+        "NIMBUSIO_SPACE_ACCOUNTING_PIPELINE_ADDRESS" : _pipeline_address,
+        "NIMBUSIO_EVENT_PUBLISHER_PULL_ADDRESS" : \
+            _event_publisher_pull_address,
+    }
+    server_process = start_space_accounting_server(
+        _node_name,
+        _server_address,
+        _pipeline_address,
+        _event_publisher_pull_address,
+        environment=environment
+    )
+    context = zmq.Context()
+    push_client = GreenletPUSHClient(context, _node_name, _pipeline_address)
+    try:
+        # let the server bind
+        time.sleep(2.0)
+        _wait_for_idle(server_process.pid)
+        print "{0:,} requests/sec for {1}s over {2} collections".format(
+            requests_per_second, seconds, collection_count)
+        _run("one detail message per request",
+             _DetailClient(push_client),
+             server_process.pid,
+             requests_per_second,
+             seconds,
+             collection_count)
+        _run("batches every {0}s".format(_batch_flush_interval),
+             _BatchClient(push_client),
+             server_process.pid,
+             requests_per_second,
+             seconds,
+             collection_count)
+    finally:
+        push_client.close()
+        context.term()
+        terminate_process(server_process)
+
+if __name__ == "__main__":
+    main()
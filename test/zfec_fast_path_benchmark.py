@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+zfec_fast_path_benchmark.py
+
+compare the MB/s at which a GET reassembles data from 8 segments when it has
+the primary segments (joined without decoding) against 8 segments that
+include parity (decoded by zfec)
+arguments [<megabytes>]
+"""
+import os
+import sys
+import time
+
+from tools.data_definitions import block_generator, incoming_slice_size
+from tools.zfec_segmenter import ZfecSegmenter
+
+_default_megabytes = 100
+_min_segments = 8
+_num_segments = 10
+
+# the segment numbers we get when all primaries reply, and when
+# one primary is missing
+_cases = [
+    ("primary segments (fast path)", range(1, _min_segments+1)),
+    ("parity segments (decode)", range(1, _min_segments) + [_num_segments]),
+]
+
+def _time_case(segmenter, encoded_sequences, segment_numbers):
+    byte_count = 0
+    start_time = time.time()
+    for encoded_segments, padding_size in encoded_sequences:
+        segments = [encoded_segments[n-1] for n in segment_numbers]
+        for data in segmenter.decode(segments, segment_numbers, padding_size):
+            byte_count += len(data)
+    return byte_count, time.time() - start_time
+
+def main():
+    """
+    main entry point
+    """
+    megabytes = _default_megabytes
+    if len(sys.argv) > 1:
+        megabytes = int(sys.argv[1])
+
+    segmenter = ZfecSegmenter(_min_segments, _num_segments)
+
+    # encode one sequence of incoming_slice_size, and reuse it
+    # the last sequence of a file is usually padded
+    test_data = os.urandom(incoming_slice_size - 1)
+    padding_size = segmenter.padding_size(test_data)
+    encoded_segments = segmenter.encode(block_generator(test_data))
+    sequence_count = max(1, (megabytes * 1024 * 1024) // len(test_data))
+    encoded_sequences = [(encoded_segments, padding_size, )] * sequence_count
+
+    print "reassembling {0} sequences of {1} bytes".format(sequence_count,
+                                                           len(test_data))
+    for name, segment_numbers in _cases:
+        byte_count, elapsed_time = \
+            _time_case(segmenter, encoded_sequences, segment_numbers)
+        print "{0:30} {1:10.2f} MB/s".format(
+            name, byte_count / elapsed_time / (1024 * 1024))
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+admission_control.py
+
+per collection admission control for the web servers.
+
+Each collection has a token bucket, refilled at NIMBUSIO_COLLECTION_REQUEST_RATE
+requests per second up to NIMBUSIO_COLLECTION_REQUEST_BURST, and a limit of
+NIMBUSIO_COLLECTION_MAX_CONCURRENT requests in progress at once. A request
+that would exceed either is refused with AdmissionRefused, which carries the
+number of seconds the client should wait before retrying (the web servers
+return 503 Service Unavailable with a Retry-After header). A limit of 0
+turns that check off.
+
+An admitted request holds an AdmissionTicket until it is done. For a
+response that streams its body, wrap the body in ReleasingIterator (see
+hold_until_sent) so the ticket is held until the body has been sent.
+"""
+import math
+import os
+import time
+
+_request_rate = float(
+    os.environ.get("NIMBUSIO_COLLECTION_REQUEST_RATE", "200"))
+_request_burst = float(
+    os.environ.get("NIMBUSIO_COLLECTION_REQUEST_BURST", "400"))
+_max_concurrent = int(
+    os.environ.get("NIMBUSIO_COLLECTION_MAX_CONCURRENT", "100"))
+_concurrent_retry_after = 1
+_prune_interval = 60.0
+
+admission_ticket_key = "nimbusio.admission-ticket"
+
+class AdmissionRefused(Exception):
+    """
+    the collection is over its limits, the client should retry after
+    retry_after seconds
+    """
+    def __init__(self, message, retry_after):
+        Exception.__init__(self, message)
+        self.retry_after = retry_after
+
+class AdmissionTicket(object):
+    """
+    held by an admitted request until it is done
+    """
+    def __init__(self, admission_control, collection_id):
+        self._admission_control = admission_control
+        self._collection_id = collection_id
+        self._released = False
+
+    def release(self):
+        """
+        end the request: release may be called more than once
+        """
+        if self._released:
+            return
+        self._released = True
+        self._admission_control._release(self._collection_id)
+
+class ReleasingIterator(object):
+    """
+    wrap a response body, releasing the ticket when the body is done
+    """
+    def __init__(self, iterable, ticket):
+        self._iterator = iter(iterable)
+        self._ticket = ticket
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        try:
+            return self._iterator.next()
+        except StopIteration:
+            self.close()
+            raise
+
+    def close(self):
+        # the WSGI server calls close() even if it never iterates
+        self._ticket.release()
+        if hasattr(self._iterator, "close"):
+            self._iterator.close()
+
+def hold_until_sent(response, ticket):
+    """
+    wrap the body of a webob response in a ReleasingIterator. Setting
+    app_iter clears content_length, so we put it back: a HEAD response
+    has no body, but must still report the size of the object.
+    """
+    content_length = response.content_length
+    response.app_iter = ReleasingIterator(response.app_iter, ticket)
+    response.content_length = content_length
+
+class AdmissionControl(object):
+    """
+    token bucket and concurrency limit per collection
+    """
+    def __init__(self,
+                 request_rate=_request_rate,
+                 request_burst=_request_burst,
+                 max_concurrent=_max_concurrent,
+                 time_function=time.time):
+        self._request_rate = request_rate
+        self._request_burst = max(request_burst, 1.0)
+        self._max_concurrent = max_concurrent
+        self._time_function = time_function
+        # collection_id : [tokens, time of last refill]
+        self._buckets = dict()
+        self._active_counts = dict()
+        self._next_prune_time = time_function() + _prune_interval
+
+    def admit(self, collection_id):
+        """
+        return an AdmissionTicket, or raise AdmissionRefused
+        """
+        current_time = self._time_function()
+        if current_time >= self._next_prune_time:
+            self._prune(current_time)
+
+        active_count = self._active_counts.get(collection_id, 0)
+        if self._max_concurrent > 0 and active_count >= self._max_concurrent:
+            raise AdmissionRefused(
+                "collection {0} has {1} requests in progress".format(
+                    collection_id, active_count),
+                _concurrent_retry_after)
+
+        if self._request_rate > 0:
+            tokens = self._refill(collection_id, current_time)
+            if tokens < 1.0:
+                raise AdmissionRefused(
+                    "collection {0} is over {1} requests per second".format(
+                        collection_id, self._request_rate),
+                    int(math.ceil((1.0 - tokens) / self._request_rate)))
+            self._buckets[collection_id][0] = tokens - 1.0
+
+        self._active_counts[collection_id] = active_count + 1
+        return AdmissionTicket(self, collection_id)
+
+    def active_count(self, collection_id):
+        """
+        the number of admitted requests in progress for the collection
+        """
+        return self._active_counts.get(collection_id, 0)
+
+    def _refill(self, collection_id, current_time):
+        try:
+            bucket = self._buckets[collection_id]
+        except KeyError:
+            bucket = [self._request_burst, current_time]
+            self._buckets[collection_id] = bucket
+        elapsed_time = max(current_time - bucket[1], 0.0)
+        bucket[0] = min(bucket[0] + elapsed_time * self._request_rate,
+                        self._request_burst)
+        bucket[1] = current_time
+        return bucket[0]
+
+    def _release(self, collection_id):
+        active_count = self._active_counts[collection_id] - 1
+        if active_count == 0:
+            del self._active_counts[collection_id]
+        else:
+            self._active_counts[collection_id] = active_count
+
+    def _prune(self, current_time):
+        # a bucket that would be full again is the same as no bucket
+        for collection_id in list(self._buckets.keys()):
+            if self._refill(collection_id, current_time) >= \
+               self._request_burst:
+                del self._buckets[collection_id]
+        self._next_prune_time = current_time + _prune_interval
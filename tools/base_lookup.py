@@ -5,12 +5,52 @@ base_lookup.py
 See Ticket #45 Cache records from nimbus.io central database in memcached
 
 This is a base class for table lookups, wrapping common functionality
+
+Lookups are cached in two tiers: a small process-local LRU with a short
+time to live, in front of memcached. Lookups that find nothing are cached
+locally for an even shorter time, so unknown names do not hammer the
+central database. Concurrent misses for the same value wait for a single
+lookup. Local entries are invalidated early by
+GreenletCentralCacheInvalidator when the central database changes.
+
+The invalidator and central_cache_update both hear of a change, in no
+particular order, so invalidation also deletes the memcached entry: if we
+ran first, the next lookup would read the old row back from memcached.
+A lookup that is in progress when its value is invalidated may have read
+the old row: its result goes to the greenlets already waiting for it,
+but is not cached, locally or in memcached.
 """
 import logging
+import os
+import time
+import weakref
+
+from gevent.event import AsyncResult
 
+from tools.LRUCache import LRUCache
 from tools.data_definitions import memcached_central_key_template
 
 _expiration_time_in_seconds = 24 * 60 * 60 # expiration of 1 day
+_local_cache_size = int(
+    os.environ.get("NIMBUSIO_CENTRAL_LOCAL_CACHE_SIZE", "10000"))
+_local_cache_ttl = float(
+    os.environ.get("NIMBUSIO_CENTRAL_LOCAL_CACHE_TTL", "30.0"))
+_local_negative_cache_ttl = float(
+    os.environ.get("NIMBUSIO_CENTRAL_LOCAL_NEGATIVE_CACHE_TTL", "5.0"))
+
+# every live lookup, so that central database changes can be applied
+# to the local caches of the process
+_live_lookups = weakref.WeakSet()
+
+def invalidate_local_lookups(table_name, rows):
+    """
+    discard local cache entries for rows of table_name, in every lookup
+    in this process
+    """
+    for lookup in list(_live_lookups):
+        if lookup.table_name == table_name:
+            for row in rows:
+                lookup.invalidate_row(row)
 
 class BaseLookup(object):
     """
@@ -18,11 +58,14 @@ class BaseLookup(object):
 
     This is a base class for table lookups, wrapping common functionality
     """
-    def __init__(self, 
-                 memcached_client, 
-                 table_name, 
-                 lookup_field_name, 
-                 database_lookup_function):
+    def __init__(self,
+                 memcached_client,
+                 table_name,
+                 lookup_field_name,
+                 database_lookup_function,
+                 local_cache_size=_local_cache_size,
+                 local_cache_ttl=_local_cache_ttl,
+                 local_negative_cache_ttl=_local_negative_cache_ttl):
 
         self._name = table_name
         self._log = logging.getLogger(self._name)
@@ -32,9 +75,25 @@ class BaseLookup(object):
         self._lookup_field_name = lookup_field_name
         self._database_lookup_function = database_lookup_function
 
+        # map lookup_field_value to (expiration_time, dict or None)
+        self._local_cache = LRUCache(local_cache_size)
+        self._local_cache_ttl = local_cache_ttl
+        self._local_negative_cache_ttl = local_negative_cache_ttl
+
+        # map lookup_field_value to AsyncResult for lookups in progress
+        self._pending_lookups = dict()
+        # lookups in progress that were invalidated
+        self._stale_lookups = set()
+
+        _live_lookups.add(self)
+
     def __str__(self):
         return self._name
 
+    @property
+    def table_name(self):
+        return self._table_name
+
     def __get_value__(self, lookup_field_value):
         """
         retrieve a dict of column data from memcached, or database
@@ -46,14 +105,88 @@ class BaseLookup(object):
         return result
 
     def get(self, lookup_field_value):
+        """
+        retrieve a dict of column data from local cache, memcached,
+        or database
+        return None if not found
+        """
+        try:
+            expiration_time, cached_dict = \
+                self._local_cache[lookup_field_value]
+        except KeyError:
+            pass
+        else:
+            if time.time() < expiration_time:
+                return cached_dict
+            del self._local_cache[lookup_field_value]
+
+        # if another greenlet is already looking up this value,
+        # wait for its result
+        try:
+            pending_result = self._pending_lookups[lookup_field_value]
+        except KeyError:
+            pass
+        else:
+            return pending_result.get()
+
+        pending_result = AsyncResult()
+        self._pending_lookups[lookup_field_value] = pending_result
+        try:
+            result = self._lookup(lookup_field_value)
+        except Exception, instance:
+            pending_result.set_exception(instance)
+            raise
+        else:
+            if lookup_field_value not in self._stale_lookups:
+                if result is None:
+                    ttl = self._local_negative_cache_ttl
+                else:
+                    ttl = self._local_cache_ttl
+                self._local_cache[lookup_field_value] = (time.time() + ttl,
+                                                         result, )
+            pending_result.set(result)
+        finally:
+            del self._pending_lookups[lookup_field_value]
+            self._stale_lookups.discard(lookup_field_value)
+
+        return result
+
+    def invalidate(self, lookup_field_value):
+        """
+        discard the cache entries for lookup_field_value, and don't cache
+        the result of a lookup for it that is in progress
+        """
+        try:
+            del self._local_cache[lookup_field_value]
+        except KeyError:
+            pass
+
+        if lookup_field_value in self._pending_lookups:
+            self._stale_lookups.add(lookup_field_value)
+
+        memcached_key = self._memcached_key(lookup_field_value)
+        result = self._memcached_client.delete(memcached_key)
+        self._log.debug("delete {0} result = {1}".format(memcached_key,
+                                                         result))
+
+    def invalidate_row(self, row):
+        """
+        discard the local cache entry for a (possibly stale) row dict
+        """
+        if self._lookup_field_name in row:
+            self.invalidate(row[self._lookup_field_name])
+
+    def _memcached_key(self, lookup_field_value):
+        return memcached_central_key_template.format(self._table_name,
+                                                     self._lookup_field_name,
+                                                     lookup_field_value)
+
+    def _lookup(self, lookup_field_value):
         """
         retrieve a dict of column data from memcached, or database
         return None if not found
         """
-        memcached_key = \
-            memcached_central_key_template.format(self._table_name,
-                                                  self._lookup_field_name,
-                                                  lookup_field_value)
+        memcached_key = self._memcached_key(lookup_field_value)
 
         cached_dict = self._memcached_client.get(memcached_key)
         if cached_dict is not None:
@@ -64,11 +197,15 @@ class BaseLookup(object):
         self._log.debug("cache miss {0}".format(memcached_key))
         database_dict = self._database_lookup_function(lookup_field_value)
 
-        if database_dict is not None:
+        if database_dict is not None and \
+            lookup_field_value in self._stale_lookups:
+            self._log.debug("database hit {0} invalidated".format(
+                memcached_key))
+        elif database_dict is not None:
             self._log.debug("database hit {0}".format(memcached_key))
             success = \
-                self._memcached_client.set(memcached_key, 
-                                           database_dict, 
+                self._memcached_client.set(memcached_key,
+                                           database_dict,
                                            time=_expiration_time_in_seconds)
             if not success:
                 self._log.error(
@@ -4,7 +4,9 @@ collection_access_control.py
 
 Ticket #43 Implement access_control properties for collections
 """
+from bisect import bisect_right
 from copy import deepcopy
+import hashlib
 import json
 import logging
 import re
@@ -12,6 +14,8 @@ from urlparse import urlparse
 
 import ipaddr
 
+from tools.LRUCache import LRUCache
+
 class AccessControlError(Exception):
     pass
 class AccessControlCleanseError(AccessControlError):
@@ -97,6 +101,11 @@ locations = "locations"
 
 _current_version = "1.0"
 _max_access_control_json_length = 16 * 1024
+_default_compiled_cache_size = 10000
+
+# marks the end of a prefix in the referrer prefix trie. 
+# None can never collide with a single character key
+_trie_terminal = None
 
 def _cleanse_version(entry):
     if type(entry) not in [str, unicode]:
@@ -507,3 +516,232 @@ def check_access_control(access_type, request, baseline_access_control_json):
     log.debug("no access control applies")
     return access_requires_password_authentication
 
+
+def _build_ipv4_intervals(raw_whitelist):
+    """
+    return a sorted list of non-overlapping (first, last) integer address
+    ranges covering the networks in the whitelist
+    """
+    intervals = list()
+    for raw_network in raw_whitelist:
+        network = ipaddr.IPv4Network(raw_network)
+        intervals.append((int(network.network), int(network.broadcast), ))
+    intervals.sort()
+
+    merged_intervals = list()
+    for first, last in intervals:
+        if len(merged_intervals) > 0 and first <= merged_intervals[-1][1] + 1:
+            if last > merged_intervals[-1][1]:
+                merged_intervals[-1] = (merged_intervals[-1][0], last, )
+        else:
+            merged_intervals.append((first, last, ))
+
+    return merged_intervals
+
+def _build_referrer_prefix_trie(raw_whitelist):
+    """
+    return a character trie of the normalized prefixes in the whitelist
+    """
+    trie = dict()
+    for raw_prefix in raw_whitelist:
+        node = trie
+        for character in _normalize_path(raw_prefix):
+            node = node.setdefault(character, dict())
+        node[_trie_terminal] = True
+    return trie
+
+def _trie_matches_prefix(trie, text):
+    """
+    return True if some prefix stored in the trie is a prefix of text
+    """
+    node = trie
+    if _trie_terminal in node:
+        return True
+    for character in text:
+        node = node.get(character)
+        if node is None:
+            return False
+        if _trie_terminal in node:
+            return True
+    return False
+
+class _CompiledRules(object):
+    """
+    the access control rules that apply to a single request, after any
+    'locations' entry has been applied, in a form that is cheap to check
+    """
+    __slots__ = ["ipv4_intervals", 
+                 "ipv4_interval_starts",
+                 "referrer_trie", 
+                 "unauth_access_types", ]
+
+    def __init__(self, access_control):
+        self.ipv4_intervals = None
+        self.ipv4_interval_starts = None
+        raw_ipv4_whitelist = access_control.get(ipv4_whitelist)
+        if raw_ipv4_whitelist is not None and len(raw_ipv4_whitelist) > 0:
+            self.ipv4_intervals = _build_ipv4_intervals(raw_ipv4_whitelist)
+            self.ipv4_interval_starts = [i[0] for i in self.ipv4_intervals]
+
+        # check_access_control enforces the referrer whitelist whenever 
+        # the key is present, even if the list is empty
+        self.referrer_trie = None
+        if unauth_referrer_whitelist in access_control:
+            self.referrer_trie = _build_referrer_prefix_trie(
+                access_control[unauth_referrer_whitelist] or [])
+
+        self.unauth_access_types = set()
+        for access_type, key in [(read_access, allow_unauth_read, ),
+                                 (write_access, allow_unauth_write, ),
+                                 (list_access, allow_unauth_list, ),
+                                 (delete_access, allow_unauth_delete, ), ]:
+            if access_control.get(key, False):
+                self.unauth_access_types.add(access_type)
+
+    def check(self, access_type, request):
+        if self.ipv4_intervals is not None:
+            remote_addr = int(ipaddr.IPv4Address(request.remote_addr))
+            index = bisect_right(self.ipv4_interval_starts, remote_addr) - 1
+            if index < 0 or remote_addr > self.ipv4_intervals[index][1]:
+                return access_forbidden
+
+        if self.referrer_trie is not None:
+            # the webob headers dict is case insensitive
+            if "Referer" not in request.headers:
+                return access_forbidden
+            parsed_referrer = urlparse(request.headers["Referer"])
+            test_path = "/".join([parsed_referrer.netloc.lower(), 
+                                  _normalize_path(parsed_referrer.path)])
+            if not _trie_matches_prefix(self.referrer_trie, test_path):
+                return access_forbidden
+
+        if access_type in self.unauth_access_types:
+            return access_allowed
+
+        return access_requires_password_authentication
+
+class CompiledAccessControl(object):
+    """
+    the access_control JSON of a collection, parsed once and compiled into
+    a form that can be checked against many requests.
+
+    compiled.check(access_type, request) returns the same result as
+    check_access_control(access_type, request, access_control_json)
+    """
+    def __init__(self, baseline_access_control_json):
+        self._fixed_result = None
+        self._default_rules = None
+        self._location_rules = list()
+
+        log = logging.getLogger("CompiledAccessControl")
+
+        # if no special access control is specified, we must authenticate
+        if baseline_access_control_json is None:
+            self._fixed_result = access_requires_password_authentication
+            return
+
+        try:
+            baseline_access_control = json.loads(baseline_access_control_json)
+        except Exception, instance:
+            log.error("Unable to parse access_control JSON {0}".format(
+                instance))
+            self._fixed_result = access_forbidden
+            return
+
+        if len(baseline_access_control) == 0:
+            self._fixed_result = access_requires_password_authentication
+            return
+
+        # if the access_control data is not a known version, 
+        # something is wrong
+        if not version in baseline_access_control or \
+            baseline_access_control[version] != _current_version:
+            log.error("invalid version {0}".format(baseline_access_control))
+            self._fixed_result = access_forbidden
+            return
+
+        self._default_rules = _CompiledRules(baseline_access_control)
+
+        for location in baseline_access_control.get(locations) or []:
+            if "prefix" in location:
+                prefix = _normalize_path(location["prefix"])
+                matcher = lambda path, prefix=prefix: path.startswith(prefix)
+            elif "regexp" in location:
+                matcher = re.compile(location["regexp"], 
+                                     flags=re.IGNORECASE).match
+            else:
+                log.error("unparsable location entry {0}".format(location))
+                continue
+
+            access_control = dict(baseline_access_control)
+            for key, value in location.items():
+                if key not in ["prefix", "regexp", ]:
+                    access_control[key] = value
+
+            self._location_rules.append(
+                (matcher, _CompiledRules(access_control), ))
+
+    def check(self, access_type, request):
+        """
+        return an integer result
+            * access_allowed
+            * access_requires_password_authentication
+            * access_forbidden
+        """
+        if self._fixed_result is not None:
+            return self._fixed_result
+
+        rules = self._default_rules
+        if len(self._location_rules) > 0:
+            path = _normalize_path(urlparse(request.url).path)
+            for matcher, location_rules in self._location_rules:
+                if matcher(path):
+                    rules = location_rules
+                    break
+
+        return rules.check(access_type, request)
+
+def compile_access_control(baseline_access_control_json):
+    """
+    return a CompiledAccessControl for the access_control column
+    of nimbusio_central.collection
+    """
+    return CompiledAccessControl(baseline_access_control_json)
+
+class CompiledAccessControlCache(object):
+    """
+    LRU cache of CompiledAccessControl objects keyed by 
+    (collection_id, hash of the access_control JSON), so a changed
+    access_control column is recompiled on first use
+    """
+    def __init__(self, max_size=_default_compiled_cache_size):
+        self._cache = LRUCache(max_size)
+
+    def check_access_control(self, 
+                             collection_id, 
+                             access_type, 
+                             request, 
+                             baseline_access_control_json):
+        """
+        equivalent to check_access_control, using a cached compiled policy
+        """
+        if baseline_access_control_json is None:
+            access_control_hash = None
+        elif type(baseline_access_control_json) is unicode:
+            access_control_hash = hashlib.md5(
+                baseline_access_control_json.encode("utf-8")).digest()
+        else:
+            access_control_hash = \
+                hashlib.md5(baseline_access_control_json).digest()
+
+        cache_key = (collection_id, access_control_hash, )
+        try:
+            compiled = self._cache[cache_key]
+        except KeyError:
+            compiled = compile_access_control(baseline_access_control_json)
+            self._cache[cache_key] = compiled
+
+        return compiled.check(access_type, request)
+
+    def clear(self):
+        self._cache.clear()
@@ -5,15 +5,31 @@ data_definitions.py
 common data definitions
 """
 
+import base64
 from collections import namedtuple
 from datetime import datetime, timedelta
 import os
 import os.path
+import pickle
 import re
 import time
+import zlib
 
 memcached_central_key_template = "nimbusio_central_{0}_by_{1}_{2}" 
 
+# skeeter channel carrying changes to the central database tables
+# that are cached in memcached
+central_cache_update_channel = "nimbusio_central_cache_update"
+
+def parse_central_cache_update_data(data):
+    """
+    parse the data part of a skeeter central cache update message
+    return (table_name, event_data)
+    """
+    table_name, _uuid, raw_data = data.split("\n", 2)
+    event_data = pickle.loads(zlib.decompress(base64.b64decode(raw_data)))
+    return table_name, event_data
+
 # our internal message format
 message_format = namedtuple("Message", "ident control body")
 
@@ -118,7 +134,12 @@ def parse_timestamp_repr(timestamp_repr):
     """
     We can't send a timestamp pbject over JSON, so we send the repr
     and parse that to re-create the object
+
+    The compact message codec sends the timestamp itself: pass it through
     """
+    if isinstance(timestamp_repr, datetime):
+        return timestamp_repr
+
     match_object = _timestamp_repr_re.match(timestamp_repr)
     if match_object is None:
         raise ValueError("unparsable timestamp '%s'" % (timestamp_repr, ))
@@ -135,6 +156,17 @@ def parse_timestamp_repr(timestamp_repr):
 
     return timestamp
 
+def parse_digest(digest_value):
+    """
+    We can't send a digest over JSON, so we send it base64 encoded.
+    The compact message codec sends the digest itself, as bytes (bytearray
+    under python 2)
+    """
+    if isinstance(digest_value, bytearray) or \
+       not isinstance(digest_value, (str, type(u""), )):
+        return bytes(digest_value)
+    return base64.b64decode(digest_value.encode("utf-8"))
+
 def parse_timedelta_str(interval_str):
     """
     crudely parse a string into keyword arguments for timedelta
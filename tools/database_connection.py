@@ -99,6 +99,17 @@ class DatabaseConnection(object):
         cursor.close()
         return rowcount
         
+    def copy_from(self, file_object, table_name, columns):
+        """
+        bulk load tab separated rows from file_object into a table
+        using COPY
+        """
+        cursor = self._connection.cursor()
+        cursor.copy_from(file_object, table_name, columns=columns)
+        rowcount = cursor.rowcount
+        cursor.close()
+        return rowcount
+        
     def execute_and_return_id(self, query, *args):
         """
         run a statement
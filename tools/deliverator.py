@@ -6,19 +6,43 @@ The deliverator holds the channels that will be used to deliver
 the replies that come over a resilient connection
 """
 import logging
+import os
+import time
 
 from gevent.queue import Queue
-from gevent.coros import RLock
+try:
+    from gevent.lock import RLock
+except ImportError:
+    # gevent before 1.0
+    from gevent.coros import RLock
+
+# a reply that has not come in this long is not coming: the request was
+# cancelled, or lost in a disconnect
+_channel_timeout = float(
+    os.environ.get("NIMBUSIO_DELIVERATOR_CHANNEL_TIMEOUT", str(10 * 60.0)))
+_expire_interval = 60.0
 
 class Deliverator(object):
     """
     The deliverator holds the channels that will be used to deliver 
     the replies that come over a resilient connection
     """
-    def __init__(self):
+    def __init__(self, channel_timeout=_channel_timeout, clock=time.time):
         self._log = logging.getLogger("Deliverator")
+        self._channel_timeout = channel_timeout
+        self._clock = clock
         self._active_requests = dict()
         self._lock = RLock()
+        self._last_expire_time = clock()
+        self._expired_count = 0
+
+    @property
+    def active_request_count(self):
+        return len(self._active_requests)
+
+    @property
+    def expired_count(self):
+        return self._expired_count
 
     def add_request(self, message_id):
         """
@@ -33,21 +57,51 @@ class Deliverator(object):
         We can't use the zero size 'channel' queue because the web server moves 
         on after 8 of 10 retrieves and nobody is waiting on the last two.
 
-        So we use a size of one, and it is the caller's responsibility to clean
-        up unused channels.
+        So we use a size of one. Channels whose reply never comes expire
+        after channel_timeout.
         """
         channel = Queue(maxsize=1)
+        current_time = self._clock()
 
         self._lock.acquire()
         try:
             if message_id in self._active_requests:
                 raise ValueError("Duplicate request '%s'" % (message_id, ))
-            self._active_requests[message_id] = channel
+            self._active_requests[message_id] = (channel, current_time, )
+            if current_time - self._last_expire_time >= _expire_interval:
+                self._expire_requests(current_time)
         finally:
             self._lock.release()
 
         return channel
 
+    def _expire_requests(self, current_time):
+        """
+        discard channels that have waited longer than channel_timeout.
+        If someone is still waiting on one, they get a failure reply.
+        """
+        self._last_expire_time = current_time
+        expired_message_ids = [
+            message_id \
+            for message_id, (_, start_time) in self._active_requests.items() \
+            if current_time - start_time >= self._channel_timeout
+        ]
+        for message_id in expired_message_ids:
+            channel, _ = self._active_requests.pop(message_id)
+            reply = {
+                "message-type"  : "deliverator-expired-reply",
+                "message-id"    : message_id,
+                "result"        : "expired",
+                "error-message" : "no reply in {0} seconds".format(
+                    self._channel_timeout),
+            }
+            channel.put((reply, None, ))
+
+        if len(expired_message_ids) > 0:
+            self._expired_count += len(expired_message_ids)
+            self._log.warn("expired {0} channels, {1} active".format(
+                len(expired_message_ids), len(self._active_requests)))
+
     def deliver_reply(self, message):
         """
         Deliver the reply nessage over the channel for its message-id
@@ -56,7 +110,8 @@ class Deliverator(object):
         """
         self._lock.acquire()
         try:
-            channel = self._active_requests.pop(message.control["message-id"])
+            channel, _ = \
+                self._active_requests.pop(message.control["message-id"])
         except KeyError:
             channel = None
         finally:
@@ -73,6 +73,21 @@ class DequeDispatcher(object):
         next_tasks.append((self.run, next_interval, ))
         return next_tasks
 
+    def dispatch_all(self, halt_event):
+        """
+        dispatch every message in the input queue. This is called by the
+        event reactor, after the sockets have been polled.
+
+        return a list of tasks for the time queue
+        """
+        next_tasks = list()
+        while len(self._input_queue) > 0 and not halt_event.is_set():
+            message, data = self._input_queue.popleft()
+            result = self._dispatch_message(message, data)
+            if result is not None:
+                next_tasks.extend(result)
+        return next_tasks
+
     def _dispatch_message(self, message, data):
         handler = self._default_handler
 
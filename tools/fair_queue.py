@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+fair_queue.py
+
+An object that acts like a deque, but which returns work items in weighted
+fair order across flows (usually collections), so one collection with
+thousands of queued items cannot make everyone else wait behind it.
+
+We use start-time fair queuing: each item is tagged with a start time in
+virtual time, max(virtual time, finish tag of the previous item in its flow),
+and a finish tag of start + cost / weight. We always serve the item with the
+lowest start tag, and virtual time becomes that start tag. So items within a
+flow stay in order, and flows that are backlogged share the service in
+proportion to their weights. A flow that has been idle starts at the current
+virtual time: it gets no credit for the time it was away.
+
+Cost is in whatever unit the caller chooses: bytes for reads and writes.
+Weights come from NIMBUSIO_COLLECTION_WEIGHTS, a comma separated list of
+collection-id:weight pairs, for example "1001:4,1002:0.5". Other collections
+have weight 1.
+
+We also keep the time each item waited in the queue, per flow, for reporting,
+and the wait of the last item popped in last_wait_time.
+
+This module must run under both python 2 and python 3 (the data writer).
+"""
+import heapq
+import itertools
+import os
+import time
+
+_default_weight = 1.0
+
+def parse_weights(weights_string):
+    """
+    parse a string of collection-id:weight pairs into a dict
+    """
+    weights = dict()
+    for entry in weights_string.split(","):
+        entry = entry.strip()
+        if len(entry) == 0:
+            continue
+        collection_id, weight = entry.split(":")
+        weights[int(collection_id)] = float(weight)
+    return weights
+
+_collection_weights = \
+    parse_weights(os.environ.get("NIMBUSIO_COLLECTION_WEIGHTS", ""))
+
+def collection_weight(collection_id):
+    """
+    the configured weight of a collection
+    """
+    return _collection_weights.get(collection_id, _default_weight)
+
+def _unit_cost(_item):
+    return 1
+
+class FairQueue(object):
+    """
+    This object is a replacement for deque as a work queue.
+
+    flow_function(item) returns the flow an item belongs to
+    cost_function(item) returns the cost of serving an item
+    weight_function(flow) returns the share of a flow
+    """
+    def __init__(self,
+                 flow_function,
+                 cost_function=_unit_cost,
+                 weight_function=collection_weight,
+                 time_function=time.time):
+        self._flow_function = flow_function
+        self._cost_function = cost_function
+        self._weight_function = weight_function
+        self._time_function = time_function
+        self._internal_queue = list()
+        self._counter = itertools.count()
+        self._virtual_time = 0.0
+        # flow : [queued count, finish tag of the last item queued]
+        self._flows = dict()
+        # flow : [items served, total wait seconds, max wait seconds]
+        self._wait_stats = dict()
+        self.last_wait_time = 0.0
+
+    def append(self, item):
+        """
+        add an item to the tail of its flow
+        """
+        flow = self._flow_function(item)
+        try:
+            flow_entry = self._flows[flow]
+        except KeyError:
+            flow_entry = [0, self._virtual_time]
+            self._flows[flow] = flow_entry
+
+        start_tag = max(self._virtual_time, flow_entry[1])
+        weight = self._weight_function(flow)
+        flow_entry[0] += 1
+        flow_entry[1] = start_tag + float(self._cost_function(item)) / weight
+
+        heapq.heappush(
+            self._internal_queue,
+            (start_tag, next(self._counter), flow, self._time_function(),
+             item, )
+        )
+
+    def popleft(self):
+        """
+        return the next item in fair order
+
+        raise IndexError when queue is empty
+        """
+        start_tag, _, flow, queued_time, item = \
+            heapq.heappop(self._internal_queue)
+        self._virtual_time = start_tag
+        self._remove_from_flow(flow)
+
+        wait_time = self._time_function() - queued_time
+        self.last_wait_time = wait_time
+        try:
+            wait_entry = self._wait_stats[flow]
+        except KeyError:
+            self._wait_stats[flow] = [1, wait_time, wait_time]
+        else:
+            wait_entry[0] += 1
+            wait_entry[1] += wait_time
+            wait_entry[2] = max(wait_entry[2], wait_time)
+
+        return item
+
+    def remove_if(self, predicate):
+        """
+        remove the items for which predicate(item) is true,
+        return a list of them
+        """
+        removed_items = list()
+        kept_entries = list()
+        for queue_entry in self._internal_queue:
+            if predicate(queue_entry[4]):
+                removed_items.append(queue_entry[4])
+                self._remove_from_flow(queue_entry[2])
+            else:
+                kept_entries.append(queue_entry)
+
+        if len(removed_items) > 0:
+            heapq.heapify(kept_entries)
+            self._internal_queue = kept_entries
+
+        return removed_items
+
+    def pop_wait_stats(self):
+        """
+        return a dict of flow : (items served, total wait, max wait)
+        since the last call
+        """
+        wait_stats = self._wait_stats
+        self._wait_stats = dict()
+        return dict([(flow, tuple(wait_entry), ) \
+                     for flow, wait_entry in wait_stats.items()])
+
+    def _remove_from_flow(self, flow):
+        flow_entry = self._flows[flow]
+        flow_entry[0] -= 1
+        if flow_entry[0] == 0:
+            # forget idle flows, so we don't grow without bound
+            del self._flows[flow]
+
+    def __iter__(self):
+        return iter([queue_entry[4] for queue_entry in \
+                     sorted(self._internal_queue)])
+
+    def __len__(self):
+        return len(self._internal_queue)
+
+def report_wait_stats(event_push_client, log, topic, wait_stats, limit=10):
+    """
+    report the flows that waited longest in total, one event each
+    """
+    wait_entries = sorted(wait_stats.items(),
+                          key=lambda entry: entry[1][1],
+                          reverse=True)
+    for flow, (count, total_wait, max_wait, ) in wait_entries[:limit]:
+        report_message = \
+            "collection {0}: {1:,} items, mean wait {2:.3f}s, " \
+            "max wait {3:.3f}s".format(flow,
+                                       count,
+                                       total_wait / count,
+                                       max_wait)
+        log.info(report_message)
+        if event_push_client is not None:
+            event_push_client.info(topic,
+                                   report_message,
+                                   collection_id=flow,
+                                   count=count,
+                                   mean_wait=total_wait / count,
+                                   max_wait=max_wait)
@@ -42,6 +42,13 @@ def file_space_sanity_check(file_space_info, repository_path):
             assert real_path == file_space_row.path, (real_path, 
                                                       file_space_row.path, )
 
+def available_space(path):
+    """
+    return the bytes available to us on the filesystem holding path
+    """
+    statvfs_result = os.statvfs(path)
+    return statvfs_result.f_bsize * statvfs_result.f_bavail
+
 def find_least_volume_space_id(purpose, file_space_info):
     """
     choses the volume with the greatest available free space, 
@@ -50,8 +57,7 @@ def find_least_volume_space_id(purpose, file_space_info):
     max_avail_space = None
     max_space_id = None
     for file_space_row in file_space_info[purpose]:
-        statvfs_result = os.statvfs(file_space_row.path)
-        avail_space = statvfs_result.f_bsize * statvfs_result.f_bavail
+        avail_space = available_space(file_space_row.path)
         if max_avail_space is None or avail_space > max_avail_space:
             max_avail_space = avail_space
             max_space_id = file_space_row.space_id
@@ -63,3 +69,38 @@ def find_least_volume_space_id(purpose, file_space_info):
 
     return max_space_id
 
+
+def find_volume_space_ids(purpose, file_space_info):
+    """
+    return a list of space_ids for the purpose, one for each distinct volume,
+    so that writes can be spread across the volumes.
+    Spaces without a volume name are told apart by their device.
+    Of several spaces on the same volume, we take the first.
+    """
+    space_ids = list()
+    volumes = set()
+    for file_space_row in file_space_info.get(purpose, []):
+        if file_space_row.volume is None:
+            volume = os.stat(file_space_row.path).st_dev
+        else:
+            volume = file_space_row.volume
+        if volume in volumes:
+            continue
+        volumes.add(volume)
+        space_ids.append(file_space_row.space_id)
+
+    if len(space_ids) == 0:
+        raise FileSpacesError("No space for purpose '{0}'".format(purpose))
+
+    return space_ids
+
+def available_volume_space(purpose, file_space_info):
+    """
+    return the total free bytes of the distinct volumes for the purpose
+    """
+    space_ids = find_volume_space_ids(purpose, file_space_info)
+    avail_space = 0
+    for file_space_row in file_space_info[purpose]:
+        if file_space_row.space_id in space_ids:
+            avail_space += available_space(file_space_row.path)
+    return avail_space
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+greenlet_central_cache_invalidator.py
+
+a class that subscribes to the skeeter central cache update channel
+and discards stale entries from the process-local lookup caches
+"""
+import logging
+
+from  gevent.greenlet import Greenlet
+import zmq.green as zmq
+
+from tools.base_lookup import invalidate_local_lookups
+from tools.data_definitions import central_cache_update_channel, \
+        parse_central_cache_update_data
+from tools.zeromq_util import prepare_ipc_path
+
+_deleted_name_prefix = "__deleted__"
+
+def _rows_to_invalidate(table_name, event_data):
+    """
+    return a list of row dicts whose local cache entries are stale
+    """
+    rows = list()
+    for key in ["old", "new", ]:
+        row = event_data.get(key)
+        if row is None:
+            continue
+        rows.append(row)
+
+        # deleted collections have their name changed to have
+        # __deleted__$id__ at the front so that they do not conflict with
+        # future collections. We must also clear the undecorated name
+        if table_name == "collection" and \
+            row.get("name", "").startswith(_deleted_name_prefix):
+            name = row["name"]
+            rows.append({"name" : name[name.rindex("_") + 1:]})
+
+    return rows
+
+class GreenletCentralCacheInvalidator(Greenlet):
+    """
+    context
+        zeromq context
+
+    address
+        the skeeter PUB socket address (NIMBUSIO_CENTRAL_SKEETER_URI)
+
+    The process-local caches in BaseLookup expire on their own after a
+    short time; this greenlet expires them as soon as the central database
+    reports a change.
+    """
+    def __init__(self, context, address):
+        Greenlet.__init__(self)
+
+        self._log = logging.getLogger("CentralCacheInvalidator")
+
+        if address.startswith("ipc://"):
+            prepare_ipc_path(address)
+
+        self._sub_socket = context.socket(zmq.SUB)
+        self._log.debug("connecting to {0}".format(address))
+        self._sub_socket.connect(address)
+        self._sub_socket.setsockopt(zmq.SUBSCRIBE,
+                                    central_cache_update_channel)
+
+    def join(self, timeout=3.0):
+        """
+        Clean up and wait for the greenlet to shut down
+        """
+        self._log.debug("joining")
+        self._sub_socket.close()
+        Greenlet.join(self, timeout)
+        self._log.debug("join complete")
+
+    def _run(self):
+        while True:
+            _topic = self._sub_socket.recv()
+            assert self._sub_socket.rcvmore
+            _meta = self._sub_socket.recv()
+            if not self._sub_socket.rcvmore:
+                continue
+            data = self._sub_socket.recv()
+
+            try:
+                _, event_data = parse_central_cache_update_data(data)
+                table_name = event_data["table_name"]
+            except Exception:
+                self._log.exception("unable to parse data '{0}'".format(data))
+                continue
+
+            rows = _rows_to_invalidate(table_name, event_data)
+            self._log.debug("invalidating {0} {1}".format(table_name, rows))
+            invalidate_local_lookups(table_name, rows)
+
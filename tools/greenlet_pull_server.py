@@ -12,6 +12,7 @@ import zmq.green as zmq
 
 from tools.zeromq_util import prepare_ipc_path
 from tools.data_definitions import message_format
+from tools.message_codec import recv_control
 
 class GreenletPULLServer(Greenlet):
     """
@@ -57,7 +58,7 @@ class GreenletPULLServer(Greenlet):
 
     def _run(self):
         while True:
-            control = self._pull_socket.recv_json()
+            control = recv_control(self._pull_socket)
 
             body = []
             while self._pull_socket.rcvmore:
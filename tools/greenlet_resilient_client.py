@@ -7,6 +7,7 @@ to a resilient server
 """
 import logging
 import os
+import time
 import uuid
 
 from  gevent.greenlet import Greenlet
@@ -15,6 +16,8 @@ import gevent
 import zmq.green as zmq
 
 from tools.data_definitions import message_format
+from tools.message_codec import json_codec_name, offered_codecs, \
+        send_control, recv_control
 
 class ResilientClientError(Exception):
     pass
@@ -25,6 +28,7 @@ _handshake_retry_interval = 60.0
 _max_idle_time = 10 * 60.0
 _reporting_interval = 60.0
 _connect_delay = 60.0
+_ack_latency_ewma_alpha = 0.2
 
 class GreenletResilientClient(Greenlet):
     """
@@ -62,6 +66,8 @@ class GreenletResilientClient(Greenlet):
 
     At startup the client sends a *handshake* message to the server. The client
     is not considered connected until it gets an ack from the handshake.
+    The handshake offers our message codecs; the ack names the one the
+    server chose. A server that does not name one gets JSON.
 
     Normal workflow:
     
@@ -73,6 +79,9 @@ class GreenletResilientClient(Greenlet):
     5. The actual reply from the server comes to the PULL_ socket and is
        handled outside the client
 
+    We keep an exponentially weighted moving average of the time from
+    sending a message to its ack, and the status fields the server adds
+    to its acks (see ResilientServer), as a measure of the server's load.
     """
     def __init__(
         self, 
@@ -111,7 +120,10 @@ class GreenletResilientClient(Greenlet):
             self._send_queue.put(message)
 
         self._req_socket = None
+        self._codec_name = json_codec_name
         self.connected = False
+        self._ack_latency = None
+        self._server_status = dict()
 
     @property
     def server_node_name(self):
@@ -121,6 +133,32 @@ class GreenletResilientClient(Greenlet):
     def queue_size(self):
         return self._send_queue.qsize()
 
+    @property
+    def ack_latency(self):
+        """
+        the average seconds from send to ack, None until we have an ack
+        """
+        return self._ack_latency
+
+    @property
+    def server_status(self):
+        """
+        the status fields of the server's last ack
+        """
+        return self._server_status
+
+    def _record_ack(self, ack_reply, send_time):
+        elapsed_time = time.time() - send_time
+        if self._ack_latency is None:
+            self._ack_latency = elapsed_time
+        else:
+            self._ack_latency += \
+                _ack_latency_ewma_alpha * (elapsed_time - self._ack_latency)
+        self._server_status = dict(
+            [(key, value, ) for key, value in ack_reply.items() \
+             if key not in ["message-type", "message-id", "incoming-type",
+                            "accepted", "codec", ]])
+
     def join(self, timeout=3.0):
         self._log.debug("joining")
         if self._req_socket is not None:
@@ -188,13 +226,16 @@ class GreenletResilientClient(Greenlet):
                 "message-id"        : uuid.uuid1().hex,
                 "client-tag"        : self._client_tag,
                 "client-address"    : self._client_address,
+                "codecs"            : offered_codecs(),
             }
-            self._req_socket.send_json(message_control)
+            send_time = time.time()
+            send_control(self._req_socket, message_control)
 
             # wait for  an ack
             ack_reply = gevent.with_timeout(
                 _ack_timeout, 
-                self._req_socket.recv_json,
+                recv_control,
+                self._req_socket,
                 timeout_value=None
             )
             if ack_reply is None:
@@ -208,6 +249,8 @@ class GreenletResilientClient(Greenlet):
                 gevent.sleep(_handshake_retry_interval)
                 continue
 
+            self._codec_name = ack_reply.get("codec", json_codec_name)
+            self._record_ack(ack_reply, send_time)
             self.connected = True
 
             while self.connected:
@@ -215,12 +258,14 @@ class GreenletResilientClient(Greenlet):
                 # block until we get a message to send
                 message_to_send = self._send_queue.get()
 
+                send_time = time.time()
                 self._send_message(message_to_send)
 
                 # wait for  an ack
                 ack_reply = gevent.with_timeout(
                     _ack_timeout, 
-                    self._req_socket.recv_json,
+                    recv_control,
+                    self._req_socket,
                     timeout_value=None
                 )
                 if ack_reply is None:
@@ -231,12 +276,16 @@ class GreenletResilientClient(Greenlet):
                     self._req_socket = None
 
                     self.connected = False
+                    self._ack_latency = None
+                    self._server_status = dict()
 
                     self._deliver_failure_reply(message_to_send)
 
                     gevent.sleep(_handshake_retry_interval)
                     break
 
+                self._record_ack(ack_reply, send_time)
+
     def _send_message(self, message):
         self._log.debug("sending message: %s" % (message.control, ))
         message.control["client-tag"] = self._client_tag
@@ -250,9 +299,11 @@ class GreenletResilientClient(Greenlet):
                 message = message._replace(body=[message.body, ])
 
         if message.body is None:
-            self._req_socket.send_json(message.control)
+            send_control(self._req_socket, message.control, 
+                         codec_name=self._codec_name)
         else:
-            self._req_socket.send_json(message.control, zmq.SNDMORE)
+            send_control(self._req_socket, message.control, zmq.SNDMORE,
+                         self._codec_name)
             for segment in message.body[:-1]:
                 self._req_socket.send(segment, zmq.SNDMORE)
             self._req_socket.send(message.body[-1])
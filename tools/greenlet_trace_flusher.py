@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+greenlet_trace_flusher.py
+
+A Greenlet that sends the spans held by a RequestTracer every flush
+interval, for the gevent web servers, whose tracers otherwise only flush
+when a traced request records a span.
+"""
+import logging
+
+from  gevent.greenlet import Greenlet
+from  gevent.event import Event
+
+_check_interval = 1.0
+
+class GreenletTraceFlusher(Greenlet):
+    """
+    A Greenlet that calls tracer.flush_if_due()
+    """
+    def __init__(self, tracer, check_interval=_check_interval):
+        Greenlet.__init__(self)
+        self._log = logging.getLogger(str(self))
+        self._tracer = tracer
+        self._check_interval = check_interval
+        self._halt_event = Event()
+
+    def _run(self):
+        self._log.debug("starting")
+
+        while not self._halt_event.is_set():
+            self._tracer.flush_if_due()
+            self._halt_event.wait(self._check_interval)
+
+        self._log.debug("ending")
+
+    def join(self, timeout=None):
+        self._log.debug("joining")
+        self._halt_event.set()
+        Greenlet.join(self, timeout)
+        self._log.debug("join complete")
+
+    def __str__(self):
+        return "GreenletTraceFlusher"
@@ -13,16 +13,24 @@ import urllib
 
 import gevent
 
+from tools.LRUCache import LRUCache
 from tools.collection_lookup import CollectionLookup
-from tools.collection_access_control import check_access_control, \
+from tools.collection_access_control import CompiledAccessControlCache, \
         access_allowed, \
         access_requires_password_authentication, \
         access_forbidden
 from tools.customer_lookup import CustomerIdLookup
 from tools.customer_key_lookup import CustomerKeyLookup
+from tools.latency_histogram import LatencyHistogram
 
 from web_public_reader.util import sec_str_eq
 
+# the timestamp must agree within 10 minutes of that on the server
+_max_timestamp_delta = 600
+_verified_signature_cache_size = 10000
+_verified_signature_ttl = 60.0
+_customer_key_hmac_cache_size = 10000
+
 class AuthenticationError(Exception):
     pass
 class AccessUnauthorized(AuthenticationError):
@@ -39,7 +47,17 @@ def _string_to_sign(username, req):
     ))
 
 class InteractionPoolAuthenticator(object):
-    def __init__(self, memcached_client, interaction_pool):
+    """
+    Signatures that have been verified recently are remembered for a short
+    time (never past the end of the timestamp window), so repeated requests,
+    such as range GETs of the same object, skip the HMAC computation.
+    HMAC state is preloaded once per customer key.
+
+    If event_push_client is not None, authentication latency is reported 
+    periodically as a histogram event.
+    """
+    def __init__(self, memcached_client, interaction_pool, 
+                 event_push_client=None):
         self._log = logging.getLogger("InteractionPoolAuthenticator")
         self._interaction_pool = interaction_pool
         self._collection_lookup = CollectionLookup(memcached_client,
@@ -48,6 +66,20 @@ class InteractionPoolAuthenticator(object):
                                                  interaction_pool)
         self._customer_key_lookup = CustomerKeyLookup(memcached_client,
                                                       interaction_pool)
+        self._access_control_cache = CompiledAccessControlCache()
+
+        # (key_id, signature) : (key, string_to_sign, expiration_time)
+        self._verified_signatures = LRUCache(_verified_signature_cache_size)
+
+        # key_id : (key, hmac object)
+        self._customer_key_hmacs = LRUCache(_customer_key_hmac_cache_size)
+
+        self._latency_histogram = LatencyHistogram("authenticate",
+                                                   event_push_client)
+
+    @property
+    def latency_histogram(self):
+        return self._latency_histogram
 
     def authenticate(self, collection_name, access_type, req):
         """
@@ -55,6 +87,30 @@ class InteractionPoolAuthenticator(object):
         return collection_entry if valid
         raise AccessUnauthorized(error_message) if invalid
         """
+        start_time = time.time()
+        try:
+            return self._authenticate(collection_name, access_type, req)
+        finally:
+            self._latency_histogram.record(time.time() - start_time)
+
+    def _compute_signature(self, key_id, key, string_to_sign):
+        """
+        compute the HMAC from a copy of the preloaded state for this key
+        """
+        try:
+            cached_key, base_hmac = self._customer_key_hmacs[key_id]
+        except KeyError:
+            cached_key, base_hmac = None, None
+
+        if base_hmac is None or cached_key != key:
+            base_hmac = hmac.new(key, digestmod=hashlib.sha256)
+            self._customer_key_hmacs[key_id] = (key, base_hmac, )
+
+        signature_hmac = base_hmac.copy()
+        signature_hmac.update(string_to_sign)
+        return signature_hmac.digest()
+
+    def _authenticate(self, collection_name, access_type, req):
         collection_row = self._collection_lookup.get(collection_name.lower()) 
         if collection_row is None:
             error_message = "unknown collection {0}".format(collection_name)
@@ -63,9 +119,11 @@ class InteractionPoolAuthenticator(object):
 
         if access_type is not None:
             access_result = \
-                check_access_control(access_type, 
-                                     req, 
-                                     collection_row["access_control"])
+                self._access_control_cache.check_access_control(
+                    collection_row["id"],
+                    access_type, 
+                    req, 
+                    collection_row["access_control"])
             if access_result == access_allowed:
                 return collection_row
             if access_result == access_forbidden:
@@ -138,30 +196,50 @@ class InteractionPoolAuthenticator(object):
             raise AccessUnauthorized(error_message)
 
         # The timestamp must agree within 10 minutes of that on the server
-        time_delta = abs(time.time() - timestamp)
-        if time_delta > 600:
+        current_time = time.time()
+        time_delta = abs(current_time - timestamp)
+        if time_delta > _max_timestamp_delta:
             error_message = "timestamp out of range {0} {1}".format(
                 timestamp, time_delta)
             self._log.error(error_message)
             raise AccessUnauthorized(error_message)
 
+        key = str(customer_key_row["key"])
+        verified_signature_key = (key_id, signature, )
         try:
-            signature = a2b_hex(signature)
+            verified_key, verified_string_to_sign, expiration_time = \
+                self._verified_signatures[verified_signature_key]
+        except KeyError:
+            pass
+        else:
+            if current_time < expiration_time and \
+               verified_key == key and \
+               verified_string_to_sign == string_to_sign:
+                return collection_row
+            del self._verified_signatures[verified_signature_key]
+
+        try:
+            binary_signature = a2b_hex(signature)
         except Exception, instance:
             error_message = "a2b_hex(signature) failed {0} {1}".format(
                 timestamp, instance)
             self._log.error(error_message)
             raise AccessUnauthorized(error_message)
 
-        expected = hmac.new(str(customer_key_row["key"]), 
-                            string_to_sign, 
-                            hashlib.sha256).digest()
+        expected = self._compute_signature(key_id, key, string_to_sign)
 
-        if not sec_str_eq(signature, expected):
+        if not sec_str_eq(binary_signature, expected):
             error_message = "signature comparison failed {0} {1}".format(
                 customer_row["username"], string_to_sign)
             self._log.error(error_message)
             raise AccessUnauthorized(error_message)
 
+        # remember this signature until it would fall out of the
+        # timestamp window
+        expiration_time = min(current_time + _verified_signature_ttl,
+                              timestamp + _max_timestamp_delta)
+        self._verified_signatures[verified_signature_key] = \
+            (key, string_to_sign, expiration_time, )
+
         return collection_row
 
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+latency_histogram.py
+
+class LatencyHistogram
+
+accumulate elapsed times in exponential buckets, and periodically report
+them as a "latency-histogram" event through an EventPushClient
+"""
+from bisect import bisect_left
+import time
+
+latency_histogram_topic = "latency-histogram"
+
+# bucket upper limits in seconds: 100us, 200us, 400us ... ~52s
+_bucket_count = 20
+_default_bucket_limits = [0.0001 * (2 ** i) for i in range(_bucket_count)]
+_default_report_interval = 60.0
+
+def compute_percentile(bucket_limits, bucket_counts, max_value, fraction):
+    """
+    return the upper limit of the bucket holding the given fraction
+    (0.0 - 1.0) of the counted values, or None if nothing is counted
+    """
+    total_count = sum(bucket_counts)
+    if total_count == 0:
+        return None
+    threshold = fraction * total_count
+    running_count = 0
+    for index, bucket_count in enumerate(bucket_counts):
+        running_count += bucket_count
+        if running_count >= threshold and bucket_count > 0:
+            if index < len(bucket_limits):
+                return min(bucket_limits[index], max_value)
+            return max_value
+    return max_value
+
+class LatencyHistogram(object):
+    """
+    name
+        identifies the histogram in reported events
+
+    event_push_client
+        if not None, the histogram is sent as an event and reset
+        every report_interval seconds (checked when a value is recorded)
+    """
+    def __init__(self,
+                 name,
+                 event_push_client=None,
+                 report_interval=_default_report_interval,
+                 bucket_limits=_default_bucket_limits):
+        self._name = name
+        self._event_push_client = event_push_client
+        self._report_interval = report_interval
+        self._bucket_limits = list(bucket_limits)
+        self._next_report_time = time.time() + report_interval
+        self.reset()
+
+    def __str__(self):
+        return self._name
+
+    @property
+    def count(self):
+        return self._count
+
+    def reset(self):
+        # the last bucket holds everything larger than the last limit
+        self._bucket_counts = [0 for _ in range(len(self._bucket_limits)+1)]
+        self._count = 0
+        self._total = 0.0
+        self._max = 0.0
+
+    def record(self, elapsed_seconds):
+        """
+        add one elapsed time to the histogram
+        """
+        self._bucket_counts[
+            bisect_left(self._bucket_limits, elapsed_seconds)] += 1
+        self._count += 1
+        self._total += elapsed_seconds
+        if elapsed_seconds > self._max:
+            self._max = elapsed_seconds
+
+        if self._event_push_client is not None:
+            current_time = time.time()
+            if current_time >= self._next_report_time:
+                self.report()
+                self._next_report_time = current_time + self._report_interval
+
+    def percentile(self, fraction):
+        """
+        return the upper limit of the bucket holding the given fraction
+        (0.0 - 1.0) of the recorded values, or None if nothing is recorded
+        """
+        return compute_percentile(self._bucket_limits, 
+                                  self._bucket_counts, 
+                                  self._max,
+                                  fraction)
+
+    def snapshot(self):
+        """
+        return a dict suitable for sending as event data
+        """
+        if self._count == 0:
+            mean = 0.0
+        else:
+            mean = self._total / self._count
+        return {
+            "histogram-name"    : self._name,
+            "bucket-limits"     : self._bucket_limits,
+            "bucket-counts"     : list(self._bucket_counts),
+            "count"             : self._count,
+            "mean"              : mean,
+            "max"               : self._max,
+        }
+
+    def report(self):
+        """
+        send the histogram as an event and start a new interval
+        """
+        if self._count > 0:
+            self._event_push_client.info(
+                latency_histogram_topic,
+                "{0} latency".format(self._name),
+                **self.snapshot()
+            )
+        self.reset()
+
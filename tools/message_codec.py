@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+message_codec.py
+
+encode and decode the control frames of our zeromq messages.
+
+A control frame is a dict of JSON types. We have two codecs:
+
+json
+    what we have always sent; every process understands it
+
+compact-1
+    a tagged binary encoding in the style of msgpack. Timestamps (datetime)
+    travel as 8 byte microsecond counts and binary values (bytearray, or
+    bytes under python 3) travel as raw bytes, where JSON needs a repr
+    and base64. Binary values decode as bytearray under python 2, where a
+    str would go out again as text if the message is passed on.
+
+A compact frame starts with _compact_magic, a byte that never starts a
+JSON document, followed by the codec version. decode() looks at the first
+byte, so a receiver does not need to know which codec the sender used.
+The sender picks the codec: resilient clients offer their codecs in the
+handshake, and the resilient server answers with the one it chose.
+Without an answer, we send JSON.
+
+The compact codec is off unless NIMBUSIO_COMPACT_MESSAGE_CODEC=1 on both
+ends. Its frames are smaller, but it is pure python and json is not: see
+test/message_codec_benchmark.py before turning it on.
+
+Under JSON, timestamps are sent as their repr and binary values as base64,
+which is what our messages carried before we had the compact codec. So a
+receiver must accept either: see data_definitions.parse_timestamp_repr and
+data_definitions.parse_digest.
+
+This module must run under both python 2 and python 3 (the data writer).
+"""
+from base64 import b64encode
+from datetime import datetime, timedelta
+import json
+import os
+import struct
+import sys
+
+json_codec_name = "json"
+compact_codec_name = "compact-1"
+
+_compact_codec_enabled = \
+    os.environ.get("NIMBUSIO_COMPACT_MESSAGE_CODEC", "0") == "1"
+
+_compact_magic = b"\xc1"
+_compact_version = 1
+_compact_header = _compact_magic + struct.pack(">B", _compact_version)
+
+_tag_none = 0x00
+_tag_false = 0x01
+_tag_true = 0x02
+_tag_int8 = 0x03
+_tag_int32 = 0x04
+_tag_int64 = 0x05
+_tag_big_int = 0x06
+_tag_float = 0x07
+_tag_short_text = 0x08
+_tag_text = 0x09
+_tag_binary = 0x0a
+_tag_list = 0x0b
+_tag_dict = 0x0c
+_tag_timestamp = 0x0d
+
+_tag_struct = struct.Struct(">B")
+_tag_int8_struct = struct.Struct(">Bb")
+_tag_int32_struct = struct.Struct(">Bi")
+_tag_int64_struct = struct.Struct(">Bq")
+_tag_float_struct = struct.Struct(">Bd")
+_tag_byte_length_struct = struct.Struct(">BB")
+_tag_length_struct = struct.Struct(">BI")
+_int8_struct = struct.Struct(">b")
+_int32_struct = struct.Struct(">i")
+_int64_struct = struct.Struct(">q")
+_float_struct = struct.Struct(">d")
+_length_struct = struct.Struct(">I")
+
+_min_int64 = -(2 ** 63)
+_max_int64 = 2 ** 63 - 1
+
+_epoch = datetime(1970, 1, 1)
+
+if sys.version_info[0] < 3:
+    _text_types = (unicode, str, )
+    _binary_types = (bytearray, )
+    _binary_result_type = bytearray
+    _int_types = (int, long, )
+else:
+    _text_types = (str, )
+    _binary_types = (bytes, bytearray, )
+    _binary_result_type = bytes
+    _int_types = (int, )
+
+class MessageCodecError(Exception):
+    pass
+
+def offered_codecs():
+    """
+    the codecs a resilient client offers in its handshake, in order of
+    preference
+    """
+    if _compact_codec_enabled:
+        return [compact_codec_name, json_codec_name, ]
+    return [json_codec_name, ]
+
+def choose_codec(offered_codec_names):
+    """
+    pick the first of the codecs offered by a client that we support.
+    Clients that predate the compact codec offer nothing: they get JSON.
+    """
+    for codec_name in offered_codec_names or []:
+        if codec_name == compact_codec_name and _compact_codec_enabled:
+            return codec_name
+        if codec_name == json_codec_name:
+            return codec_name
+    return json_codec_name
+
+def frame_codec(frame):
+    """
+    return the name of the codec that encoded this frame
+    """
+    if frame[:1] == _compact_magic:
+        return compact_codec_name
+    return json_codec_name
+
+def encode(control, codec_name=json_codec_name):
+    """
+    encode a control dict as a frame
+    """
+    if codec_name == compact_codec_name:
+        parts = [_compact_header, ]
+        _encode_value(control, parts)
+        return b"".join(parts)
+    if codec_name == json_codec_name:
+        return json.dumps(control, default=_json_default).encode("utf-8")
+    raise MessageCodecError("unknown codec {0}".format(codec_name))
+
+def decode(frame):
+    """
+    decode a frame from either codec
+    """
+    if frame[:1] != _compact_magic:
+        return json.loads(bytes(frame).decode("utf-8"))
+
+    data = bytearray(frame)
+    if data[1] != _compact_version:
+        raise MessageCodecError(
+            "unknown compact codec version {0}".format(data[1]))
+    try:
+        value, offset = _decode_value(data, 2)
+    except (IndexError, struct.error) as instance:
+        raise MessageCodecError("truncated frame: {0}".format(instance))
+    if offset != len(data):
+        raise MessageCodecError(
+            "{0} bytes after the end of the value".format(len(data) - offset))
+    return value
+
+def send_control(socket, control, flags=0, codec_name=json_codec_name):
+    """
+    encode a control dict and send it over a zeromq socket
+    """
+    socket.send(encode(control, codec_name), flags)
+
+def recv_control(socket, flags=0):
+    """
+    receive a control frame from a zeromq socket and decode it
+    """
+    return decode(socket.recv(flags))
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return repr(value)
+    if isinstance(value, _binary_types):
+        return b64encode(bytes(value)).decode("ascii")
+    raise TypeError("{0!r} is not JSON serializable".format(value))
+
+def _encode_none(_value, parts):
+    parts.append(_tag_struct.pack(_tag_none))
+
+def _encode_bool(value, parts):
+    parts.append(_tag_struct.pack(_tag_true if value else _tag_false))
+
+def _encode_int(value, parts):
+    if -128 <= value <= 127:
+        parts.append(_tag_int8_struct.pack(_tag_int8, value))
+    elif -2147483648 <= value <= 2147483647:
+        parts.append(_tag_int32_struct.pack(_tag_int32, value))
+    elif _min_int64 <= value <= _max_int64:
+        parts.append(_tag_int64_struct.pack(_tag_int64, value))
+    else:
+        _encode_text_bytes(str(value).encode("ascii"), parts, _tag_big_int)
+
+def _encode_float(value, parts):
+    parts.append(_tag_float_struct.pack(_tag_float, value))
+
+def _encode_text_bytes(encoded_value, parts, tag=None):
+    if tag is None and len(encoded_value) <= 255:
+        parts.append(_tag_byte_length_struct.pack(_tag_short_text,
+                                                  len(encoded_value)))
+    else:
+        parts.append(_tag_length_struct.pack(tag or _tag_text,
+                                             len(encoded_value)))
+    parts.append(encoded_value)
+
+def _encode_text(value, parts):
+    # a python 2 str is taken to be utf-8, as json does
+    if not isinstance(value, bytes):
+        value = value.encode("utf-8")
+    _encode_text_bytes(value, parts)
+
+def _encode_binary(value, parts):
+    parts.append(_tag_length_struct.pack(_tag_binary, len(value)))
+    parts.append(bytes(value))
+
+def _encode_list(value, parts):
+    parts.append(_tag_length_struct.pack(_tag_list, len(value)))
+    for item in value:
+        _encode_value(item, parts)
+
+def _encode_dict(value, parts):
+    parts.append(_tag_length_struct.pack(_tag_dict, len(value)))
+    for key, item in value.items():
+        _encode_text(key, parts)
+        _encode_value(item, parts)
+
+def _encode_timestamp(value, parts):
+    delta = value - _epoch
+    microseconds = (delta.days * 86400 + delta.seconds) * 1000000 + \
+                   delta.microseconds
+    parts.append(_tag_int64_struct.pack(_tag_timestamp, microseconds))
+
+_encoders = {
+    type(None)  : _encode_none,
+    bool        : _encode_bool,
+    float       : _encode_float,
+    list        : _encode_list,
+    tuple       : _encode_list,
+    dict        : _encode_dict,
+    datetime    : _encode_timestamp,
+}
+for _type in _int_types:
+    _encoders[_type] = _encode_int
+for _type in _text_types:
+    _encoders[_type] = _encode_text
+for _type in _binary_types:
+    _encoders[_type] = _encode_binary
+
+def _encode_value(value, parts):
+    try:
+        encoder = _encoders[type(value)]
+    except KeyError:
+        # subclasses, such as OrderedDict
+        for value_type, encoder in _encoders.items():
+            if isinstance(value, value_type):
+                break
+        else:
+            raise MessageCodecError(
+                "can't encode {0!r}".format(type(value)))
+    encoder(value, parts)
+
+def _decode_value(data, offset):
+    """
+    return the value starting at data[offset] and the offset after it
+    """
+    tag = data[offset]
+    offset += 1
+
+    if tag == _tag_short_text:
+        length = data[offset]
+        offset += 1
+        return data[offset:offset+length].decode("utf-8"), offset+length
+    if tag == _tag_int8:
+        return _int8_struct.unpack_from(data, offset)[0], offset+1
+    if tag == _tag_dict:
+        (count, ) = _length_struct.unpack_from(data, offset)
+        offset += 4
+        result = dict()
+        for _ in range(count):
+            key, offset = _decode_value(data, offset)
+            result[key], offset = _decode_value(data, offset)
+        return result, offset
+    if tag == _tag_none:
+        return None, offset
+    if tag == _tag_false:
+        return False, offset
+    if tag == _tag_true:
+        return True, offset
+    if tag == _tag_int32:
+        return _int32_struct.unpack_from(data, offset)[0], offset+4
+    if tag == _tag_int64:
+        return _int64_struct.unpack_from(data, offset)[0], offset+8
+    if tag == _tag_float:
+        return _float_struct.unpack_from(data, offset)[0], offset+8
+    if tag == _tag_timestamp:
+        (microseconds, ) = _int64_struct.unpack_from(data, offset)
+        return _epoch + timedelta(microseconds=microseconds), offset+8
+    if tag in (_tag_text, _tag_binary, _tag_big_int, ):
+        (length, ) = _length_struct.unpack_from(data, offset)
+        offset += 4
+        value = data[offset:offset+length]
+        if len(value) != length:
+            raise MessageCodecError("truncated frame")
+        offset += length
+        if tag == _tag_text:
+            return value.decode("utf-8"), offset
+        if tag == _tag_binary:
+            return _binary_result_type(value), offset
+        return int(value.decode("ascii")), offset
+    if tag == _tag_list:
+        (count, ) = _length_struct.unpack_from(data, offset)
+        offset += 4
+        result = list()
+        for _ in range(count):
+            value, offset = _decode_value(data, offset)
+            result.append(value)
+        return result, offset
+
+    raise MessageCodecError("unknown tag 0x{0:02x}".format(tag))
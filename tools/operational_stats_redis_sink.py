@@ -6,11 +6,19 @@ A Greenlet that acts as a sink:
 reading status entries a queue and passing them to redis
 
 See Ticket #64 Implement Operational Stats Accumulation
+
+Entries are summed in memory per (partial key, minute, collection_id)
+and written with a single pipelined batch of HINCRBY on each flush,
+so at most one flush interval of counts is lost if the process dies.
 """
 from collections import namedtuple
+import time
+
+from redis import RedisError
 
 from tools.redis_sink import RedisSink
 from tools.operational_stats_redis_key import compute_key
+from tools.latency_histogram import LatencyHistogram
 
 redis_queue_entry_tuple = namedtuple("RedisQueueEntry", ["timestamp",
                                                          "collection_id",
@@ -22,17 +30,53 @@ class OperationalStatsRedisSink(RedisSink):
 
     See Ticket #64 Implement Operational Stats Accumulation
     """
-    def __init__(self, halt_event, redis_queue, node_name):
+    def __init__(self, halt_event, redis_queue, node_name, 
+                 event_push_client=None):
         RedisSink.__init__(self, halt_event, redis_queue)
         self._node_name = node_name
+        self._pending_values = dict()
+        self._flush_latency_histogram = LatencyHistogram("redis_sink_flush",
+                                                         event_push_client)
+
+    @property
+    def flush_latency_histogram(self):
+        return self._flush_latency_histogram
 
     def store(self, partial_key, entry):
         """
-        store one entry from the queue in redis
+        add one entry from the queue to the pending values
+        """
+        minute = entry.timestamp.replace(second=0, microsecond=0)
+        pending_key = (partial_key, minute, entry.collection_id, )
+        self._pending_values[pending_key] = \
+            self._pending_values.get(pending_key, 0) + entry.value
+
+    def pending_count(self):
+        return len(self._pending_values)
+
+    def flush(self):
+        """
+        store the pending values in redis 
         """
-        key = compute_key(self._node_name, entry.timestamp, partial_key)
-        self._log.debug("hincrby({0}, {1}, {2})".format(key, 
-                                                        entry.collection_id, 
-                                                        entry.value))
-        self._redis_connection.hincrby(key, entry.collection_id, entry.value)
+        if len(self._pending_values) == 0:
+            return
+
+        pending_values = self._pending_values
+        self._pending_values = dict()
+
+        start_time = time.time()
+        pipeline = self._redis_connection.pipeline(transaction=False)
+        for (partial_key, minute, collection_id, ), value in \
+            pending_values.items():
+            key = compute_key(self._node_name, minute, partial_key)
+            pipeline.hincrby(key, collection_id, value)
+
+        try:
+            pipeline.execute()
+        except RedisError:
+            self._log.exception("discarding {0} values".format(
+                len(pending_values)))
+            return
 
+        self._log.debug("flushed {0} values".format(len(pending_values)))
+        self._flush_latency_histogram.record(time.time() - start_time)
@@ -12,6 +12,7 @@ import zmq
 
 from tools.zeromq_util import prepare_ipc_path
 from tools.data_definitions import message_format
+from tools.message_codec import recv_control
 
 _pull_hwm = 100
 
@@ -75,7 +76,7 @@ class PULLServer(object):
 
     def _receive_message(self):
         try:
-            control = self._pull_socket.recv_json(zmq.NOBLOCK)
+            control = recv_control(self._pull_socket, zmq.NOBLOCK)
         except zmq.ZMQError:
             instance = sys.exc_info()[1]
             if instance.errno == zmq.EAGAIN:
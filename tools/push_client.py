@@ -9,14 +9,20 @@ import logging
 
 import zmq
 
+from tools.message_codec import json_codec_name, send_control
+
 _push_hwm = 100
 
 class PUSHClient(object):
     """
     a class that manages a zeromq PUSH socket as a client,
     The purpose is to have multiple clients pushing to a single PULL server
+
+    codec_name
+        the message codec for the control frames: the default, JSON, is
+        understood by every PULL server
     """
-    def __init__(self, context, address):
+    def __init__(self, context, address, codec_name=json_codec_name):
         self._log = logging.getLogger("PUSH.{0}".format(address))
 
         self._push_socket = context.socket(zmq.PUSH)
@@ -24,6 +30,11 @@ class PUSHClient(object):
         self._push_socket.setsockopt(zmq.LINGER, 5000)
         self._log.debug("connecting")
         self._push_socket.connect(address)
+        self._codec_name = codec_name
+
+    @property
+    def codec_name(self):
+        return self._codec_name
 
     def close(self):
         self._push_socket.close()
@@ -39,9 +50,11 @@ class PUSHClient(object):
                 data = [data, ]
 
         if data is None:
-            self._push_socket.send_json(message)
+            send_control(self._push_socket, message, 
+                         codec_name=self._codec_name)
         else:
-            self._push_socket.send_json(message, zmq.SNDMORE)
+            send_control(self._push_socket, message, zmq.SNDMORE, 
+                         self._codec_name)
             for segment in data[:-1]:
                 self._push_socket.send(segment, zmq.SNDMORE)
             self._push_socket.send(data[-1])
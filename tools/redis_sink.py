@@ -6,22 +6,39 @@ A Greenlet that acts as a sink:
 reading status entries a queue and passing them to redis
 """
 import logging
+import os
+import time
 
 import gevent.greenlet
 import gevent.queue
 
 from tools.redis_connection import create_redis_connection
 
+_flush_interval = float(
+    os.environ.get("NIMBUSIO_REDIS_SINK_FLUSH_INTERVAL", "0.5"))
+_max_pending_entries = int(
+    os.environ.get("NIMBUSIO_REDIS_SINK_MAX_PENDING_ENTRIES", "1000"))
+
 class RedisSink(gevent.greenlet.Greenlet):
     """
+    A derived class may hold entries in store() and write them to redis
+    in flush(), which is called at least every flush_interval seconds,
+    whenever pending_count() reaches max_pending_entries, 
+    and when the halt_event is set.
     """
-    def __init__(self, halt_event, redis_queue):
+    def __init__(self, 
+                 halt_event, 
+                 redis_queue,
+                 flush_interval=_flush_interval,
+                 max_pending_entries=_max_pending_entries):
         gevent.greenlet.Greenlet.__init__(self)
         self._name = "redis_sink"
         self._log = logging.getLogger(self._name)
         self._halt_event = halt_event
         self._redis_queue = redis_queue
         self._redis_connection = None
+        self._flush_interval = flush_interval
+        self._max_pending_entries = max_pending_entries
 
     def __str__(self):
         return self._name
@@ -34,12 +51,25 @@ class RedisSink(gevent.greenlet.Greenlet):
         self._redis_connection = create_redis_connection()
 
         self._log.debug("start halt_event loop")
-        while not self._halt_event.is_set():
-            try:
-                key, entry = self._redis_queue.get(block=True, timeout=1.0)
-            except gevent.queue.Empty:
-                continue
-            self.store(key, entry)
+        next_flush_time = time.time() + self._flush_interval
+        try:
+            while not self._halt_event.is_set():
+                timeout = min(1.0, max(0.0, next_flush_time - time.time()))
+                try:
+                    key, entry = self._redis_queue.get(block=True, 
+                                                       timeout=timeout)
+                except gevent.queue.Empty:
+                    pass
+                else:
+                    self.store(key, entry)
+
+                if self.pending_count() >= self._max_pending_entries or \
+                   time.time() >= next_flush_time:
+                    self.flush()
+                    next_flush_time = time.time() + self._flush_interval
+        finally:
+            # write whatever we are holding, even if we are being killed
+            self.flush()
 
         self._log.debug("end halt_event loop")
 
@@ -49,3 +79,13 @@ class RedisSink(gevent.greenlet.Greenlet):
         """
         # we expect a derived class to implement this
 
+    def pending_count(self):
+        """
+        return the number of entries held by store() for the next flush
+        """
+        return 0
+
+    def flush(self):
+        """
+        write any entries held by store() to redis
+        """
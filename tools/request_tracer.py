@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+request_tracer.py
+
+class RequestTracer
+
+record how long each stage of a request takes in this process, as spans of
+(user-request-id, stage, start time, duration), so that the performance
+packager can put together the waterfall of a request across the cluster
+and a latency histogram for each stage.
+
+Spans are kept in a bounded ring: when it is full, the oldest span is
+dropped (and counted). They are sent as "trace-spans" events through an
+EventPushClient every flush_interval seconds. That is checked when a span
+is recorded, and each process also calls flush_if_due() from its loop (or
+runs a GreenletTraceFlusher), so that the spans of a request don't wait
+for the next traced request. A tracer is not shared between threads: each
+thread that traces has its own tracer and its own EventPushClient.
+
+We trace NIMBUSIO_TRACE_SAMPLE_RATE (0.0 - 1.0) of requests. The choice
+is made from the user-request-id, so every process traces the same
+requests.
+
+This module must run under both python 2 and python 3 (the data writer).
+"""
+from collections import deque
+from contextlib import contextmanager
+import os
+import time
+import zlib
+
+trace_spans_topic = "trace-spans"
+
+_trace_sample_rate = float(
+    os.environ.get("NIMBUSIO_TRACE_SAMPLE_RATE", "0.01"))
+_ring_size = int(os.environ.get("NIMBUSIO_TRACE_RING_SIZE", "10000"))
+_flush_interval = 5.0
+_max_spans_per_event = 500
+
+def is_traced(user_request_id, sample_rate=_trace_sample_rate):
+    """
+    return True if the request is one we trace
+    """
+    if user_request_id is None or sample_rate <= 0.0:
+        return False
+    if sample_rate >= 1.0:
+        return True
+    request_hash = zlib.crc32(user_request_id.encode("utf-8")) & 0xffffffff
+    return request_hash < sample_rate * 2 ** 32
+
+class RequestTracer(object):
+    """
+    a bounded ring of spans for one thread
+
+    stage names say where they were measured, e.g. "web-writer-zfec-encode"
+    """
+    def __init__(self,
+                 event_push_client=None,
+                 ring_size=_ring_size,
+                 flush_interval=_flush_interval,
+                 sample_rate=_trace_sample_rate):
+        self._event_push_client = event_push_client
+        self._spans = deque(maxlen=ring_size)
+        self._flush_interval = flush_interval
+        self._sample_rate = sample_rate
+        self._dropped_count = 0
+        self._next_flush_time = time.time() + flush_interval
+
+    def is_traced(self, user_request_id):
+        """
+        return True if the request is one we trace
+        """
+        return is_traced(user_request_id, self._sample_rate)
+
+    def record(self, user_request_id, stage, start_time, end_time=None):
+        """
+        record one span, if we trace this request
+        """
+        if not is_traced(user_request_id, self._sample_rate):
+            return
+        if end_time is None:
+            end_time = time.time()
+        if len(self._spans) == self._spans.maxlen:
+            self._dropped_count += 1
+        self._spans.append(
+            (user_request_id, stage, start_time, end_time - start_time, ))
+
+        self.flush_if_due(end_time)
+
+    def flush_if_due(self, current_time=None):
+        """
+        send the spans we have if flush_interval has passed since the last
+        flush
+        """
+        if self._event_push_client is None:
+            return
+        if current_time is None:
+            current_time = time.time()
+        if current_time < self._next_flush_time:
+            return
+        if len(self._spans) > 0 or self._dropped_count > 0:
+            self.flush()
+        self._next_flush_time = current_time + self._flush_interval
+
+    @contextmanager
+    def span(self, user_request_id, stage):
+        """
+        record the time spent in a with block
+        """
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.record(user_request_id, stage, start_time)
+
+    def pop_spans(self):
+        """
+        remove and return the spans we have
+        """
+        spans = list()
+        while len(self._spans) > 0:
+            spans.append(self._spans.popleft())
+        return spans
+
+    def flush(self):
+        """
+        send the spans we have as events
+        """
+        spans = self.pop_spans()
+        dropped_count = self._dropped_count
+        self._dropped_count = 0
+        for index in range(0, len(spans), _max_spans_per_event):
+            batch = spans[index:index+_max_spans_per_event]
+            self._event_push_client.info(
+                trace_spans_topic,
+                "{0} spans, {1} dropped".format(len(batch), dropped_count),
+                spans=[list(span) for span in batch],
+                dropped=dropped_count)
+            dropped_count = 0
@@ -13,6 +13,8 @@ import uuid
 import zmq
 
 from tools.data_definitions import message_format
+from tools.message_codec import json_codec_name, offered_codecs, \
+        send_control, recv_control
 
 _ack_timeout = 10.0 * 60.0
 _handshake_retry_interval = 60.0
@@ -66,6 +68,8 @@ class ResilientClient(object):
 
     At startup the client sends a *handshake* message to the server. The client
     is not considered connected until it gets an ack from the handshake.
+    The handshake offers our message codecs; the ack names the one the
+    server chose. A server that does not name one gets JSON.
 
     Normal workflow:
     
@@ -98,6 +102,7 @@ class ResilientClient(object):
         self._server_address = server_address
 
         self._req_socket = None
+        self._codec_name = json_codec_name
 
         self._send_queue = deque()
 
@@ -147,6 +152,7 @@ class ResilientClient(object):
         message = {
             "message-type"      : "resilient-server-handshake",
             "message-id"        : uuid.uuid1().hex,
+            "codecs"            : offered_codecs(),
         }
         message = message_format(ident=None, control=message, body=None)
         self._pending_message = message
@@ -204,6 +210,8 @@ class ResilientClient(object):
         self._pollster.unregister(self._req_socket)
         self._req_socket.close()
         self._req_socket = None
+        # the next handshake goes out as JSON
+        self._codec_name = json_codec_name
 
         self._status = _status_disconnected
         self._status_time = time.time()
@@ -269,6 +277,7 @@ class ResilientClient(object):
         # if we got an ack to a handshake request, we are connected
         if message_type == "resilient-server-handshake":
             assert self._status == _status_handshaking, self._status
+            self._codec_name = message.get("codec", json_codec_name)
             self._status = _status_connected
             self._status_time = time.time()
 
@@ -298,9 +307,11 @@ class ResilientClient(object):
                 message = message._replace(body=[message.body, ])
 
         if message.body is None:
-            self._req_socket.send_json(message.control)
+            send_control(self._req_socket, message.control, 
+                         codec_name=self._codec_name)
         else:
-            self._req_socket.send_json(message.control, zmq.SNDMORE)
+            send_control(self._req_socket, message.control, zmq.SNDMORE,
+                         self._codec_name)
             for segment in message.body[:-1]:
                 self._req_socket.send(segment, zmq.SNDMORE)
             self._req_socket.send(message.body[-1])
@@ -309,7 +320,7 @@ class ResilientClient(object):
         # we should only be receiving ack, so we don't
         # check for multipart messages
         try:
-            return self._req_socket.recv_json(zmq.NOBLOCK)
+            return recv_control(self._req_socket, zmq.NOBLOCK)
         except zmq.ZMQError, instance:
             if instance.errno == zmq.EAGAIN:
                 self._log.warn("socket would have blocked")
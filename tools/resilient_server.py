@@ -12,6 +12,8 @@ import zmq
 from tools.zeromq_util import prepare_ipc_path
 from tools.push_client import PUSHClient
 from tools.data_definitions import message_format
+from tools.message_codec import choose_codec, frame_codec, decode, \
+        send_control
 
 class ResilientServer(object):
     """
@@ -21,8 +23,14 @@ class ResilientServer(object):
     The resilient server receives messages from resilient clients over a
     REP socket and sends replies using PUSH clients.
 
+    In the handshake, the client offers the message codecs it supports. We
+    tell it the one we chose in the ack, and use it for the replies.
+
+    ack_status (optional)
+        a function returning a dict of fields to add to every ack, so the
+        clients see the load of the server as of their last message
     """
-    def __init__(self, context, address, receive_queue):
+    def __init__(self, context, address, receive_queue, ack_status=None):
         self._log = logging.getLogger("ResilientServer-%s" % (address, ))
 
         self._context = context
@@ -44,6 +52,7 @@ class ResilientServer(object):
             self._rep_socket.bind(bind_address)
 
         self._receive_queue = receive_queue
+        self._ack_status = ack_status
 
         self._dispatch_table = {
             "ping" : \
@@ -109,7 +118,7 @@ class ResilientServer(object):
         
         # assume we are readable, because we are only registered for read
         assert readable
-        message = self._receive_message()      
+        codec_name, message = self._receive_message()      
 
         ack_message = {
             "message-type" : "resilient-server-ack",
@@ -125,11 +134,22 @@ class ResilientServer(object):
         else:
             self._receive_queue.append((message.control, message.body, ))
         ack_message["accepted"] = True
+        if message.control["message-type"] == "resilient-server-handshake":
+            ack_message["codec"] = \
+                self._active_clients[message.control["client-tag"]].codec_name
+        if self._ack_status is not None:
+            ack_message.update(self._ack_status())
 
-        self._rep_socket.send_json(ack_message)
+        # the client decodes the ack with the codec it sent the message in
+        send_control(self._rep_socket, ack_message, codec_name=codec_name)
 
     def _receive_message(self):
-        control = self._rep_socket.recv_json()
+        """
+        return the name of the codec the client used, and the message
+        """
+        control_frame = self._rep_socket.recv()
+        codec_name = frame_codec(control_frame)
+        control = decode(control_frame)
 
         body = []
         while self._rep_socket.rcvmore:
@@ -142,7 +162,8 @@ class ResilientServer(object):
         elif len(body) == 1:
             body = body[0]
 
-        return message_format(ident=None, control=control, body=body)
+        return codec_name, \
+            message_format(ident=None, control=control, body=body)
 
     def _handle_ping(self, _message, _data):
         pass
@@ -155,9 +176,12 @@ class ResilientServer(object):
             log.debug("replacing existing client %(client-tag)s" % message) 
             self._active_clients[message["client-tag"]].close()
 
+        codec_name = choose_codec(message.get("codecs"))
+        log.debug("%s codec %s" % (message["client-tag"], codec_name, ))
         self._active_clients[message["client-tag"]] = PUSHClient(
             self._context,
-            message["client-address"]
+            message["client-address"],
+            codec_name
         )
         
     def _handle_resilient_server_signoff(self, message, _data):
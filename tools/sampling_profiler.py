@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+"""
+sampling_profiler.py
+
+class SamplingProfiler
+
+a statistical profiler that can be switched on and off in a running process,
+so we can see where a service spends its time under real load without
+restarting it under cProfile.
+
+While it runs, it samples the Python stack every NIMBUSIO_PROFILE_INTERVAL
+seconds (default 0.01) and counts each distinct stack. A dump writes two
+files to NIMBUSIO_LOG_DIR:
+
+    nimbusio_profile_<name>_<node>_<time>_<pid>.pstats
+        for pstats, and for tools/gprof2dot.py as profile_graphs.py uses it
+    nimbusio_profile_<name>_<node>_<time>_<pid>.folded
+        one "frame;frame;frame count" line per stack, for flamegraph.pl
+
+and starts a new sample set. We keep the last NIMBUSIO_PROFILE_DUMP_COUNT
+(default 10) dumps for each name and node. While the profiler runs, it also
+dumps every NIMBUSIO_PROFILE_DUMP_INTERVAL seconds (default 600).
+
+How we sample depends on the process:
+
+ * in a process where gevent has patched threads, we can't have a real
+   thread, so we sample the current frame from a SIGPROF handler driven by
+   ITIMER_PROF: samples are in CPU time.
+ * otherwise a daemon thread samples every thread's stack with
+   sys._current_frames(): samples are in wall clock time, so threads that
+   are waiting show up in the wait. We don't use signals here, because they
+   interrupt blocking zeromq calls.
+
+Every service main calls install_sampling_profiler. Then
+
+    kill -USR1 <pid>    starts the profiler, or stops it and dumps
+    kill -USR2 <pid>    dumps, leaving the profiler running
+
+A process that subscribes to "profiler-control" events (the data writer)
+also takes control messages, which send_profiler_control sends through the
+event publisher: see handle_control_message. Set
+NIMBUSIO_PROFILE=1 to start profiling when the process starts.
+
+This module must run under both python 2 and python 3 (the data writer).
+"""
+import logging
+import marshal
+import os
+import os.path
+import signal
+import sys
+import threading
+import time
+
+profiler_control_topic = "profiler-control"
+
+_local_node_name = os.environ.get("NIMBUSIO_NODE_NAME", "local")
+_profile_at_start = os.environ.get("NIMBUSIO_PROFILE", "0") == "1"
+_sample_interval = float(os.environ.get("NIMBUSIO_PROFILE_INTERVAL", "0.01"))
+_dump_interval = float(
+    os.environ.get("NIMBUSIO_PROFILE_DUMP_INTERVAL", "600"))
+_max_dump_count = int(os.environ.get("NIMBUSIO_PROFILE_DUMP_COUNT", "10"))
+_dump_prefix_template = "nimbusio_profile_{0}_{1}_"
+_dump_name_template = "{0}{1}_{2}"
+_toggle_signal = signal.SIGUSR1
+_dump_signal = signal.SIGUSR2
+
+def _thread_is_patched():
+    """
+    return True if gevent has replaced real threads with greenlets
+    """
+    try:
+        import thread as thread_module
+    except ImportError:
+        import _thread as thread_module
+    return thread_module.start_new_thread.__module__.startswith("gevent")
+
+def _frame_stack(frame):
+    """
+    return the stack ending in frame as a tuple of pstats function keys
+    (file name, line number, function name), outermost first
+    """
+    stack = list()
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_filename, code.co_firstlineno, code.co_name, ))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+def pstats_dict(stack_counts, interval):
+    """
+    convert stack counts to the dict that pstats.Stats loads with marshal:
+    function : (primitive calls, calls, total time, cumulative time, callers)
+
+    we don't know the number of calls, so we count samples instead
+    """
+    stats = dict()
+    for stack, count in stack_counts.items():
+        seconds = count * interval
+        seen_functions = set()
+        for index, function in enumerate(stack):
+            try:
+                entry = stats[function]
+            except KeyError:
+                entry = [0, 0, 0.0, 0.0, dict()]
+                stats[function] = entry
+            # a recursive function is only charged once per sample
+            if function not in seen_functions:
+                seen_functions.add(function)
+                entry[0] += count
+                entry[1] += count
+                entry[3] += seconds
+            if index > 0:
+                caller = stack[index-1]
+                try:
+                    caller_entry = entry[4][caller]
+                except KeyError:
+                    caller_entry = [0, 0, 0.0, 0.0]
+                    entry[4][caller] = caller_entry
+                caller_entry[0] += count
+                caller_entry[1] += count
+                caller_entry[3] += seconds
+                if index == len(stack) - 1:
+                    caller_entry[2] += seconds
+        stats[stack[-1]][2] += seconds
+
+    return dict(
+        [(function,
+          (cc, nc, tt, ct,
+           dict([(caller, tuple(caller_entry), ) \
+                 for caller, caller_entry in callers.items()]), ), ) \
+         for function, (cc, nc, tt, ct, callers) in stats.items()]
+    )
+
+def folded_lines(stack_counts):
+    """
+    return the stack counts as lines in the collapsed format
+    flamegraph.pl reads
+    """
+    lines = list()
+    for stack, count in stack_counts.items():
+        frames = ["{0} ({1}:{2})".format(function_name,
+                                         os.path.basename(file_name),
+                                         line_number) \
+                  for file_name, line_number, function_name in stack]
+        lines.append("{0} {1}".format(";".join(frames), count))
+    lines.sort()
+    return lines
+
+class SamplingProfiler(object):
+    """
+    name
+        the process name, used in dump file names and to match
+        control messages
+
+    use_signal_timer
+        sample from a SIGPROF handler rather than a thread: must be set
+        where gevent has patched threads. The default is to decide from the
+        process.
+    """
+    def __init__(self,
+                 name,
+                 dump_dir,
+                 interval=_sample_interval,
+                 dump_interval=_dump_interval,
+                 max_dump_count=_max_dump_count,
+                 use_signal_timer=None):
+        self._log = logging.getLogger("SamplingProfiler")
+        self._name = name
+        self._dump_dir = dump_dir
+        self._interval = interval
+        self._dump_interval = dump_interval
+        self._max_dump_count = max_dump_count
+        if use_signal_timer is None:
+            use_signal_timer = _thread_is_patched()
+        self._use_signal_timer = use_signal_timer
+        self._stack_counts = dict()
+        self._sample_count = 0
+        self._running = False
+        self._sampler_thread = None
+        self._next_dump_time = None
+
+    @property
+    def running(self):
+        return self._running
+
+    @property
+    def sample_count(self):
+        return self._sample_count
+
+    def start(self):
+        """
+        start sampling
+        """
+        if self._running:
+            return
+        self._log.info("starting, interval {0}".format(self._interval))
+        self._running = True
+        self._next_dump_time = time.time() + self._dump_interval
+        if self._use_signal_timer:
+            signal.signal(signal.SIGPROF, self._handle_sigprof)
+            signal.setitimer(signal.ITIMER_PROF,
+                             self._interval,
+                             self._interval)
+        else:
+            self._sampler_thread = threading.Thread(target=self._sample_loop,
+                                                    name="SamplingProfiler")
+            self._sampler_thread.daemon = True
+            self._sampler_thread.start()
+
+    def stop(self):
+        """
+        stop sampling, keeping the samples for dump
+        """
+        if not self._running:
+            return
+        self._log.info("stopping")
+        self._running = False
+        if self._use_signal_timer:
+            signal.setitimer(signal.ITIMER_PROF, 0.0)
+            signal.signal(signal.SIGPROF, signal.SIG_IGN)
+        else:
+            self._sampler_thread.join()
+            self._sampler_thread = None
+
+    def toggle(self):
+        """
+        start if we are stopped, stop and dump if we are running
+        """
+        if self._running:
+            self.stop()
+            self.dump()
+        else:
+            self.start()
+
+    def sample_frame(self, frame):
+        """
+        count the stack ending in frame
+        """
+        stack = _frame_stack(frame)
+        if len(stack) == 0:
+            return
+        stack_counts = self._stack_counts
+        stack_counts[stack] = stack_counts.get(stack, 0) + 1
+        self._sample_count += 1
+
+    def dump(self):
+        """
+        write the samples we have to a .pstats and a .folded file,
+        start a new sample set, and remove old dumps
+
+        return the paths written, or None if we have no samples
+        """
+        # swap first: a sample may arrive while we write
+        stack_counts, self._stack_counts = self._stack_counts, dict()
+        sample_count, self._sample_count = self._sample_count, 0
+        if len(stack_counts) == 0:
+            self._log.info("no samples to dump")
+            return None
+
+        dump_prefix = _dump_prefix_template.format(self._name,
+                                                   _local_node_name)
+        dump_base = os.path.join(
+            self._dump_dir,
+            _dump_name_template.format(dump_prefix,
+                                       time.strftime("%Y%m%d%H%M%S"),
+                                       os.getpid()))
+        pstats_path = dump_base + ".pstats"
+        folded_path = dump_base + ".folded"
+
+        with open(pstats_path, "wb") as output_file:
+            marshal.dump(pstats_dict(stack_counts, self._interval),
+                         output_file)
+        with open(folded_path, "w") as output_file:
+            for line in folded_lines(stack_counts):
+                output_file.write(line)
+                output_file.write("\n")
+
+        self._log.info("dumped {0} samples to {1}".format(sample_count,
+                                                          dump_base))
+        self._remove_old_dumps(dump_prefix)
+        return pstats_path, folded_path
+
+    def handle_control_message(self, message):
+        """
+        act on a "profiler-control" message. A message has "action"
+        (start, stop, toggle or dump), and may have "target_node_name" and
+        "target_name": if they are not None, we ignore messages meant
+        for other nodes or processes.
+        """
+        target_node_name = message.get("target_node_name")
+        if target_node_name is not None and \
+           target_node_name != _local_node_name:
+            return
+        target_name = message.get("target_name")
+        if target_name is not None and target_name != self._name:
+            return
+
+        action = message["action"]
+        if action == "start":
+            self.start()
+        elif action == "stop":
+            self.stop()
+            self.dump()
+        elif action == "toggle":
+            self.toggle()
+        elif action == "dump":
+            self.dump()
+        else:
+            self._log.error("unknown action {0}".format(action))
+
+    def _handle_sigprof(self, _signum, frame):
+        self.sample_frame(frame)
+        self._check_dump_time()
+
+    def _sample_loop(self):
+        sampler_ident = threading.current_thread().ident
+        while self._running:
+            time.sleep(self._interval)
+            for ident, frame in sys._current_frames().items():
+                if ident != sampler_ident:
+                    self.sample_frame(frame)
+            self._check_dump_time()
+
+    def _check_dump_time(self):
+        if self._dump_interval > 0 and time.time() >= self._next_dump_time:
+            self._next_dump_time = time.time() + self._dump_interval
+            try:
+                self.dump()
+            except Exception:
+                self._log.exception("dump failed")
+
+    def _remove_old_dumps(self, dump_prefix):
+        dump_names = sorted(
+            [file_name[:-len(".pstats")] \
+             for file_name in os.listdir(self._dump_dir) \
+             if file_name.startswith(dump_prefix) and \
+                file_name.endswith(".pstats")]
+        )
+        for dump_name in dump_names[:-self._max_dump_count]:
+            for suffix in [".pstats", ".folded", ]:
+                path = os.path.join(self._dump_dir, dump_name + suffix)
+                if os.path.exists(path):
+                    os.unlink(path)
+
+def send_profiler_control(event_push_client,
+                          action,
+                          target_node_name=None,
+                          target_name=None):
+    """
+    send a control message to the profilers of the processes that
+    subscribe to "profiler-control" events
+    """
+    event_push_client.info(profiler_control_topic,
+                           "profiler {0}".format(action),
+                           action=action,
+                           target_node_name=target_node_name,
+                           target_name=target_name)
+
+def _create_signal_handler(function):
+    def cb_handler(*_):
+        function()
+    return cb_handler
+
+def install_sampling_profiler(name=None):
+    """
+    create a SamplingProfiler for this process, dumping to the log dir,
+    and set the signal handlers that control it.
+    Call from the main thread, after initialize_logging.
+
+    return the profiler
+    """
+    if name is None:
+        name = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    profiler = SamplingProfiler(name, os.environ["NIMBUSIO_LOG_DIR"])
+    signal.signal(_toggle_signal, _create_signal_handler(profiler.toggle))
+    signal.signal(_dump_signal, _create_signal_handler(profiler.dump))
+    if _profile_at_start:
+        profiler.start()
+    return profiler
@@ -3,30 +3,159 @@
 standard_logging.py
 
 common routines for logging
+
+For hot paths (every segment, sequence or block):
+
+LazyFormat
+    log.info(LazyFormat("request {0}: {1}", user_request_id, key)) formats
+    the message only if a handler emits the record, so a disabled level
+    costs almost nothing.
+
+sampled_logger
+    a logger that passes 1 in N of its records below WARNING. N comes from
+    NIMBUSIO_LOG_SAMPLE, a comma separated list of logger-name:N pairs,
+    or NIMBUSIO_LOG_SAMPLE_INTERVAL for sampled loggers not in the list.
+    The default is 1: log everything.
+
+For DEBUG lines in a loop, check log.isEnabledFor(logging.DEBUG) once per
+request: a disabled log call still costs more than formatting the message.
+
+With NIMBUSIO_LOG_ASYNC=1, records are handed to a thread that writes them
+(AsyncHandler), so the caller does not wait for the disk. It saves no CPU:
+it is for slow log volumes. Records still queued at exit are written by
+logging.shutdown. See test/logging_benchmark.py.
+
+This module must run under both python 2 and python 3 (the data writer).
 """
 import datetime
+import itertools
 import logging
 import logging.handlers
 import os
 import sys
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 _max_log_size = 16 * 1024 * 1024
 _max_log_backup_files = 1000
 _log_level_name = os.environ.get("NIMBUSIO_LOG_LEVEL", "INFO")
 _log_format_template = '%(asctime)s %(levelname)-8s %(name)-20s: %(message)s'
 _log_to_stderr = bool(int(os.environ.get("NIMBUSIO_LOG_TO_STDERR", "0")))
+_log_async = os.environ.get("NIMBUSIO_LOG_ASYNC", "0") == "1"
+_async_queue_size = 10000
+_default_sample_interval = \
+    int(os.environ.get("NIMBUSIO_LOG_SAMPLE_INTERVAL", "1"))
+
+def _parse_sample_intervals(sample_string):
+    sample_intervals = dict()
+    for entry in sample_string.split(","):
+        entry = entry.strip()
+        if len(entry) == 0:
+            continue
+        logger_name, interval = entry.rsplit(":", 1)
+        sample_intervals[logger_name] = int(interval)
+    return sample_intervals
 
+_sample_intervals = \
+    _parse_sample_intervals(os.environ.get("NIMBUSIO_LOG_SAMPLE", ""))
 
 def format_timestamp(timestamp):
     """return python float time.time() as a human readable string"""
     return datetime.datetime.fromtimestamp(timestamp).isoformat()
 
+class LazyFormat(object):
+    """
+    a log message in str.format style, formatted only when it is emitted
+    """
+    __slots__ = ("_template", "_args", "_kwargs", )
+
+    def __init__(self, template, *args, **kwargs):
+        self._template = template
+        self._args = args
+        self._kwargs = kwargs
+
+    def __str__(self):
+        return self._template.format(*self._args, **self._kwargs)
+
+class SamplingFilter(logging.Filter):
+    """
+    pass 1 in interval records below WARNING
+    """
+    def __init__(self, interval):
+        logging.Filter.__init__(self)
+        self._interval = max(interval, 1)
+        self._counter = itertools.count()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        return next(self._counter) % self._interval == 0
+
+def sampled_logger(logger_name):
+    """
+    return the named logger, sampled as configured
+    """
+    log = logging.getLogger(logger_name)
+    interval = _sample_intervals.get(logger_name, _default_sample_interval)
+    if interval > 1 and not any(isinstance(log_filter, SamplingFilter) \
+                                for log_filter in log.filters):
+        log.addFilter(SamplingFilter(interval))
+    return log
+
+class AsyncHandler(logging.Handler):
+    """
+    pass records through a queue to a thread that emits them with
+    target_handler
+    """
+    def __init__(self, target_handler, queue_size=_async_queue_size):
+        logging.Handler.__init__(self)
+        self._target_handler = target_handler
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run,
+                                        name="AsyncHandler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def emit(self, record):
+        try:
+            # as logging.handlers.QueueHandler: format the arguments and
+            # traceback now, while they are still what was logged
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = \
+                    logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+            self._queue.put(record)
+        except Exception:
+            self.handleError(record)
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            self._target_handler.handle(record)
+
+    def setFormatter(self, formatter):
+        self._target_handler.setFormatter(formatter)
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._target_handler.close()
+        logging.Handler.close(self)
+
 def initialize_logging(log_path):
     """initialize the log"""
     invalid_log_level = False
-    try:
-        log_level = logging._levelNames[_log_level_name]
-    except KeyError:
+    log_level = logging.getLevelName(_log_level_name)
+    if not isinstance(log_level, int):
         log_level = logging.DEBUG
         invalid_log_level = True
 
@@ -40,6 +169,8 @@ def initialize_logging(log_path):
             backupCount=_max_log_backup_files,
             encoding="utf-8"
         )
+    if _log_async:
+        handler = AsyncHandler(handler)
     formatter = logging.Formatter(_log_format_template)
     handler.setFormatter(formatter)
 
@@ -48,4 +179,3 @@ def initialize_logging(log_path):
 
     if invalid_log_level:
         logging.error("Invalid log level {0}".format(_log_level_name))
-
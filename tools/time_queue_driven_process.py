@@ -30,6 +30,13 @@ The time queue. A task can 'loop' by returning its own callback function.
 This behavior is the same on all back-end servers, so we have encapsulated
 the code in a 'time queue driven process'.
 
+By default the loop is an event reactor: the ZeroMQPollster and
+DequeDispatcher tasks that a process puts in the time queue are taken over by
+the reactor instead of being run at their polling intervals. While no task is
+due, the reactor waits on the pollster's sockets until the next task's time,
+and every message received is dispatched at once. Other tasks run from the
+time queue as before. Set NIMBUSIO_EVENT_REACTOR=0 to get the polling loop.
+
 The server is driven by callback functions passed in at startup::
 
     if __name__ == "__main__":
@@ -46,13 +53,106 @@ The server is driven by callback functions passed in at startup::
 
 """
 import logging
+import os
 import sys
 from threading import Event
 import time
 
 from tools.time_queue import TimeQueue
 from tools.standard_logging import initialize_logging
+from tools.sampling_profiler import install_sampling_profiler
 from tools.process_util import set_signal_handler
+from tools.zeromq_pollster import ZeroMQPollster
+from tools.deque_dispatcher import DequeDispatcher
+
+_event_reactor = os.environ.get("NIMBUSIO_EVENT_REACTOR", "1") == "1"
+# the longest the reactor waits before looking at halt_event again
+_max_reactor_wait = 1.0
+
+def _put_tasks(time_queue, result_list):
+    if result_list is not None:
+        for task, start_time in result_list:
+            time_queue.put(task, start_time=start_time)
+
+def _task_owner(task, owner_class):
+    """
+    return the object if task is the run method of an instance of
+    owner_class, otherwise None
+    """
+    owner = getattr(task, "__self__", None)
+    if isinstance(owner, owner_class) and task == owner.run:
+        return owner
+    return None
+
+def _run_polling_loop(time_queue, halt_event):
+    # run until the time queue is empty. This means each task
+    # must watch the halt_event and behave correctly at shutdown.
+    while len(time_queue) > 0:
+
+        next_task_delay = time_queue.peek_time() - time.time()
+        if next_task_delay > 0.0:
+            halt_event.wait(next_task_delay)
+
+        next_task = time_queue.pop()
+        _put_tasks(time_queue, next_task(halt_event))
+
+def _run_reactor(time_queue, halt_event):
+    pollsters = list()
+    dispatchers = list()
+
+    # run until the time queue is empty, and the pollsters and dispatchers
+    # have been released at halt.
+    while True:
+        if halt_event.is_set() and len(pollsters) > 0:
+            # let the pollsters clean up as they do at halt
+            for pollster in pollsters:
+                pollster.run(halt_event)
+            pollsters = list()
+        if halt_event.is_set():
+            dispatchers = list()
+
+        if len(time_queue) == 0 and len(pollsters) == 0 \
+        and len(dispatchers) == 0:
+            break
+
+        # run the tasks that are due
+        while len(time_queue) > 0 and time_queue.peek_time() <= time.time():
+            next_task = time_queue.pop()
+
+            pollster = _task_owner(next_task, ZeroMQPollster)
+            if pollster is not None and not halt_event.is_set():
+                if pollster not in pollsters:
+                    pollsters.append(pollster)
+                continue
+
+            dispatcher = _task_owner(next_task, DequeDispatcher)
+            if dispatcher is not None and not halt_event.is_set():
+                if dispatcher not in dispatchers:
+                    dispatchers.append(dispatcher)
+                continue
+
+            _put_tasks(time_queue, next_task(halt_event))
+
+        # dispatch everything that has been received
+        for dispatcher in dispatchers:
+            _put_tasks(time_queue, dispatcher.dispatch_all(halt_event))
+
+        if len(time_queue) > 0:
+            wait_time = max(time_queue.peek_time() - time.time(), 0.0)
+        else:
+            wait_time = _max_reactor_wait
+        wait_time = min(wait_time, _max_reactor_wait)
+
+        # wait for input, or for the next task to come due
+        if len(pollsters) == 0:
+            if wait_time > 0.0:
+                halt_event.wait(wait_time)
+            continue
+
+        # we expect one pollster per process
+        for pollster in pollsters:
+            _put_tasks(time_queue, 
+                       pollster.poll(halt_event, wait_time / len(pollsters)))
 
 def _run_until_halt(
     state,
@@ -86,19 +186,10 @@ def _run_until_halt(
 
     log.info("main loop starts")
 
-    # run until the time queue is empty. This means each task
-    # must watch the halt_event and behave correctly at shutdown.
-    while len(time_queue) > 0:
-
-        next_task_delay = time_queue.peek_time() - time.time()
-        if next_task_delay > 0.0:
-            halt_event.wait(next_task_delay)
-
-        next_task = time_queue.pop()
-        result_list = next_task(halt_event)
-        if result_list is not None:
-            for task, start_time in result_list:
-                time_queue.put(task, start_time=start_time)
+    if _event_reactor:
+        _run_reactor(time_queue, halt_event)
+    else:
+        _run_polling_loop(time_queue, halt_event)
 
     log.info("main loop ends")
 
@@ -171,6 +262,7 @@ def main(
 
     """
     initialize_logging(log_path)
+    install_sampling_profiler()
     log = logging.getLogger("main")
     log.info("start")
 
@@ -33,6 +33,12 @@ class ZeroMQPollster(object):
     Note that zeromq sockets are almost always writable so the pollster
     is used mostly for reads.
 
+    The event reactor in time_queue_driven_process does not schedule ``run``;
+    it calls ``poll`` with the time until its next task is due. ``poll``
+    waits only for input, and flushes output to the sockets registered for
+    writing when zeromq says they are writable, so an always writable socket
+    does not keep the reactor awake.
+
     .. _poller: http://zeromq.github.com/pyzmq/api/generated/zmq.core.poll.html
     """
 
@@ -41,7 +47,9 @@ class ZeroMQPollster(object):
         self._polling_interval = polling_interval
         self._poll_timeout = poll_timeout
         self._poller = zmq.Poller()
+        self._read_poller = zmq.Poller()
         self._active_sockets = dict()
+        self._write_sockets = set()
 
     def register_read(self, active_socket, callback):
         """
@@ -49,6 +57,7 @@ class ZeroMQPollster(object):
         """
         self.unregister(active_socket)
         self._poller.register(active_socket, zmq.POLLIN)
+        self._read_poller.register(active_socket, zmq.POLLIN)
         self._active_sockets[active_socket] = callback
 
     def register_write(self, active_socket, callback):
@@ -57,6 +66,7 @@ class ZeroMQPollster(object):
         """
         self.unregister(active_socket)
         self._poller.register(active_socket, zmq.POLLOUT)
+        self._write_sockets.add(active_socket)
         self._active_sockets[active_socket] = callback
 
     def register_read_or_write(self, active_socket, callback):
@@ -65,6 +75,8 @@ class ZeroMQPollster(object):
         """
         self.unregister(active_socket)
         self._poller.register(active_socket, zmq.POLLIN | zmq.POLLOUT)
+        self._read_poller.register(active_socket, zmq.POLLIN)
+        self._write_sockets.add(active_socket)
         self._active_sockets[active_socket] = callback
 
     def unregister(self, active_socket):
@@ -76,6 +88,11 @@ class ZeroMQPollster(object):
             del self._active_sockets[active_socket]
         except KeyError:
             pass
+        try:
+            self._read_poller.unregister(active_socket)
+        except KeyError:
+            pass
+        self._write_sockets.discard(active_socket)
 
     def run(self, halt_event):
         """
@@ -97,13 +114,16 @@ class ZeroMQPollster(object):
             result_list = self._poller.poll(timeout=self._poll_timeout)
         except zmq.ZMQError:
             zmq_error = sys.exc_info()[1]
-            if is_interrupted_system_call(zmq_error) and halt_event.is_set():
+            if not is_interrupted_system_call(zmq_error):
+                raise
+            if halt_event.is_set():
                 self._log.info("Interrupted with halt_event set: exiting")
                 for active_socket in self._active_sockets.keys():
                     self._poller.unregister(active_socket)
                 self._active_sockets.clear()
                 return
-            raise
+            # some other signal, such as the sampling profiler's
+            result_list = list()
 
         for active_socket, event_flags in result_list:
             if active_socket not in self._active_sockets:
@@ -144,3 +164,66 @@ class ZeroMQPollster(object):
         next_tasks.append((self.run, next_interval, ))
         return next_tasks
 
+    def _call_back(self, active_socket, readable, writable):
+        callback = self._active_sockets[active_socket]
+        return callback(
+            active_socket,
+            readable=readable,
+            writable=writable,
+        )
+
+    def poll(self, halt_event, timeout):
+        """
+        wait up to timeout seconds for input, and call the callbacks of the
+        sockets that are ready. This is called by the event reactor.
+
+        return a list of tasks for the time queue
+        """
+        next_tasks = list()
+
+        # send whatever the last round of callbacks queued for output
+        for active_socket in list(self._write_sockets):
+            if active_socket.getsockopt(zmq.EVENTS) & zmq.POLLOUT:
+                result_list = self._call_back(active_socket, False, True)
+                if result_list is not None:
+                    next_tasks.extend(result_list)
+
+        # if a callback queued new work, let the reactor run it at once
+        if len(next_tasks) > 0:
+            timeout = 0.0
+
+        try:
+            result_list = self._read_poller.poll(timeout=timeout * 1000.0)
+        except zmq.ZMQError:
+            zmq_error = sys.exc_info()[1]
+            if not is_interrupted_system_call(zmq_error):
+                raise
+            if halt_event.is_set():
+                self._log.info("Interrupted with halt_event set")
+                return next_tasks
+            # some other signal, such as the sampling profiler's
+            result_list = list()
+
+        for active_socket, event_flags in result_list:
+            if active_socket not in self._active_sockets:
+                self._log.warn("Ignoring unknown active_socket %s" % (
+                    active_socket,
+                ))
+                self.unregister(active_socket)
+                continue
+
+            if event_flags & zmq.POLLERR:
+                message = ("Error flag from poll() %s" % (
+                    active_socket,
+                ))
+                self._log.error(message)
+                raise ZeroMQPollsterError(message)
+
+            writable = active_socket in self._write_sockets and \
+                (True if active_socket.getsockopt(zmq.EVENTS) & zmq.POLLOUT \
+                 else False)
+            result_list = self._call_back(active_socket, True, writable)
+            if result_list is not None:
+                next_tasks.extend(result_list)
+
+        return next_tasks
@@ -3,13 +3,21 @@
 zfec_segmenter.py
 
 Encodes/decodes segments using zfec.
+
+zfec is a systematic code: the first min_segments shares of each block are
+the block itself, split into equal parts (the last part zero padded). So when
+we have exactly the primary segments (1..min_segments) we reassemble the
+blocks by joining the shares, without running the decoder.
 """
+from operator import itemgetter
+
 from zfec.easyfec import Encoder, Decoder
 
 class ZfecSegmenter(object):
     def __init__(self, min_segments, num_segments):
         self.min_segments = min_segments
         self.num_segments = num_segments
+        self.primary_segment_numbers = range(1, min_segments+1)
 
     def padding_size(self, data):
         modulus = len(data) % self.min_segments
@@ -44,6 +52,11 @@ class ZfecSegmenter(object):
         return
             a list of data blocks
         """
+        if sorted(segment_numbers) == self.primary_segment_numbers:
+            return self._join_primary_segments(segments, 
+                                               segment_numbers, 
+                                               padding_size)
+
         data_list = list()
         decoder = Decoder(self.min_segments, self.num_segments)
         zfec_segment_numbers = [n-1 for n in segment_numbers]
@@ -63,3 +76,22 @@ class ZfecSegmenter(object):
 
         return data_list
 
+
+    def _join_primary_segments(self, segments, segment_numbers, padding_size):
+        """
+        reassemble data blocks from the primary segments, without decoding
+        """
+        primary_segments = [segment for _, segment in \
+            sorted(zip(segment_numbers, segments), key=itemgetter(0))]
+
+        data_list = list()
+        for i in range(len(primary_segments[0])):
+            data_list.append(
+                "".join([segment[i] for segment in primary_segments])
+            )
+
+        # the zfec padding is at the end of the last block
+        if padding_size > 0:
+            data_list[-1] = data_list[-1][:-padding_size]
+
+        return data_list
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+test_admission_control.py
+
+test per collection admission control
+"""
+import httplib
+import unittest
+
+from webob import Request, Response
+
+from tools.admission_control import AdmissionControl, AdmissionRefused, \
+        ReleasingIterator, hold_until_sent
+
+class _FakeClock(object):
+    def __init__(self):
+        self.current_time = 1000.0
+
+    def __call__(self):
+        return self.current_time
+
+class TestAdmissionControl(unittest.TestCase):
+    """test per collection admission control"""
+
+    def test_concurrency_limit(self):
+        """test that a collection can't have too many requests in progress"""
+        admission_control = AdmissionControl(request_rate=0,
+                                             max_concurrent=2,
+                                             time_function=_FakeClock())
+        first_ticket = admission_control.admit(1001)
+        admission_control.admit(1001)
+        self.assertRaises(AdmissionRefused, admission_control.admit, 1001)
+
+        # other collections are not affected
+        admission_control.admit(1002)
+
+        first_ticket.release()
+        first_ticket.release()
+        self.assertEqual(admission_control.active_count(1001), 1)
+        admission_control.admit(1001)
+
+    def test_request_rate(self):
+        """test the token bucket, and the retry after it gives"""
+        clock = _FakeClock()
+        admission_control = AdmissionControl(request_rate=2.0,
+                                             request_burst=4,
+                                             max_concurrent=0,
+                                             time_function=clock)
+        for _ in range(4):
+            admission_control.admit(1001).release()
+
+        try:
+            admission_control.admit(1001)
+        except AdmissionRefused as instance:
+            self.assertEqual(instance.retry_after, 1)
+        else:
+            self.fail("admitted over the burst")
+
+        clock.current_time += 0.5
+        admission_control.admit(1001).release()
+        self.assertRaises(AdmissionRefused, admission_control.admit, 1001)
+
+    def test_releasing_iterator(self):
+        """test that a streamed body holds its ticket until it is done"""
+        admission_control = AdmissionControl(request_rate=0,
+                                             max_concurrent=1,
+                                             time_function=_FakeClock())
+        body = ReleasingIterator(iter(["a", "b", ]),
+                                 admission_control.admit(1001))
+        self.assertEqual(body.next(), "a")
+        self.assertEqual(admission_control.active_count(1001), 1)
+        self.assertEqual(list(body), ["b", ])
+        self.assertEqual(admission_control.active_count(1001), 0)
+
+        # the server closes a body it never read
+        body = ReleasingIterator(iter(["a", ]), admission_control.admit(1001))
+        body.close()
+        self.assertEqual(admission_control.active_count(1001), 0)
+
+    def test_head_content_length(self):
+        """test that a HEAD response keeps its Content-Length"""
+        admission_control = AdmissionControl(request_rate=0,
+                                             max_concurrent=1,
+                                             time_function=_FakeClock())
+        response = Response(status=httplib.OK)
+        response.content_length = 1234
+        hold_until_sent(response, admission_control.admit(1001))
+        self.assertEqual(response.content_length, 1234)
+
+        request = Request.blank("/data/key", method="HEAD")
+        status, headers, body = request.call_application(response)
+        self.assertEqual(dict(headers)["Content-Length"], "1234")
+        self.assertEqual(admission_control.active_count(1001), 1)
+        body.close()
+        self.assertEqual(admission_control.active_count(1001), 0)
+
+    def test_body_content_length(self):
+        """test that a JSON body keeps its Content-Length"""
+        admission_control = AdmissionControl(request_rate=0,
+                                             max_concurrent=1,
+                                             time_function=_FakeClock())
+        response = Response(status=httplib.OK, content_type="application/json")
+        response.body = '{"key_data": []}'
+        hold_until_sent(response, admission_control.admit(1001))
+        self.assertEqual(response.content_length, len(response.body))
+        self.assertEqual(admission_control.active_count(1001), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+test_base_lookup.py
+
+test the process-local cache tier of BaseLookup
+"""
+import time
+import unittest
+
+import gevent
+
+from tools.base_lookup import BaseLookup, invalidate_local_lookups
+
+class _MockMemcachedClient(object):
+    def __init__(self):
+        self.data = dict()
+        self.get_count = 0
+
+    def get(self, key):
+        self.get_count += 1
+        return self.data.get(key)
+
+    def set(self, key, value, time=None):
+        self.data[key] = value
+        return True
+
+    def delete(self, key):
+        self.data.pop(key, None)
+        return True
+
+class _MockDatabase(object):
+    def __init__(self, rows, delay=0.0):
+        self.rows = rows
+        self.delay = delay
+        self.lookup_count = 0
+
+    def lookup(self, name):
+        self.lookup_count += 1
+        # the row is read before the delay, as if before a commit
+        row = self.rows.get(name)
+        if self.delay > 0.0:
+            gevent.sleep(self.delay)
+        return row
+
+class TestBaseLookup(unittest.TestCase):
+    """test the process-local cache tier of BaseLookup"""
+
+    def setUp(self):
+        self._memcached_client = _MockMemcachedClient()
+        self._database = _MockDatabase({"aaa" : {"id" : 1, "name" : "aaa"}})
+
+    def _create_lookup(self, **kwargs):
+        return BaseLookup(self._memcached_client,
+                          "collection",
+                          "name",
+                          self._database.lookup,
+                          **kwargs)
+
+    def test_local_hit(self):
+        """test that a repeated lookup does not go to memcached"""
+        lookup = self._create_lookup()
+        for _ in range(3):
+            self.assertEqual(lookup.get("aaa")["id"], 1)
+        self.assertEqual(self._memcached_client.get_count, 1)
+        self.assertEqual(self._database.lookup_count, 1)
+
+    def test_local_expiration(self):
+        """test that an expired local entry is looked up again"""
+        lookup = self._create_lookup(local_cache_ttl=0.01)
+        self.assertEqual(lookup.get("aaa")["id"], 1)
+        time.sleep(0.02)
+        self.assertEqual(lookup.get("aaa")["id"], 1)
+        self.assertEqual(self._memcached_client.get_count, 2)
+        # the second lookup is satisfied by memcached
+        self.assertEqual(self._database.lookup_count, 1)
+
+    def test_negative_caching(self):
+        """test that a lookup which finds nothing is cached locally"""
+        lookup = self._create_lookup(local_negative_cache_ttl=0.01)
+        for _ in range(3):
+            self.assertEqual(lookup.get("bbb"), None)
+        self.assertEqual(self._database.lookup_count, 1)
+
+        time.sleep(0.02)
+        self._database.rows["bbb"] = {"id" : 2, "name" : "bbb"}
+        self.assertEqual(lookup.get("bbb")["id"], 2)
+        self.assertEqual(self._database.lookup_count, 2)
+
+    def test_invalidation(self):
+        """test that a central database change discards local entries"""
+        lookup = self._create_lookup()
+        self.assertEqual(lookup.get("aaa")["id"], 1)
+        invalidate_local_lookups("customer", [{"name" : "aaa"}, ])
+        self.assertEqual(lookup.get("aaa")["id"], 1)
+        self.assertEqual(self._memcached_client.get_count, 1)
+
+        invalidate_local_lookups("collection", [{"id" : 1, "name" : "aaa"}, ])
+        self.assertEqual(lookup.get("aaa")["id"], 1)
+        self.assertEqual(self._memcached_client.get_count, 2)
+
+    def _change_row(self):
+        """
+        change the row in the database, but not in memcached, as
+        central_cache_update has not run yet
+        """
+        self._database.rows["aaa"] = {"id" : 1, "name" : "aaa", "x" : 2}
+
+    def test_invalidation_before_central_cache_update(self):
+        """test that we don't read the old row back from memcached"""
+        lookup = self._create_lookup()
+        self.assertEqual(lookup.get("aaa").get("x"), None)
+        self._change_row()
+        invalidate_local_lookups("collection", [{"id" : 1, "name" : "aaa"}, ])
+        self.assertEqual(lookup.get("aaa").get("x"), 2)
+
+    def test_invalidation_after_central_cache_update(self):
+        """test invalidation when memcached was already updated"""
+        lookup = self._create_lookup()
+        self.assertEqual(lookup.get("aaa").get("x"), None)
+        self._change_row()
+        self._memcached_client.data.clear()
+        invalidate_local_lookups("collection", [{"id" : 1, "name" : "aaa"}, ])
+        self.assertEqual(lookup.get("aaa").get("x"), 2)
+
+    def test_invalidation_in_flight(self):
+        """test that a lookup in progress does not cache the old row"""
+        self._database.delay = 0.01
+        lookup = self._create_lookup()
+        greenlet = gevent.spawn(lookup.get, "aaa")
+        gevent.sleep(0)
+        self._change_row()
+        invalidate_local_lookups("collection", [{"id" : 1, "name" : "aaa"}, ])
+        # the waiting greenlet gets the row it asked for
+        self.assertEqual(greenlet.get().get("x"), None)
+        self.assertEqual(self._memcached_client.data, {})
+
+        self._database.delay = 0.0
+        self.assertEqual(lookup.get("aaa").get("x"), 2)
+        self.assertEqual(self._database.lookup_count, 2)
+
+    def test_single_flight(self):
+        """test that concurrent misses share a single lookup"""
+        self._database.delay = 0.01
+        lookup = self._create_lookup()
+        greenlets = [gevent.spawn(lookup.get, "aaa") for _ in range(10)]
+        gevent.joinall(greenlets)
+        for greenlet in greenlets:
+            self.assertEqual(greenlet.get()["id"], 1)
+        self.assertEqual(self._database.lookup_count, 1)
+
+if __name__ == "__main__":
+    unittest.main()
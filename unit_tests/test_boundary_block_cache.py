@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+test_boundary_block_cache.py
+
+test the web_internal_reader boundary block cache
+"""
+import os
+import unittest
+
+from tools.data_definitions import block_size
+from web_internal_reader.boundary_block_cache import BoundaryBlockCache
+
+_unified_id = 1
+_conjoined_part = 0
+
+class TestBoundaryBlockCache(unittest.TestCase):
+    """test the web_internal_reader boundary block cache"""
+
+    def setUp(self):
+        self._cache = BoundaryBlockCache(16)
+
+    def test_leading_blocks(self):
+        """test that consecutive cached blocks are returned"""
+        blocks = [os.urandom(block_size) for _ in range(3)]
+        for block_index, data in enumerate(blocks):
+            self._cache.put(_unified_id, _conjoined_part, block_index + 4,
+                            data, False)
+
+        self.assertEqual(
+            self._cache.leading_blocks(_unified_id, _conjoined_part, 4, 2),
+            (blocks[:2], False, ))
+        # an open ended range stops at the first block we don't have
+        self.assertEqual(
+            self._cache.leading_blocks(_unified_id, _conjoined_part, 5, None),
+            (blocks[1:], False, ))
+        self.assertEqual(
+            self._cache.leading_blocks(_unified_id, _conjoined_part, 3, None),
+            ([], False, ))
+
+    def test_short_last_block(self):
+        """test that a short block ends the object"""
+        data = os.urandom(block_size // 2)
+        self._cache.put(_unified_id, _conjoined_part, 7, data, False)
+        self.assertEqual(
+            self._cache.leading_blocks(_unified_id, _conjoined_part, 7, None),
+            ([data], True, ))
+
+    def test_full_last_block(self):
+        """
+        test the last block of an object whose size is an exact multiple
+        of block_size: an open ended range starting in it must not go on
+        to the block past the end
+        """
+        block_count = 4
+        data = os.urandom(block_size)
+        # the end of a full GET
+        self._cache.put(_unified_id, _conjoined_part, block_count - 1,
+                        data, True)
+        self.assertEqual(
+            self._cache.leading_blocks(_unified_id,
+                                       _conjoined_part,
+                                       block_count - 1,
+                                       None),
+            ([data], True, ))
+
+        # retrieving it again as the first block of another range
+        # does not forget that it is the last block
+        self._cache.put(_unified_id, _conjoined_part, block_count - 1,
+                        data, False)
+        self.assertEqual(
+            self._cache.get(_unified_id, _conjoined_part, block_count - 1),
+            (data, True, ))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -19,6 +19,8 @@ except ImportError:
 from tools.collection_access_control import version, \
     cleanse_access_control, \
     check_access_control, \
+    compile_access_control, \
+    CompiledAccessControlCache, \
     read_access, \
     write_access, \
     list_access, \
@@ -427,6 +429,76 @@ class TestCollectionAccessControl(unittest.TestCase):
                              "Test #{0} expected {1} received {2}".format(
                                 index+1, test_case.expected_result, result))
 
+    def test_compiled_access_control(self):
+        """
+        test that a compiled access control gives the same results as
+        check_access_control
+        """
+        for index, test_case in enumerate(_check_test_cases):
+            if test_case.access_control is None:
+                access_control = None
+            else:
+                access_control = json.dumps(test_case.access_control)
+            compiled = compile_access_control(access_control)
+            result = compiled.check(test_case.access_type, test_case.request)
+            self.assertEqual(result, 
+                             test_case.expected_result, 
+                             "Test #{0} expected {1} received {2}".format(
+                                index+1, test_case.expected_result, result))
+
+    def test_compiled_ipv4_whitelist(self):
+        """
+        test overlapping and adjacent netblocks in a compiled ipv4_whitelist
+        """
+        access_control = json.dumps({version : "1.0",
+                                     allow_unauth_read : True,
+                                     ipv4_whitelist : ["10.0.0.0/8",
+                                                       "10.1.0.0/16",
+                                                       "192.168.1.0/24",
+                                                       "192.168.2.0/24",
+                                                       "172.16.0.1"]})
+        compiled = compile_access_control(access_control)
+        for remote_addr in ["10.0.0.0", "10.255.255.255", "10.1.2.3", 
+                            "192.168.1.1", "192.168.2.255", "172.16.0.1", ]:
+            request = _default_request._replace(remote_addr=remote_addr)
+            self.assertEqual(compiled.check(read_access, request), 
+                             access_allowed, 
+                             remote_addr)
+        for remote_addr in ["9.255.255.255", "11.0.0.0", "192.168.0.255", 
+                            "192.168.3.0", "172.16.0.2", "0.0.0.0", ]:
+            request = _default_request._replace(remote_addr=remote_addr)
+            self.assertEqual(compiled.check(read_access, request), 
+                             access_forbidden, 
+                             remote_addr)
+
+    def test_compiled_access_control_cache(self):
+        """
+        test that the cache recompiles when the access_control changes
+        """
+        cache = CompiledAccessControlCache()
+        collection_id = 42
+        allow_read = json.dumps({version : "1.0", allow_unauth_read : True})
+        deny_read = json.dumps({version : "1.0", allow_unauth_read : False})
+
+        for _ in range(2):
+            result = cache.check_access_control(collection_id, 
+                                                read_access,
+                                                _default_request,
+                                                allow_read)
+            self.assertEqual(result, access_allowed)
+
+        result = cache.check_access_control(collection_id, 
+                                            read_access,
+                                            _default_request,
+                                            deny_read)
+        self.assertEqual(result, access_requires_password_authentication)
+
+        result = cache.check_access_control(collection_id, 
+                                            read_access,
+                                            _default_request,
+                                            None)
+        self.assertEqual(result, access_requires_password_authentication)
+
 if __name__ == "__main__":
     _initialize_logging_to_stderr()
     unittest.main()
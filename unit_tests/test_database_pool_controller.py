@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+test_database_pool_controller.py
+
+test how the retrieve_source database pool controller maps a block range
+onto sequence rows
+"""
+import os
+import unittest
+
+# internal_sockets takes its addresses from the environment when imported
+os.environ.setdefault("NIMBUSIO_NODE_NAME", "test-node")
+os.environ.setdefault("NIMBUSIO_SOCKET_DIR", "/tmp")
+
+from tools.data_definitions import encoded_block_slice_size
+from retrieve_source.database_pool_controller import _analyze_slice_offsets
+
+_blocks_per_sequence = 4
+
+def _sequence_rows(count, last_block_count=_blocks_per_sequence):
+    rows = [{"size" : _blocks_per_sequence * encoded_block_slice_size} \
+            for _ in range(count - 1)]
+    rows.append({"size" : last_block_count * encoded_block_slice_size})
+    return rows
+
+class TestDatabasePoolController(unittest.TestCase):
+    """test the database pool controller's slice offsets"""
+
+    def test_slice_offsets(self):
+        """test skipping and trimming sequence rows"""
+        sequence_rows = _sequence_rows(3)
+        self.assertEqual(_analyze_slice_offsets(sequence_rows, 0, None),
+                         (0, 3, 0, 0, ))
+        self.assertEqual(_analyze_slice_offsets(sequence_rows, 5, 2),
+                         (1, 1, 1, 1, ))
+        self.assertEqual(_analyze_slice_offsets(sequence_rows, 11, None),
+                         (2, 1, 3, 0, ))
+
+    def test_offset_past_end(self):
+        """
+        test a block offset at or past the end of an object whose size
+        is an exact multiple of the block size
+        """
+        sequence_rows = _sequence_rows(3)
+        total_block_count = 3 * _blocks_per_sequence
+        for block_offset in [total_block_count, total_block_count + 1]:
+            for block_count in [None, 1]:
+                skip_count, keep_count, _, _ = \
+                    _analyze_slice_offsets(sequence_rows,
+                                           block_offset,
+                                           block_count)
+                self.assertEqual(skip_count, len(sequence_rows))
+                self.assertEqual(keep_count, 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+test_deliverator.py
+
+test that the deliverator expires channels whose reply never comes
+"""
+from collections import namedtuple
+import unittest
+
+from tools.deliverator import Deliverator, _expire_interval
+
+_channel_timeout = 600.0
+
+_message_tuple = namedtuple("Message", ["control", "body", ])
+
+class _FakeClock(object):
+    def __init__(self):
+        self.current_time = 1000.0
+
+    def __call__(self):
+        return self.current_time
+
+class TestDeliverator(unittest.TestCase):
+    """test the deliverator"""
+
+    def setUp(self):
+        self._clock = _FakeClock()
+        self._deliverator = Deliverator(_channel_timeout, self._clock)
+
+    def test_deliver_reply(self):
+        """test that a reply goes to the channel of its message-id"""
+        channel = self._deliverator.add_request("message-1")
+        self._deliverator.deliver_reply(
+            _message_tuple({"message-id" : "message-1"}, "data"))
+        self.assertEqual(channel.get(block=False),
+                         ({"message-id" : "message-1"}, "data", ))
+        self.assertEqual(self._deliverator.active_request_count, 0)
+
+    def test_expiry(self):
+        """test that a channel expires, and that a late reply is dropped"""
+        old_channel = self._deliverator.add_request("message-1")
+
+        # expiry is checked when a request is added
+        self._clock.current_time += _expire_interval
+        self._deliverator.add_request("message-2")
+        self.assertEqual(self._deliverator.active_request_count, 2)
+        self.assertTrue(old_channel.empty())
+
+        self._clock.current_time += _channel_timeout
+        new_channel = self._deliverator.add_request("message-3")
+        self.assertEqual(self._deliverator.expired_count, 2)
+        self.assertEqual(self._deliverator.active_request_count, 1)
+
+        reply, data = old_channel.get(block=False)
+        self.assertEqual(reply["message-type"], "deliverator-expired-reply")
+        self.assertEqual(reply["message-id"], "message-1")
+        self.assertEqual(reply["result"], "expired")
+        self.assertEqual(data, None)
+
+        # the late reply does not reach (or block on) the expired channel
+        self._deliverator.deliver_reply(
+            _message_tuple({"message-id" : "message-1"}, "late data"))
+        self.assertTrue(old_channel.empty())
+
+        self._deliverator.deliver_reply(
+            _message_tuple({"message-id" : "message-3"}, "data"))
+        self.assertEqual(new_channel.get(block=False)[1], "data")
+        self.assertEqual(self._deliverator.active_request_count, 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+test_fair_queue.py
+
+test serving work items in weighted fair order with FairQueue
+"""
+import unittest
+
+from tools.fair_queue import FairQueue, parse_weights
+
+class _FakeClock(object):
+    def __init__(self):
+        self.current_time = 1000.0
+
+    def __call__(self):
+        return self.current_time
+
+def _flow(item):
+    return item[0]
+
+def _cost(item):
+    return item[2]
+
+def _create_queue(weights=None, clock=None):
+    weights = weights or dict()
+    return FairQueue(_flow,
+                     _cost,
+                     lambda flow: weights.get(flow, 1.0),
+                     clock or _FakeClock())
+
+class TestFairQueue(unittest.TestCase):
+    """test serving work items in weighted fair order with FairQueue"""
+
+    def test_empty_queue(self):
+        """test popping from an empty queue"""
+        queue = _create_queue()
+        self.assertEqual(len(queue), 0)
+        self.assertRaises(IndexError, queue.popleft)
+
+    def test_bulk_flow_does_not_starve_others(self):
+        """
+        test that a flow with a long backlog shares service with a flow
+        that arrives later
+        """
+        queue = _create_queue()
+        for index in range(100):
+            queue.append(("bulk", index, 1, ))
+        queue.append(("small", 0, 1, ))
+        queue.append(("small", 1, 1, ))
+
+        served = [queue.popleft() for _ in range(4)]
+        self.assertEqual([_flow(item) for item in served].count("small"), 2)
+
+    def test_flow_order_is_kept(self):
+        """test that items within a flow come out in the order they went in"""
+        queue = _create_queue()
+        for index in range(10):
+            queue.append(("a", index, 3, ))
+            queue.append(("b", index, 1, ))
+
+        served = [queue.popleft() for _ in range(len(queue))]
+        for flow in ["a", "b", ]:
+            self.assertEqual([item[1] for item in served if item[0] == flow],
+                             list(range(10)))
+
+    def test_weighted_cost_share(self):
+        """test that backlogged flows are served in proportion to weight"""
+        queue = _create_queue(weights={"heavy" : 3.0})
+        for index in range(300):
+            queue.append(("heavy", index, 100, ))
+            queue.append(("light", index, 100, ))
+
+        served = [queue.popleft() for _ in range(200)]
+        heavy_count = [_flow(item) for item in served].count("heavy")
+        self.assertTrue(145 <= heavy_count <= 155, heavy_count)
+
+    def test_cost_share(self):
+        """test that flows share cost, not item count"""
+        queue = _create_queue()
+        for index in range(100):
+            queue.append(("large", index, 10, ))
+            queue.append(("small", index, 1, ))
+
+        served = [queue.popleft() for _ in range(55)]
+        large_count = [_flow(item) for item in served].count("large")
+        self.assertTrue(4 <= large_count <= 6, large_count)
+
+    def test_remove_if(self):
+        """test removing items from the queue"""
+        queue = _create_queue()
+        for index in range(10):
+            queue.append(("a", index, 1, ))
+            queue.append(("b", index, 1, ))
+
+        removed = queue.remove_if(lambda item: item[0] == "a")
+        self.assertEqual(len(removed), 10)
+        self.assertEqual(len(queue), 10)
+        self.assertEqual([item[1] for item in queue], list(range(10)))
+        served = [queue.popleft() for _ in range(len(queue))]
+        self.assertEqual([item[1] for item in served], list(range(10)))
+
+    def test_wait_stats(self):
+        """test the wait times we report per flow"""
+        clock = _FakeClock()
+        queue = _create_queue(clock=clock)
+        queue.append(("a", 0, 1, ))
+        queue.append(("a", 1, 1, ))
+        clock.current_time += 2.0
+        queue.popleft()
+        clock.current_time += 2.0
+        queue.popleft()
+
+        wait_stats = queue.pop_wait_stats()
+        self.assertEqual(wait_stats, {"a" : (2, 6.0, 4.0, )})
+        self.assertEqual(queue.pop_wait_stats(), dict())
+
+    def test_parse_weights(self):
+        """test parsing weights from the environment"""
+        self.assertEqual(parse_weights(""), dict())
+        self.assertEqual(parse_weights("1001:4, 1002:0.5"),
+                         {1001 : 4.0, 1002 : 0.5})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+test_handoff_selector.py
+
+test the load aware choice of hinted handoff backups
+"""
+import unittest
+
+from web_writer.handoff_selector import HandoffSelector, handoff_load, \
+        _min_journal_free_bytes
+
+class _Client(object):
+    """stands in for a GreenletResilientClient"""
+    def __init__(self, server_node_name, queue_size=0, ack_latency=0.01,
+                 queue_depth=0, journal_free_bytes=None):
+        self.server_node_name = server_node_name
+        self.queue_size = queue_size
+        self.ack_latency = ack_latency
+        self.server_status = {"queue-depth"         : queue_depth,
+                              "journal-free-bytes"  : journal_free_bytes, }
+
+def _clients(count=9):
+    return [_Client("node-{0:02d}".format(index + 1)) for index in range(count)]
+
+def _names(clients):
+    return sorted([client.server_node_name for client in clients])
+
+class TestHandoffSelector(unittest.TestCase):
+    """test the load aware choice of hinted handoff backups"""
+
+    def test_load(self):
+        """test that the load counts both queues and the ack latency"""
+        self.assertAlmostEqual(
+            handoff_load(_Client("node-01", queue_size=3, ack_latency=0.5,
+                                 queue_depth=6)), 5.0)
+        # a client without acks yet
+        client = _Client("node-01", ack_latency=None)
+        client.server_status = dict()
+        self.assertTrue(handoff_load(client) > 0.0)
+
+    def test_stable_assignment(self):
+        """test that a destination keeps its backups while they are fine"""
+        selector = HandoffSelector()
+        clients = _clients()
+        first = selector.select("node-10", clients)
+        self.assertEqual(len(first), 2)
+        self.assertNotEqual(first[0], first[1])
+        for _ in range(10):
+            self.assertEqual(_names(selector.select("node-10", clients)),
+                             _names(first))
+
+        # a lightly loaded backup is kept
+        first[0].queue_size = 10
+        self.assertEqual(_names(selector.select("node-10", clients)),
+                         _names(first))
+
+    def test_destinations_spread(self):
+        """test that destinations do not all hand off to the same nodes"""
+        selector = HandoffSelector()
+        clients = _clients(8)
+        backup_names = set()
+        for index in range(20):
+            backup_names.update(_names(
+                selector.select("dest-{0}".format(index), clients)))
+        self.assertTrue(len(backup_names) > 2, backup_names)
+
+    def test_overloaded_backup_replaced(self):
+        """test that a backup is replaced when it is overloaded"""
+        selector = HandoffSelector()
+        clients = _clients()
+        first = selector.select("node-10", clients)
+        overloaded = first[0]
+        overloaded.server_status["queue-depth"] = 1000
+        second = selector.select("node-10", clients)
+        self.assertNotIn(overloaded, second)
+        self.assertIn(first[1], second)
+
+    def test_journal_space(self):
+        """test that nodes short of journal space are avoided"""
+        selector = HandoffSelector()
+        clients = _clients()
+        for client in clients[:-2]:
+            client.server_status["journal-free-bytes"] = \
+                _min_journal_free_bytes - 1
+        self.assertEqual(_names(selector.select("node-10", clients)),
+                         _names(clients[-2:]))
+
+        # when almost every node is short, we still hand off
+        clients[-1].server_status["journal-free-bytes"] = 0
+        self.assertEqual(len(selector.select("node-10", clients)), 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+test_interaction_pool_authenticator.py
+
+test the verified signature cache in InteractionPoolAuthenticator
+"""
+import hashlib
+import hmac
+import time
+import unittest
+
+from tools.interaction_pool_authenticator import \
+    InteractionPoolAuthenticator, \
+    AccessUnauthorized
+
+_test_username = "test-authenticator-user"
+_test_key_id = 42
+_test_key = "test-authenticator-key"
+_test_collection = {"id" : 1,
+                    "name" : "test-collection",
+                    "customer_id" : 7,
+                    "access_control" : None}
+
+class _MockLookup(object):
+    def __init__(self, rows):
+        self._rows = rows
+
+    def get(self, lookup_field_value):
+        return self._rows.get(lookup_field_value)
+
+class _MockRequest(object):
+    def __init__(self, method, path_qs, timestamp, key_id, signature):
+        self.method = method
+        self.path_qs = path_qs
+        self.headers = {"x-nimbus-io-timestamp" : str(timestamp)}
+        self.authorization = ("NIMBUS.IO",
+                              "{0}:{1}".format(key_id, signature))
+
+def _sign(method, path_qs, timestamp, key=_test_key):
+    string_to_sign = "\n".join([_test_username,
+                                method,
+                                str(timestamp),
+                                path_qs])
+    return hmac.new(key, string_to_sign, hashlib.sha256).hexdigest()
+
+class TestInteractionPoolAuthenticator(unittest.TestCase):
+    """test the verified signature cache in InteractionPoolAuthenticator"""
+
+    def setUp(self):
+        self._authenticator = InteractionPoolAuthenticator(None, None)
+        self._authenticator._collection_lookup = _MockLookup(
+            {_test_collection["name"] : _test_collection})
+        self._authenticator._customer_lookup = _MockLookup(
+            {7 : {"id" : 7, "username" : _test_username}})
+        self._customer_keys = {_test_key_id : {"id" : _test_key_id,
+                                               "customer_id" : 7,
+                                               "key" : _test_key}}
+        self._authenticator._customer_key_lookup = \
+            _MockLookup(self._customer_keys)
+
+        self._signature_count = 0
+        compute_signature = self._authenticator._compute_signature
+        def _counting_compute_signature(*args):
+            self._signature_count += 1
+            return compute_signature(*args)
+        self._authenticator._compute_signature = _counting_compute_signature
+
+    def _request(self, method, path_qs, signature=None, timestamp=None):
+        if timestamp is None:
+            timestamp = int(time.time())
+        if signature is None:
+            signature = _sign(method, path_qs, timestamp)
+        return _MockRequest(method, path_qs, timestamp, _test_key_id,
+                            signature)
+
+    def test_repeated_request(self):
+        """test that a repeated request skips the HMAC computation"""
+        request = self._request("GET", "/data/aaa")
+        for _ in range(3):
+            collection_row = self._authenticator.authenticate(
+                _test_collection["name"], None, request)
+            self.assertEqual(collection_row["id"], _test_collection["id"])
+        self.assertEqual(self._signature_count, 1)
+        self.assertEqual(self._authenticator.latency_histogram.count, 3)
+
+    def test_reused_signature(self):
+        """test that a verified signature is not accepted for another path"""
+        request = self._request("GET", "/data/aaa")
+        self._authenticator.authenticate(_test_collection["name"],
+                                         None,
+                                         request)
+        forged_request = self._request(
+            "GET", "/data/bbb",
+            signature=request.authorization[1].split(":", 1)[1],
+            timestamp=request.headers["x-nimbus-io-timestamp"])
+        self.assertRaises(AccessUnauthorized,
+                          self._authenticator.authenticate,
+                          _test_collection["name"],
+                          None,
+                          forged_request)
+
+    def test_changed_key(self):
+        """test that a verified signature is rejected after a key change"""
+        request = self._request("GET", "/data/aaa")
+        self._authenticator.authenticate(_test_collection["name"],
+                                         None,
+                                         request)
+        self._customer_keys[_test_key_id]["key"] = "new-key"
+        self.assertRaises(AccessUnauthorized,
+                          self._authenticator.authenticate,
+                          _test_collection["name"],
+                          None,
+                          request)
+
+    def test_expired_timestamp(self):
+        """test that an old timestamp is rejected"""
+        request = self._request("GET", "/data/aaa",
+                                timestamp=int(time.time()) - 3600)
+        self.assertRaises(AccessUnauthorized,
+                          self._authenticator.authenticate,
+                          _test_collection["name"],
+                          None,
+                          request)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+test_journal_volumes.py
+
+test how the data writer finds its journal volumes and chooses one for
+each new segment
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from tools.data_definitions import file_space_template
+from tools.file_space import find_volume_space_ids, FileSpacesError
+from data_writer.journal_volumes import JournalVolumes
+
+_min_free_bytes = 1000
+_check_interval = 10.0
+
+def _file_space_row(space_id, path, volume, purpose="journal"):
+    return file_space_template(space_id=space_id,
+                               purpose=purpose,
+                               path=path,
+                               volume=volume,
+                               creation_time=None)
+
+class _AvailableSpace(object):
+    """stands in for statvfs: available bytes by path"""
+    def __init__(self, available_bytes):
+        self.available_bytes = available_bytes
+
+    def __call__(self, path):
+        return self.available_bytes[path]
+
+class TestJournalVolumes(unittest.TestCase):
+    """test the choice of journal volumes"""
+
+    def setUp(self):
+        self._test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._test_dir)
+
+    def _file_space_info(self, volume_count):
+        return {"journal" : [_file_space_row(space_id + 1,
+                                             "/journal-{0}".format(space_id),
+                                             "volume-{0}".format(space_id)) \
+                             for space_id in range(volume_count)]}
+
+    def test_find_volume_space_ids(self):
+        """test that spaces are grouped by volume"""
+        file_space_info = {
+            "journal" : [_file_space_row(1, "/a", "volume-1"),
+                         _file_space_row(2, "/b", "volume-2"),
+                         _file_space_row(3, "/c", "volume-1"),
+                         _file_space_row(4, "/d", "volume-3")],
+            "storage" : [_file_space_row(5, "/e", "volume-1", "storage")],
+        }
+        self.assertEqual(find_volume_space_ids("journal", file_space_info),
+                         [1, 2, 4, ])
+        self.assertEqual(find_volume_space_ids("storage", file_space_info),
+                         [5, ])
+        self.assertRaises(FileSpacesError,
+                          find_volume_space_ids,
+                          "nonexistent",
+                          file_space_info)
+
+    def test_find_volume_space_ids_by_device(self):
+        """test that spaces without a volume name are told apart by device"""
+        paths = [os.path.join(self._test_dir, name) for name in ["a", "b"]]
+        for path in paths:
+            os.mkdir(path)
+        file_space_info = {
+            "journal" : [_file_space_row(1, paths[0], None),
+                         _file_space_row(2, paths[1], None)]
+        }
+        # both directories are on the same device
+        self.assertEqual(find_volume_space_ids("journal", file_space_info),
+                         [1, ])
+
+    def test_round_robin(self):
+        """test that equal volumes are taken in turn"""
+        available_space = _AvailableSpace(
+            dict.fromkeys(["/journal-0", "/journal-1", "/journal-2"], 10**9))
+        journal_volumes = JournalVolumes(self._file_space_info(3),
+                                         _min_free_bytes,
+                                         _check_interval,
+                                         available_space)
+        self.assertEqual([journal_volumes.choose_space_id(100.0) \
+                          for _ in range(6)],
+                         [1, 2, 3, 1, 2, 3, ])
+
+    def test_fewest_unsynced_bytes(self):
+        """test that the volume with the shortest fsync queue is chosen"""
+        available_space = _AvailableSpace(
+            dict.fromkeys(["/journal-0", "/journal-1", "/journal-2"], 10**9))
+        journal_volumes = JournalVolumes(self._file_space_info(3),
+                                         _min_free_bytes,
+                                         _check_interval,
+                                         available_space)
+        journal_volumes.written(1, 500)
+        journal_volumes.written(2, 100)
+        journal_volumes.written(3, 300)
+        self.assertEqual(journal_volumes.unsynced_bytes, 900)
+        self.assertEqual(journal_volumes.choose_space_id(100.0), 2)
+        journal_volumes.written(2, 1000)
+        self.assertEqual(journal_volumes.choose_space_id(100.0), 3)
+
+        journal_volumes.synced()
+        self.assertEqual(journal_volumes.unsynced_bytes, 0)
+
+    def test_free_space_floor(self):
+        """test that a volume short of space is skipped until it recovers"""
+        available_space = _AvailableSpace({"/journal-0" : 10**9,
+                                           "/journal-1" : _min_free_bytes - 1,
+                                           "/journal-2" : 10**9})
+        journal_volumes = JournalVolumes(self._file_space_info(3),
+                                         _min_free_bytes,
+                                         _check_interval,
+                                         available_space)
+        self.assertEqual([journal_volumes.choose_space_id(100.0) \
+                          for _ in range(4)],
+                         [1, 3, 1, 3, ])
+
+        # free space is only checked every check_interval
+        available_space.available_bytes["/journal-1"] = 10**9
+        self.assertEqual(journal_volumes.choose_space_id(105.0), 1)
+        self.assertEqual(journal_volumes.choose_space_id(105.0), 3)
+        self.assertEqual(journal_volumes.choose_space_id(110.0), 1)
+        self.assertEqual(journal_volumes.choose_space_id(110.0), 2)
+
+        # between checks, what we write counts against the free space
+        available_space.available_bytes["/journal-0"] = _min_free_bytes + 10
+        self.assertEqual(journal_volumes.choose_space_id(120.0), 3)
+        journal_volumes.written(1, 20)
+        self.assertEqual([journal_volumes.choose_space_id(120.0) \
+                          for _ in range(2)],
+                         [2, 3, ])
+
+    def test_all_volumes_short(self):
+        """test that the volume with the most space is used when all are short"""
+        available_space = _AvailableSpace({"/journal-0" : 10,
+                                           "/journal-1" : 30,
+                                           "/journal-2" : 20})
+        journal_volumes = JournalVolumes(self._file_space_info(3),
+                                         _min_free_bytes,
+                                         _check_interval,
+                                         available_space)
+        self.assertEqual([journal_volumes.choose_space_id(100.0) \
+                          for _ in range(3)],
+                         [2, 2, 2, ])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+test_message_codec.py
+
+test encoding and decoding control frames with the message codecs
+"""
+from base64 import b64encode
+from datetime import datetime
+import hashlib
+import unittest
+
+from tools.data_definitions import parse_timestamp_repr, parse_digest
+from tools import message_codec
+from tools.message_codec import json_codec_name, compact_codec_name, \
+        MessageCodecError, offered_codecs, choose_codec, frame_codec, \
+        encode, decode
+
+_timestamp = datetime(2012, 3, 14, 15, 9, 26, 535897)
+_digest = hashlib.md5(b"pork").digest()
+
+def _test_control():
+    return {
+        "message-type"      : "archive-key-entire",
+        "message-id"        : "d0e3a5c2b31b11e1a7ef0024e8461e1f",
+        "priority"          : 1331737766,
+        "collection-id"     : 42,
+        "key"               : u"pork/chops é",
+        "unified-id"        : 2 ** 62,
+        "conjoined-part"    : 0,
+        "segment-num"       : -1,
+        "segment-size"      : 1024 * 1024,
+        "handoff-node-name" : None,
+        "file-size"         : 2 ** 65,
+        "ratio"             : 0.5,
+        "accepted"          : True,
+        "timestamp-repr"    : _timestamp,
+        "segment-md5-digest": bytearray(_digest),
+        "meta"              : [["a", "b"], ["c", "x" * 300]],
+        "nested"            : {"empty" : [], "false" : False},
+    }
+
+class TestMessageCodec(unittest.TestCase):
+    """test encoding and decoding control frames with the message codecs"""
+
+    def test_compact_round_trip(self):
+        """test that the compact codec returns what we encoded"""
+        control = _test_control()
+        frame = encode(control, compact_codec_name)
+        self.assertEqual(frame_codec(frame), compact_codec_name)
+        decoded = decode(frame)
+
+        self.assertEqual(decoded["timestamp-repr"], _timestamp)
+        self.assertEqual(decoded["segment-md5-digest"], _digest)
+        self.assertEqual(decoded["file-size"], 2 ** 65)
+        self.assertEqual(decoded["meta"], [["a", "b"], ["c", "x" * 300]])
+        del control["timestamp-repr"]
+        del control["segment-md5-digest"]
+        del decoded["timestamp-repr"]
+        del decoded["segment-md5-digest"]
+        self.assertEqual(decoded, control)
+
+    def test_json_fallback(self):
+        """test that JSON sends timestamps as repr and digests as base64"""
+        frame = encode(_test_control(), json_codec_name)
+        self.assertEqual(frame_codec(frame), json_codec_name)
+        decoded = decode(frame)
+
+        self.assertEqual(decoded["timestamp-repr"], repr(_timestamp))
+        self.assertEqual(decoded["segment-md5-digest"],
+                         b64encode(_digest).decode("ascii"))
+
+    def test_receiver_accepts_either_codec(self):
+        """test that the receiving side parses the values from both codecs"""
+        for codec_name in [compact_codec_name, json_codec_name, ]:
+            decoded = decode(encode(_test_control(), codec_name))
+            self.assertEqual(parse_timestamp_repr(decoded["timestamp-repr"]),
+                             _timestamp)
+            self.assertEqual(parse_digest(decoded["segment-md5-digest"]),
+                             _digest)
+
+    def test_compact_is_smaller(self):
+        """test that the compact frame is smaller than the JSON frame"""
+        control = _test_control()
+        self.assertLess(len(encode(control, compact_codec_name)),
+                        len(encode(control, json_codec_name)))
+
+    def test_choose_codec(self):
+        """test that the server picks the first codec it supports"""
+        saved_compact_codec_enabled = message_codec._compact_codec_enabled
+        try:
+            message_codec._compact_codec_enabled = True
+            self.assertEqual(offered_codecs()[0], compact_codec_name)
+            self.assertEqual(choose_codec(None), json_codec_name)
+            self.assertEqual(choose_codec(["compact-99", json_codec_name]),
+                             json_codec_name)
+            self.assertEqual(
+                choose_codec([compact_codec_name, json_codec_name]),
+                compact_codec_name)
+
+            message_codec._compact_codec_enabled = False
+            self.assertEqual(offered_codecs(), [json_codec_name, ])
+            self.assertEqual(
+                choose_codec([compact_codec_name, json_codec_name]),
+                json_codec_name)
+        finally:
+            message_codec._compact_codec_enabled = saved_compact_codec_enabled
+
+    def test_bad_frames(self):
+        """test that we reject frames we can't decode"""
+        frame = encode(_test_control(), compact_codec_name)
+        self.assertRaises(MessageCodecError, decode, frame[:-1])
+        self.assertRaises(MessageCodecError, decode, frame + b"\x00")
+        self.assertRaises(MessageCodecError,
+                          decode,
+                          frame[:1] + b"\x63" + frame[2:])
+        self.assertRaises(MessageCodecError,
+                          encode,
+                          {"bad" : object()},
+                          compact_codec_name)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+test_node_latency_tracker.py
+
+test the per node latency tracking used for hedged retrieves
+"""
+import unittest
+
+from web_internal_reader.node_latency_tracker import NodeLatencyTracker, \
+        _min_hedge_deadline, \
+        _max_hedge_deadline
+
+class TestNodeLatencyTracker(unittest.TestCase):
+    """test the per node latency tracking used for hedged retrieves"""
+
+    def test_new_node(self):
+        """test that a node we have not heard from gets tried first"""
+        tracker = NodeLatencyTracker("node-01")
+        self.assertEqual(tracker.expected_latency, 0.0)
+        self.assertFalse(tracker.degraded)
+        self.assertEqual(tracker.hedge_deadline(), _max_hedge_deadline)
+
+    def test_hedge_deadline(self):
+        """test that the deadline follows the reply latency"""
+        tracker = NodeLatencyTracker("node-01")
+        for _ in range(100):
+            tracker.record_reply(0.2)
+        self.assertAlmostEqual(tracker.expected_latency, 0.2)
+        self.assertTrue(0.2 <= tracker.hedge_deadline() <= 0.5,
+                        tracker.hedge_deadline())
+
+        fast_tracker = NodeLatencyTracker("node-02")
+        for _ in range(100):
+            fast_tracker.record_reply(0.0001)
+        self.assertEqual(fast_tracker.hedge_deadline(), _min_hedge_deadline)
+
+    def test_failures(self):
+        """test that a failing node is degraded, and recovers"""
+        tracker = NodeLatencyTracker("node-01")
+        for _ in range(10):
+            tracker.record_failure(0.01)
+        self.assertTrue(tracker.degraded)
+        self.assertTrue(tracker.expected_latency > 0.01)
+
+        for _ in range(10):
+            tracker.record_reply(0.01)
+        self.assertFalse(tracker.degraded)
+
+    def test_abandoned(self):
+        """test that an abandoned request only raises the latency"""
+        tracker = NodeLatencyTracker("node-01")
+        tracker.record_reply(0.1)
+        tracker.record_abandoned(0.01)
+        self.assertAlmostEqual(tracker.expected_latency, 0.1)
+        tracker.record_abandoned(1.1)
+        self.assertTrue(tracker.expected_latency > 0.1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+test_operational_stats_redis_sink.py
+
+test that operational stats are summed in memory and flushed to redis
+as one pipelined batch of HINCRBY
+"""
+from datetime import datetime
+import unittest
+
+from gevent.event import Event
+from gevent.queue import Queue
+
+from tools.operational_stats_redis_key import compute_key
+from tools.operational_stats_redis_sink import OperationalStatsRedisSink, \
+        redis_queue_entry_tuple
+
+_node_name = "node-01"
+
+class _FakePipeline(object):
+    def __init__(self, redis_connection):
+        self._redis_connection = redis_connection
+        self._commands = list()
+
+    def hincrby(self, key, field, value):
+        self._commands.append((key, field, value, ))
+
+    def execute(self):
+        self._redis_connection.executed.append(self._commands)
+
+class _FakeRedisConnection(object):
+    def __init__(self):
+        self.pipelines = list()
+        self.executed = list()
+
+    def pipeline(self, transaction=True):
+        self.pipelines.append(transaction)
+        return _FakePipeline(self)
+
+class TestOperationalStatsRedisSink(unittest.TestCase):
+    """test the operational stats redis sink"""
+
+    def setUp(self):
+        self._redis_connection = _FakeRedisConnection()
+        self._sink = OperationalStatsRedisSink(Event(), Queue(), _node_name)
+        self._sink._redis_connection = self._redis_connection
+
+    def test_flush(self):
+        """test that increments to the same key are summed into one call"""
+        timestamp = datetime(2012, 12, 4, 22, 12, 30)
+        next_minute = datetime(2012, 12, 4, 22, 13, 1)
+        entries = [
+            ("archive_success", redis_queue_entry_tuple(timestamp, 1001, 1)),
+            ("archive_success", redis_queue_entry_tuple(
+                timestamp.replace(second=59), 1001, 1)),
+            ("archive_success", redis_queue_entry_tuple(timestamp, 1001, 1)),
+            ("success_bytes_in", redis_queue_entry_tuple(timestamp, 1001, 10)),
+            ("success_bytes_in", redis_queue_entry_tuple(timestamp, 1001, 20)),
+            ("archive_success", redis_queue_entry_tuple(timestamp, 1002, 1)),
+            ("archive_success", redis_queue_entry_tuple(next_minute, 1001, 1)),
+        ]
+        for partial_key, entry in entries:
+            self._sink.store(partial_key, entry)
+        self.assertEqual(self._sink.pending_count(), 4)
+        self.assertEqual(self._redis_connection.pipelines, [])
+
+        self._sink.flush()
+        self.assertEqual(self._sink.pending_count(), 0)
+        self.assertEqual(self._redis_connection.pipelines, [False, ])
+        self.assertEqual(len(self._redis_connection.executed), 1)
+
+        key = compute_key(_node_name, timestamp, "archive_success")
+        next_key = compute_key(_node_name, next_minute, "archive_success")
+        bytes_key = compute_key(_node_name, timestamp, "success_bytes_in")
+        self.assertEqual(sorted(self._redis_connection.executed[0]),
+                         sorted([(key, 1001, 3, ),
+                                 (key, 1002, 1, ),
+                                 (next_key, 1001, 1, ),
+                                 (bytes_key, 1001, 30, ), ]))
+
+        # nothing pending, nothing sent
+        self._sink.flush()
+        self.assertEqual(len(self._redis_connection.executed), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+test_request_tracer.py
+
+test per request tracing spans and the trace collector
+"""
+import time
+import unittest
+
+import gevent
+
+from tools.request_tracer import is_traced, RequestTracer, trace_spans_topic
+from tools.greenlet_trace_flusher import GreenletTraceFlusher
+from performance_packager.trace_collector import TraceCollector
+
+class _FakeEventPushClient(object):
+    def __init__(self):
+        self.events = list()
+
+    def info(self, topic, description, **kwargs):
+        self.events.append((topic, description, kwargs, ))
+
+class TestRequestTracer(unittest.TestCase):
+    """test per request tracing spans"""
+
+    def test_sampling(self):
+        """test that the choice depends only on the user-request-id"""
+        user_request_ids = ["request-{0}".format(n) for n in range(10000)]
+        traced = [user_request_id for user_request_id in user_request_ids \
+                  if is_traced(user_request_id, 0.1)]
+        self.assertTrue(800 < len(traced) < 1200, len(traced))
+        self.assertEqual(
+            traced,
+            [user_request_id for user_request_id in user_request_ids \
+             if is_traced(user_request_id, 0.1)])
+        self.assertFalse(is_traced(None, 1.0))
+        self.assertFalse(is_traced("request-1", 0.0))
+        self.assertTrue(is_traced("request-1", 1.0))
+
+    def test_ring(self):
+        """test that the ring keeps the newest spans and counts the rest"""
+        event_push_client = _FakeEventPushClient()
+        tracer = RequestTracer(event_push_client,
+                               ring_size=3,
+                               flush_interval=3600.0,
+                               sample_rate=1.0)
+        for index in range(5):
+            tracer.record("request-1", "stage-{0}".format(index),
+                          100.0 + index, 100.5 + index)
+        self.assertEqual(len(event_push_client.events), 0)
+
+        tracer.flush()
+        self.assertEqual(len(event_push_client.events), 1)
+        topic, _, event = event_push_client.events[0]
+        self.assertEqual(topic, trace_spans_topic)
+        self.assertEqual(event["dropped"], 2)
+        self.assertEqual([span[1] for span in event["spans"]],
+                         ["stage-2", "stage-3", "stage-4", ])
+        self.assertEqual(event["spans"][0][3], 0.5)
+
+    def test_flush_if_due(self):
+        """test that buffered spans are sent without another record()"""
+        event_push_client = _FakeEventPushClient()
+        tracer = RequestTracer(event_push_client,
+                               flush_interval=5.0,
+                               sample_rate=1.0)
+        start_time = time.time()
+        # the first span is sent, the others wait for the flush interval
+        tracer.record("request-1", "stage-1", start_time, start_time + 10.0)
+        tracer.record("request-1", "stage-2", start_time, start_time + 11.0)
+        tracer.record("request-1", "stage-3", start_time, start_time + 12.0)
+        self.assertEqual(len(event_push_client.events), 1)
+
+        tracer.flush_if_due(start_time + 14.0)
+        self.assertEqual(len(event_push_client.events), 1)
+
+        tracer.flush_if_due(start_time + 15.0)
+        self.assertEqual(len(event_push_client.events), 2)
+        _, _, event = event_push_client.events[1]
+        self.assertEqual([span[1] for span in event["spans"]],
+                         ["stage-2", "stage-3", ])
+
+        # nothing to send
+        tracer.flush_if_due(start_time + 30.0)
+        self.assertEqual(len(event_push_client.events), 2)
+
+    def test_greenlet_trace_flusher(self):
+        """test that the web servers' greenlet sends buffered spans"""
+        event_push_client = _FakeEventPushClient()
+        tracer = RequestTracer(event_push_client,
+                               flush_interval=0.1,
+                               sample_rate=1.0)
+        start_time = time.time()
+        tracer.record("request-1", "stage-1", start_time, start_time)
+        self.assertEqual(len(event_push_client.events), 0)
+
+        flusher = GreenletTraceFlusher(tracer, check_interval=0.05)
+        flusher.start()
+        gevent.sleep(0.3)
+        flusher.join()
+        self.assertEqual(len(event_push_client.events), 1)
+        _, _, event = event_push_client.events[0]
+        self.assertEqual([span[1] for span in event["spans"]], ["stage-1", ])
+
+    def test_span(self):
+        """test that a with block is recorded even if it raises"""
+        tracer = RequestTracer(sample_rate=1.0)
+        try:
+            with tracer.span("request-1", "failing-stage"):
+                raise ValueError()
+        except ValueError:
+            pass
+        with tracer.span("request-2", "stage"):
+            pass
+        spans = tracer.pop_spans()
+        self.assertEqual([span[:2] for span in spans],
+                         [("request-1", "failing-stage", ),
+                          ("request-2", "stage", ), ])
+        self.assertEqual(tracer.pop_spans(), [])
+
+    def test_collector(self):
+        """test that spans from several nodes make one waterfall"""
+        collector = TraceCollector(quiet_interval=30.0, max_requests=2)
+        collector.add_spans("node-1",
+                            [["request-1", "web-writer-archive", 10.0, 2.0],
+                             ["request-2", "web-writer-archive", 11.0, 1.0]],
+                            current_time=1000.0)
+        collector.add_spans("node-2",
+                            [["request-1", "data-writer-fsync", 11.0, 0.5],
+                             ["request-3", "data-writer-fsync", 11.0, 0.5]],
+                            current_time=1020.0)
+        self.assertEqual(collector.pop_quiet_requests(1040.0),
+                         [("request-2",
+                           [(11.0, 1.0, "node-1", "web-writer-archive")], )])
+        self.assertEqual(collector.pop_quiet_requests(1050.0),
+                         [("request-1",
+                           [(10.0, 2.0, "node-1", "web-writer-archive"),
+                            (11.0, 0.5, "node-2", "data-writer-fsync")], )])
+
+if __name__ == "__main__":
+    unittest.main()
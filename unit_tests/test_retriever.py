@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+test_retriever.py
+
+test that the Retriever cancels the requests it no longer needs
+"""
+import unittest
+
+import gevent
+
+from web_internal_reader.node_latency_tracker import NodeLatencyTracker
+from web_internal_reader.retriever import Retriever
+
+_node_count = 10
+_segments_needed = 8
+_slow_segment_number = 3
+_slow_reply_time = 3.0
+_sequence_count = 2
+
+class _FakeDataReader(object):
+    """
+    reply to each sequence with one block, after reply_time
+    """
+    def __init__(self, segment_number, reply_time=0.0):
+        self._segment_number = segment_number
+        self._reply_time = reply_time
+        self._latency_tracker = NodeLatencyTracker(self.node_name)
+        self.requests = list()
+        self.cancels = list()
+
+    @property
+    def connected(self):
+        return True
+
+    @property
+    def node_name(self):
+        return "node-{0:02}".format(self._segment_number)
+
+    @property
+    def latency_tracker(self):
+        return self._latency_tracker
+
+    def _reply(self, message_type, sequence):
+        self.requests.append((message_type, sequence, ))
+        gevent.sleep(self._reply_time)
+        return ["block-{0}".format(self._segment_number), ], 0, \
+            sequence == _sequence_count
+
+    def retrieve_key_start(self, _retrieve_id, sequence, *_args):
+        return self._reply("retrieve-key-start", sequence)
+
+    def retrieve_key_next(self, _retrieve_id, sequence, *_args):
+        return self._reply("retrieve-key-next", sequence)
+
+    def retrieve_key_cancel(self, retrieve_id, segment_num, _user_request_id):
+        assert segment_num == self._segment_number
+        self.cancels.append(retrieve_id)
+
+def _data_readers():
+    return [_FakeDataReader(segment_number,
+                            _slow_reply_time \
+                                if segment_number == _slow_segment_number \
+                                else 0.0) \
+            for segment_number in range(1, _node_count+1)]
+
+def _retriever(data_readers):
+    return Retriever(None,
+                     data_readers,
+                     1001,
+                     "test-key",
+                     1,
+                     0,
+                     0,
+                     None,
+                     _segments_needed,
+                     "test-request")
+
+class TestRetriever(unittest.TestCase):
+    """test that the Retriever cancels the requests it no longer needs"""
+
+    def test_abandoned_node_is_cancelled(self):
+        """
+        test that a node we hedge around is cancelled, and sits out the
+        following sequences
+        """
+        data_readers = _data_readers()
+        result_dicts = list(_retriever(data_readers).retrieve(10.0))
+        self.assertEqual(len(result_dicts), _sequence_count)
+
+        slow_data_reader = data_readers[_slow_segment_number-1]
+        self.assertEqual(len(slow_data_reader.cancels), 1)
+        self.assertEqual(slow_data_reader.requests,
+                         [("retrieve-key-start", 1, ), ])
+
+        # the hedge replaces it for the rest of the retrieve
+        hedge_data_reader = data_readers[_segments_needed]
+        self.assertEqual(hedge_data_reader.requests,
+                         [("retrieve-key-start", 1, ),
+                          ("retrieve-key-next", 2, ), ])
+
+        for data_reader in data_readers:
+            if data_reader is not slow_data_reader:
+                self.assertEqual(data_reader.cancels, [])
+
+    def test_caller_stops_early(self):
+        """
+        test that the nodes we started are cancelled when the caller does
+        not read the whole retrieve
+        """
+        data_readers = _data_readers()
+        retrieve_generator = _retriever(data_readers).retrieve(10.0)
+        retrieve_generator.next()
+        retrieve_generator.close()
+
+        cancelled_count = sum([len(data_reader.cancels) \
+                               for data_reader in data_readers])
+        # the slow node was cancelled once when we hedged around it,
+        # the 8 nodes in step with us when the caller stopped
+        self.assertEqual(cancelled_count, _segments_needed + 1)
+
+if __name__ == "__main__":
+    unittest.main()
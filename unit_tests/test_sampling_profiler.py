@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+test_sampling_profiler.py
+
+test the sampling profiler and its dumps
+"""
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from tools.sampling_profiler import SamplingProfiler
+
+def _inner_function(profiler):
+    profiler.sample_frame(sys._getframe())
+
+def _outer_function(profiler, count):
+    for _ in range(count):
+        _inner_function(profiler)
+
+def _busy_function(seconds):
+    end_time = time.time() + seconds
+    while time.time() < end_time:
+        pass
+
+class TestSamplingProfiler(unittest.TestCase):
+    """test the sampling profiler and its dumps"""
+
+    def setUp(self):
+        self._dump_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dump_dir)
+
+    def test_dump(self):
+        """test that a dump loads in pstats and has the folded stacks"""
+        profiler = SamplingProfiler("test", self._dump_dir, interval=0.01)
+        _outer_function(profiler, 5)
+        self.assertEqual(profiler.sample_count, 5)
+        pstats_path, folded_path = profiler.dump()
+        self.assertEqual(profiler.sample_count, 0)
+        self.assertEqual(profiler.dump(), None)
+
+        stats = pstats.Stats(pstats_path).stats
+        inner_key, = [key for key in stats if key[2] == "_inner_function"]
+        outer_key, = [key for key in stats if key[2] == "_outer_function"]
+        cc, nc, tt, ct, callers = stats[inner_key]
+        self.assertEqual((cc, nc, ), (5, 5, ))
+        self.assertAlmostEqual(tt, 0.05)
+        self.assertAlmostEqual(ct, 0.05)
+        self.assertEqual(list(callers.keys()), [outer_key, ])
+        self.assertAlmostEqual(stats[outer_key][2], 0.0)
+        self.assertAlmostEqual(stats[outer_key][3], 0.05)
+
+        with open(folded_path) as input_file:
+            lines = input_file.readlines()
+        self.assertEqual(len(lines), 1)
+        stack, count = lines[0].rsplit(" ", 1)
+        self.assertEqual(int(count), 5)
+        self.assertTrue(stack.endswith(
+            "_outer_function (test_sampling_profiler.py:{0});"
+            "_inner_function (test_sampling_profiler.py:{1})".format(
+                _outer_function.__code__.co_firstlineno,
+                _inner_function.__code__.co_firstlineno)), stack)
+
+    def test_old_dumps_removed(self):
+        """test that we keep only the newest dumps"""
+        profiler = SamplingProfiler("test",
+                                    self._dump_dir,
+                                    max_dump_count=2)
+        for index in range(3):
+            _outer_function(profiler, 1)
+            # dump names have a one second resolution
+            os.rename(profiler.dump()[0],
+                      os.path.join(self._dump_dir, "keep-{0}".format(index)))
+            _outer_function(profiler, 1)
+            profiler.dump()
+            time.sleep(1.01)
+        self.assertEqual(
+            len([file_name for file_name in os.listdir(self._dump_dir) \
+                 if file_name.startswith("nimbusio_profile_test_")]), 4)
+
+    def test_sampler_thread(self):
+        """test that the sampler thread sees a busy thread"""
+        profiler = SamplingProfiler("test",
+                                    self._dump_dir,
+                                    interval=0.001,
+                                    use_signal_timer=False)
+        profiler.start()
+        _busy_function(0.2)
+        profiler.stop()
+        self.assertFalse(profiler.running)
+        self.assertTrue(profiler.sample_count > 0)
+        stats = pstats.Stats(profiler.dump()[0]).stats
+        self.assertTrue(
+            any(key[2] == "_busy_function" for key in stats.keys()))
+
+    def test_control_message(self):
+        """test that control messages for other processes are ignored"""
+        profiler = SamplingProfiler("test",
+                                    self._dump_dir,
+                                    interval=0.001,
+                                    use_signal_timer=False)
+        profiler.handle_control_message({"action"       : "start",
+                                         "target_name"  : "other", })
+        self.assertFalse(profiler.running)
+        profiler.handle_control_message({"action"       : "start",
+                                         "target_name"  : "test", })
+        self.assertTrue(profiler.running)
+        _busy_function(0.05)
+        profiler.handle_control_message({"action" : "stop", })
+        self.assertFalse(profiler.running)
+        self.assertTrue(any(file_name.endswith(".pstats") \
+                            for file_name in os.listdir(self._dump_dir)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+test_slice_cache.py
+
+test the web_internal_reader slice cache
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from tools.data_definitions import block_size
+from web_internal_reader.slice_cache import SliceCache
+
+_slice_blocks = 2
+_slot_count = 4
+
+class TestSliceCache(unittest.TestCase):
+    """test the web_internal_reader slice cache"""
+
+    def setUp(self):
+        self._test_dir = tempfile.mkdtemp()
+        self._slice_cache = SliceCache(
+            os.path.join(self._test_dir, "slice_cache_pool"),
+            _slot_count * _slice_blocks * block_size,
+            _slice_blocks
+        )
+
+    def tearDown(self):
+        self._slice_cache.close()
+        shutil.rmtree(self._test_dir)
+
+    def test_get_put(self):
+        """test that a cached slice comes back intact"""
+        data = os.urandom(_slice_blocks * block_size)
+        self.assertEqual(self._slice_cache.get(1, 0, 0), None)
+        self.assertTrue(self._slice_cache.put(1, 0, 0, data, False))
+        self.assertEqual(self._slice_cache.get(1, 0, 0), (data, False, ))
+        stats = self._slice_cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_collector(self):
+        """test that only whole slices, or the last slice, are cached"""
+        blocks = [os.urandom(block_size) for _ in range(4)] + ["short"]
+
+        # starting in the middle of a slice, we can't cache the first slice
+        collector = self._slice_cache.collector(1, 0, 1)
+        for block in blocks[1:]:
+            collector.add(block)
+        collector.finish(True)
+
+        self.assertEqual(self._slice_cache.get(1, 0, 0), None)
+        self.assertEqual(self._slice_cache.get(1, 0, 1), 
+                         ("".join(blocks[2:4]), False, ))
+        self.assertEqual(self._slice_cache.get(1, 0, 2), ("short", True, ))
+
+        # a range that ends part way through a slice is not the last slice
+        collector = self._slice_cache.collector(2, 0, 0)
+        for block in blocks[:3]:
+            collector.add(block)
+        collector.finish(False)
+        self.assertEqual(self._slice_cache.get(2, 0, 0), 
+                         ("".join(blocks[:2]), False, ))
+        self.assertEqual(self._slice_cache.get(2, 0, 1), None)
+
+    def test_scan_resistance(self):
+        """test that a scan of slices used once does not flush hot slices"""
+        data = os.urandom(_slice_blocks * block_size)
+        for slice_index in range(_slot_count):
+            for _ in range(3):
+                self._slice_cache.get(1, 0, slice_index)
+            self.assertTrue(self._slice_cache.put(1, 0, slice_index, data, 
+                                                  False))
+
+        for slice_index in range(100):
+            self._slice_cache.get(2, 0, slice_index)
+            self._slice_cache.put(2, 0, slice_index, data, False)
+
+        for slice_index in range(_slot_count):
+            self.assertNotEqual(self._slice_cache.get(1, 0, slice_index), 
+                                None)
+        self.assertEqual(self._slice_cache.stats()["evictions"], 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+test_space_accounting_client.py
+
+test that the space accounting client batches its messages, and keeps
+them when a flush fails
+"""
+import unittest
+
+import gevent
+
+from tools.data_definitions import create_timestamp
+from web_public_reader.space_accounting_client import SpaceAccountingClient
+
+_flush_interval = 0.05
+
+class _FakePushClient(object):
+    """stands in for a GreenletPUSHClient"""
+    def __init__(self, fail_count=0):
+        self._fail_count = fail_count
+        self.messages = list()
+
+    def send(self, message):
+        if self._fail_count > 0:
+            self._fail_count -= 1
+            raise IOError("send failed")
+        self.messages.append(message)
+
+    def close(self):
+        pass
+
+def _sent_values(messages):
+    values = dict()
+    for message in messages:
+        for entries in message["hour-entries"].values():
+            for collection_id, event, value in entries:
+                key = (collection_id, event, )
+                values[key] = values.get(key, 0) + value
+    return values
+
+class TestSpaceAccountingClient(unittest.TestCase):
+    """test the batching space accounting client"""
+
+    def test_batch(self):
+        """test that values are summed into one message"""
+        push_client = _FakePushClient()
+        client = SpaceAccountingClient("node-01",
+                                       None,
+                                       push_client,
+                                       _flush_interval)
+        client.start()
+        timestamp = create_timestamp()
+        client.added(1001, timestamp, 10)
+        client.added(1001, timestamp, 20)
+        client.retrieved(1002, timestamp, 5)
+        self.assertEqual(push_client.messages, [])
+
+        gevent.sleep(_flush_interval * 3)
+        self.assertEqual(len(push_client.messages), 1)
+        self.assertEqual(_sent_values(push_client.messages),
+                         {(1001, "bytes_added", ) : 30,
+                          (1002, "bytes_retrieved", ) : 5, })
+        client.close()
+
+    def test_failed_flush(self):
+        """test that a later flush sends the values of a failed one"""
+        push_client = _FakePushClient(fail_count=1)
+        client = SpaceAccountingClient("node-01",
+                                       None,
+                                       push_client,
+                                       _flush_interval)
+        client.start()
+        timestamp = create_timestamp()
+        client.added(1001, timestamp, 10)
+        gevent.sleep(_flush_interval * 1.5)
+        # the first flush failed
+        self.assertEqual(push_client.messages, [])
+
+        client.added(1001, timestamp, 20)
+        gevent.sleep(_flush_interval * 2)
+        self.assertEqual(_sent_values(push_client.messages),
+                         {(1001, "bytes_added", ) : 30, })
+        client.close()
+
+if __name__ == "__main__":
+    unittest.main()
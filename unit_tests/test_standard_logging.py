@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+test_standard_logging.py
+
+test the hot path logging tools
+"""
+import logging
+import unittest
+
+from tools.standard_logging import LazyFormat, SamplingFilter, AsyncHandler
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = list()
+
+    def emit(self, record):
+        self.messages.append(self.format(record))
+
+class _Unformattable(object):
+    def __format__(self, _format_spec):
+        raise AssertionError("formatted a disabled message")
+
+class TestStandardLogging(unittest.TestCase):
+    """test the hot path logging tools"""
+
+    def setUp(self):
+        self._log = logging.getLogger("test_standard_logging")
+        self._log.propagate = False
+        self._log.setLevel(logging.INFO)
+        self._handler = _ListHandler()
+        self._log.addHandler(self._handler)
+
+    def tearDown(self):
+        self._log.removeHandler(self._handler)
+        for log_filter in list(self._log.filters):
+            self._log.removeFilter(log_filter)
+
+    def test_lazy_format(self):
+        """test that a message is formatted only when it is emitted"""
+        self._log.debug(LazyFormat("{0}", _Unformattable()))
+        self._log.info(LazyFormat("request {0}: {key}", 42, key="pork"))
+        self.assertEqual(self._handler.messages, ["request 42: pork", ])
+
+    def test_sampling(self):
+        """test that a sampled logger passes 1 in N, and every warning"""
+        self._log.addFilter(SamplingFilter(10))
+        for index in range(100):
+            self._log.info(LazyFormat("info {0}", index))
+        self._log.warn("warning")
+        self.assertEqual(len(self._handler.messages), 11)
+        self.assertEqual(self._handler.messages[:2], ["info 0", "info 10", ])
+        self.assertEqual(self._handler.messages[-1], "warning")
+
+    def test_async_handler(self):
+        """
+        test that the async handler writes every record, with the arguments
+        as they were when logged
+        """
+        self._log.removeHandler(self._handler)
+        async_handler = AsyncHandler(self._handler)
+        async_handler.setFormatter(logging.Formatter("%(message)s"))
+        self._log.addHandler(async_handler)
+        try:
+            values = ["before", ]
+            self._log.info("value %s", values)
+            values[0] = "after"
+            for index in range(1000):
+                self._log.info(LazyFormat("info {0}", index))
+            try:
+                raise ValueError("pork")
+            except ValueError:
+                self._log.exception("exception")
+        finally:
+            self._log.removeHandler(async_handler)
+            async_handler.close()
+
+        self.assertEqual(len(self._handler.messages), 1002)
+        self.assertEqual(self._handler.messages[0], "value ['before']")
+        self.assertEqual(self._handler.messages[1000], "info 999")
+        self.assertTrue("ValueError: pork" in self._handler.messages[-1])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+test_sync_scheduler.py
+
+test the group commit decisions of the data writer SyncScheduler
+"""
+import random
+import unittest
+
+from data_writer.sync_scheduler import SyncScheduler
+
+_latency_budget = 1.0
+_min_sync_interval = 0.02
+_idle_sync_rate = 2.0
+_max_completions = 10
+_max_unsynced_bytes = 1024 * 1024
+
+class TestSyncScheduler(unittest.TestCase):
+    """test the group commit decisions of the data writer SyncScheduler"""
+
+    def setUp(self):
+        self._scheduler = SyncScheduler(
+            latency_budget=_latency_budget,
+            min_sync_interval=_min_sync_interval,
+            idle_sync_rate=_idle_sync_rate,
+            max_completions=_max_completions,
+            max_unsynced_bytes=_max_unsynced_bytes
+        )
+
+    def test_nothing_pending(self):
+        """test that we don't sync without completions or unsynced bytes"""
+        self.assertFalse(self._scheduler.sync_due(0, 0, True, 100.0))
+        self.assertEqual(self._scheduler.wait_time(100.0, 1.0), 1.0)
+
+    def test_idle(self):
+        """test that we sync as soon as the writer goes idle"""
+        self.assertTrue(self._scheduler.sync_due(1, 100, True, 100.0))
+
+    def test_min_sync_interval(self):
+        """test that idle syncs are not closer than min_sync_interval"""
+        self._scheduler.record_sync(1, 99.999, 100.0)
+        self.assertFalse(self._scheduler.sync_due(1, 100, True, 100.01))
+        self.assertAlmostEqual(self._scheduler.wait_time(100.01, 1.0), 0.01)
+        self.assertTrue(self._scheduler.sync_due(1, 100, True, 100.025))
+
+    def test_busy(self):
+        """test that a busy writer accumulates completions until the budget"""
+        self._scheduler.record_sync(1, 99.999, 100.0)
+        self.assertFalse(self._scheduler.sync_due(1, 100, False, 100.5))
+        self.assertFalse(self._scheduler.sync_due(5, 500, False, 101.0))
+        self.assertTrue(self._scheduler.sync_due(5, 500, False, 101.5))
+
+    def test_thresholds(self):
+        """test that we sync a busy writer over the thresholds"""
+        self.assertTrue(
+            self._scheduler.sync_due(_max_completions, 100, False, 100.0))
+        self.assertTrue(
+            self._scheduler.sync_due(0, _max_unsynced_bytes, False, 100.0))
+
+    def _run_writer(self, arrival_rate, duration):
+        """
+        simulate a writer that empties its queue between messages, each of
+        which adds a completion, arriving at random at arrival_rate.
+        return the number of syncs and the longest wait for a sync
+        """
+        # don't let the thresholds sync for us
+        scheduler = SyncScheduler(
+            latency_budget=_latency_budget,
+            min_sync_interval=_min_sync_interval,
+            idle_sync_rate=_idle_sync_rate,
+        )
+        rng = random.Random(0)
+        current_time = 100.0
+        end_time = current_time + duration
+        next_arrival_time = current_time + rng.expovariate(arrival_rate)
+        arrival_times = list()
+        sync_count = 0
+        max_wait = 0.0
+        while current_time < end_time:
+            timeout = scheduler.wait_time(current_time, 1.0)
+            if current_time + timeout < next_arrival_time:
+                # the clock moves on while we wait, if only a little
+                current_time += max(timeout, 0.000001)
+            else:
+                current_time = next_arrival_time
+                arrival_times.append(current_time)
+                next_arrival_time += rng.expovariate(arrival_rate)
+            if scheduler.sync_due(len(arrival_times),
+                                  100 * len(arrival_times),
+                                  True,
+                                  current_time):
+                sync_count += 1
+                max_wait = max(max_wait, current_time - arrival_times[0])
+                scheduler.record_sync(len(arrival_times),
+                                      current_time,
+                                      current_time)
+                arrival_times = list()
+        return sync_count, max_wait
+
+    def test_moderate_arrival_rate(self):
+        """test that an idle writer does not sync on every message"""
+        sync_count, max_wait = self._run_writer(20.0, 60.0)
+        # a fixed idle interval would sync about 20 times a second
+        self.assertTrue(sync_count <= 60 * 1.5, sync_count)
+        self.assertTrue(max_wait <= _latency_budget, max_wait)
+
+    def test_idle_sync_rate(self):
+        """test that idle syncs stay near idle_sync_rate a second"""
+        for arrival_rate in [1.0, 2.0, 5.0, 10.0, ]:
+            sync_count, _ = self._run_writer(arrival_rate, 60.0)
+            self.assertTrue(sync_count <= 60 * _idle_sync_rate * 1.25,
+                            (arrival_rate, sync_count, ))
+
+    def test_low_arrival_rate(self):
+        """test that an occasional completion is synced at once"""
+        sync_count, max_wait = self._run_writer(0.2, 60.0)
+        self.assertTrue(sync_count >= 5, sync_count)
+        self.assertTrue(max_wait < _min_sync_interval, max_wait)
+
+    def test_histograms(self):
+        """test that syncs are recorded in the histograms"""
+        self._scheduler.record_sync(3, 100.0, 100.01)
+        self._scheduler.record_sync(0, 101.0, 101.01)
+        self.assertEqual(self._scheduler.sync_latency_histogram.count, 2)
+        self.assertEqual(self._scheduler.batch_size_histogram.count, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -66,6 +66,27 @@ class TestZfecSegmenter(unittest.TestCase):
         decoded_data = "".join(decoded_segments)
         self.assertTrue(decoded_data == test_data, len(decoded_data))
 
+    def test_primary_segments(self):
+        """test reassembling from the primary segments without decoding"""
+        segment_size = incoming_slice_size - 1
+        test_data = os.urandom(segment_size)
+        segmenter = ZfecSegmenter(_min_segments, _num_segments)
+
+        padding_size = segmenter.padding_size(test_data)
+        encoded_segments = segmenter.encode(block_generator(test_data))
+
+        # the segments may arrive in any order
+        test_segment_numbers = range(1, _min_segments+1)
+        random.shuffle(test_segment_numbers)
+        test_segments = [encoded_segments[n-1] for n in test_segment_numbers]
+
+        decoded_segments = segmenter.decode(
+            test_segments, test_segment_numbers, padding_size
+        )
+
+        decoded_data = "".join(decoded_segments)
+        self.assertTrue(decoded_data == test_data, len(decoded_data))
+
 if __name__ == "__main__":
     unittest.main()
 
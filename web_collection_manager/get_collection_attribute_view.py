@@ -25,36 +25,19 @@ endpoint = "get_collection_attribute"
 
 _memcached_space_accounting_template = \
     "nimbusio_space_accounting_{0}_{1}_{2}days" 
-_short_day_query = """
+# redis_stats_collector keeps collection_ops_accounting_daily current, so
+# we read one row per day instead of summing the per node, per minute history
+_day_query = """
 SELECT 
-        date_trunc('day', timestamp) as day,
-        sum(retrieve_success),
-        sum(archive_success),
-        sum(listmatch_success),
-        sum(delete_success),
-        sum(success_bytes_in),
-        sum(success_bytes_out)
-  FROM nimbusio_central.collection_ops_accounting
+        timestamp as day,
+        retrieve_success,
+        archive_success,
+        listmatch_success,
+        delete_success,
+        success_bytes_in,
+        success_bytes_out
+  FROM nimbusio_central.collection_ops_accounting_daily
  WHERE collection_id=%s
- GROUP BY day
- ORDER BY day desc
- LIMIT %s
-"""
-
-_long_day_query = """
-SELECT 
-        date_trunc('day', timestamp) as day,
-        sum(retrieve_success),
-        sum(archive_success),
-        sum(listmatch_success),
-        sum(delete_success),
-        sum(success_bytes_in),
-        sum(success_bytes_out)
-  FROM (select * from collection_ops_accounting
-        UNION ALL
-        select * from collection_ops_accounting_old) combined
- WHERE collection_id=%s
- GROUP BY day
  ORDER BY day desc
  LIMIT %s
 """
@@ -168,11 +151,8 @@ def _get_collection_space_usage(memcached_client,
     # 2012-12-10 dougfort -- for reasons I don't understand, success_bytes_in
     # and success_bytes_out emerge as type Dec. So I force them to int to
     # keep JSON happy.
-    
-    if days_of_history > _default_days_of_history:
-        cursor.execute(_long_day_query, [collection_id, days_of_history, ])
-    else:
-        cursor.execute(_short_day_query, [collection_id, days_of_history, ])
+
+    cursor.execute(_day_query, [collection_id, days_of_history, ])
 
     collection_dict = {"success" : True, "operational_stats" : list()}
     for row in map(_operational_stats_row._make, cursor.fetchall()):
@@ -12,6 +12,7 @@ from psycopg2.pool import ThreadedConnectionPool
 import memcache
 
 from tools.standard_logging import initialize_logging
+from tools.sampling_profiler import install_sampling_profiler
 from tools.database_connection import central_database_name, \
     central_database_user
 
@@ -53,6 +54,7 @@ app = Flask("web_collection_manager")
 
 if not app.debug:
     initialize_logging(_log_path)
+    install_sampling_profiler()
 
 app.logger.info("creating connection pool")
 ConnectionPoolView.connection_pool = \
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+availability_snapshot.py
+
+A Greenlet that keeps an in process snapshot of the web_monitor redis hash,
+so that routing a request does not need a round trip to redis.
+
+The snapshot is reloaded every refresh_interval seconds, and immediately when
+web_monitor publishes a change of reachability on the changes channel.
+"""
+import json
+import logging
+import time
+
+import gevent
+from gevent.greenlet import Greenlet
+from redis import RedisError
+
+_error_delay = 3.0
+
+class GreenletAvailabilitySnapshot(Greenlet):
+    """
+    redis
+        a StrictRedis connection
+
+    hash_name
+        the web_monitor redis hash: keys are "address:port", values are
+        JSON status dicts containing "reachable"
+
+    changes_channel
+        the redis pub/sub channel on which web_monitor publishes the keys
+        whose reachability has changed
+
+    refresh_interval
+        reload the whole hash at least this often
+
+    max_snapshot_age
+        if we have not been able to reload for this long, we know nothing
+    """
+    def __init__(self,
+                 redis,
+                 hash_name,
+                 changes_channel,
+                 refresh_interval,
+                 max_snapshot_age):
+        Greenlet.__init__(self)
+        self._log = logging.getLogger("AvailabilitySnapshot")
+        self._redis = redis
+        self._hash_name = hash_name
+        self._changes_channel = changes_channel
+        self._refresh_interval = refresh_interval
+        self._max_snapshot_age = max_snapshot_age
+        self._reachable = dict()
+        self._snapshot_time = 0.0
+
+    def __str__(self):
+        return "AvailabilitySnapshot"
+
+    def reachable(self, redis_key):
+        """
+        return True or False if the snapshot knows whether the service
+        at redis_key is reachable, None if it does not
+        """
+        if time.time() - self._snapshot_time > self._max_snapshot_age:
+            return None
+        return self._reachable.get(redis_key)
+
+    def refresh(self):
+        """
+        reload the snapshot from the web_monitor hash
+        """
+        values = self._redis.hgetall(self._hash_name)
+        reachable = dict()
+        for redis_key, value in values.iteritems():
+            try:
+                status = json.loads(value)
+            except Exception:
+                self._log.warn("cannot decode %s %s %r" % (
+                    self._hash_name, redis_key, value, ))
+                continue
+            reachable[redis_key] = bool(status["reachable"])
+
+        self._reachable = reachable
+        self._snapshot_time = time.time()
+
+    def _run(self):
+        while True:
+            try:
+                self._follow_changes()
+            except RedisError as err:
+                self._log.warn("redis error following %s: %s" % (
+                    self._hash_name, err, ))
+                gevent.sleep(_error_delay)
+
+    def _follow_changes(self):
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(self._changes_channel)
+            # we load after we subscribe, so we can't miss a change
+            self.refresh()
+            next_refresh_time = time.time() + self._refresh_interval
+            while True:
+                timeout = max(0.0, next_refresh_time - time.time())
+                message = pubsub.get_message(timeout=timeout)
+                if message is not None or time.time() >= next_refresh_time:
+                    if message is not None:
+                        self._log.debug("change %r" % (message["data"], ))
+                    self.refresh()
+                    next_refresh_time = time.time() + self._refresh_interval
+        finally:
+            pubsub.close()
@@ -4,20 +4,26 @@ import logging
 from collections import deque
 from hashlib import sha256
 import hmac
+import math
+import struct
 import gevent
 from gevent.event import AsyncResult
 import httplib
-from redis import StrictRedis, RedisError
+from redis import StrictRedis
 import socket
-import json
 import memcache
 import random
+import zmq.green as zmq
 
 from gdbpool.interaction_pool import DBInteractionPool
 
 from tools.LRUCache import LRUCache
 from tools.database_connection import get_central_database_dsn
 from tools.collection_lookup import CollectionLookup
+from tools.greenlet_central_cache_invalidator import \
+    GreenletCentralCacheInvalidator
+
+from web_director.availability_snapshot import GreenletAvailabilitySnapshot
 
 # LRUCache mapping names to integers is approximately 32m of memory per 100,000
 # entries
@@ -52,11 +58,26 @@ REDIS_DB = int(os.environ.get("REDIS_DB", str(0)))
 REDIS_WEB_MONITOR_HASH_NAME = "nimbus.io.web_monitor.{0}".format(
     socket.gethostname())
 REDIS_WEB_MONITOR_HASHKEY_FORMAT = "%s:%s"
+REDIS_WEB_MONITOR_CHANGES_CHANNEL = "{0}.changes".format(
+    REDIS_WEB_MONITOR_HASH_NAME)
+AVAILABILITY_REFRESH_INTERVAL = float(os.environ.get(
+    "NIMBUSIO_WEB_DIRECTOR_AVAILABILITY_REFRESH_INTERVAL", "5.0"))
+AVAILABILITY_MAX_SNAPSHOT_AGE = float(os.environ.get(
+    "NIMBUSIO_WEB_DIRECTOR_AVAILABILITY_MAX_SNAPSHOT_AGE", "30.0"))
+
+# relative weights for rendezvous hashing, "host:weight host:weight ..."
+# hosts that are not listed have weight 1.0
+HOST_WEIGHTS = dict([
+    (entry.rsplit(":", 1)[0], float(entry.rsplit(":", 1)[1]), )
+    for entry in os.environ.get("NIMBUSIO_WEB_DIRECTOR_HOST_WEIGHTS", 
+                                "").split()])
 
 MEMCACHED_HOST = os.environ.get("NIMBUSIO_MEMCACHED_HOST", "localhost")
 MEMCACHED_PORT = int(os.environ.get("NIMBUSIO_MEMCACHED_PORT", "11211"))
 MEMCACHED_NODES = ["{0}:{1}".format(MEMCACHED_HOST, MEMCACHED_PORT), ]
 
+NIMBUSIO_CENTRAL_SKEETER_URI = os.environ.get("NIMBUSIO_CENTRAL_SKEETER_URI")
+
 
 class Router(object):
     """
@@ -76,6 +97,9 @@ class Router(object):
             deque(NIMBUSIO_MANAGEMENT_API_REQUEST_DEST.strip().split())
         self.memcached_client = None
         self.collection_lookup = None
+        self.zeromq_context = None
+        self.cache_invalidator = None
+        self.availability_snapshot = None
         self.request_counter = 0
         self.path_hash_base = hmac.new(
             key = NIMBUSIO_URL_DEST_HASH_KEY,
@@ -100,14 +124,57 @@ class Router(object):
                                  port = REDIS_PORT,
                                  db = REDIS_DB)
 
+        self.availability_snapshot = GreenletAvailabilitySnapshot(
+            self.redis,
+            REDIS_WEB_MONITOR_HASH_NAME,
+            REDIS_WEB_MONITOR_CHANGES_CHANNEL,
+            AVAILABILITY_REFRESH_INTERVAL,
+            AVAILABILITY_MAX_SNAPSHOT_AGE)
+        self.availability_snapshot.link_exception(
+            self._unhandled_greenlet_exception)
+        self.availability_snapshot.start()
+
         self.memcached_client = memcache.Client(MEMCACHED_NODES)
 
         self.collection_lookup = CollectionLookup(self.memcached_client,
                                                   self.central_conn_pool)
 
+        if NIMBUSIO_CENTRAL_SKEETER_URI is not None:
+            self.zeromq_context = zmq.Context()
+            self.cache_invalidator = GreenletCentralCacheInvalidator(
+                self.zeromq_context, NIMBUSIO_CENTRAL_SKEETER_URI)
+            self.cache_invalidator.link_exception(
+                self._unhandled_greenlet_exception)
+            self.cache_invalidator.start()
+
         log.info("init complete")
         self.init_complete.set(True)
 
+    def close(self):
+        """
+        stop the greenlets started by init
+        """
+        log = logging.getLogger("close")
+        log.info("close start")
+        if self.cache_invalidator is not None:
+            self.cache_invalidator.kill()
+            self.cache_invalidator.join()
+            self.cache_invalidator = None
+        if self.zeromq_context is not None:
+            self.zeromq_context.term()
+            self.zeromq_context = None
+        if self.availability_snapshot is not None:
+            self.availability_snapshot.kill()
+            self.availability_snapshot = None
+        log.info("close complete")
+
+    def _unhandled_greenlet_exception(self, greenlet_object):
+        log = logging.getLogger("unhandled_greenlet_exception")
+        try:
+            greenlet_object.get()
+        except Exception:
+            log.exception(str(greenlet_object))
+
     def _parse_collection(self, hostname):
         "return the Nimbus.io collection name from host name"
         offset = -1 * ( len(self.service_domain) + 1 )
@@ -171,30 +238,15 @@ class Router(object):
         redis_keys = [ REDIS_WEB_MONITOR_HASHKEY_FORMAT % (a, dest_port, )
                        for a in addresses ]
 
-        try:
-            redis_values = self.redis.hmget(REDIS_WEB_MONITOR_HASH_NAME,
-                                            redis_keys)
-        except RedisError as err:
-            log.warn("redis error querying availability for %s: %s, %r"
-                % ( REDIS_WEB_MONITOR_HASH_NAME, err, redis_keys, ))
-            # just consider everything available. it's the best we can do.
-            available.update(hosts)
-            return available
-
+        # the snapshot is kept up to date by a background greenlet,
+        # so there is no round trip to redis here
         unknown = []
-        for idx, val in enumerate(redis_values):
-            if val is None:
-                unknown.append((hosts[idx], redis_keys[idx], ))
-                continue
-            try:
-                status = json.loads(val)
-            except Exception, err:
-                log.warn("cannot decode %s %s %s %r" % ( 
-                    REDIS_WEB_MONITOR_HASH_NAME, hosts[idx], 
-                    redis_keys[idx], val, ))
-            else:
-                if status["reachable"]:
-                    available.add(hosts[idx])
+        for host, redis_key in zip(hosts, redis_keys):
+            reachable = self.availability_snapshot.reachable(redis_key)
+            if reachable is None:
+                unknown.append((host, redis_key, ))
+            elif reachable:
+                available.add(host)
             
         if unknown:
             log.warn("no availability info in redis for hkeys: %s %r" % 
@@ -216,51 +268,41 @@ class Router(object):
         return { 'close': 'HTTP/1.0 %d %s\r\n\r\n%s' % ( 
                   code, http_error_str, reason, ) }
 
-    def consistent_hash_dest(self, hosts, availability, collection, path,
-                             prefix=None, recur=0):
+    def consistent_hash_dest(self, hosts, availability, collection, path):
         """
-        Pick an available host in a semi-stable way based on collection + path
+        Pick an available host in a stable way based on collection + path
         hashing, despite hosts becoming available an unavailable dynamically.
 
+        Uses weighted rendezvous (highest random weight) hashing: every 
+        available host gets a score from a hash of collection + path + host,
+        and the highest score wins. When a host becomes unavailable, only the
+        paths it was winning move, and they come back when it returns.
+
         Uses HMAC with key contained in the file pointed to by env
         NIMBUSIO_URL_DEST_HASH_KEY or a random key if that file is unspecified.
 
         Returns a host.
         """
-        log = logging.getLogger("consistent_hash_dest")
-
         pathhash = self.path_hash_base.copy()
-        if prefix is not None:
-            pathhash.update(prefix)
         pathhash.update(unicode(collection).encode('utf_8'))
         pathhash.update(unicode(path).encode('utf_8'))
-        hexresult = pathhash.hexdigest()
-        intresult = int(hexresult, 16)
-        target_host_idx = intresult % len(hosts)
-        target_host = hosts[target_host_idx]
-
-        if target_host in availability:
-            return target_host
-
-        # since our target host is not available, we want to pick a new one.
-        # but we want to do this in a way that is somewhat stable.  we could
-        # easily just make buckets for each of the available hosts, but then
-        # the destination would change every time ANY host changes
-        # availability.
-
-        # recurse, modifying our hash, until we hit an available host.
-        if prefix is None:
-            prefix = target_host + str(recur)
-        else:
-            prefix += target_host + str(recur)
-
-        if recur == 25:
-            log.warn(
-                "excessive hashing with %d hosts available" %
-                    ( len(availability), ))
 
-        return self.consistent_hash_dest(hosts, availability, collection, 
-            path, prefix, recur+1)
+        target_host = None
+        target_score = None
+        for host in hosts:
+            if host not in availability:
+                continue
+            hosthash = pathhash.copy()
+            hosthash.update(host)
+            # a uniform value in (0, 1) from the top 53 bits of the hash
+            value, = struct.unpack(">Q", hosthash.digest()[:8])
+            uniform = ((value >> 11) + 0.5) / (2.0 ** 53)
+            score = -HOST_WEIGHTS.get(host, 1.0) / math.log(uniform)
+            if target_score is None or score > target_score:
+                target_host = host
+                target_score = score
+
+        return target_host
 
     def route(self, hostname, method, path, _query_string, start=None):
         """
@@ -341,6 +383,7 @@ class Router(object):
         else:
             routing_method = 'round_robin'
             while True:
+                self.round_robin_dispatch_counter += 1
                 hosts_idx = self.round_robin_dispatch_counter % len(hosts)
                 target = hosts[hosts_idx]
                 if target in availability:
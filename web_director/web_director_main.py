@@ -20,6 +20,7 @@ does not implement several of the needed capabilities including:
       cluster.)
 """
 
+import atexit
 import uuid
 import gevent
 import re
@@ -35,6 +36,7 @@ import os
 from http_parser.parser import HttpParser
 
 from tools.standard_logging import initialize_logging
+from tools.sampling_profiler import install_sampling_profiler
 
 from web_director.router import Router
 
@@ -172,11 +174,14 @@ def rewrite_request(req):
 
 def init_setup():
     initialize_logging(LOG_PATH)
+    install_sampling_profiler()
     log = logging.getLogger("init_setup")
     log.info("setup start")
     global _ROUTER
     _ROUTER = Router()
     gevent.spawn_later(0.0, _ROUTER.init)
+    # stop the router's greenlets when the proxy worker exits
+    atexit.register(_ROUTER.close)
     log.info("setup complete")
 
 init_setup()
@@ -29,9 +29,11 @@ from tools.data_definitions import create_timestamp, \
 
 from tools.zfec_segmenter import ZfecSegmenter
 from tools.iter_exception_logger import iter_exception_logger
+from tools.request_tracer import RequestTracer
 
 from web_public_reader.retriever import memcached_key_template
 
+from web_internal_reader.boundary_block_cache import BoundaryBlockCache
 from web_internal_reader.exceptions import RetrieveFailedError
 from web_internal_reader.retriever import Retriever
 from web_internal_reader.url_discriminator import parse_url, \
@@ -46,6 +48,8 @@ _nimbusio_node_name = os.environ['NIMBUSIO_NODE_NAME']
 _min_connected_clients = 8
 _min_segments = 8
 _max_segments = 10
+_boundary_block_cache_size = int(os.environ.get(
+    "NIMBUSIO_WEB_INTERNAL_READER_BOUNDARY_BLOCK_CACHE_SIZE", "1024"))
 
 _range_re = re.compile("^bytes=(?P<lower_bound>\d+)-(?P<upper_bound>\d*)$")
 
@@ -99,7 +103,8 @@ class Application(object):
         data_readers,
         accounting_client,
         event_push_client,
-        stats
+        stats,
+        slice_cache=None
     ):
         self._log = logging.getLogger("Application")
         self._memcached_client = memcached_client
@@ -110,13 +115,22 @@ class Application(object):
         self.accounting_client = accounting_client
         self._event_push_client = event_push_client
         self._stats = stats
-
+        self._slice_cache = slice_cache
+        # the first and last blocks of recent retrieves, which are likely
+        # to be needed again by clients reading sequential ranges
+        self._boundary_block_cache = \
+            BoundaryBlockCache(_boundary_block_cache_size)
+        self._tracer = RequestTracer(event_push_client)
 
         self._dispatch_table = {
             action_respond_to_ping      : self._respond_to_ping,
             action_retrieve_key         : self._retrieve_key,
         }
 
+    @property
+    def tracer(self):
+        return self._tracer
+
     @wsgify
     def __call__(self, req):
 
@@ -183,6 +197,41 @@ class Application(object):
             where unified_id = %s and conjoined_part = %s
             limit 1""", [unified_id, conjoined_part, ])
 
+    def _get_cached_blocks(self, 
+                           unified_id, 
+                           conjoined_part, 
+                           block_offset, 
+                           block_count):
+        """
+        return (blocks, end_of_object) for the leading blocks of the 
+        request that are in the slice cache
+        """
+        slice_blocks = self._slice_cache.slice_blocks
+        blocks = list()
+        block_index = block_offset
+        while block_count is None or len(blocks) < block_count:
+            slice_index, block_remainder = divmod(block_index, slice_blocks)
+            cached_slice = self._slice_cache.get(unified_id,
+                                                 conjoined_part,
+                                                 slice_index)
+            if cached_slice is None:
+                break
+            data, is_last_slice = cached_slice
+
+            slice_data_blocks = [data[i:i+block_size] \
+                                 for i in range(0, len(data), block_size)]
+            new_blocks = slice_data_blocks[block_remainder:]
+            if block_count is not None:
+                new_blocks = new_blocks[:block_count-len(blocks)]
+            blocks.extend(new_blocks)
+            block_index += len(new_blocks)
+
+            if is_last_slice and \
+            block_remainder + len(new_blocks) >= len(slice_data_blocks):
+                return blocks, True
+
+        return blocks, False
+
     def _retrieve_key(self, req, match_object, user_request_id):
         unified_id = int(match_object.group("unified_id"))
         conjoined_part = int(match_object.group("conjoined_part"))
@@ -203,13 +252,16 @@ class Application(object):
             total_file_size = \
                 int(req.headers["x-nimbus-io-expected-content-length"])
 
-        assert slice_offset % block_size == 0, slice_offset
-        block_offset = slice_offset / block_size
+        # we retrieve whole blocks, and trim them to the byte range
+        # before sending
+        block_offset, offset_into_first_block = divmod(slice_offset, 
+                                                       block_size)
         if slice_size is None:
             block_count = None
         else:
-            assert slice_size % block_size == 0, slice_size
-            block_count = slice_size / block_size
+            end_block = (slice_offset + slice_size + block_size - 1) // \
+                block_size
+            block_count = end_block - block_offset
 
         connected_data_readers = _connected_clients(self.data_readers)
 
@@ -246,51 +298,174 @@ class Application(object):
         start_time = time.time()
         self._stats["retrieves"] += 1
 
-        retriever = Retriever(
-            self._node_local_connection,
-            self.data_readers,
-            collection_id,
-            key,
-            unified_id,
-            conjoined_part,
-            block_offset,
-            block_count,
-            _min_segments,
-            user_request_id
-        )
-
-        retrieved = retriever.retrieve(_reply_timeout)
+        # serve whatever leading blocks we can from the slice cache
+        # and the boundary block cache, and retrieve the rest
+        cached_blocks = list()
+        end_of_object = False
+        if self._slice_cache is not None:
+            cached_blocks, end_of_object = self._get_cached_blocks(
+                unified_id, conjoined_part, block_offset, block_count
+            )
 
-        try:
-            first_segments = retrieved.next()
-        except RetrieveFailedError, instance:
-            self._log.error("retrieve failed: {0} {1}".format(
-                description, instance
-            ))
-            self._stats["retrieves"] -= 1
-            return exc.HTTPNotFound(str(instance))
+        if not end_of_object:
+            if block_count is None:
+                remaining_block_count = None
+            else:
+                remaining_block_count = block_count - len(cached_blocks)
+            boundary_blocks, end_of_object = \
+                self._boundary_block_cache.leading_blocks(
+                    unified_id, 
+                    conjoined_part, 
+                    block_offset+len(cached_blocks), 
+                    remaining_block_count
+                )
+            cached_blocks.extend(boundary_blocks)
+
+        # an open ended range tells us where the object ends: never
+        # retrieve past the last block
+        if block_count is None and total_file_size is not None:
+            total_block_count = \
+                (slice_offset + total_file_size + block_size - 1) // \
+                block_size
+            if block_offset + len(cached_blocks) >= total_block_count:
+                end_of_object = True
+
+        next_block_offset = block_offset + len(cached_blocks)
+        discard_block_count = 0
+        retrieve_block_offset = next_block_offset
+        retrieve_block_count = block_count
+        trailing_block = None
+        if end_of_object or \
+        (block_count is not None and len(cached_blocks) == block_count):
+            self._log.debug("request {0} all {1} blocks from cache".format(
+                user_request_id, len(cached_blocks)))
+            retrieved = None
+            first_segments = None
+        else:
+            if self._slice_cache is not None:
+                # start the retrieve at a slice boundary, so that the first
+                # slice can be cached; unless that would more than double 
+                # the retrieve
+                discard_block_count = \
+                    next_block_offset % self._slice_cache.slice_blocks
+                if block_count is not None and discard_block_count > \
+                    block_offset + block_count - next_block_offset:
+                    discard_block_count = 0
+                retrieve_block_offset -= discard_block_count
+            if block_count is not None:
+                retrieve_block_count = \
+                    block_offset + block_count - retrieve_block_offset
+                if retrieve_block_count - discard_block_count > 1:
+                    cached_block = self._boundary_block_cache.get(
+                        unified_id, 
+                        conjoined_part, 
+                        block_offset+block_count-1
+                    )
+                    if cached_block is not None:
+                        trailing_block, _ = cached_block
+                        retrieve_block_count -= 1
 
-        def app_iterator(response):
-            segmenter = ZfecSegmenter( _min_segments, _max_segments)
-            sent = 0
-            try:
-                for segments in chain([first_segments], retrieved):
-                    segment_numbers = segments.keys()
-                    encoded_segments = list()
-                    zfec_padding_size = None
+            retriever = Retriever(
+                self._node_local_connection,
+                self.data_readers,
+                collection_id,
+                key,
+                unified_id,
+                conjoined_part,
+                retrieve_block_offset,
+                retrieve_block_count,
+                _min_segments,
+                user_request_id
+            )
 
-                    for segment_number in segment_numbers:
-                        encoded_segment, zfec_padding_size = \
-                                segments[segment_number]
-                        encoded_segments.append(encoded_segment)
+            retrieved = retriever.retrieve(_reply_timeout)
 
+            try:
+                with self._tracer.span(user_request_id, 
+                                       "web-internal-reader-first-sequence"):
+                    first_segments = retrieved.next()
+            except RetrieveFailedError, instance:
+                self._log.error("retrieve failed: {0} {1}".format(
+                    description, instance
+                ))
+                self._stats["retrieves"] -= 1
+                return exc.HTTPNotFound(str(instance))
+
+        def _retrieve_blocks():
+            if self._slice_cache is None:
+                collector = None
+            else:
+                collector = self._slice_cache.collector(
+                    unified_id, conjoined_part, retrieve_block_offset
+                )
+            segmenter = ZfecSegmenter( _min_segments, _max_segments)
+            block_index = retrieve_block_offset
+            data = None
+            for segments in chain([first_segments], retrieved):
+                segment_numbers = segments.keys()
+                encoded_segments = list()
+                zfec_padding_size = None
+
+                for segment_number in segment_numbers:
+                    encoded_segment, zfec_padding_size = \
+                            segments[segment_number]
+                    encoded_segments.append(encoded_segment)
+
+                with self._tracer.span(user_request_id, 
+                                       "web-internal-reader-zfec-decode"):
                     data_list = segmenter.decode(
                         encoded_segments,
                         segment_numbers,
                         zfec_padding_size
                     )
 
-                    for data in data_list:
+                for data in data_list:
+                    if collector is not None:
+                        collector.add(data)
+                    if block_index == next_block_offset:
+                        self._boundary_block_cache.put(
+                            unified_id, conjoined_part, block_index, data, False
+                        )
+                    if block_index >= next_block_offset:
+                        yield data
+                    block_index += 1
+
+            # the last block we retrieved is the first block
+            # of the next sequential range
+            if data is not None:
+                self._boundary_block_cache.put(
+                    unified_id, 
+                    conjoined_part, 
+                    block_index-1, 
+                    data, 
+                    retrieve_block_count is None
+                )
+
+            if collector is not None:
+                collector.finish(retrieve_block_count is None)
+
+        def _generate_blocks():
+            for data in cached_blocks:
+                yield data
+            if retrieved is not None:
+                for data in _retrieve_blocks():
+                    yield data
+            if trailing_block is not None:
+                yield trailing_block
+
+        def app_iterator(response):
+            sent = 0
+            skip_size = offset_into_first_block
+            remaining_size = slice_size
+            try:
+                for data in _generate_blocks():
+                    if skip_size > 0:
+                        data = data[skip_size:]
+                        skip_size = 0
+                    if remaining_size is not None:
+                        data = data[:remaining_size]
+                        remaining_size -= len(data)
+                    if len(data) > 0:
                         yield data
                         sent += len(data)
 
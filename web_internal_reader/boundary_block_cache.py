@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+boundary_block_cache.py
+
+class BoundaryBlockCache
+
+a small LRU of the decoded first and last blocks of recent retrieves,
+which are likely to be needed again by clients reading sequential ranges.
+
+Each block is cached with a flag telling whether it is the last block of
+the object. We can't tell that from the size of the block: the last block
+of an object whose size is a multiple of block_size is a full block.
+"""
+from tools.data_definitions import block_size
+from tools.LRUCache import LRUCache
+
+class BoundaryBlockCache(object):
+    """
+    decoded blocks keyed by (unified_id, conjoined_part, block_index)
+    """
+    def __init__(self, max_blocks):
+        self._cache = LRUCache(max_blocks)
+
+    def get(self, unified_id, conjoined_part, block_index):
+        """
+        return (data, is_last_block) or None
+        """
+        return self._cache.get((unified_id, conjoined_part, block_index, ))
+
+    def put(self, unified_id, conjoined_part, block_index, data, is_last_block):
+        """
+        cache one decoded block. A short block is always the last block,
+        and we don't forget that a block is the last one when it is
+        retrieved again by a range that doesn't reach the end
+        """
+        key = (unified_id, conjoined_part, block_index, )
+        cached_block = self._cache.get(key)
+        is_last_block = is_last_block or \
+                        len(data) < block_size or \
+                        (cached_block is not None and cached_block[1])
+        self._cache[key] = (data, is_last_block, )
+
+    def leading_blocks(self,
+                       unified_id,
+                       conjoined_part,
+                       block_offset,
+                       block_count):
+        """
+        return (blocks, end_of_object) for the consecutive blocks starting
+        at block_offset that are in the cache, up to block_count blocks
+        (or to the end of the object if block_count is None)
+        """
+        blocks = list()
+        while block_count is None or len(blocks) < block_count:
+            cached_block = self.get(unified_id,
+                                    conjoined_part,
+                                    block_offset+len(blocks))
+            if cached_block is None:
+                break
+            data, is_last_block = cached_block
+            blocks.append(data)
+            if is_last_block:
+                return blocks, True
+
+        return blocks, False
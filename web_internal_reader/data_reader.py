@@ -10,12 +10,16 @@ import logging
 
 from tools.greenlet_resilient_client import ResilientClientError
 
+from web_internal_reader.node_latency_tracker import NodeLatencyTracker
+
 class DataReader(object):
 
-    def __init__(self, node_name, resilient_client):
+    def __init__(self, node_name, resilient_client, event_push_client=None):
         self._log = logging.getLogger("DataReader-%s" % (node_name, ))
         self._node_name = node_name
         self._resilient_client = resilient_client
+        self._latency_tracker = NodeLatencyTracker(node_name, 
+                                                   event_push_client)
 
     @property
     def connected(self):
@@ -25,6 +29,10 @@ class DataReader(object):
     def node_name(self):
         return self._node_name
 
+    @property
+    def latency_tracker(self):
+        return self._latency_tracker
+
     def retrieve_key_start(self, 
                            retrieve_id,
                            sequence,
@@ -161,3 +169,22 @@ class DataReader(object):
             return None
 
         return data, reply["zfec-padding-size"], reply["completed"]
+
+    def retrieve_key_cancel(self, retrieve_id, segment_num, user_request_id):
+        """
+        tell the node to drop the work it has queued for this retrieve:
+        we have moved on without it. There is no reply.
+        """
+        message = {
+            "message-type"      : "retrieve-key-cancel",
+            "user-request-id"   : user_request_id,
+            "retrieve-id"       : retrieve_id,
+            "segment-num"       : segment_num,
+        }
+        if not self._resilient_client.connected:
+            return
+
+        self._log.debug("request: {user-request-id} " \
+                        "{message-type}: {retrieve-id} {segment-num}".format(
+                        **message))
+        self._resilient_client.queue_message_for_broadcast(message)
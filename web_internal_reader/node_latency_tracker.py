@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+node_latency_tracker.py
+
+class NodeLatencyTracker
+
+track the reply latency and error rate of one data reader node, as
+exponentially weighted moving averages (EWMA) and as a LatencyHistogram
+which is reported through the EventPushClient.
+
+The Retriever uses these to send requests to the fastest nodes first, and to
+decide how long to wait for a reply before hedging with a request to another
+node. Since a slow or failing node stops getting requests, its averages are
+forgotten after a while, so that it gets another chance.
+"""
+import os
+import time
+
+from tools.latency_histogram import LatencyHistogram
+
+_ewma_alpha = float(os.environ.get("NIMBUSIO_NODE_LATENCY_EWMA_ALPHA", "0.2"))
+_hedge_percentile = float(
+    os.environ.get("NIMBUSIO_HEDGE_PERCENTILE", "0.95"))
+_min_hedge_deadline = float(
+    os.environ.get("NIMBUSIO_MIN_HEDGE_DEADLINE", "0.05"))
+_max_hedge_deadline = float(
+    os.environ.get("NIMBUSIO_MAX_HEDGE_DEADLINE", "1.0"))
+# a node whose error rate is over this is only used if we run out of others
+_max_error_rate = float(os.environ.get("NIMBUSIO_NODE_MAX_ERROR_RATE", "0.5"))
+# we forget the averages of a node we have not heard from for this long
+_max_sample_age = float(os.environ.get("NIMBUSIO_NODE_MAX_SAMPLE_AGE", "30.0"))
+
+# we use the histogram percentile once it has this many values; until then
+# we estimate the deadline from the EWMA latency and deviation
+_min_histogram_count = 20
+_deviation_factor = 4.0
+
+class NodeLatencyTracker(object):
+    """
+    node_name
+        the data reader node we are tracking
+
+    event_push_client
+        if not None, the latency histogram is reported periodically
+    """
+    def __init__(self, node_name, event_push_client=None):
+        self._node_name = node_name
+        self._latency = None
+        self._deviation = 0.0
+        self._error_rate = 0.0
+        self._last_sample_time = 0.0
+        self._histogram = LatencyHistogram(
+            "data-reader-{0}".format(node_name), event_push_client
+        )
+
+    def __str__(self):
+        return "NodeLatencyTracker-{0}".format(self._node_name)
+
+    @property
+    def latency_histogram(self):
+        return self._histogram
+
+    @property
+    def error_rate(self):
+        return self._error_rate
+
+    @property
+    def degraded(self):
+        self._forget_stale_samples()
+        return self._error_rate > _max_error_rate
+
+    @property
+    def expected_latency(self):
+        """
+        the EWMA latency, penalized for errors; 0.0 for a node we have
+        not heard from, so that it gets tried
+        """
+        self._forget_stale_samples()
+        if self._latency is None:
+            return 0.0
+        return self._latency / (1.0 - min(self._error_rate, 0.9))
+
+    def _forget_stale_samples(self):
+        if self._latency is not None and \
+            time.time() - self._last_sample_time > _max_sample_age:
+            self._latency = None
+            self._deviation = 0.0
+            self._error_rate = 0.0
+
+    def _update_latency(self, elapsed_seconds):
+        self._last_sample_time = time.time()
+        if self._latency is None:
+            self._latency = elapsed_seconds
+            return
+        error = elapsed_seconds - self._latency
+        self._latency += _ewma_alpha * error
+        self._deviation += _ewma_alpha * (abs(error) - self._deviation)
+
+    def record_reply(self, elapsed_seconds):
+        """
+        the node replied successfully
+        """
+        self._update_latency(elapsed_seconds)
+        self._error_rate -= _ewma_alpha * self._error_rate
+        self._histogram.record(elapsed_seconds)
+
+    def record_failure(self, elapsed_seconds):
+        """
+        the node replied with an error, or invalid data
+        """
+        self._update_latency(elapsed_seconds)
+        self._error_rate += _ewma_alpha * (1.0 - self._error_rate)
+
+    def record_abandoned(self, elapsed_seconds):
+        """
+        we stopped waiting for the node, because others replied first.
+        we only know that the reply would have taken at least this long.
+        """
+        if self._latency is None or elapsed_seconds > self._latency:
+            self._update_latency(elapsed_seconds)
+
+    def hedge_deadline(self):
+        """
+        return the time to wait for a reply from this node before sending
+        a hedged request to another node
+        """
+        self._forget_stale_samples()
+        if self._histogram.count >= _min_histogram_count:
+            deadline = self._histogram.percentile(_hedge_percentile)
+        elif self._latency is not None:
+            deadline = self._latency + _deviation_factor * self._deviation
+        else:
+            deadline = _max_hedge_deadline
+        return min(max(deadline, _min_hedge_deadline), _max_hedge_deadline)
@@ -3,8 +3,23 @@
 retriever.py
 
 A class that retrieves data from data readers.
+
+We send requests to segments_needed nodes: by default the primary segments
+(1..segments_needed), which the caller can join without zfec decoding,
+otherwise the nodes with the lowest expected latency. Nodes with a high error
+rate, or whose expected latency is over the hedge deadline, go last.
+When a request fails, or a reply takes longer than the hedge deadline, we
+send a hedged request to the next best node. The hedge deadline is the median
+of the per node deadlines (see NodeLatencyTracker), so that one slow node
+does not set it.
+
+When we have enough replies, or a node fails, or the caller stops early, we
+send retrieve-key-cancel to the nodes whose requests are still running, so
+they stop reading segments that nobody will use. Those nodes sit out the
+following sequences.
 """
 import logging
+import os
 import time
 import uuid
 
@@ -17,6 +32,8 @@ from web_internal_reader.exceptions import RetrieveFailedError
 # 2012-06-13 dougfort - we don't want to block too long here
 # because if a node is down, we will block a lot
 _task_timeout = 1.0
+_primary_segments_first = bool(int(
+    os.environ.get("NIMBUSIO_READ_PRIMARY_SEGMENTS_FIRST", "1")))
 
 class Retriever(object):
     """Retrieves data from data readers."""
@@ -31,9 +48,12 @@ class Retriever(object):
         block_offset,
         block_count,
         segments_needed,
-        user_request_id
+        user_request_id,
+        primary_segments_first=_primary_segments_first
     ):
         self._log = logging.getLogger("Retriever")
+        # checked once: these debug lines are for every sequence and task
+        self._debug_enabled = self._log.isEnabledFor(logging.DEBUG)
         self._log.info("request {0} {1}, {2}, {3}, {4}, {5} {6}".format(
             user_request_id,
             collection_id, 
@@ -56,6 +76,10 @@ class Retriever(object):
         self._pending = gevent.pool.Group()
         self._finished_tasks = gevent.queue.Queue()
         self._sequence = 0
+        self._primary_segments_first = primary_segments_first
+        self._spawned_task_count = 0
+        self._started_segment_numbers = set()
+        self._sequence_segment_numbers = set()
 
     def _unhandled_greenlet_exception(self, greenlet_object):
         self._log.error("request {0}: " \
@@ -67,97 +91,257 @@ class Retriever(object):
                 
     def _done_link(self, task):
         if task.sequence != self._sequence:
-            self._log.debug("request {0} _done_link ignore task {1} seq {2} expect {3}".format(
-                self._user_request_id,
-                task.data_reader.node_name,
-                task.sequence,
-                self._sequence
-            ))
+            if self._debug_enabled:
+                self._log.debug("request {0} _done_link ignore task {1} seq {2} expect {3}".format(
+                    self._user_request_id,
+                    task.data_reader.node_name,
+                    task.sequence,
+                    self._sequence
+                ))
         else:
             self._finished_tasks.put(task, block=True)
 
     def retrieve(self, timeout):
         retrieve_id = uuid.uuid1().hex
 
+        completed = False
+        try:
+            for result_dict in self._retrieve_sequences(timeout,
+                                                        retrieve_id):
+                yield result_dict
+            completed = True
+        finally:
+            # if we failed, or our caller has stopped, the nodes we started
+            # still hold the rest of the retrieve
+            if not completed:
+                for segment_number in sorted(self._started_segment_numbers):
+                    self._cancel(retrieve_id, segment_number)
+
+    def _retrieve_sequences(self, timeout, retrieve_id):
         # spawn retrieve_key start, then spawn retrieve key next
         # until we are done
-        start = True
+        blocks_retrieved = 0
         while True:
             self._sequence += 1
-            self._log.debug("request {0} retrieve: {1} {2} {3} {4}".format(
-                self._user_request_id,
-                self._sequence, 
-                self._unified_id, 
-                self._conjoined_part,
-                retrieve_id
-            ))
-            # send a request to all node
-            for i, data_reader in enumerate(self._data_readers):
-                if not data_reader.connected:
-                    self._log.warn("request {0} ignoring disconnected reader {1}".format(
-                        self._user_request_id, str(data_reader),
-                    ))
-                    continue
+            if self._debug_enabled:
+                self._log.debug("request {0} retrieve: {1} {2} {3} {4}".format(
+                    self._user_request_id,
+                    self._sequence, 
+                    self._unified_id, 
+                    self._conjoined_part,
+                    retrieve_id
+                ))
+            self._spawned_task_count = 0
+            self._sequence_segment_numbers = set()
 
-                segment_number = i + 1
-                if start:
-                    task = self._pending.spawn(
-                        data_reader.retrieve_key_start,
-                        retrieve_id,
-                        self._sequence,
-                        self._collection_id,
-                        self._key,
-                        self._unified_id,
-                        self._conjoined_part,
-                        segment_number,
-                        self._block_offset,
-                        self._block_count,
-                        self._user_request_id,
-                    )
-                else:
-                    task = self._pending.spawn(
-                        data_reader.retrieve_key_next,
-                        retrieve_id,
-                        self._sequence,
-                        self._collection_id,
-                        self._key,
-                        self._unified_id,
-                        self._conjoined_part,
-                        segment_number,
-                        self._block_offset,
-                        self._block_count,
-                        self._user_request_id
-                    )
-                task.link(self._done_link)
-                task.link_exception(self._unhandled_greenlet_exception)
-                task.segment_number = segment_number
-                task.data_reader = data_reader
-                task.sequence = self._sequence
+            # every node we have started must get every sequence, so that
+            # it stays in step with the others
+            if len(self._started_segment_numbers) > 0:
+                segment_numbers = sorted(self._started_segment_numbers)
+            else:
+                segment_numbers = \
+                    self._rank_segment_numbers()[:self._segments_needed]
+
+            for segment_number in segment_numbers:
+                self._spawn_task(retrieve_id, segment_number, blocks_retrieved)
 
             # wait for, and process, replies from the nodes
-            result_dict, completed = self._process_node_replies(timeout)
-            self._log.debug("request {0} retrieve: completed sequence {1}".format(
-                self._user_request_id, self._sequence,
-            ))
+            result_dict, completed = \
+                self._process_node_replies(timeout, 
+                                           retrieve_id, 
+                                           blocks_retrieved)
+            if self._debug_enabled:
+                self._log.debug("request {0} retrieve: completed sequence {1}".format(
+                    self._user_request_id, self._sequence,
+                ))
 
             yield result_dict
             if completed:
                 break
 
-            start = False
+            data_segment, _ = result_dict.values()[0]
+            blocks_retrieved += len(data_segment)
+
+    def _hedge_deadline(self):
+        """
+        return the time to wait for a reply before sending a hedged request
+        """
+        deadlines = sorted([data_reader.latency_tracker.hedge_deadline() \
+                            for data_reader in self._data_readers])
+        return deadlines[len(deadlines) // 2]
+
+    def _rank_segment_numbers(self):
+        """
+        return the segment numbers of the connected data readers, best first
+        """
+        hedge_deadline = self._hedge_deadline()
+        def _rank_key(segment_number):
+            tracker = self._data_readers[segment_number-1].latency_tracker
+            preferred = self._primary_segments_first and \
+                segment_number <= self._segments_needed
+            return (tracker.degraded or \
+                        tracker.expected_latency > hedge_deadline, 
+                    not preferred, 
+                    tracker.expected_latency, 
+                    segment_number, )
+
+        segment_numbers = list()
+        for i, data_reader in enumerate(self._data_readers):
+            if not data_reader.connected:
+                self._log.warn("request {0} ignoring disconnected reader {1}".format(
+                    self._user_request_id, str(data_reader),
+                ))
+                continue
+            segment_numbers.append(i+1)
+
+        return sorted(segment_numbers, key=_rank_key)
+
+    def _spawn_task(self, retrieve_id, segment_number, blocks_retrieved):
+        """
+        spawn a request for segment_number in the current sequence
+        return True if the request was sent
+        """
+        data_reader = self._data_readers[segment_number-1]
+        if not data_reader.connected:
+            self._log.warn("request {0} ignoring disconnected reader {1}".format(
+                self._user_request_id, str(data_reader),
+            ))
+            self._started_segment_numbers.discard(segment_number)
+            return False
+
+        if segment_number in self._started_segment_numbers:
+            task = self._pending.spawn(
+                data_reader.retrieve_key_next,
+                retrieve_id,
+                self._sequence,
+                self._collection_id,
+                self._key,
+                self._unified_id,
+                self._conjoined_part,
+                segment_number,
+                self._block_offset,
+                self._block_count,
+                self._user_request_id
+            )
+        else:
+            # a node that joins after the first sequence starts
+            # at the first block we have not yet retrieved
+            if self._block_count is None:
+                block_count = None
+            else:
+                block_count = self._block_count - blocks_retrieved
+            task = self._pending.spawn(
+                data_reader.retrieve_key_start,
+                retrieve_id,
+                self._sequence,
+                self._collection_id,
+                self._key,
+                self._unified_id,
+                self._conjoined_part,
+                segment_number,
+                self._block_offset + blocks_retrieved,
+                block_count,
+                self._user_request_id,
+            )
+            self._started_segment_numbers.add(segment_number)
+        task.link(self._done_link)
+        task.link_exception(self._unhandled_greenlet_exception)
+        task.segment_number = segment_number
+        task.data_reader = data_reader
+        task.sequence = self._sequence
+        task.start_time = time.time()
+        self._sequence_segment_numbers.add(segment_number)
+        self._spawned_task_count += 1
+        return True
+
+    def _hedge(self, retrieve_id, blocks_retrieved):
+        """
+        send a request to the best node we have not yet asked
+        in this sequence
+        return True if a request was sent
+        """
+        for segment_number in self._rank_segment_numbers():
+            if segment_number in self._sequence_segment_numbers:
+                continue
+            self._log.info("request {0} ({1}) {2} " \
+                           "hedging with segment {3}".format(
+                self._user_request_id,
+                self._collection_id,
+                self._key,
+                segment_number,
+            ))
+            if self._spawn_task(retrieve_id, segment_number, blocks_retrieved):
+                return True
+        return False
+
+    def _next_hedge_deadline(self, hedged_tasks):
+        """
+        return (seconds to wait, task) for the running task in this sequence 
+        whose hedge deadline comes first, or (_task_timeout, None, )
+        """
+        hedge_deadline = self._hedge_deadline()
+        current_time = time.time()
+        wait_time = _task_timeout
+        overdue_task = None
+        for task in self._pending:
+            if task.sequence != self._sequence or task in hedged_tasks:
+                continue
+            remaining_time = task.start_time + hedge_deadline - current_time
+            if remaining_time < wait_time:
+                wait_time = max(remaining_time, 0.0)
+                overdue_task = task
+        return wait_time, overdue_task
+
+    def _cancel(self, retrieve_id, segment_number):
+        """
+        tell a node to drop the rest of this retrieve, 
+        and don't ask it for any more sequences
+        """
+        self._started_segment_numbers.discard(segment_number)
+        self._data_readers[segment_number-1].retrieve_key_cancel(
+            retrieve_id, segment_number, self._user_request_id
+        )
+
+    def _abandon_running_tasks(self, retrieve_id):
+        """
+        we have enough replies, record the lower bound latency of the nodes 
+        we did not wait for, kill their tasks and cancel their requests
+        """
+        current_time = time.time()
+        for task in self._pending:
+            if task.sequence == self._sequence:
+                task.data_reader.latency_tracker.record_abandoned(
+                    current_time - task.start_time
+                )
+                self._cancel(retrieve_id, task.segment_number)
+        self._pending.kill()
 
-    def _process_node_replies(self, timeout):
+    def _process_node_replies(self, timeout, retrieve_id, blocks_retrieved):
         finished_task_count = 0
         result_dict = dict()
         completed_list = list()
         start_time = time.time()
 
+        # tasks that are already covered by a hedged request
+        hedged_tasks = set()
+
         # block on the finished_tasks queue until done
-        while finished_task_count < len(self._data_readers):
+        while True:
+            if finished_task_count >= self._spawned_task_count:
+                # everyone we asked has replied, and we still need more
+                if not self._hedge(retrieve_id, blocks_retrieved):
+                    break
+
+            wait_time, overdue_task = self._next_hedge_deadline(hedged_tasks)
             try:
                 task = self._finished_tasks.get(block=True, 
-                                                timeout=_task_timeout)
+                                                timeout=wait_time)
             except gevent.queue.Empty:
+                if overdue_task is not None:
+                    hedged_tasks.add(overdue_task)
+                    self._hedge(retrieve_id, blocks_retrieved)
+                    continue
+
                 elapsed_time = time.time() - start_time
                 if elapsed_time > timeout:
                     error_message = \
@@ -174,22 +358,36 @@ class Retriever(object):
             # if we previously only waited for 8/10 replies, we may still get
             # those other 2 replies coming in even though we have moved on.
             if task.sequence != self._sequence:
-                self._log.debug(
-                    "request {0} _process_node_replies ignore task {1} seq {2} expect {3}".format(
-                        self._user_request_id,
-                        task.data_reader.node_name,
-                        task.sequence,
-                        self._sequence
+                if self._debug_enabled:
+                    self._log.debug(
+                        "request {0} _process_node_replies ignore task {1} seq {2} expect {3}".format(
+                            self._user_request_id,
+                            task.data_reader.node_name,
+                            task.sequence,
+                            self._sequence
+                        )
                     )
-                )
                 continue
 
             finished_task_count += 1
+            task_elapsed_time = time.time() - task.start_time
             result = self._process_finished_task(task)
 
             if result is None:
+                if not isinstance(task.value, gevent.GreenletExit):
+                    task.data_reader.latency_tracker.record_failure(
+                        task_elapsed_time
+                    )
+                # don't ask this node for the rest of the sequences
+                if task.segment_number in self._started_segment_numbers:
+                    self._cancel(retrieve_id, task.segment_number)
+                if not task in hedged_tasks:
+                    hedged_tasks.add(task)
+                    self._hedge(retrieve_id, blocks_retrieved)
                 continue
 
+            task.data_reader.latency_tracker.record_reply(task_elapsed_time)
+
             data_segment, zfec_padding_size, completion_status = result
 
             result_dict[task.segment_number] = \
@@ -197,14 +395,15 @@ class Retriever(object):
             completed_list.append(completion_status)
 
             if len(result_dict) >= self._segments_needed:
-                self._log.debug(
-                    "request {0} {1} {2} len(result_dict) = {3}: enough".format(
-                    self._user_request_id,
-                    self._collection_id,
-                    self._key,
-                    len(result_dict),
-                ))
-                self._pending.kill()
+                if self._debug_enabled:
+                    self._log.debug(
+                        "request {0} {1} {2} len(result_dict) = {3}: enough".format(
+                        self._user_request_id,
+                        self._collection_id,
+                        self._key,
+                        len(result_dict),
+                    ))
+                self._abandon_running_tasks(retrieve_id)
                 break
 
         # if anything is still running, get rid of it
@@ -221,11 +420,12 @@ class Retriever(object):
             raise RetrieveFailedError(error_message)
 
         if all(completed_list):
-            self._log.debug("request {0} ({1}) {2} all nodes say completed".format(
-                self._user_request_id,
-                self._collection_id,
-                self._key,
-            ))
+            if self._debug_enabled:
+                self._log.debug("request {0} ({1}) {2} all nodes say completed".format(
+                    self._user_request_id,
+                    self._collection_id,
+                    self._key,
+                ))
             return result_dict, True
 
         if any(completed_list):
@@ -238,23 +438,25 @@ class Retriever(object):
                                                      error_message))
             raise RetrieveFailedError(error_message)
             
-        self._log.debug("request {0} ({1}) {2} all nodes say NOT completed".format(
-            self._user_request_id,
-            self._collection_id,
-            self._key,
-        ))
+        if self._debug_enabled:
+            self._log.debug("request {0} ({1}) {2} all nodes say NOT completed".format(
+                self._user_request_id,
+                self._collection_id,
+                self._key,
+            ))
         return result_dict, False
         
     def _process_finished_task(self, task):
         if isinstance(task.value, gevent.GreenletExit):
-            self._log.debug(
-                "request {0} ({1}) {2} {3} task ends with GreenletExit".format(
-                    self._user_request_id,
-                    self._collection_id,
-                    self._key,
-                    task.data_reader.node_name,
+            if self._debug_enabled:
+                self._log.debug(
+                    "request {0} ({1}) {2} {3} task ends with GreenletExit".format(
+                        self._user_request_id,
+                        self._collection_id,
+                        self._key,
+                        task.data_reader.node_name,
+                    )
                 )
-            )
             return None
 
         if not task.successful():
@@ -268,12 +470,13 @@ class Retriever(object):
             ))
             return None
 
-        self._log.debug("request {0} ({1}) {2} {3} task successful".format(
-            self._user_request_id,
-            self._collection_id,
-            self._key,
-            task.data_reader.node_name,
-        ))
+        if self._debug_enabled:
+            self._log.debug("request {0} ({1}) {2} {3} task successful".format(
+                self._user_request_id,
+                self._collection_id,
+                self._key,
+                task.data_reader.node_name,
+            ))
 
         # we expect retrieve_key_start to return the tuple
         # (<data-segment>, <zfec-padding-size>, <completion-status>, )
@@ -282,24 +485,26 @@ class Retriever(object):
         # returns None
 
         if task.value is None:
-            self._log.debug(
-                "request {0} ({1}) {2} {3} task value is None".format(
-                    self._user_request_id,
-                    self._collection_id,
-                    self._key,
-                    task.data_reader.node_name,
+            if self._debug_enabled:
+                self._log.debug(
+                    "request {0} ({1}) {2} {3} task value is None".format(
+                        self._user_request_id,
+                        self._collection_id,
+                        self._key,
+                        task.data_reader.node_name,
+                    )
                 )
-            )
             return None
 
         data_segment, zfec_padding_size, completion_status = task.value
 
-        self._log.debug("request {0} ({1}) {2} {3} task successful complete = {4}".format(
-            self._user_request_id,
-            self._collection_id,
-            self._key,
-            task.data_reader.node_name, 
-            completion_status,
-        ))
+        if self._debug_enabled:
+            self._log.debug("request {0} ({1}) {2} {3} task successful complete = {4}".format(
+                self._user_request_id,
+                self._collection_id,
+                self._key,
+                task.data_reader.node_name, 
+                completion_status,
+            ))
 
         return data_segment, zfec_padding_size, completion_status
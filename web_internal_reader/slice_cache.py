@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+slice_cache.py
+
+class SliceCache
+
+a bounded cache of decoded data, so that popular objects can be served
+without going to the data readers.
+
+The cache holds slices of slice_blocks consecutive blocks, keyed by
+(unified_id, conjoined_part, slice_index). The slice data lives in a
+preallocated pool file (intended for local SSD) with one fixed size slot per
+slice; the index of slices, in LRU order, is kept in memory.
+
+A new slice is admitted only if it has been asked for more often than the
+slice it would evict (TinyLFU), so that one big sequential read does not
+flush the hot set. Frequencies are estimated with a count-min sketch, which
+is halved periodically so that old popularity fades.
+"""
+from collections import OrderedDict
+import logging
+import os
+
+from tools.data_definitions import block_size
+
+_cache_path = os.environ.get("NIMBUSIO_WEB_INTERNAL_READER_SLICE_CACHE_PATH")
+_cache_size = int(os.environ.get(
+    "NIMBUSIO_WEB_INTERNAL_READER_SLICE_CACHE_SIZE", str(1024 ** 3)))
+_slice_blocks = int(os.environ.get(
+    "NIMBUSIO_WEB_INTERNAL_READER_SLICE_CACHE_BLOCKS", "32"))
+
+_sketch_depth = 4
+_sketch_max_count = 15
+# the sketch is halved after this many increments per cache slot
+_sketch_sample_factor = 10
+# so that a small cache still has a useful frequency history
+_min_sketch_capacity = 1024
+
+class _FrequencySketch(object):
+    """
+    a count-min sketch of small counters, halved every sample_size
+    increments
+    """
+    def __init__(self, capacity):
+        capacity = max(capacity, _min_sketch_capacity)
+        width = 1
+        while width < capacity * 2:
+            width *= 2
+        self._mask = width - 1
+        self._rows = [[0] * width for _ in range(_sketch_depth)]
+        self._sample_size = capacity * _sketch_sample_factor
+        self._increment_count = 0
+
+    def _indices(self, key):
+        key_hash = hash(key)
+        for seed in range(_sketch_depth):
+            yield hash((key_hash, seed, )) & self._mask
+
+    def frequency(self, key):
+        return min([row[index] \
+                    for row, index in zip(self._rows, self._indices(key))])
+
+    def increment(self, key):
+        for row, index in zip(self._rows, self._indices(key)):
+            if row[index] < _sketch_max_count:
+                row[index] += 1
+
+        self._increment_count += 1
+        if self._increment_count >= self._sample_size:
+            for row in self._rows:
+                for index in range(len(row)):
+                    row[index] >>= 1
+            self._increment_count //= 2
+
+class SliceCache(object):
+    """
+    path
+        the pool file; it is truncated and preallocated at startup
+
+    size
+        the size of the pool file in bytes
+
+    slice_blocks
+        the number of blocks in a slice
+    """
+    def __init__(self, path, size, slice_blocks=_slice_blocks):
+        self._log = logging.getLogger("SliceCache")
+        self._slice_blocks = slice_blocks
+        self._slot_size = slice_blocks * block_size
+        self._slot_count = max(1, size // self._slot_size)
+
+        self._log.info("{0} slots of {1} bytes in {2}".format(
+            self._slot_count, self._slot_size, path))
+        self._pool_file = open(path, "w+b")
+        self._pool_file.truncate(self._slot_count * self._slot_size)
+
+        # map key to (slot, data size, is_last_slice), in LRU order
+        self._index = OrderedDict()
+        self._free_slots = range(self._slot_count)
+        self._sketch = _FrequencySketch(self._slot_count)
+        self._stats = dict.fromkeys(
+            ["hits", "misses", "admissions", "rejections", "evictions", ], 0)
+
+    @property
+    def slice_blocks(self):
+        return self._slice_blocks
+
+    def close(self):
+        self._pool_file.close()
+
+    def stats(self):
+        """
+        return a dict of counts since startup
+        """
+        stats = dict(self._stats)
+        stats["slices"] = len(self._index)
+        return stats
+
+    def get(self, unified_id, conjoined_part, slice_index):
+        """
+        return (data, is_last_slice) or None if the slice is not cached
+        """
+        key = (unified_id, conjoined_part, slice_index, )
+        self._sketch.increment(key)
+        try:
+            slot, data_size, is_last_slice = self._index.pop(key)
+        except KeyError:
+            self._stats["misses"] += 1
+            return None
+
+        self._index[key] = (slot, data_size, is_last_slice, )
+        self._stats["hits"] += 1
+        self._pool_file.seek(slot * self._slot_size)
+        return self._pool_file.read(data_size), is_last_slice
+
+    def put(self, unified_id, conjoined_part, slice_index, data,
+            is_last_slice):
+        """
+        offer a slice to the cache
+        return True if the slice is admitted
+        """
+        assert len(data) <= self._slot_size, (len(data), self._slot_size, )
+        key = (unified_id, conjoined_part, slice_index, )
+        if key in self._index:
+            return True
+
+        if len(self._free_slots) == 0:
+            victim_key = next(iter(self._index))
+            if self._sketch.frequency(key) <= \
+                self._sketch.frequency(victim_key):
+                self._stats["rejections"] += 1
+                return False
+            victim_slot, _, _ = self._index.pop(victim_key)
+            self._free_slots.append(victim_slot)
+            self._stats["evictions"] += 1
+
+        slot = self._free_slots.pop()
+        self._pool_file.seek(slot * self._slot_size)
+        self._pool_file.write(data)
+        self._index[key] = (slot, len(data), is_last_slice, )
+        self._stats["admissions"] += 1
+        return True
+
+    def collector(self, unified_id, conjoined_part, first_block_index):
+        """
+        return a SliceCollector that offers retrieved blocks to the cache
+        """
+        return SliceCollector(self,
+                              unified_id,
+                              conjoined_part,
+                              first_block_index)
+
+class SliceCollector(object):
+    """
+    accumulate consecutive blocks as they are retrieved, and offer each
+    complete slice to the cache. A partial slice is only offered as the last
+    slice of the object.
+    """
+    def __init__(self, slice_cache, unified_id, conjoined_part,
+                 first_block_index):
+        self._slice_cache = slice_cache
+        self._unified_id = unified_id
+        self._conjoined_part = conjoined_part
+        slice_blocks = slice_cache.slice_blocks
+        self._slice_index, block_remainder = \
+            divmod(first_block_index, slice_blocks)
+        # we can't cache a slice unless we have it from its first block
+        self._skip_blocks = \
+            (0 if block_remainder == 0 else slice_blocks - block_remainder)
+        if self._skip_blocks > 0:
+            self._slice_index += 1
+        self._blocks = list()
+
+    def add(self, data_block):
+        if self._skip_blocks > 0:
+            self._skip_blocks -= 1
+            return
+
+        # we hold on to a complete slice until we know whether it is the last
+        if len(self._blocks) == self._slice_cache.slice_blocks:
+            self._offer(False)
+        self._blocks.append(data_block)
+
+    def finish(self, end_of_object):
+        """
+        end_of_object
+            True if the last block added is the last block of the object
+        """
+        if len(self._blocks) == self._slice_cache.slice_blocks \
+        or (end_of_object and len(self._blocks) > 0):
+            self._offer(end_of_object)
+        self._blocks = list()
+
+    def _offer(self, is_last_slice):
+        self._slice_cache.put(self._unified_id,
+                              self._conjoined_part,
+                              self._slice_index,
+                              "".join(self._blocks),
+                              is_last_slice)
+        self._slice_index += 1
+        self._blocks = list()
+
+def create_slice_cache():
+    """
+    return a SliceCache if NIMBUSIO_WEB_INTERNAL_READER_SLICE_CACHE_PATH
+    is set, otherwise None
+    """
+    if _cache_path is None:
+        return None
+    return SliceCache(_cache_path, _cache_size)
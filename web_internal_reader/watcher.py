@@ -13,12 +13,17 @@ class Watcher(Greenlet):
     """
     A Greenlet to watch web server internals
     """
-    def __init__(self, stats, reader_clients, event_push_client):
+    def __init__(self, 
+                 stats, 
+                 reader_clients, 
+                 event_push_client, 
+                 slice_cache=None):
         Greenlet.__init__(self)
         self._log = logging.getLogger(str(self))
         self._stats = stats
         self._reader_clients = reader_clients
         self._event_push_client = event_push_client
+        self._slice_cache = slice_cache
         self._halt_event = Event()
 
     def _run(self):
@@ -37,6 +42,14 @@ class Watcher(Greenlet):
                 stats=self._stats,
                 reader=reader_info
             )
+            if self._slice_cache is not None:
+                slice_cache_stats = self._slice_cache.stats()
+                self._log.info("slice cache: {0}".format(slice_cache_stats))
+                self._event_push_client.info(
+                    "slice-cache-stats",
+                    "web internal reader slice cache stats",
+                    **slice_cache_stats
+                )
             self._halt_event.wait(_interval)
 
         self._log.debug("ending")
@@ -29,11 +29,13 @@ import gevent
 import memcache
 
 from tools.standard_logging import initialize_logging
+from tools.sampling_profiler import install_sampling_profiler
 from tools.greenlet_dealer_client import GreenletDealerClient
 from tools.greenlet_resilient_client import GreenletResilientClient
 from tools.greenlet_pull_server import GreenletPULLServer
 from tools.deliverator import Deliverator
 from tools.greenlet_push_client import GreenletPUSHClient
+from tools.greenlet_trace_flusher import GreenletTraceFlusher
 from tools.database_connection import get_central_connection, \
         get_node_local_connection
 from tools.event_push_client import EventPushClient
@@ -41,6 +43,7 @@ from tools.data_definitions import create_timestamp
 
 from web_internal_reader.application import Application
 from web_internal_reader.data_reader import DataReader
+from web_internal_reader.slice_cache import create_slice_cache
 from web_public_reader.space_accounting_client import SpaceAccountingClient
 from web_internal_reader.watcher import Watcher
 from web_public_reader.central_database_util import get_cluster_row
@@ -96,6 +99,11 @@ class WebInternalReader(object):
         )
         self._pull_server.link_exception(self._unhandled_greenlet_exception)
 
+        self._event_push_client = EventPushClient(
+            self._zeromq_context,
+            "web-internal-reader"
+        )
+
         self._data_reader_clients = list()
         self._data_readers = list()
         for node_name, address in zip(_node_names, _data_reader_addresses):
@@ -111,7 +119,7 @@ class WebInternalReader(object):
             resilient_client.link_exception(self._unhandled_greenlet_exception)
             self._data_reader_clients.append(resilient_client)
             data_reader = DataReader(
-                node_name, resilient_client
+                node_name, resilient_client, self._event_push_client
             )
             self._data_readers.append(data_reader)
 
@@ -136,11 +144,6 @@ class WebInternalReader(object):
             push_client
         )
 
-        self._event_push_client = EventPushClient(
-            self._zeromq_context,
-            "web-internal-reader"
-        )
-
         # message sent to data readers telling them the server
         # is (re)starting, thereby invalidating any archvies or retrieved
         # that are in progress for this node
@@ -150,10 +153,13 @@ class WebInternalReader(object):
                                      timestamp_repr=repr(timestamp),
                                      source_node_name=_local_node_name)
 
+        self._slice_cache = create_slice_cache()
+
         self._watcher = Watcher(
             _stats, 
             self._data_reader_clients,
-            self._event_push_client
+            self._event_push_client,
+            self._slice_cache
         )
 
         self.application = Application(
@@ -164,8 +170,12 @@ class WebInternalReader(object):
             self._data_readers,
             self._accounting_client,
             self._event_push_client,
-            _stats
+            _stats,
+            self._slice_cache
         )
+        self._trace_flusher = GreenletTraceFlusher(self.application.tracer)
+        self._trace_flusher.link_exception(self._unhandled_greenlet_exception)
+
         self.wsgi_server = WSGIServer(
             (_web_internal_reader_host, _web_internal_reader_port), 
             application=self.application,
@@ -174,8 +184,10 @@ class WebInternalReader(object):
 
     def start(self):
         self._space_accounting_dealer_client.start()
+        self._accounting_client.start()
         self._pull_server.start()
         self._watcher.start()
+        self._trace_flusher.start()
         for client in self._data_reader_clients:
             client.start()
         self.wsgi_server.start()
@@ -188,14 +200,18 @@ class WebInternalReader(object):
         self._space_accounting_dealer_client.kill()
         self._pull_server.kill()
         self._watcher.kill()
+        self._trace_flusher.kill()
         for client in self._data_reader_clients:
             client.kill()
         self._log.debug("joining greenlets")
         self._space_accounting_dealer_client.join()
         self._pull_server.join()
         self._watcher.join()
+        self._trace_flusher.join()
         for client in self._data_reader_clients:
             client.join()
+        if self._slice_cache is not None:
+            self._slice_cache.close()
         self._log.debug("closing zmq")
         self._event_push_client.close()
         self._zeromq_context.term()
@@ -211,6 +227,7 @@ class WebInternalReader(object):
 
 def main():
     initialize_logging(_log_path)
+    install_sampling_profiler()
     log = logging.getLogger("main")
     halt_event = Event()
     gevent.signal(signal.SIGTERM, _signal_handler_closure(halt_event))
@@ -47,6 +47,7 @@ patch_all()
 from gevent.event import Event
 
 from tools.standard_logging import initialize_logging
+from tools.sampling_profiler import install_sampling_profiler
 
 from web_monitor.web_monitor_redis_sink import WebMonitorRedisSink
 from web_monitor.pinger import Pinger
@@ -89,6 +90,7 @@ def main():
     global _return_code
 
     initialize_logging(_log_path)
+    install_sampling_profiler()
     log = logging.getLogger("main")
 
     halt_event = Event()
@@ -12,6 +12,8 @@ from tools.redis_sink import RedisSink
 
 _hostname = socket.gethostname()
 _hash_name = "nimbus.io.web_monitor.{0}".format(_hostname)
+# web_director follows this channel to keep its availability snapshot current
+_changes_channel = "{0}.changes".format(_hash_name)
 
 class WebMonitorRedisSink(RedisSink):
     """
@@ -20,6 +22,7 @@ class WebMonitorRedisSink(RedisSink):
     def __init__(self, halt_event, redis_queue):
         RedisSink.__init__(self, halt_event, redis_queue)
         self._log.info("hash name = '{0}'".format(_hash_name))
+        self._reachable = dict()
 
     def store(self, key, entry):
         """
@@ -32,3 +35,8 @@ class WebMonitorRedisSink(RedisSink):
                                                sort_keys=True,
                                                indent=4))
 
+        # publish the key when its reachability changes
+        if self._reachable.get(key) != entry["reachable"]:
+            self._reachable[key] = entry["reachable"]
+            self._redis_connection.publish(_changes_channel, key)
+
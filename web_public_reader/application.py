@@ -22,6 +22,8 @@ from tools.data_definitions import http_timestamp_str, \
         parse_http_timestamp, \
         create_timestamp
 from tools.collection_access_control import read_access, list_access
+from tools.admission_control import AdmissionControl, AdmissionRefused, \
+        hold_until_sent, admission_ticket_key
 from tools.interaction_pool_authenticator import AccessUnauthorized, \
         AccessForbidden
 from tools.operational_stats_redis_sink import redis_queue_entry_tuple
@@ -113,6 +115,7 @@ class Application(object):
         self._event_push_client = event_push_client
         self._redis_queue = redis_queue
         self._request_counter = itertools.count(1)
+        self._admission_control = AdmissionControl()
 
         self._dispatch_table = {
             action_respond_to_ping      : self._respond_to_ping,
@@ -152,6 +155,7 @@ class Application(object):
             response = self._dispatch_table[action_tag](
                 req, match_object, user_request_id)
         except exc.HTTPException, instance:
+            self._release_admission(req)
             self._log.error("request %s %s %s %s %r" % (
                 user_request_id,
                 instance.__class__.__name__, 
@@ -161,6 +165,7 @@ class Application(object):
             ))
             raise
         except Exception, instance:
+            self._release_admission(req)
             self._log.exception(instance)
             self._log.error("request %s: exception on %r" 
                 % (user_request_id, req.url, ))
@@ -180,8 +185,37 @@ class Application(object):
                     str(hasattr(response, "app_iter")), )
             )
 
+        # hold the admission until the body has been sent
+        if isinstance(response, exc.HTTPException):
+            self._release_admission(req)
+        elif admission_ticket_key in req.environ:
+            hold_until_sent(response, req.environ[admission_ticket_key])
+
         return response
 
+    def _admit(self, req, collection_row, user_request_id):
+        """
+        refuse the request with 503 if the collection is over its limits
+        """
+        try:
+            ticket = self._admission_control.admit(collection_row["id"])
+        except AdmissionRefused, instance:
+            self._log.warn("request {0}: refused {1}".format(user_request_id,
+                                                             instance))
+            queue_entry = \
+                redis_queue_entry_tuple(timestamp=create_timestamp(),
+                                        collection_id=collection_row["id"],
+                                        value=1)
+            self._redis_queue.put(("admission_refused", queue_entry, ))
+            response = exc.HTTPServiceUnavailable(str(instance))
+            response.retry_after = instance.retry_after
+            raise response
+        req.environ[admission_ticket_key] = ticket
+
+    def _release_admission(self, req):
+        if admission_ticket_key in req.environ:
+            req.environ[admission_ticket_key].release()
+
     def _respond_to_ping(self, _req, _match_object, user_request_id):
         # self._log.debug("_respond_to_ping")
         # Ticket #44 We don't send Connection: close here
@@ -210,6 +244,8 @@ class Application(object):
         except Exception:
             self._log.exception("request {0}".format(user_request_id))
             raise exc.HTTPBadRequest()
+
+        self._admit(req, collection_row, user_request_id)
             
         variable_names = [
             "prefix",
@@ -327,6 +363,8 @@ class Application(object):
         except Exception:
             self._log.exception("request {0}".format(user_request_id))
             raise exc.HTTPBadRequest()
+
+        self._admit(req, collection_row, user_request_id)
             
         variable_names = [
             "prefix",
@@ -442,6 +480,8 @@ class Application(object):
                                 user_request_id, 
                                 instance))
             raise exc.HTTPBadRequest()
+
+        self._admit(req, collection_row, user_request_id)
             
         try:
             key = urllib.unquote_plus(key)
@@ -674,6 +714,8 @@ class Application(object):
         except Exception:
             self._log.exception("request {0}".format(user_request_id))
             raise exc.HTTPBadRequest()
+
+        self._admit(req, collection_row, user_request_id)
             
         try:
             key = urllib.unquote_plus(key)
@@ -739,6 +781,8 @@ class Application(object):
         except Exception:
             self._log.exception("request {0}".format(user_request_id))
             raise exc.HTTPBadRequest()
+
+        self._admit(req, collection_row, user_request_id)
             
         try:
             key = urllib.unquote_plus(key)
@@ -859,6 +903,8 @@ class Application(object):
         except Exception:
             self._log.exception("request {0}".format(user_request_id))
             raise exc.HTTPBadRequest()
+
+        self._admit(req, collection_row, user_request_id)
             
         variable_names = [
             "max_conjoined",
@@ -950,6 +996,8 @@ class Application(object):
         except Exception:
             self._log.exception("request {0}".format(user_request_id))
             raise exc.HTTPBadRequest()
+
+        self._admit(req, collection_row, user_request_id)
             
         try:
             key = urllib.unquote_plus(key)
@@ -291,6 +291,8 @@ class Retriever(object):
             raise RetrieveFailedError(instance)
 
     def _retrieve(self, response, timeout):
+        # checked once: some of these debug lines are for every block
+        debug_enabled = self._log.isEnabledFor(logging.DEBUG)
         self._log.debug("request {0}: start _retrieve".format(
             (self.user_request_id)))
         self._cache_key_rows_in_memcached(self._key_rows)
@@ -305,7 +307,6 @@ class Retriever(object):
         retrieve_bytes = 0L
 
         self._log.debug("start key_rows loop")
-        first_block = True
 
         for entry in self._generate_key_rows(self._key_rows):
             key_row, \
@@ -314,10 +315,11 @@ class Retriever(object):
             offset_into_first_block, \
             offset_into_last_block = entry
 
-            self._log.debug("request {0}: {1} {2}".format(
-                            self.user_request_id,
-                            key_row["unified_id"], 
-                            key_row["conjoined_part"]))
+            if debug_enabled:
+                self._log.debug("request {0}: {1} {2}".format(
+                                self.user_request_id,
+                                key_row["unified_id"], 
+                                key_row["conjoined_part"]))
 
             # if a cache port is defined, and this response isn't larger than
             # the configured maximum, send the request through the cache.
@@ -340,29 +342,34 @@ class Retriever(object):
 
             headers = {"x-nimbus-io-user-request-id" : self.user_request_id}
 
-            if block_offset > 0 and block_count is None:
-                headers["range"] = \
-                    "bytes={0}-".format(block_offset * block_size)
+            # web_internal_reader trims the blocks to the exact byte range
+            first_byte = block_offset * block_size + offset_into_first_block
+            if block_count is None:
+                last_byte = None
+            else:
+                last_byte = first_byte + self._slice_size - retrieve_bytes - 1
+
+            if first_byte > 0 and last_byte is None:
+                headers["range"] = "bytes={0}-".format(first_byte)
                 headers["x-nimbus-io-expected-content-length"] = \
-                    str(key_row["file_size"] - (block_offset * block_size))
+                    str(key_row["file_size"] - first_byte)
                 expected_status = httplib.PARTIAL_CONTENT
-            elif block_count is not None:
+            elif last_byte is not None:
                 headers["range"] = \
-                    "bytes={0}-{1}".format(
-                        block_offset * block_size, 
-                        (block_offset + block_count) * block_size - 1)
+                    "bytes={0}-{1}".format(first_byte, last_byte)
                 headers["x-nimbus-io-expected-content-length"] = \
-                    str(block_count * block_size)
+                    str(last_byte - first_byte + 1)
                 expected_status = httplib.PARTIAL_CONTENT
             else:
                 headers["x-nimbus-io-expected-content-length"] = \
-                            str(key_row["file_size"]),
+                            str(key_row["file_size"])
                 expected_status = httplib.OK
                 
             request = urllib2.Request(uri, headers=headers)
-            self._log.debug(
-                "request {0} start internal; expected={1}; headers={2}".format(
-                    self.user_request_id, repr(expected_status), headers))
+            if debug_enabled:
+                self._log.debug(
+                    "request {0} start internal; expected={1}; headers={2}".format(
+                        self.user_request_id, repr(expected_status), headers))
             try:
                 urllib_response = urllib2.urlopen(request, timeout=timeout)
             except urllib2.HTTPError, instance:
@@ -414,73 +421,31 @@ class Retriever(object):
                 response.retry_after = _retrieve_retry_interval
                 break
 
-            self._log.debug(
-                "request {0} internal request made".format(
-                self.user_request_id))
+            if debug_enabled:
+                self._log.debug(
+                    "request {0} internal request made".format(
+                    self.user_request_id))
 
             # Ticket #68 add buffering
             # 2012-12-23 dougfort -- the choice of block_size as the
             # amount to read is fairly arbitrary but we should read at least 
             # that much
-            prev_data = None
             while True:
                 data = urllib_response.read(block_size)
-                self._log.debug("{0} retrieved {1} bytes from internal".format(
-                                self.user_request_id, len(data)))
+                if debug_enabled:
+                    self._log.debug("{0} retrieved {1} bytes from internal".format(
+                                    self.user_request_id, len(data)))
                 if len(data) == 0: 
-                    if self._last_block_in_slice_retrieved and \
-                    retrieve_bytes >= self._slice_size:
-                        self._log.debug("Ending slice at {0}".format(
-                                        retrieve_bytes))
-                        break
-                    assert prev_data is not None
-                    if self._last_block_in_slice_retrieved and \
-                    offset_into_last_block > 0:
-                        # if the first block is the only block, we must
-                        # decrement the offset_into_last_block
-                        # because we've already chopped offset_into_first_block
-                        if first_block:
-                            self._log.debug("request {0}: " \
-                                            "subtracting {1} bytes from " \
-                                            "offset_into_last_block".format(
-                                            self.user_request_id,
-                                            offset_into_first_block))
-                            offset_into_last_block -= offset_into_first_block
-                        self._log.debug("request {0}: " \
-                                        "len(prev_data) = {1} " \
-                                        "offset_into_last_block = {2}".format(
-                                        self.user_request_id, 
-                                        len(prev_data),
-                                        offset_into_last_block))
-                        prev_data = prev_data[:offset_into_last_block]
-                    self._log.debug(
-                        "request {0} yielding {1} bytes from last block".format(
-                        self.user_request_id, len(prev_data)))
-                    yield prev_data
-                    retrieve_bytes += len(prev_data)
                     break
-                if prev_data is None:
-                    if first_block:
-                        assert len(data) > offset_into_first_block, (
-                            len(data), offset_into_first_block)
-                        prev_data = data[offset_into_first_block:]
-                    else:
-                        prev_data = data
-                    continue
-                self._log.debug(
-                    "request {0} yielding {1} bytes".format(
-                    self.user_request_id, len(prev_data)))
-                yield prev_data
-                retrieve_bytes += len(prev_data)
-                prev_data = data
-
-                first_block = False
+                yield data
+                retrieve_bytes += len(data)
 
             urllib_response.close()
 
-            self._log.debug(
-                "request {0} internal request complete".format(
-                self.user_request_id))
+            if debug_enabled:
+                self._log.debug(
+                    "request {0} internal request complete".format(
+                    self.user_request_id))
 
         # end - for entry in self._generate_key_rows(self._key_rows):
 
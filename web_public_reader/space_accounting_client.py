@@ -3,8 +3,21 @@
 space_accounting_client.py
 
 Sends space accounting messages.
+
+The values reported by added, retrieved and removed are summed locally by
+(hour, collection_id, event) and pushed to the space accounting server as
+one space-accounting-batch message every flush_interval seconds, so that
+the server sees a message per flush instead of a message per request.
 """
 import logging
+import os
+
+import gevent
+
+from space_accounting_server.util import floor_hour
+
+_flush_interval = float(
+    os.environ.get("NIMBUSIO_SPACE_ACCOUNTING_FLUSH_INTERVAL", "5.0"))
 
 class SpaceUsageFailedError(Exception):
     pass
@@ -12,45 +25,91 @@ class SpaceUsageFailedError(Exception):
 class SpaceAccountingClient(object):
     """Sends space accounting messages."""
 
-    def __init__(self, node_name, dealer_client, push_socket):
+    def __init__(self, 
+                 node_name, 
+                 dealer_client, 
+                 push_socket, 
+                 flush_interval=_flush_interval):
+        """
+        flush_interval
+            seconds between batches; if 0, every value is sent at once
+        """
         self._log = logging.getLogger("SpaceAccountingClient-%s" % (
             node_name, 
         ))
         self._dealer_client = dealer_client
         self._push_socket = push_socket
+        self._flush_interval = flush_interval
+        # (hour, collection_id, event) : value
+        self._pending = dict()
+        self._flush_greenlet = None
+
+    def start(self):
+        if self._flush_interval > 0:
+            self._flush_greenlet = gevent.spawn(self._flush_loop)
 
     def close(self):
+        if self._flush_greenlet is not None:
+            self._flush_greenlet.kill()
+            self._flush_greenlet = None
+        self.flush()
         self._push_socket.close()
 
     def added(self, collection_id, timestamp, bytes_added):
-        message = {
-            "message-type"  : "space-accounting-detail",
-            "collection-id" : collection_id,
-            "timestamp-repr": repr(timestamp),
-            "event"         : "bytes_added",
-            "value"         : bytes_added,
-        }
-        self._push_socket.send(message)
+        self._add(collection_id, timestamp, "bytes_added", bytes_added)
 
     def retrieved(self, collection_id, timestamp, bytes_retrieved):
-        message = {
-            "message-type"  : "space-accounting-detail",
-            "collection-id" : collection_id,
-            "timestamp-repr": repr(timestamp),
-            "event"         : "bytes_retrieved",
-            "value"         : bytes_retrieved,
-        }
-        self._push_socket.send(message)
+        self._add(collection_id, 
+                  timestamp, 
+                  "bytes_retrieved", 
+                  bytes_retrieved)
 
     def removed(self, collection_id, timestamp, bytes_removed):
+        self._add(collection_id, timestamp, "bytes_removed", bytes_removed)
+
+    def _add(self, collection_id, timestamp, event, value):
+        key = (floor_hour(timestamp), collection_id, event, )
+        self._pending[key] = self._pending.get(key, 0) + value
+        if self._flush_greenlet is None:
+            self.flush()
+
+    def _flush_loop(self):
+        while True:
+            gevent.sleep(self._flush_interval)
+            # a failed flush keeps its values for the next one
+            try:
+                self.flush()
+            except Exception:
+                self._log.exception("flush failed; {0} values held".format(
+                    len(self._pending)))
+
+    def flush(self):
+        """
+        send everything we have summed so far as one message
+        """
+        if len(self._pending) == 0:
+            return
+
+        pending, self._pending = self._pending, dict()
+
+        # the server parses each hour once per batch
+        hour_entries = dict()
+        for (hour, collection_id, event, ), value in pending.iteritems():
+            hour_entries.setdefault(repr(hour), list()).append(
+                [collection_id, event, value, ]
+            )
+
         message = {
-            "message-type"  : "space-accounting-detail",
-            "collection-id" : collection_id,
-            "timestamp-repr": repr(timestamp),
-            "event"         : "bytes_removed",
-            "value"         : bytes_removed,
+            "message-type"  : "space-accounting-batch",
+            "hour-entries"  : hour_entries,
         }
-        self._push_socket.send(message)
+        try:
+            self._push_socket.send(message)
+        except Exception:
+            # put the values back, adding anything summed since
+            for key, value in pending.iteritems():
+                self._pending[key] = self._pending.get(key, 0) + value
+            raise
 
     def get_space_usage(self, collection_id):
         request = {
@@ -28,8 +28,11 @@ import gdbpool.interaction_pool
 
 
 from tools.standard_logging import initialize_logging
+from tools.sampling_profiler import install_sampling_profiler
 from tools.greenlet_dealer_client import GreenletDealerClient
 from tools.greenlet_push_client import GreenletPUSHClient
+from tools.greenlet_central_cache_invalidator import \
+    GreenletCentralCacheInvalidator
 from tools.database_connection import get_central_database_dsn, \
         get_node_local_database_dsn
 from tools.event_push_client import EventPushClient
@@ -60,6 +63,7 @@ _web_public_reader_port = \
     int(os.environ.get("NIMBUSIO_WEB_PUBLIC_READER_PORT", "8088"))
 _wsgi_backlog = int(os.environ.get("NIMBUS_IO_WSGI_BACKLOG", "1024"))
 _repository_path = os.environ["NIMBUSIO_REPOSITORY_PATH"]
+_central_skeeter_uri = os.environ.get("NIMBUSIO_CENTRAL_SKEETER_URI")
 _central_database_pool_size = 3 
 _central_pool_name = "default"
 _local_database_pool_size = 3 
@@ -118,12 +122,17 @@ class WebPublicReaderServer(object):
         greenlet.join()
         self._cluster_row = greenlet.get()
 
-        authenticator = \
-            InteractionPoolAuthenticator(memcached_client, 
-                                         self._interaction_pool)
-
         self._zeromq_context = zmq.Context()
 
+        self._cache_invalidator = None
+        if _central_skeeter_uri is not None:
+            self._cache_invalidator = GreenletCentralCacheInvalidator(
+                self._zeromq_context, _central_skeeter_uri
+            )
+            self._cache_invalidator.link_exception(
+                self._unhandled_greenlet_exception
+            )
+
         self._space_accounting_dealer_client = GreenletDealerClient(
             self._zeromq_context, 
             _local_node_name, 
@@ -150,6 +159,11 @@ class WebPublicReaderServer(object):
             "web-server"
         )
 
+        authenticator = \
+            InteractionPoolAuthenticator(memcached_client, 
+                                         self._interaction_pool,
+                                         self._event_push_client)
+
         id_translator_keys_path = os.environ.get(
             "NIMBUS_IO_ID_TRANSLATION_KEYS", 
             os.path.join(_repository_path, "id_translator_keys.pkl"))
@@ -167,7 +181,8 @@ class WebPublicReaderServer(object):
 
         self._redis_sink = OperationalStatsRedisSink(halt_event, 
                                                      redis_queue,
-                                                     _local_node_name)
+                                                     _local_node_name,
+                                                     self._event_push_client)
         self._redis_sink.link_exception(self._unhandled_greenlet_exception)
 
         self.application = Application(
@@ -188,7 +203,10 @@ class WebPublicReaderServer(object):
 
     def start(self):
         self._space_accounting_dealer_client.start()
+        self._accounting_client.start()
         self._redis_sink.start()
+        if self._cache_invalidator is not None:
+            self._cache_invalidator.start()
         self.wsgi_server.start()
 
     def stop(self):
@@ -200,6 +218,9 @@ class WebPublicReaderServer(object):
         self._log.debug("joining greenlets")
         self._space_accounting_dealer_client.join()
         self._redis_sink.kill()
+        if self._cache_invalidator is not None:
+            self._cache_invalidator.kill()
+            self._cache_invalidator.join()
         self._log.debug("closing zmq")
         self._event_push_client.close()
         self._zeromq_context.term()
@@ -218,6 +239,7 @@ class WebPublicReaderServer(object):
 
 def main():
     initialize_logging(_log_path)
+    install_sampling_profiler()
     log = logging.getLogger("main")
     halt_event = Event()
     gevent.signal(signal.SIGTERM, _signal_handler_closure(halt_event))
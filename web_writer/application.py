@@ -21,7 +21,7 @@ from base64 import b64decode
 import httplib
 import logging
 import os
-import random
+import time
 import zlib
 import hashlib
 import json
@@ -42,9 +42,12 @@ from tools.data_definitions import incoming_slice_size, \
         nimbus_meta_prefix, \
         http_timestamp_str
 from tools.collection_access_control import write_access, delete_access
+from tools.admission_control import AdmissionControl, AdmissionRefused, \
+        admission_ticket_key
 from tools.interaction_pool_authenticator import AccessUnauthorized, \
         AccessForbidden
 from tools.operational_stats_redis_sink import redis_queue_entry_tuple
+from tools.request_tracer import RequestTracer
 
 from tools.zfec_segmenter import ZfecSegmenter
 
@@ -53,6 +56,7 @@ from web_writer.exceptions import ArchiveFailedError, \
         ConjoinedFailedError
 
 from web_writer.data_writer_handoff_client import DataWriterHandoffClient
+from web_writer.handoff_selector import HandoffSelector
 from web_writer.data_writer import DataWriter
 from web_writer.archiver import Archiver
 from web_writer.destroyer import Destroyer
@@ -91,7 +95,6 @@ _reply_timeout = float(
 _min_connected_clients = 8
 _min_segments = 8
 _max_segments = 10
-_handoff_count = 2
 
 _s3_meta_prefix = "x-amz-meta-"
 _sizeof_s3_meta_prefix = len(_s3_meta_prefix)
@@ -122,7 +125,7 @@ def _build_meta_dict(req_get):
 def _connected_clients(clients):
     return [client for client in clients if client.connected]
 
-def _create_data_writers(clients):
+def _create_data_writers(clients, handoff_selector):
     data_writers_dict = dict()
 
     connected_clients_by_node = list()
@@ -146,7 +149,8 @@ def _create_data_writers(clients):
         data_writers_dict[node_name] = DataWriter(node_name, client)
     
     for node_name, client in disconnected_clients_by_node:
-        backup_clients = random.sample(connected_clients, _handoff_count)
+        backup_clients = handoff_selector.select(client.server_node_name,
+                                                 connected_clients)
         assert backup_clients[0] != backup_clients[1]
         data_writer_handoff_client = DataWriterHandoffClient(
             client.server_node_name,
@@ -162,7 +166,11 @@ def _create_data_writers(clients):
     # segment numbers get defined in
     return [data_writers_dict[node_name] for node_name in _node_names]
 
-def _send_archive_cancel(user_request_id, unified_id, conjoined_part, clients):
+def _send_archive_cancel(user_request_id, 
+                         collection_id, 
+                         unified_id, 
+                         conjoined_part, 
+                         clients):
     # message sent to data writers telling them to cancel the archive
     for i, client in enumerate(clients):
         if not client.connected:
@@ -171,6 +179,7 @@ def _send_archive_cancel(user_request_id, unified_id, conjoined_part, clients):
             "message-type"      : "archive-key-cancel",            
             "priority"          : create_priority(),
             "user-request-id"   : user_request_id,
+            "collection-id"     : collection_id,
             "unified-id"        : unified_id,
             "conjoined-part"    : conjoined_part,
             "segment-num"       : i+1,
@@ -198,7 +207,9 @@ class Application(object):
         self.accounting_client = accounting_client
         self._event_push_client = event_push_client
         self._redis_queue = redis_queue
-
+        self._admission_control = AdmissionControl()
+        self._tracer = RequestTracer(event_push_client)
+        self._handoff_selector = HandoffSelector()
 
         self._dispatch_table = {
             action_respond_to_ping      : self._respond_to_ping,
@@ -209,6 +220,10 @@ class Application(object):
             action_abort_conjoined      : self._abort_conjoined,
         }
 
+    @property
+    def tracer(self):
+        return self._tracer
+
     @wsgify
     def __call__(self, req):
 
@@ -248,6 +263,29 @@ class Application(object):
             self._log.exception("request {0}: {1}".format(user_request_id,
                                                           req.url))
             raise
+        finally:
+            # our responses are complete when the handler returns
+            if admission_ticket_key in req.environ:
+                req.environ[admission_ticket_key].release()
+
+    def _admit(self, req, collection_row, user_request_id):
+        """
+        refuse the request with 503 if the collection is over its limits
+        """
+        try:
+            ticket = self._admission_control.admit(collection_row["id"])
+        except AdmissionRefused, instance:
+            self._log.warn("request {0}: refused {1}".format(user_request_id,
+                                                             instance))
+            queue_entry = \
+                redis_queue_entry_tuple(timestamp=create_timestamp(),
+                                        collection_id=collection_row["id"],
+                                        value=1)
+            self._redis_queue.put(("admission_refused", queue_entry, ))
+            response = exc.HTTPServiceUnavailable(str(instance))
+            response.retry_after = instance.retry_after
+            raise response
+        req.environ[admission_ticket_key] = ticket
 
     def _respond_to_ping(self, _req, _match_object, _user_request_id):
         self._log.debug("_respond_to_ping")
@@ -258,6 +296,7 @@ class Application(object):
         return response
 
     def _archive_key(self, req, match_object, user_request_id):
+        request_start_time = time.time()
         collection_name = match_object.group("collection_name")
         key = match_object.group("key")
 
@@ -278,6 +317,8 @@ class Application(object):
         except Exception:
             self._log.exception("request {0}".format(user_request_id))
             raise exc.HTTPBadRequest()
+
+        self._admit(req, collection_row, user_request_id)
             
         try:
             key = urllib.unquote_plus(key)
@@ -335,7 +376,8 @@ class Application(object):
             if len(value) > 0:
                 conjoined_part = int(value)
 
-        data_writers = _create_data_writers(self._data_writer_clients) 
+        data_writers = _create_data_writers(self._data_writer_clients,
+                                            self._handoff_selector) 
         timestamp = create_timestamp()
         archiver = Archiver(
             data_writers,
@@ -368,35 +410,43 @@ class Application(object):
         zfec_padding_size = None
         try:
             while True:
-                slice_item = \
-                    data_queue.get(block=True, 
-                                   timeout=_max_sequence_upload_interval)
+                with self._tracer.span(user_request_id, 
+                                       "web-writer-http-receive"):
+                    slice_item = \
+                        data_queue.get(block=True, 
+                                       timeout=_max_sequence_upload_interval)
                 if slice_item is None:
                     break
                 actual_content_length += len(slice_item)
                 file_adler32 = zlib.adler32(slice_item, file_adler32)
                 file_md5.update(slice_item)
                 file_size += len(slice_item)
-                segments = segmenter.encode(block_generator(slice_item))
+                with self._tracer.span(user_request_id, 
+                                       "web-writer-zfec-encode"):
+                    segments = segmenter.encode(block_generator(slice_item))
                 zfec_padding_size = segmenter.padding_size(slice_item)
-                if actual_content_length == expected_content_length:
-                    archiver.archive_final(
-                        file_size,
-                        file_adler32,
-                        file_md5.digest(),
-                        segments,
-                        zfec_padding_size,
-                        _reply_timeout
-                    )
-                else:
-                    archiver.archive_slice(
-                        segments, zfec_padding_size, _reply_timeout
-                    )
+                # from sending the slice to every data writer's reply
+                with self._tracer.span(user_request_id, 
+                                       "web-writer-archive-send"):
+                    if actual_content_length == expected_content_length:
+                        archiver.archive_final(
+                            file_size,
+                            file_adler32,
+                            file_md5.digest(),
+                            segments,
+                            zfec_padding_size,
+                            _reply_timeout
+                        )
+                    else:
+                        archiver.archive_slice(
+                            segments, zfec_padding_size, _reply_timeout
+                        )
         except gevent.queue.Empty, instance:
             # Ticket #69 Protection in Web Writer from Slow Uploads
             self._log.error("archive failed: {0} timeout {1}".format(
                 description, instance))
             _send_archive_cancel(user_request_id, 
+                                 collection_row["id"],
                                  unified_id, 
                                  conjoined_part, 
                                  self._data_writer_clients)
@@ -414,6 +464,7 @@ class Application(object):
                 description, instance, 
             ))
             _send_archive_cancel(user_request_id, 
+                                 collection_row["id"],
                                  unified_id, 
                                  conjoined_part, 
                                  self._data_writer_clients)
@@ -437,6 +488,7 @@ class Application(object):
                 description, instance, 
             ))
             _send_archive_cancel(user_request_id, 
+                                 collection_row["id"],
                                  unified_id, 
                                  conjoined_part, 
                                  self._data_writer_clients)
@@ -458,6 +510,7 @@ class Application(object):
             self._log.error("request {0}: {1}".format(user_request_id, 
                                                       error_message))
             _send_archive_cancel(user_request_id, 
+                                 collection_row["id"],
                                  unified_id, 
                                  conjoined_part, 
                                  self._data_writer_clients)
@@ -478,6 +531,7 @@ class Application(object):
             self._log.error("request {0}: {1}".format(user_request_id, 
                                                       error_message))
             _send_archive_cancel(user_request_id, 
+                                 collection_row["id"],
                                  unified_id, 
                                  conjoined_part, 
                                  self._data_writer_clients)
@@ -512,6 +566,10 @@ class Application(object):
             file_size
         )
 
+        self._tracer.record(user_request_id, 
+                            "web-writer-archive", 
+                            request_start_time)
+
         response_dict = {
             "version_identifier" : self._id_translator.public_id(unified_id),
         }
@@ -551,6 +609,8 @@ class Application(object):
         except Exception:
             self._log.exception("request {0}".format(user_request_id))
             raise exc.HTTPBadRequest()
+
+        self._admit(req, collection_row, user_request_id)
             
         try:
             key = urllib.unquote_plus(key)
@@ -574,7 +634,8 @@ class Application(object):
                       key,
                       unified_id_to_delete)
         self._log.info(description)
-        data_writers = _create_data_writers(self._data_writer_clients)
+        data_writers = _create_data_writers(self._data_writer_clients,
+                                            self._handoff_selector)
 
         unified_id = self._unified_id_factory.next()
         timestamp = create_timestamp()
@@ -657,6 +718,8 @@ class Application(object):
         except Exception:
             self._log.exception("request {0}".format(user_request_id))
             raise exc.HTTPBadRequest()
+
+        self._admit(req, collection_row, user_request_id)
             
         try:
             key = urllib.unquote_plus(key)
@@ -672,7 +735,8 @@ class Application(object):
             collection_row["name"],
             key))
 
-        data_writers = _create_data_writers(self._data_writer_clients) 
+        data_writers = _create_data_writers(self._data_writer_clients,
+                                            self._handoff_selector) 
         unified_id = self._unified_id_factory.next()
         timestamp = create_timestamp()
 
@@ -776,6 +840,8 @@ class Application(object):
         except Exception:
             self._log.exception("request {0}".format(user_request_id))
             raise exc.HTTPBadRequest()
+
+        self._admit(req, collection_row, user_request_id)
             
         try:
             key = urllib.unquote_plus(key)
@@ -793,7 +859,8 @@ class Application(object):
                                               key,
                                               unified_id))
 
-        data_writers = _create_data_writers(self._data_writer_clients) 
+        data_writers = _create_data_writers(self._data_writer_clients,
+                                            self._handoff_selector) 
         timestamp = create_timestamp()
 
         try:
@@ -895,6 +962,8 @@ class Application(object):
         except Exception:
             self._log.exception("%s" % (instance, ))
             raise exc.HTTPBadRequest()
+
+        self._admit(req, collection_row, user_request_id)
             
         try:
             key = urllib.unquote_plus(key)
@@ -911,7 +980,8 @@ class Application(object):
             key,
             unified_id))
 
-        data_writers = _create_data_writers(self._data_writer_clients) 
+        data_writers = _create_data_writers(self._data_writer_clients,
+                                            self._handoff_selector) 
         timestamp = create_timestamp()
 
         try:
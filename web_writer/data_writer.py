@@ -3,8 +3,10 @@
 data_writer.py
 
 A class that represents a data writer in the system.
+
+Timestamps and digests go into messages as datetime and bytearray: the
+compact message codec sends them as they are, JSON as repr and base64.
 """
-from base64 import b64encode
 import hashlib
 import logging
 import zlib
@@ -65,16 +67,16 @@ class DataWriter(object):
             "collection-id"             : collection_id,
             "key"                       : key, 
             "unified-id"                : unified_id,
-            "timestamp-repr"            : repr(timestamp),
+            "timestamp-repr"            : timestamp,
             "conjoined-part"            : conjoined_part,
             "segment-num"               : segment_num,
             "segment-size"              : segment_size,
             "zfec-padding-size"         : zfec_padding_size,
-            "segment-md5-digest"        : b64encode(segment_md5.digest()),
+            "segment-md5-digest"        : bytearray(segment_md5.digest()),
             "segment-adler32"           : segment_adler32,
             "file-size"                 : file_size,
             "file-adler32"              : file_adler32,
-            "file-hash"                 : b64encode(file_md5),
+            "file-hash"                 : bytearray(file_md5),
             "source-node-name"          : source_node_name,
             "handoff-node-name"         : None,
         }
@@ -115,12 +117,12 @@ class DataWriter(object):
             "collection-id"         : collection_id,
             "key"                   : key, 
             "unified-id"            : unified_id,
-            "timestamp-repr"        : repr(timestamp),
+            "timestamp-repr"        : timestamp,
             "conjoined-part"        : conjoined_part,
             "segment-num"           : segment_num,
             "segment-size"          : segment_size,
             "zfec-padding-size"     : zfec_padding_size,
-            "segment-md5-digest"    : b64encode(segment_md5.digest()),
+            "segment-md5-digest"    : bytearray(segment_md5.digest()),
             "segment-adler32"       : segment_adler32,
             "sequence-num"          : sequence_num,
             "source-node-name"      : source_node_name,
@@ -160,12 +162,12 @@ class DataWriter(object):
             "collection-id"         : collection_id,
             "key"                   : key,
             "unified-id"            : unified_id,
-            "timestamp-repr"        : repr(timestamp),
+            "timestamp-repr"        : timestamp,
             "conjoined-part"        : conjoined_part,
             "segment-num"           : segment_num,
             "segment-size"          : segment_size,
             "zfec-padding-size"     : zfec_padding_size,
-            "segment-md5-digest"    : b64encode(segment_md5.digest()),
+            "segment-md5-digest"    : bytearray(segment_md5.digest()),
             "segment-adler32"       : segment_adler32,
             "sequence-num"          : sequence_num,
             "source-node-name"      : source_node_name,
@@ -209,17 +211,17 @@ class DataWriter(object):
             "collection-id"             : collection_id,
             "key"                       : key,
             "unified-id"                : unified_id,
-            "timestamp-repr"            : repr(timestamp),
+            "timestamp-repr"            : timestamp,
             "conjoined-part"            : conjoined_part,
             "segment-num"               : segment_num,
             "segment-size"              : segment_size,
             "zfec-padding-size"         : zfec_padding_size,
-            "segment-md5-digest"        : b64encode(segment_md5.digest()),
+            "segment-md5-digest"        : bytearray(segment_md5.digest()),
             "segment-adler32"           : segment_adler32,
             "sequence-num"              : sequence_num,
             "file-size"                 : file_size,
             "file-adler32"              : file_adler32,
-            "file-hash"                 : b64encode(file_md5),
+            "file-hash"                 : bytearray(file_md5),
             "source-node-name"          : source_node_name,
             "handoff-node-name"         : None,
         }
@@ -256,7 +258,7 @@ class DataWriter(object):
             "key"                       : key,
             "unified-id-to-delete"      : unified_id_to_delete,
             "unified-id"                : unified_id,
-            "timestamp-repr"            : repr(timestamp),
+            "timestamp-repr"            : timestamp,
             "segment-num"               : segment_num,
             "source-node-name"          : source_node_name,
             "handoff-node-name"         : None,
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+handoff_selector.py
+
+class HandoffSelector
+
+choose the backup nodes that receive hinted handoffs for a disconnected
+data writer.
+
+We estimate the load of each connected data writer as the time it would
+take to work off its messages: (messages queued in our client + messages
+queued at the data writer + 1) * average ack latency. The data writer
+reports its queue depth and free journal space in every ack
+(see data_writer_main.AckStatus).
+
+A node is acceptable as a backup if it has at least _min_journal_free_bytes
+of free journal space, and its load is at most _overload_factor times the
+load of the least loaded node (loads under _min_overload_load are all
+acceptable, so that an idle cluster does not flap).
+
+The assignment of a destination node is stable: we keep its backups while
+they stay acceptable, so that the handoff server drains each destination
+from as few sources as possible. New backups are taken from the acceptable
+nodes by rendezvous hashing on the destination, which spreads the
+destinations over the nodes.
+"""
+import hashlib
+import logging
+import os
+
+_handoff_count = 2
+_min_journal_free_bytes = int(
+    os.environ.get("NIMBUSIO_HANDOFF_MIN_JOURNAL_FREE_BYTES",
+                   str(1024 ** 3)))
+_overload_factor = float(
+    os.environ.get("NIMBUSIO_HANDOFF_OVERLOAD_FACTOR", "2.0"))
+_min_overload_load = float(
+    os.environ.get("NIMBUSIO_HANDOFF_MIN_OVERLOAD_LOAD", "1.0"))
+# the latency we assume for a client that has no acks yet
+_min_ack_latency = 0.001
+
+def handoff_load(client):
+    """
+    return the estimated seconds for the data writer to work off its
+    queued messages
+    """
+    queue_depth = client.server_status.get("queue-depth") or 0
+    ack_latency = max(client.ack_latency or 0.0, _min_ack_latency)
+    return (client.queue_size + queue_depth + 1) * ack_latency
+
+def _has_journal_space(client):
+    journal_free_bytes = client.server_status.get("journal-free-bytes")
+    return journal_free_bytes is None or \
+        journal_free_bytes >= _min_journal_free_bytes
+
+def _rendezvous_key(dest_node_name, client):
+    return hashlib.md5(
+        "{0} {1}".format(dest_node_name, client.server_node_name)).digest()
+
+class HandoffSelector(object):
+    """
+    choose backup clients for destination nodes
+    """
+    def __init__(self, handoff_count=_handoff_count):
+        self._log = logging.getLogger("HandoffSelector")
+        self._handoff_count = handoff_count
+        # destination node name : list of backup node names
+        self._assignments = dict()
+
+    def select(self, dest_node_name, connected_clients):
+        """
+        return a list of handoff_count clients from connected_clients
+        to back up dest_node_name
+        """
+        assert len(connected_clients) >= self._handoff_count
+        loads = dict([(client.server_node_name, handoff_load(client), ) \
+                      for client in connected_clients])
+
+        # if too many nodes are short of space, we use them anyway
+        eligible_clients = [client for client in connected_clients \
+                            if _has_journal_space(client)]
+        if len(eligible_clients) < self._handoff_count:
+            eligible_clients = list(connected_clients)
+
+        best_load = min([loads[client.server_node_name] \
+                         for client in eligible_clients])
+        load_limit = max(_overload_factor * best_load, _min_overload_load)
+        acceptable_clients = [client for client in eligible_clients \
+                              if loads[client.server_node_name] <= load_limit]
+
+        previous_node_names = self._assignments.get(dest_node_name, [])
+        selected_clients = [client for client in acceptable_clients \
+                            if client.server_node_name in previous_node_names]
+
+        new_clients = [client for client in acceptable_clients \
+                       if client not in selected_clients]
+        new_clients.sort(key=lambda c: _rendezvous_key(dest_node_name, c))
+        selected_clients.extend(
+            new_clients[:self._handoff_count - len(selected_clients)])
+
+        # too few acceptable nodes: take the least loaded of the rest
+        if len(selected_clients) < self._handoff_count:
+            other_clients = [client for client in eligible_clients \
+                             if client not in selected_clients]
+            other_clients.sort(key=lambda c: loads[c.server_node_name])
+            selected_clients.extend(
+                other_clients[:self._handoff_count - len(selected_clients)])
+
+        selected_node_names = \
+            [client.server_node_name for client in selected_clients]
+        if sorted(selected_node_names) != sorted(previous_node_names):
+            self._log.info("handoffs for {0} go to {1} (loads {2})".format(
+                dest_node_name,
+                ", ".join(selected_node_names),
+                ", ".join(["{0:.3f}".format(loads[node_name]) \
+                           for node_name in selected_node_names])))
+            self._assignments[dest_node_name] = selected_node_names
+
+        return selected_clients
@@ -34,11 +34,15 @@ import zmq.green as zmq
 import gdbpool.interaction_pool
 
 from tools.standard_logging import initialize_logging
+from tools.sampling_profiler import install_sampling_profiler
 from tools.greenlet_dealer_client import GreenletDealerClient
 from tools.greenlet_resilient_client import GreenletResilientClient
 from tools.greenlet_pull_server import GreenletPULLServer
 from tools.deliverator import Deliverator
 from tools.greenlet_push_client import GreenletPUSHClient
+from tools.greenlet_trace_flusher import GreenletTraceFlusher
+from tools.greenlet_central_cache_invalidator import \
+    GreenletCentralCacheInvalidator
 from tools.database_connection import get_central_database_dsn
 from tools.event_push_client import EventPushClient
 from tools.unified_id_factory import UnifiedIDFactory
@@ -79,6 +83,7 @@ _repository_path = os.environ["NIMBUSIO_REPOSITORY_PATH"]
 _memcached_host = os.environ.get("NIMBUSIO_MEMCACHED_HOST", "localhost")
 _memcached_port = int(os.environ.get("NIMBUSIO_MEMCACHED_PORT", "11211"))
 _memcached_nodes = ["{0}:{1}".format(_memcached_host, _memcached_port), ]
+_central_skeeter_uri = os.environ.get("NIMBUSIO_CENTRAL_SKEETER_URI")
 _database_pool_size = 3 
 _central_pool_name = "default"
 
@@ -150,9 +155,6 @@ class WebWriter(object):
             pool_size=_database_pool_size, 
             do_log=True)
 
-        authenticator = InteractionPoolAuthenticator(memcached_client, 
-                                                     self._interaction_pool)
-
         # Ticket #25: must run database operation in a greenlet
         greenlet =  gevent.Greenlet.spawn(_get_cluster_row_and_node_row, 
                                            self._interaction_pool)
@@ -172,6 +174,15 @@ class WebWriter(object):
         )
         self._pull_server.link_exception(self._unhandled_greenlet_exception)
 
+        self._cache_invalidator = None
+        if _central_skeeter_uri is not None:
+            self._cache_invalidator = GreenletCentralCacheInvalidator(
+                self._zeromq_context, _central_skeeter_uri
+            )
+            self._cache_invalidator.link_exception(
+                self._unhandled_greenlet_exception
+            )
+
         self._data_writer_clients = list()
         for node_name, address in zip(_node_names, _data_writer_addresses):
             resilient_client = GreenletResilientClient(
@@ -212,6 +223,10 @@ class WebWriter(object):
             "web-server"
         )
 
+        authenticator = InteractionPoolAuthenticator(memcached_client, 
+                                                     self._interaction_pool,
+                                                     self._event_push_client)
+
         # message sent to data writers telling them the server
         # is (re)starting, thereby invalidating any archives
         # that are in progress for this node
@@ -240,7 +255,8 @@ class WebWriter(object):
 
         self._redis_sink = OperationalStatsRedisSink(halt_event, 
                                                      redis_queue,
-                                                     _local_node_name)
+                                                     _local_node_name,
+                                                     self._event_push_client)
         self._redis_sink.link_exception(self._unhandled_greenlet_exception)
 
         self.application = Application(
@@ -253,6 +269,9 @@ class WebWriter(object):
             self._event_push_client,
             redis_queue
         )
+        self._trace_flusher = GreenletTraceFlusher(self.application.tracer)
+        self._trace_flusher.link_exception(self._unhandled_greenlet_exception)
+
         self.wsgi_server = WSGIServer((_web_writer_host, _web_writer_port), 
                                       application=self.application,
                                       backlog=_wsgi_backlog
@@ -260,10 +279,14 @@ class WebWriter(object):
 
     def start(self):
         self._space_accounting_dealer_client.start()
+        self._accounting_client.start()
         self._pull_server.start()
         for client in self._data_writer_clients:
             client.start()
         self._redis_sink.start()
+        if self._cache_invalidator is not None:
+            self._cache_invalidator.start()
+        self._trace_flusher.start()
         self.wsgi_server.start()
 
     def stop(self):
@@ -276,11 +299,17 @@ class WebWriter(object):
         for client in self._data_writer_clients:
             client.kill()
         self._redis_sink.kill()
+        if self._cache_invalidator is not None:
+            self._cache_invalidator.kill()
+        self._trace_flusher.kill()
         self._log.debug("joining greenlets")
         self._space_accounting_dealer_client.join()
         self._pull_server.join()
         for client in self._data_writer_clients:
             client.join()
+        if self._cache_invalidator is not None:
+            self._cache_invalidator.join()
+        self._trace_flusher.join()
         self._redis_sink.kill()
         self._log.debug("closing zmq")
         self._event_push_client.close()
@@ -300,6 +329,7 @@ class WebWriter(object):
 
 def main():
     initialize_logging(_log_path)
+    install_sampling_profiler()
     log = logging.getLogger("main")
     halt_event = Event()
     gevent.signal(signal.SIGTERM, _signal_handler_closure(halt_event))
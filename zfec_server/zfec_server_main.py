@@ -16,6 +16,7 @@ import zmq
 from zfec.easyfec import Encoder, Decoder
 
 from tools.standard_logging import initialize_logging
+from tools.sampling_profiler import install_sampling_profiler
 from tools.zeromq_util import prepare_ipc_path
 from tools.process_util import set_signal_handler
 
@@ -160,6 +161,7 @@ def main():
                                          _local_node_name,
                                          server_number)
     initialize_logging(log_path)
+    install_sampling_profiler()
     log = logging.getLogger("main")
     log.info("program starts")
 